@@ -27,18 +27,30 @@ class Settings(BaseSettings):
     twilio_account_sid: str = Field("", description="Twilio Account SID")
     twilio_auth_token: str = Field("", description="Twilio Auth Token")
     twilio_from_number: str = Field("", description="Twilio WhatsApp From Number (e.g., whatsapp:+14155238886)")
+    twilio_max_concurrency: int = Field(10, description="Max concurrent Twilio API calls")
+    twilio_rate_per_second: float = Field(5, description="Max WhatsApp messages per second sent to Twilio")
+    twilio_daily_quota: int = Field(1000, description="WhatsApp messages per UTC day (0 = unlimited)")
 
     # Email - Resend
     resend_api_key: str = Field("", description="Resend API key")
     email_from: str = Field(
         "noreply@iaudit.allanturing.com", description="Sender email"
     )
+    resend_max_concurrency: int = Field(10, description="Max concurrent Resend API calls")
+    resend_rate_per_second: float = Field(2, description="Max Resend API requests per second")
+    resend_daily_quota: int = Field(0, description="Emails per UTC day via Resend (0 = unlimited)")
 
     # Email - SMTP fallback
     smtp_host: str = Field("smtp.gmail.com")
     smtp_port: int = Field(587)
     smtp_user: str = Field("")
     smtp_password: str = Field("")
+    smtp_max_concurrency: int = Field(4, description="Max concurrent SMTP sessions (pool size)")
+    smtp_rate_per_second: float = Field(2, description="Max emails per second via SMTP")
+    smtp_daily_quota: int = Field(500, description="Emails per UTC day via SMTP (Gmail: 500; 0 = unlimited)")
+    smtp_noop_interval_seconds: int = Field(30, description="Idle time after which a pooled session is NOOP-checked")
+    smtp_idle_timeout_seconds: int = Field(240, description="Idle time after which a pooled session is closed")
+    email_batch_size: int = Field(50, description="Max emails sent per SMTP session / Resend batch call")
 
     # App
     app_name: str = Field("IAudit")
@@ -47,6 +59,26 @@ class Settings(BaseSettings):
     frontend_url: str = Field("http://localhost:8501")
     backend_url: str = Field("http://localhost:8000")
 
+    # Upload
+    upload_chunk_rows: int = Field(1000, description="Rows per chunk when importing spreadsheets")
+    upload_max_errors: int = Field(500, description="Max error messages returned by an import")
+
+    # Search history
+    history_max_entries: int = Field(100, description="CNPJ searches kept per user")
+
+    # Compliance certificate PDFs
+    pdf_render_workers: int = Field(2, description="Processes rendering PDFs (0 = render in a thread)")
+    pdf_cache_memory_items: int = Field(32, description="Rendered PDFs kept in memory (LRU)")
+    pdf_cache_disk_mb: int = Field(200, description="Disk space for rendered PDFs (least recently used evicted)")
+    pdf_cache_ttl_hours: int = Field(24, description="Max age of a cached PDF")
+    pdf_history_max_age_minutes: int = Field(30, description="Reuse a CNPJ query from the history this recent instead of querying again")
+    pdf_batch_concurrency: int = Field(8, description="CNPJs of a batch report loaded/rendered at the same time")
+    pdf_batch_max_items: int = Field(1000, description="Max CNPJs in one batch report")
+    pdf_batch_ttl_minutes: int = Field(60, description="How long a finished batch report stays available for download")
+
+    # Dynamic settings
+    settings_watch_interval_seconds: int = Field(5, description="Background poll interval for settings changes")
+
     # Scheduler
     scheduler_poll_interval_minutes: int = Field(5)
     scheduler_daily_hour: int = Field(0)
@@ -65,10 +97,38 @@ class Settings(BaseSettings):
     bradesco_negociacao: str = Field("", description="Format: AAAA0000000CCCCCCC")
     bradesco_acess_esc10: str = Field("4912110", description="Acessório Escritural 10 (Fixed: 4912110)")
     bradesco_sandbox: bool = Field(True, description="Use Bradesco Sandbox environment")
+    bradesco_max_connections: int = Field(20, description="Max pooled connections to the Bradesco API")
+    bradesco_keepalive_seconds: int = Field(60, description="Idle time before a pooled Bradesco connection is closed")
+    bradesco_token_refresh_margin_seconds: int = Field(300, description="Renew the OAuth token this long before it expires")
+    bradesco_register_rate_per_second: float = Field(5, description="Initial boleto registrations per second (adapts on 429/5xx)")
+    bradesco_register_max_rate_per_second: float = Field(20, description="Upper bound for the adaptive registration rate")
+
+    # Boletos (emission / status monitoring)
+    boleto_emissao_concurrency: int = Field(8, description="Max concurrent Bradesco registrations in a lote")
+    boleto_monitor_concurrency: int = Field(8, description="Max concurrent Bradesco status queries per monitoring run")
+    boleto_monitor_rate_per_second: float = Field(5, description="Initial Bradesco status queries per second (adapts on 429/5xx)")
+    boleto_monitor_max_rate_per_second: float = Field(20, description="Upper bound for the adaptive status query rate")
+    boleto_monitor_max_per_run: int = Field(5000, description="Max boletos checked per monitoring run (most overdue schedule first)")
+    boleto_registro_conciliacao_minutes: int = Field(15, description="Invoices left in 'registrando' this long (no Bradesco answer) are reconciled with Bradesco")
+    billing_concurrency: int = Field(8, description="Max concurrent registrations in the recurring billing run")
+    billing_claim_lease_seconds: int = Field(1800, description="How long a replica holds the plans it claimed for a billing run")
+    boleto_webhook_healthy_hours: int = Field(24, description="Webhooks seen within this window stretch polling intervals")
+    webhook_inbox_concurrency: int = Field(8, description="Boletos whose webhook events are processed concurrently")
+    webhook_inbox_max_attempts: int = Field(5, description="Attempts before a webhook event is parked as failed")
 
     # Notification Queue
     notification_max_retries: int = Field(3, description="Max retry attempts for failed notifications")
     notification_vencimento_hour: int = Field(7, description="Hour (UTC) to run D-1/D+1 vencimento check")
+    notification_atraso_max_days: int = Field(364, description="Weekly overdue reminders stop after this many days")
+    notification_workers_per_channel: int = Field(4, description="Queue workers per channel (email, whatsapp)")
+    notification_email_concurrency: int = Field(4, description="Max concurrent email sends")
+    notification_whatsapp_concurrency: int = Field(4, description="Max concurrent WhatsApp sends")
+    notification_coalesce_window_seconds: int = Field(30, description="Window to group events per recipient into a digest (0 = off)")
+    notification_digest_max_items: int = Field(50, description="Max events per digest message")
+    notification_quota_reserve_ratio: float = Field(0.1, description="Share of each daily quota kept for transactional events")
+
+    # Communication Logs
+    comm_log_retention_days: int = Field(90, description="Days to keep individual communication logs")
 
     model_config = {"env_file": ".env", "env_file_encoding": "utf-8"}
 
@@ -2,14 +2,17 @@
 
 from __future__ import annotations
 
+import bisect
 import logging
-from datetime import datetime, timezone
+from datetime import date, datetime, timezone, timedelta
 import uuid
 from typing import Any, List, Dict, Optional
 
 from supabase import create_client, Client
 
 from app.config import settings
+from app.services.search_index import NgramIndex, normalize_text, is_cnpj_query
+from app.utils import encode_cursor, decode_cursor
 
 logger = logging.getLogger(__name__)
 
@@ -28,10 +31,13 @@ def load_db():
         try:
             with open(DB_FILE, "r", encoding="utf-8") as f:
                 data = json.load(f)
-                return data.get("empresas", []), data.get("consultas", []), data.get("boletos", []), data.get("billing_plans", [])
+                return (
+                    data.get("empresas", []), data.get("consultas", []), data.get("boletos", []),
+                    data.get("billing_plans", []), data.get("boleto_lembretes", []),
+                )
         except Exception as e:
             logger.error(f"Failed to load local DB: {e}")
-    return [], [], [], []
+    return [], [], [], [], []
 
 def save_db():
     try:
@@ -40,13 +46,16 @@ def save_db():
                 "empresas": DEMO_EMPRESAS,
                 "consultas": DEMO_CONSULTAS,
                 "boletos": DEMO_BOLETOS,
-                "billing_plans": DEMO_BILLING_PLANS
+                "billing_plans": DEMO_BILLING_PLANS,
+                "boleto_lembretes": [list(key) for key in DEMO_LEMBRETES],
             }, f, indent=2, default=str)
     except Exception as e:
         logger.error(f"Failed to save local DB: {e}")
 
 # Initialize from file
-DEMO_EMPRESAS, DEMO_CONSULTAS, DEMO_BOLETOS, DEMO_BILLING_PLANS = load_db()
+DEMO_EMPRESAS, DEMO_CONSULTAS, DEMO_BOLETOS, DEMO_BILLING_PLANS, _lembretes = load_db()
+# Reminder ledger: (boleto_id, data_vencimento, marco) already sent
+DEMO_LEMBRETES: set[tuple] = {tuple(key) for key in _lembretes}
 
 # If empty, we start fresh (User requested "No More Fake Data")
 if not DEMO_EMPRESAS:
@@ -77,6 +86,69 @@ def get_supabase() -> Client | None:
     return _client
 
 
+# ─── DEMO search index ───────────────────────────────────────────────
+# Trigram index + per-sort-field ordered views over DEMO_EMPRESAS, so that
+# search and keyset pagination do not scan/sort the whole list per request.
+
+EMPRESA_SORT_FIELDS = ("razao_social", "cnpj", "created_at")
+
+_empresas_index = NgramIndex()
+_empresas_index_ready = False
+_empresas_by_id: dict[str, dict] = {}  # rows behind the index's ids
+_empresas_sorted: dict[str, tuple[list[tuple], list[dict]]] = {}
+
+
+def _demo_empresas_index() -> NgramIndex:
+    """Return the DEMO trigram index, building it on first use."""
+    global _empresas_index_ready
+    if not _empresas_index_ready:
+        _empresas_index.clear()
+        _empresas_by_id.clear()
+        for emp in DEMO_EMPRESAS:
+            _empresas_index.add(emp["id"], emp.get("razao_social"), emp.get("cnpj"))
+            _empresas_by_id[emp["id"]] = emp
+        _empresas_index_ready = True
+    return _empresas_index
+
+
+def _demo_reindex_empresa(emp: dict) -> None:
+    """Keep the DEMO index in sync after an empresa insert/update."""
+    if _empresas_index_ready:
+        _empresas_index.add(emp["id"], emp.get("razao_social"), emp.get("cnpj"))
+        _empresas_by_id[emp["id"]] = emp
+    _empresas_sorted.clear()
+
+
+def _demo_reset_empresas_index() -> None:
+    global _empresas_index_ready
+    _empresas_index_ready = False
+    _empresas_by_id.clear()
+    _empresas_sorted.clear()
+
+
+def _demo_sort_key(emp: dict, sort: str) -> tuple:
+    value = emp.get(sort)
+    if sort == "razao_social":
+        value = normalize_text(value)
+    return (str(value or ""), emp["id"])
+
+
+def _demo_sorted_empresas(sort: str) -> tuple[list[tuple], list[dict]]:
+    """Return (keys, rows) for DEMO_EMPRESAS ordered by (sort, id)."""
+    cached = _empresas_sorted.get(sort)
+    if cached is None:
+        pairs = sorted(((_demo_sort_key(e, sort), e) for e in DEMO_EMPRESAS), key=lambda kv: kv[0])
+        cached = ([k for k, _ in pairs], [e for _, e in pairs])
+        _empresas_sorted[sort] = cached
+    return cached
+
+
+def _pgrst_quote(value) -> str:
+    """Quote a value for use inside a PostgREST logic filter (or/and)."""
+    text = str(value).replace("\\", "\\\\").replace('"', '\\"')
+    return f'"{text}"'
+
+
 # ─── Empresas ────────────────────────────────────────────────────────
 
 def get_empresas(
@@ -91,8 +163,8 @@ def get_empresas(
         if ativo is not None:
             empresas = [e for e in empresas if e.get("ativo") == ativo]
         if search:
-            search_lower = search.lower()
-            empresas = [e for e in empresas if search_lower in str(e.get("cnpj", "")).lower() or search_lower in str(e.get("razao_social", "")).lower()]
+            matches = _demo_empresas_index().search(search)
+            empresas = [e for e in empresas if e["id"] in matches]
         return empresas[offset:offset+limit]
     
     sb = get_supabase()
@@ -108,6 +180,105 @@ def get_empresas(
     return query.execute().data
 
 
+def get_empresas_page(
+    ativo: bool | None = None,
+    search: str | None = None,
+    limit: int = 50,
+    cursor: str | None = None,
+    sort: str = "razao_social",
+    desc: bool = False,
+) -> dict:
+    """
+    Keyset-paginated empresa listing with server-side search and sorting.
+
+    Returns:
+        Dict with ``items``, ``next_cursor`` (None on the last page) and
+        ``total_estimate`` (planner estimate on Supabase, exact in DEMO).
+    """
+    if sort not in EMPRESA_SORT_FIELDS:
+        sort = "razao_social"
+    after = decode_cursor(cursor)
+
+    if DEMO_MODE:
+        if search:
+            # The index gives the matching ids; only those rows are fetched and
+            # ordered (no pass over DEMO_EMPRESAS)
+            matches = _demo_empresas_index().search(search)
+            pairs = sorted(
+                ((_demo_sort_key(e, sort), e) for e in (_empresas_by_id[i] for i in matches)),
+                key=lambda kv: kv[0],
+            )
+            keys, rows = [k for k, _ in pairs], [e for _, e in pairs]
+        else:
+            keys, rows = _demo_sorted_empresas(sort)
+
+        if not desc:
+            start = bisect.bisect_right(keys, tuple(after)) if after else 0
+            positions = range(start, len(rows))
+        else:
+            start = bisect.bisect_left(keys, tuple(after)) if after else len(rows)
+            positions = range(start - 1, -1, -1)
+
+        items: list[dict] = []
+        last_key = None
+        has_more = False
+        for i in positions:
+            row = rows[i]
+            if ativo is not None and row.get("ativo") != ativo:
+                continue
+            if len(items) == limit:
+                has_more = True
+                break
+            items.append(row)
+            last_key = keys[i]
+
+        if ativo is None:
+            total = len(rows)
+        else:
+            total = sum(1 for r in rows if r.get("ativo") == ativo)
+
+        return {
+            "items": items,
+            "next_cursor": encode_cursor(list(last_key)) if has_more else None,
+            "total_estimate": total,
+        }
+
+    sb = get_supabase()
+    if sb is None: return get_empresas_page(ativo, search, limit, cursor, sort, desc)
+
+    query = sb.table("empresas").select("*", count="estimated")
+    if ativo is not None:
+        query = query.eq("ativo", ativo)
+
+    # Both filters are combined in one logic tree; ilike '%x%' is served by
+    # the pg_trgm GIN indexes on cnpj and razao_social.
+    filters = []
+    if search:
+        term = _pgrst_quote(f"*{search}*")
+        if is_cnpj_query(search):
+            digits = _pgrst_quote("*" + "".join(filter(str.isdigit, search)) + "*")
+            filters.append(f"or(cnpj.ilike.{term},cnpj.ilike.{digits})")
+        else:
+            filters.append(f"or(cnpj.ilike.{term},razao_social.ilike.{term})")
+    if after and len(after) == 2:
+        op = "lt" if desc else "gt"
+        value, last_id = _pgrst_quote(after[0]), _pgrst_quote(after[1])
+        filters.append(f"or({sort}.{op}.{value},and({sort}.eq.{value},id.{op}.{last_id}))")
+    if filters:
+        query = query.or_(f"and({','.join(filters)})")
+
+    result = query.order(sort, desc=desc).order("id", desc=desc).limit(limit + 1).execute()
+    rows = result.data
+    items = rows[:limit]
+    has_more = len(rows) > limit
+
+    return {
+        "items": items,
+        "next_cursor": encode_cursor([items[-1].get(sort), items[-1]["id"]]) if has_more else None,
+        "total_estimate": result.count if result.count is not None else len(items),
+    }
+
+
 def get_empresa_by_id(empresa_id: str) -> dict | None:
     """Get a single empresa by ID."""
     if DEMO_MODE:
@@ -158,35 +329,39 @@ def get_empresa_by_cnpj(cnpj: str) -> dict | None:
     return result.data[0] if result.data else None
 
 
+def _demo_empresa_record(data: dict) -> dict:
+    """Build a DEMO-mode empresa row with server-side defaults."""
+    now = datetime.now(timezone.utc).isoformat()
+    return {
+        "id": str(uuid.uuid4()),
+        "cnpj": data.get("cnpj", ""),
+        "razao_social": data.get("razao_social", ""),
+        "inscricao_estadual_pr": data.get("inscricao_estadual_pr"),
+        "email_notificacao": data.get("email_notificacao"),
+        "whatsapp": data.get("whatsapp"),
+        "periodicidade": data.get("periodicidade", "mensal"),
+        "dia_semana": data.get("dia_semana"),
+        "dia_mes": data.get("dia_mes"),
+        "horario": data.get("horario", "08:00:00"),
+        "logradouro": data.get("logradouro"),
+        "numero": data.get("numero"),
+        "complemento": data.get("complemento"),
+        "bairro": data.get("bairro"),
+        "municipio": data.get("municipio"),
+        "uf": data.get("uf"),
+        "cep": data.get("cep"),
+        "ativo": True,
+        "created_at": now,
+        "updated_at": now,
+    }
+
+
 def create_empresa(data: dict) -> dict:
     """Insert a new empresa."""
     if DEMO_MODE:
-        import uuid
-        from datetime import datetime, timezone
-        
-        empresa_mock = {
-            "id": str(uuid.uuid4()),
-            "cnpj": data.get("cnpj", ""),
-            "razao_social": data.get("razao_social", ""),
-            "inscricao_estadual_pr": data.get("inscricao_estadual_pr"),
-            "email_notificacao": data.get("email_notificacao"),
-            "whatsapp": data.get("whatsapp"),
-            "periodicidade": data.get("periodicidade", "mensal"),
-            "dia_semana": data.get("dia_semana"),
-            "dia_mes": data.get("dia_mes"),
-            "horario": data.get("horario", "08:00:00"),
-            "logradouro": data.get("logradouro"),
-            "numero": data.get("numero"),
-            "complemento": data.get("complemento"),
-            "bairro": data.get("bairro"),
-            "municipio": data.get("municipio"),
-            "uf": data.get("uf"),
-            "cep": data.get("cep"),
-            "ativo": True,
-            "created_at": datetime.now(timezone.utc).isoformat(),
-            "updated_at": datetime.now(timezone.utc).isoformat(),
-        }
+        empresa_mock = _demo_empresa_record(data)
         DEMO_EMPRESAS.append(empresa_mock)
+        _demo_reindex_empresa(empresa_mock)
         save_db()
         return empresa_mock
     
@@ -197,6 +372,47 @@ def create_empresa(data: dict) -> dict:
     return result.data[0]
 
 
+def create_empresas_bulk(rows: list[dict]) -> list[dict]:
+    """Insert many empresas in a single write (used by the spreadsheet import)."""
+    if not rows:
+        return []
+
+    if DEMO_MODE:
+        created = [_demo_empresa_record(data) for data in rows]
+        DEMO_EMPRESAS.extend(created)
+        for emp in created:
+            _demo_reindex_empresa(emp)
+        save_db()
+        return created
+
+    sb = get_supabase()
+    if sb is None: return create_empresas_bulk(rows)
+
+    return sb.table("empresas").insert(rows).execute().data
+
+
+def get_existing_cnpjs(cnpjs: list[str]) -> set[str]:
+    """Return which of the given CNPJs (digits only) are already registered."""
+    wanted = {"".join(filter(str.isdigit, c)) for c in cnpjs if c}
+    if not wanted:
+        return set()
+
+    if DEMO_MODE:
+        stored = {"".join(filter(str.isdigit, str(e.get("cnpj", "")))) for e in DEMO_EMPRESAS}
+        return wanted & stored
+
+    sb = get_supabase()
+    if sb is None: return get_existing_cnpjs(cnpjs)
+
+    # CNPJs may be stored either as digits or formatted (XX.XXX.XXX/XXXX-XX)
+    variants = list(wanted)
+    variants += [
+        f"{c[:2]}.{c[2:5]}.{c[5:8]}/{c[8:12]}-{c[12:]}" for c in wanted if len(c) == 14
+    ]
+    result = sb.table("empresas").select("cnpj").in_("cnpj", variants).execute()
+    return {"".join(filter(str.isdigit, r["cnpj"])) for r in result.data} & wanted
+
+
 def update_empresa(empresa_id: str, data: dict) -> dict:
     """Update an empresa."""
     if DEMO_MODE:
@@ -204,6 +420,7 @@ def update_empresa(empresa_id: str, data: dict) -> dict:
             if emp["id"] == empresa_id:
                 updated_emp = {**emp, **data, "updated_at": datetime.now(timezone.utc).isoformat()}
                 DEMO_EMPRESAS[i] = updated_emp
+                _demo_reindex_empresa(updated_emp)
                 save_db()
                 return updated_emp
         raise Exception("Empresa not found in demo mode")
@@ -222,6 +439,7 @@ def delete_empresa(empresa_id: str) -> None:
             if emp["id"] == empresa_id:
                 emp["ativo"] = False
                 emp["updated_at"] = datetime.now(timezone.utc).isoformat()
+                _empresas_sorted.clear()
                 save_db()
                 return
         return
@@ -235,12 +453,15 @@ def delete_empresa(empresa_id: str) -> None:
 def clear_all_empresas() -> None:
     """Hard-delete ALL empresas and associated data."""
     if DEMO_MODE:
-        global DEMO_EMPRESAS, DEMO_CONSULTAS, DEMO_BOLETOS
+        global DEMO_EMPRESAS, DEMO_CONSULTAS, DEMO_BOLETOS, DEMO_LEMBRETES
         DEMO_EMPRESAS = []
         DEMO_CONSULTAS = []
         DEMO_CONSULTAS = []
         DEMO_BOLETOS = []
+        DEMO_LEMBRETES = set()
         DEMO_BILLING_PLANS = []
+        _demo_reset_empresas_index()
+        _demo_reset_boletos_index()
         save_db()
         return
 
@@ -388,6 +609,72 @@ def get_consultas(
     return query.execute().data
 
 
+def get_consultas_page(
+    empresa_id: str | None = None,
+    tipo: str | None = None,
+    status: str | None = None,
+    limit: int = 50,
+    cursor: str | None = None,
+) -> dict:
+    """Keyset-paginated consultas, newest data_agendada first."""
+    after = decode_cursor(cursor)
+
+    if DEMO_MODE:
+        consultas = [
+            c for c in DEMO_CONSULTAS
+            if (not empresa_id or c.get("empresa_id") == empresa_id)
+            and (not tipo or c.get("tipo") == tipo)
+            and (not status or c.get("status") == status)
+        ]
+        keyed = sorted(
+            (((c.get("data_agendada") or ""), c["id"]), c) for c in consultas
+        )
+        keyed.reverse()
+        if after:
+            bound = tuple(after)
+            keyed = [(k, c) for k, c in keyed if k < bound]
+
+        page = keyed[:limit]
+        has_more = len(keyed) > limit
+        return {
+            "items": [c for _, c in page],
+            "next_cursor": encode_cursor(list(page[-1][0])) if has_more else None,
+            "total_estimate": len(consultas),
+        }
+
+    sb = get_supabase()
+    if sb is None: return get_consultas_page(empresa_id, tipo, status, limit, cursor)
+
+    query = sb.table("consultas").select("*, empresas(cnpj, razao_social)", count="estimated")
+    if empresa_id:
+        query = query.eq("empresa_id", empresa_id)
+    if tipo:
+        query = query.eq("tipo", tipo)
+    if status:
+        query = query.eq("status", status)
+    if after and len(after) == 2:
+        value, last_id = _pgrst_quote(after[0]), _pgrst_quote(after[1])
+        query = query.or_(f"data_agendada.lt.{value},and(data_agendada.eq.{value},id.lt.{last_id})")
+
+    result = (
+        query.order("data_agendada", desc=True)
+        .order("id", desc=True)
+        .limit(limit + 1)
+        .execute()
+    )
+    rows = result.data
+    items = rows[:limit]
+    has_more = len(rows) > limit
+
+    return {
+        "items": items,
+        "next_cursor": (
+            encode_cursor([items[-1]["data_agendada"], items[-1]["id"]]) if has_more else None
+        ),
+        "total_estimate": result.count if result.count is not None else len(items),
+    }
+
+
 def get_consulta_by_id(consulta_id: str) -> dict | None:
     """Get a single consulta by ID."""
     if DEMO_MODE:
@@ -465,6 +752,27 @@ def create_log(consulta_id: str, nivel: str, mensagem: str, payload: Any = None)
     sb.table("logs_execucao").insert(data).execute()
 
 
+def create_logs(entries: list[dict]) -> None:
+    """Insert many execution log entries (consulta_id, nivel, mensagem, payload) in one write."""
+    if not entries:
+        return
+    if DEMO_MODE:
+        for entry in entries:
+            print(f"[DEMO LOG] {entry['nivel']}: {entry['mensagem']} (payload={entry.get('payload')})")
+        return
+
+    sb = get_supabase()
+    if sb is None: return create_logs(entries)
+
+    rows = []
+    for entry in entries:
+        row = {"consulta_id": entry["consulta_id"], "nivel": entry["nivel"], "mensagem": entry["mensagem"]}
+        if entry.get("payload"):
+            row["payload"] = entry["payload"]
+        rows.append(row)
+    sb.table("logs_execucao").insert(rows).execute()
+
+
 # ─── RPC calls ───────────────────────────────────────────────────────
 
 def rpc_consultas_por_dia(dias: int = 7) -> list[dict]:
@@ -529,7 +837,81 @@ def rpc_alertas_ativos(limite: int = 20) -> list[dict]:
 
     return sb.rpc("alertas_ativos", {"limite": limite}).execute().data
 
+def _filter_ts(value: datetime) -> str:
+    """UTC timestamp safe to embed in a PostgREST filter string (no '+')."""
+    return value.astimezone(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
 # ─── Boletos ─────────────────────────────────────────────────────────
+# Bradesco (webhook, status queries) identifies a boleto by nosso_numero, so
+# that is the lookup key (idx_boletos_nosso_numero). In DEMO mode, dict
+# indexes over DEMO_BOLETOS play the role of the table indexes, and a rollup
+# plays the role of boleto_aggregates; the boleto dicts are updated in place
+# so the indexes stay valid.
+
+_boletos_by_id: dict[str, dict] = {}
+_boletos_by_nosso_numero: dict[str, dict] = {}
+_boletos_by_fatura: dict[str, dict] = {}
+# (empresa_id, mes, status) -> [quantidade, valor_centavos]
+_boletos_rollup: dict[tuple, list[int]] = {}
+_boletos_index_ready = False
+
+
+def _demo_boletos_index() -> None:
+    """Build the DEMO boleto indexes on first use."""
+    global _boletos_index_ready
+    if not _boletos_index_ready:
+        _boletos_by_id.clear()
+        _boletos_by_nosso_numero.clear()
+        _boletos_by_fatura.clear()
+        _boletos_rollup.clear()
+        for b in DEMO_BOLETOS:
+            _demo_reindex_boleto(b)
+            _demo_rollup(b, 1)
+        _boletos_index_ready = True
+
+
+def _demo_rollup(boleto: dict, sign: int) -> None:
+    """Add (sign=1) or remove (sign=-1) a boleto from the DEMO aggregates."""
+    ref = str(boleto.get("data_vencimento") or boleto.get("created_at") or "")[:7]
+    key = (boleto.get("empresa_id"), f"{ref}-01" if len(ref) == 7 else None, boleto.get("status") or "emitido")
+    entry = _boletos_rollup.setdefault(key, [0, 0])
+    entry[0] += sign
+    entry[1] += sign * int(float(boleto.get("vl_nominal") or 0))
+    if entry[0] == 0:
+        del _boletos_rollup[key]
+
+
+def _demo_update_boleto(boleto: dict, payload: dict) -> None:
+    _demo_rollup(boleto, -1)
+    boleto.update(payload)
+    _demo_rollup(boleto, 1)
+
+
+def _demo_reindex_boleto(boleto: dict) -> None:
+    if boleto.get("id"):
+        _boletos_by_id[boleto["id"]] = boleto
+    if boleto.get("nosso_numero"):
+        _boletos_by_nosso_numero[str(boleto["nosso_numero"])] = boleto
+    if boleto.get("nu_fatura"):
+        _boletos_by_fatura[boleto["nu_fatura"]] = boleto
+
+
+def _demo_reset_boletos_index() -> None:
+    global _boletos_index_ready
+    _boletos_index_ready = False
+
+
+def _boleto_status_payload(status: str, source: str, now: str) -> dict:
+    """Columns set by a status change. Final statuses (pago/baixado) stop the
+    polling; ``source="webhook"`` records that Bradesco pushed the change."""
+    payload = {"status": status, "updated_at": now}
+    if status in ("pago", "baixado"):
+        payload["next_check_at"] = None
+    if source == "webhook":
+        payload["webhook_confirmed_at"] = now
+    return payload
+
 
 def get_boletos_ativos() -> list[dict]:
     """Get all active boletos (emitidos ou atrasados)."""
@@ -552,6 +934,272 @@ def get_boletos_ativos() -> list[dict]:
         .data
     )
 
+def get_boletos_por_vencimento(vencimentos: list[date], status: list[str]) -> list[dict]:
+    """Boletos in these statuses whose vencimento is one of the given days
+    (served by idx_boletos_vencimento), with their empresa contacts."""
+    if DEMO_MODE:
+        dias = {d.isoformat() for d in vencimentos}
+        return [
+            b for b in DEMO_BOLETOS
+            if b.get("status") in status and str(b.get("data_vencimento") or "")[:10] in dias
+        ]
+
+    sb = get_supabase()
+    if sb is None: return get_boletos_por_vencimento(vencimentos, status)
+
+    return (
+        sb.table("boletos")
+        .select("*, empresas(razao_social, email_notificacao, whatsapp)")
+        .in_("data_vencimento", [d.isoformat() for d in vencimentos])
+        .in_("status", status)
+        .execute()
+        .data
+    )
+
+
+def claim_boleto_lembretes(lembretes: list[dict]) -> list[dict]:
+    """Record reminders in the ledger ({boleto_id, data_vencimento, marco});
+    returns only the ones not recorded before, i.e. the ones to send."""
+    if not lembretes:
+        return []
+    if DEMO_MODE:
+        novos = []
+        for lembrete in lembretes:
+            key = (lembrete["boleto_id"], lembrete["data_vencimento"], lembrete["marco"])
+            if key not in DEMO_LEMBRETES:
+                DEMO_LEMBRETES.add(key)
+                novos.append(lembrete)
+        if novos:
+            save_db()
+        return novos
+
+    sb = get_supabase()
+    if sb is None: return claim_boleto_lembretes(lembretes)
+
+    return (
+        sb.table("boleto_lembretes")
+        .upsert(lembretes, on_conflict="boleto_id,data_vencimento,marco", ignore_duplicates=True)
+        .execute()
+        .data
+    )
+
+
+def release_boleto_lembretes(lembretes: list[dict]) -> None:
+    """Drop ledger entries whose reminders could not be queued."""
+    if not lembretes:
+        return
+    if DEMO_MODE:
+        for lembrete in lembretes:
+            DEMO_LEMBRETES.discard((lembrete["boleto_id"], lembrete["data_vencimento"], lembrete["marco"]))
+        save_db()
+        return
+
+    sb = get_supabase()
+    if sb is None: return release_boleto_lembretes(lembretes)
+
+    # A run's reminders with the same marco share the vencimento: one delete per marco
+    por_marco: dict[tuple, list[str]] = {}
+    for lembrete in lembretes:
+        por_marco.setdefault((lembrete["marco"], lembrete["data_vencimento"]), []).append(lembrete["boleto_id"])
+    for (marco, vencimento), ids in por_marco.items():
+        (
+            sb.table("boleto_lembretes")
+            .delete()
+            .eq("marco", marco)
+            .eq("data_vencimento", vencimento)
+            .in_("boleto_id", ids)
+            .execute()
+        )
+
+
+def get_boletos_para_consulta(now: datetime, limit: int | None = None) -> list[dict]:
+    """Active boletos whose next status check is due (never checked first)."""
+    if DEMO_MODE:
+        now_iso = now.isoformat()
+        due = [
+            b for b in DEMO_BOLETOS
+            if b.get("status") in ("emitido", "atraso")
+            and (not b.get("next_check_at") or b["next_check_at"] <= now_iso)
+        ]
+        due.sort(key=lambda b: b.get("next_check_at") or "")
+        return due[:limit] if limit else due
+
+    sb = get_supabase()
+    if sb is None: return get_boletos_para_consulta(now, limit)
+
+    # Served by idx_boletos_next_check (partial index on active boletos)
+    query = (
+        sb.table("boletos")
+        .select("*, empresas(razao_social, email_notificacao, whatsapp)")
+        .in_("status", ["emitido", "atraso"])
+        .or_(f"next_check_at.is.null,next_check_at.lte.{_filter_ts(now)}")
+        .order("next_check_at", nullsfirst=True)
+    )
+    if limit:
+        query = query.limit(limit)
+    return query.execute().data
+
+
+def schedule_boleto_checks(schedule: dict[str | None, list[str]], checked_at: datetime) -> None:
+    """Set next_check_at for many boletos: {next_check_at iso: [boleto ids]}.
+
+    Boletos in the same polling tier share a timestamp, so this is one UPDATE
+    per tier (and per 200 ids) instead of one per boleto.
+    """
+    checked_iso = checked_at.isoformat()
+    if DEMO_MODE:
+        _demo_boletos_index()
+        changed = False
+        for next_at, ids in schedule.items():
+            for bid in ids:
+                b = _boletos_by_id.get(bid)
+                if b is not None:
+                    b["next_check_at"] = next_at
+                    b["last_checked_at"] = checked_iso
+                    changed = True
+        if changed:
+            save_db()
+        return
+
+    sb = get_supabase()
+    if sb is None: return schedule_boleto_checks(schedule, checked_at)
+
+    for next_at, ids in schedule.items():
+        for i in range(0, len(ids), 200):
+            (
+                sb.table("boletos")
+                .update({"next_check_at": next_at, "last_checked_at": checked_iso})
+                .in_("id", ids[i:i + 200])
+                .execute()
+            )
+
+
+def get_boleto_by_fatura(nu_fatura: str) -> dict | None:
+    """Boleto already emitted for an invoice number (idempotency key)."""
+    if DEMO_MODE:
+        _demo_boletos_index()
+        return _boletos_by_fatura.get(nu_fatura)
+
+    sb = get_supabase()
+    if sb is None: return get_boleto_by_fatura(nu_fatura)
+
+    rows = sb.table("boletos").select("*").eq("nu_fatura", nu_fatura).limit(1).execute().data
+    return rows[0] if rows else None
+
+
+def create_boleto(data: dict) -> dict:
+    """Store an emitted boleto; re-storing the same nu_fatura keeps the first row."""
+    if DEMO_MODE:
+        existing = data.get("nu_fatura") and get_boleto_by_fatura(data["nu_fatura"])
+        if existing:
+            return existing
+        now = datetime.now(timezone.utc).isoformat()
+        boleto = {"id": str(uuid.uuid4()), "status": "emitido", "created_at": now, "updated_at": now, **data}
+        DEMO_BOLETOS.append(boleto)
+        if _boletos_index_ready:
+            _demo_reindex_boleto(boleto)
+            _demo_rollup(boleto, 1)
+        save_db()
+        return boleto
+
+    sb = get_supabase()
+    if sb is None: return create_boleto(data)
+
+    rows = sb.table("boletos").upsert(data, on_conflict="nu_fatura", ignore_duplicates=True).execute().data
+    return rows[0] if rows else get_boleto_by_fatura(data["nu_fatura"])
+
+
+def claim_boleto_fatura(data: dict) -> tuple[dict, bool]:
+    """Insert the boleto of an invoice as 'registrando' before it is sent to
+    Bradesco. Returns (row, True) if this call claimed the nu_fatura, or
+    (existing row, False) if it was already emitted or is being registered."""
+    data = {**data, "status": "registrando"}
+    if DEMO_MODE:
+        existing = get_boleto_by_fatura(data["nu_fatura"])
+        if existing:
+            return existing, False
+        return create_boleto(data), True
+
+    sb = get_supabase()
+    if sb is None: return claim_boleto_fatura(data)
+
+    # Unique idx_boletos_nu_fatura: of two concurrent claims only one inserts
+    rows = sb.table("boletos").upsert(data, on_conflict="nu_fatura", ignore_duplicates=True).execute().data
+    if rows:
+        return rows[0], True
+    return get_boleto_by_fatura(data["nu_fatura"]), False
+
+
+def confirm_boleto_fatura(nu_fatura: str, data: dict) -> dict | None:
+    """Mark a claimed invoice as emitted, with Bradesco's nosso_numero / linha digitável."""
+    now = datetime.now(timezone.utc).isoformat()
+    payload = {**data, "status": "emitido", "updated_at": now}
+    if DEMO_MODE:
+        boleto = get_boleto_by_fatura(nu_fatura)
+        if boleto is None or boleto.get("status") != "registrando":
+            return None
+        _demo_update_boleto(boleto, payload)
+        _demo_reindex_boleto(boleto)
+        save_db()
+        return boleto
+
+    sb = get_supabase()
+    if sb is None: return confirm_boleto_fatura(nu_fatura, data)
+
+    rows = (
+        sb.table("boletos")
+        .update(payload)
+        .eq("nu_fatura", nu_fatura)
+        .eq("status", "registrando")
+        .execute()
+        .data
+    )
+    return rows[0] if rows else None
+
+
+def release_boleto_fatura(nu_fatura: str) -> None:
+    """Drop the claim of an invoice that Bradesco refused, so it can be sent again."""
+    if DEMO_MODE:
+        boleto = get_boleto_by_fatura(nu_fatura)
+        if boleto is None or boleto.get("status") != "registrando":
+            return
+        DEMO_BOLETOS.remove(boleto)
+        _boletos_by_fatura.pop(nu_fatura, None)
+        _boletos_by_id.pop(boleto.get("id"), None)
+        _demo_rollup(boleto, -1)
+        save_db()
+        return
+
+    sb = get_supabase()
+    if sb is None: return release_boleto_fatura(nu_fatura)
+
+    sb.table("boletos").delete().eq("nu_fatura", nu_fatura).eq("status", "registrando").execute()
+
+
+def get_boletos_registrando(before: datetime) -> list[dict]:
+    """Invoices claimed before ``before`` and still 'registrando': registrations
+    whose Bradesco answer never arrived or was never saved."""
+    if DEMO_MODE:
+        before_iso = before.isoformat()
+        return [
+            b for b in DEMO_BOLETOS
+            if b.get("status") == "registrando" and (b.get("created_at") or "") < before_iso
+        ]
+
+    sb = get_supabase()
+    if sb is None: return get_boletos_registrando(before)
+
+    # Served by idx_boletos_registrando (partial index)
+    return (
+        sb.table("boletos")
+        .select("*")
+        .eq("status", "registrando")
+        .lt("created_at", _filter_ts(before))
+        .execute()
+        .data
+    )
+
+
 def get_boletos_by_empresa(empresa_id: str) -> list[dict]:
     """Get all boletos for a specific company."""
     if DEMO_MODE:
@@ -562,26 +1210,105 @@ def get_boletos_by_empresa(empresa_id: str) -> list[dict]:
 
     return sb.table("boletos").select("*").eq("empresa_id", empresa_id).execute().data
 
-def update_boleto_status(boleto_id: str, status: str, extra_data: dict = None) -> dict:
-    """Update boleto status."""
-    update_payload = {"status": status, "updated_at": datetime.now(timezone.utc).isoformat()}
+def get_boleto_by_nosso_numero(nosso_numero: str) -> dict | None:
+    """Boleto identified by Bradesco's nosso_numero."""
+    if DEMO_MODE:
+        _demo_boletos_index()
+        return _boletos_by_nosso_numero.get(str(nosso_numero))
+
+    sb = get_supabase()
+    if sb is None: return get_boleto_by_nosso_numero(nosso_numero)
+
+    rows = sb.table("boletos").select("*").eq("nosso_numero", nosso_numero).limit(1).execute().data
+    return rows[0] if rows else None
+
+
+def update_boleto_status(nosso_numero: str, status: str, extra_data: dict = None, source: str = "polling") -> dict | None:
+    """Update the status of the boleto with this nosso_numero; None if there is none."""
+    now = datetime.now(timezone.utc).isoformat()
+    update_payload = _boleto_status_payload(status, source, now)
     if extra_data:
         # Merge extra data into a 'bradesco_metadata' column if it exists, or just specific fields
         # For simple storage, let's assume we update metadata if column exists
         pass 
     if DEMO_MODE:
-        for i, b in enumerate(DEMO_BOLETOS):
-            if b["id"] == boleto_id:
-                updated = {**b, **update_payload}
-                DEMO_BOLETOS[i] = updated
-                save_db()
-                return updated
-        return {}
+        _demo_boletos_index()
+        boleto = _boletos_by_nosso_numero.get(str(nosso_numero))
+        if boleto is None:
+            return None
+        _demo_update_boleto(boleto, update_payload)
+        save_db()
+        return boleto
 
     sb = get_supabase()
-    if sb is None: return update_boleto_status(boleto_id, status, extra_data)
+    if sb is None: return update_boleto_status(nosso_numero, status, extra_data, source)
 
-    return sb.table("boletos").update(update_payload).eq("id", boleto_id).execute().data[0]
+    rows = sb.table("boletos").update(update_payload).eq("nosso_numero", nosso_numero).execute().data
+    return rows[0] if rows else None
+
+
+def update_boletos_status(changes: dict[str, list[str]], source: str = "polling") -> int:
+    """Set the status of many boletos: {status: [nosso_numero]}.
+
+    One UPDATE per status (and per 200 boletos) instead of one per boleto;
+    returns how many boletos were updated.
+    """
+    now = datetime.now(timezone.utc).isoformat()
+    if DEMO_MODE:
+        _demo_boletos_index()
+        updated = 0
+        for status, numbers in changes.items():
+            payload = _boleto_status_payload(status, source, now)
+            for nosso_numero in numbers:
+                boleto = _boletos_by_nosso_numero.get(str(nosso_numero))
+                if boleto is not None:
+                    _demo_update_boleto(boleto, payload)
+                    updated += 1
+        if updated:
+            save_db()
+        return updated
+
+    sb = get_supabase()
+    if sb is None: return update_boletos_status(changes, source)
+
+    updated = 0
+    for status, numbers in changes.items():
+        payload = _boleto_status_payload(status, source, now)
+        for i in range(0, len(numbers), 200):
+            rows = (
+                sb.table("boletos")
+                .update(payload)
+                .in_("nosso_numero", numbers[i:i + 200])
+                .execute()
+                .data
+            )
+            updated += len(rows)
+    return updated
+
+
+def get_boleto_aggregates(empresa_id: str | None = None, mes: str | None = None) -> list[dict]:
+    """Boleto counts/amounts per (empresa, mês, status), optionally filtered.
+
+    ``mes`` is the first day of the month (YYYY-MM-01). Reads the maintained
+    aggregates, never the boletos themselves.
+    """
+    if DEMO_MODE:
+        _demo_boletos_index()
+        return [
+            {"empresa_id": emp, "mes": m, "status": status, "quantidade": qtd, "valor_centavos": valor}
+            for (emp, m, status), (qtd, valor) in _boletos_rollup.items()
+            if (empresa_id is None or emp == empresa_id) and (mes is None or m == mes)
+        ]
+
+    sb = get_supabase()
+    if sb is None: return get_boleto_aggregates(empresa_id, mes)
+
+    query = sb.table("boleto_aggregates").select("empresa_id, mes, status, quantidade, valor_centavos")
+    if empresa_id:
+        query = query.eq("empresa_id", empresa_id)
+    if mes:
+        query = query.eq("mes", mes)
+    return query.gt("quantidade", 0).execute().data
 
 
 # ─── Billing Plans ───────────────────────────────────────────────────
@@ -651,3 +1378,127 @@ def update_billing_plan(plan_id: str, data: dict) -> dict:
     
     return sb.table("billing_plans").update(data).eq("id", plan_id).execute().data[0]
 
+
+# "Not claimed" value of billing_plans.claimed_until (an expired lease is free too)
+BILLING_CLAIM_EPOCH = "1970-01-01T00:00:00+00:00"
+
+
+def get_billing_plans_pendentes(month_start: datetime) -> list[dict]:
+    """Active plans not processed since ``month_start``, with their empresa
+    embedded under "empresas" (one query instead of one lookup per plan)."""
+    if DEMO_MODE:
+        month_iso = month_start.isoformat()
+        empresas = {e.get("id"): e for e in DEMO_EMPRESAS}
+        return [
+            {**p, "empresas": empresas.get(p.get("empresa_id"))}
+            for p in DEMO_BILLING_PLANS
+            if p.get("ativo", True) and (not p.get("ultimo_processamento") or p["ultimo_processamento"] < month_iso)
+        ]
+
+    sb = get_supabase()
+    if sb is None: return get_billing_plans_pendentes(month_start)
+
+    return (
+        sb.table("billing_plans")
+        .select("*, empresas(*)")
+        .eq("ativo", True)
+        .or_(f"ultimo_processamento.is.null,ultimo_processamento.lt.{_filter_ts(month_start)}")
+        .execute()
+        .data
+    )
+
+
+def claim_billing_plans(plan_ids: list[str], owner: str, now: datetime, lease_seconds: int,
+                        month_start: datetime) -> list[str]:
+    """Claim plans for this run with a conditional update; returns the ids won.
+
+    A plan is claimable if no live lease exists and it was not processed this
+    month, so replicas running the job at the same time never bill twice.
+    """
+    if not plan_ids:
+        return []
+    lease_until = (now + timedelta(seconds=lease_seconds)).isoformat()
+
+    if DEMO_MODE:
+        now_iso, month_iso, wanted = now.isoformat(), month_start.isoformat(), set(plan_ids)
+        claimed = []
+        for p in DEMO_BILLING_PLANS:
+            if (
+                p["id"] in wanted
+                and (p.get("claimed_until") or BILLING_CLAIM_EPOCH) < now_iso
+                and (not p.get("ultimo_processamento") or p["ultimo_processamento"] < month_iso)
+            ):
+                p["claimed_by"], p["claimed_until"] = owner, lease_until
+                claimed.append(p["id"])
+        if claimed:
+            save_db()
+        return claimed
+
+    sb = get_supabase()
+    if sb is None: return claim_billing_plans(plan_ids, owner, now, lease_seconds, month_start)
+
+    claimed = []
+    for i in range(0, len(plan_ids), 200):
+        rows = (
+            sb.table("billing_plans")
+            .update({"claimed_by": owner, "claimed_until": lease_until})
+            .in_("id", plan_ids[i:i + 200])
+            .lt("claimed_until", _filter_ts(now))
+            .or_(f"ultimo_processamento.is.null,ultimo_processamento.lt.{_filter_ts(month_start)}")
+            .execute()
+            .data
+        )
+        claimed.extend(r["id"] for r in rows)
+    return claimed
+
+
+def finish_billing_plans(processed_ids: list[str], released_ids: list[str], processed_at: datetime) -> None:
+    """Mark plans billed (one UPDATE) and release the claims of the others."""
+    done = {"ultimo_processamento": processed_at.isoformat(), "claimed_by": None, "claimed_until": BILLING_CLAIM_EPOCH}
+    release = {"claimed_by": None, "claimed_until": BILLING_CLAIM_EPOCH}
+
+    if DEMO_MODE:
+        processed, released = set(processed_ids), set(released_ids)
+        for p in DEMO_BILLING_PLANS:
+            if p["id"] in processed:
+                p.update(done)
+            elif p["id"] in released:
+                p.update(release)
+        if processed or released:
+            save_db()
+        return
+
+    sb = get_supabase()
+    if sb is None: return finish_billing_plans(processed_ids, released_ids, processed_at)
+
+    for ids, data in ((processed_ids, done), (released_ids, release)):
+        for i in range(0, len(ids), 200):
+            sb.table("billing_plans").update(data).in_("id", ids[i:i + 200]).execute()
+
+
+# ─── App Settings ────────────────────────────────────────────────────
+
+def get_app_settings() -> dict | None:
+    """Get the shared settings row ({data, updated_at}). None in DEMO mode."""
+    if DEMO_MODE:
+        return None
+
+    sb = get_supabase()
+    if sb is None: return get_app_settings()
+
+    result = sb.table("app_settings").select("data, updated_at").eq("id", "global").execute()
+    return result.data[0] if result.data else None
+
+def save_app_settings(data: dict) -> None:
+    """Upsert the shared settings row. No-op in DEMO mode (settings.json is used)."""
+    if DEMO_MODE:
+        return
+
+    sb = get_supabase()
+    if sb is None: return save_app_settings(data)
+
+    sb.table("app_settings").upsert({
+        "id": "global",
+        "data": data,
+        "updated_at": datetime.now(timezone.utc).isoformat(),
+    }).execute()
@@ -15,10 +15,18 @@ from fastapi.middleware.cors import CORSMiddleware
 from app.config import settings
 from app.routes import empresas, consultas, dashboard, query, pdf, cobrancas, comunicacoes
 from app.services.scheduler import process_pending_queries, create_daily_schedules
-from app.services.monitoring import monitor_boletos
+from app.services.monitoring import monitor_boletos, monitor_stats
 from app.services.billing import billing_service
+from app.services.boleto_service import boleto_service
+from app.services.bradesco import bradesco_service
 from app.services.boleto_scheduler import check_boleto_vencimentos
 from app.services.notification_queue import notification_queue
+from app.services.webhook_inbox import webhook_inbox
+from app.services.notifications import notification_service
+from app.services.settings import dynamic_settings
+from app.services.templates import template_engine
+from app.services.pdf_cache import pdf_cache
+from app.services.pdf_batch import pdf_batch_jobs
 
 # ─── Logging ─────────────────────────────────────────────────────────
 
@@ -34,18 +42,46 @@ logger = logging.getLogger(__name__)
 scheduler = AsyncIOScheduler()
 
 _queue_task: asyncio.Task | None = None
+_settings_task: asyncio.Task | None = None
+_webhook_task: asyncio.Task | None = None
+
+# Jobs that only do work while the robot is enabled
+ROBOT_JOB_IDS = ("process_pending", "daily_schedules")
+
+
+def _apply_settings(changed: dict, current: dict) -> None:
+    """Settings subscriber: pause/resume robot jobs and notification delivery."""
+    if "robo_ativo" in changed:
+        for job_id in ROBOT_JOB_IDS:
+            job = scheduler.get_job(job_id)
+            if job is None:
+                continue
+            if current.get("robo_ativo", True):
+                job.resume()
+            else:
+                job.pause()
+        logger.info(f"🤖 Robô {'ativado' if current.get('robo_ativo', True) else 'pausado'}.")
+
+    if "mensagens_ativas" in changed:
+        notification_queue.set_paused(not current.get("mensagens_ativas", True))
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Startup/shutdown lifecycle manager."""
-    global _queue_task
+    global _queue_task, _settings_task, _webhook_task
 
     logger.info("🚀 IAudit starting up...")
 
     # ── Start Notification Queue Worker ──────────────────────────────
     _queue_task = asyncio.create_task(notification_queue.start_worker())
     logger.info("📬 Notification queue worker started.")
+    _webhook_task = asyncio.create_task(webhook_inbox.run())
+    logger.info("📥 Webhook inbox processor started.")
+    try:
+        await notification_service.restore_quota_usage()
+    except Exception as e:
+        logger.warning(f"Could not restore today's notification quota usage: {e}")
 
     # Job 1: Process pending queries every N minutes
     scheduler.add_job(
@@ -75,6 +111,8 @@ async def lifespan(app: FastAPI):
         id="monitor_boletos",
         name="Monitor Boletos Status",
         replace_existing=True,
+        max_instances=1,
+        coalesce=True,
     )
 
     # Job 4: Process Recurring Billing (Daily at 06:00)
@@ -84,6 +122,7 @@ async def lifespan(app: FastAPI):
         id="recurring_billing",
         name="Process Recurring Billing",
         replace_existing=True,
+        max_instances=1,
     )
 
     # Job 5: D-1 / D+1 Vencimento Alerts (Daily at configured hour)
@@ -98,7 +137,38 @@ async def lifespan(app: FastAPI):
         replace_existing=True,
     )
 
+    # Job 6: Keep pooled SMTP sessions healthy (NOOP / drop idle)
+    scheduler.add_job(
+        notification_service.email.maintain,
+        trigger=IntervalTrigger(seconds=settings.smtp_noop_interval_seconds),
+        id="smtp_keepalive",
+        name="SMTP Pool Health Check",
+        replace_existing=True,
+    )
+
+    # Job 7: Settle invoices left in 'registrando' by unanswered registrations
+    scheduler.add_job(
+        boleto_service.conciliar_registros,
+        trigger=IntervalTrigger(minutes=settings.boleto_registro_conciliacao_minutes),
+        id="conciliar_registros",
+        name="Reconcile Pending Boleto Registrations",
+        replace_existing=True,
+        max_instances=1,
+    )
+
     scheduler.start()
+
+    # ── React to dynamic settings changes ────────────────────────────
+    try:
+        await asyncio.to_thread(dynamic_settings.refresh)
+    except Exception as e:
+        logger.warning(f"Could not load dynamic settings, using the local file: {e}")
+    dynamic_settings.subscribe(_apply_settings)
+    current = dynamic_settings.get_settings()
+    _apply_settings(current, current)
+    template_engine.load_overrides(current)
+    _settings_task = asyncio.create_task(dynamic_settings.watch())
+
     logger.info(
         f"📅 Scheduler started: polling every {settings.scheduler_poll_interval_minutes}min, "
         f"daily at {settings.scheduler_daily_hour:02d}:{settings.scheduler_daily_minute:02d}, "
@@ -108,9 +178,20 @@ async def lifespan(app: FastAPI):
     yield
 
     # Shutdown
+    if _settings_task:
+        _settings_task.cancel()
+    dynamic_settings.unsubscribe(_apply_settings)
+    await notification_service.flush()
     notification_queue.stop_worker()
     if _queue_task:
         _queue_task.cancel()
+    webhook_inbox.stop()
+    if _webhook_task:
+        _webhook_task.cancel()
+    await notification_service.aclose()
+    await bradesco_service.aclose()
+    pdf_batch_jobs.stop()
+    pdf.shutdown_render_pool()
     scheduler.shutdown(wait=False)
     logger.info("🛑 IAudit shutting down...")
 
@@ -169,4 +250,12 @@ def api_health():
         "scheduler_running": scheduler.running,
         "jobs": jobs,
         "notification_queue": notification_queue.stats,
+        "notification_coalescer": notification_service.coalescer.stats,
+        "rate_limits": notification_service.rate_limits,
+        "boleto_monitor": monitor_stats(),
+        "bradesco": bradesco_service.stats,
+        "billing": billing_service.last_report,
+        "webhook_inbox": webhook_inbox.stats,
+        "pdf_cache": pdf_cache.stats,
+        "pdf_batches": pdf_batch_jobs.stats,
     }
@@ -107,6 +107,12 @@ class EmpresaResponse(BaseModel):
     updated_at: str | None = None
 
 
+class EmpresaPage(BaseModel):
+    items: list[EmpresaResponse] = Field(default_factory=list)
+    next_cursor: str | None = None
+    total_estimate: int = 0
+
+
 # ─── Consulta ────────────────────────────────────────────────────────
 
 class ConsultaResponse(BaseModel):
@@ -126,6 +132,12 @@ class ConsultaResponse(BaseModel):
     empresas: dict | None = None  # joined data
 
 
+class ConsultaPage(BaseModel):
+    items: list[ConsultaResponse] = Field(default_factory=list)
+    next_cursor: str | None = None
+    total_estimate: int = 0
+
+
 # ─── Dashboard ───────────────────────────────────────────────────────
 
 class DashboardStats(BaseModel):
@@ -1,10 +1,15 @@
-from fastapi import APIRouter, HTTPException, Depends, BackgroundTasks, Request
+import json
+
+from fastapi import APIRouter, HTTPException, Depends, BackgroundTasks, Request, Query
+from fastapi.responses import StreamingResponse
 from app.models import BoletoCreate, BoletoResponse, StatusBoleto
 from pydantic import BaseModel
 
 from app.services.bradesco import bradesco_service
+from app.services.boleto_service import boleto_service
 from app.services.notifications import send_boleto_notification
-from app.database import update_boleto_status, create_log
+from app.services.monitoring import record_webhook
+from app.services.webhook_inbox import webhook_inbox, extract_nosso_numero
 import logging
 
 logger = logging.getLogger(__name__)
@@ -13,32 +18,58 @@ router = APIRouter()
 
 @router.post("/registrar", response_model=dict)
 async def registrar_boleto(data: BoletoCreate):
-    """Registers a new boleto with Bradesco and stores the result."""
+    """Registers a new boleto with Bradesco and stores the result.
+
+    Goes through BoletoService, so the boleto is stored (keyed on nuFatura)
+    and later found by the webhook and the status polling."""
     try:
-        email = data.pagador_email
-        phone = data.pagador_whatsapp or data.pagador_celular
+        resp = await boleto_service.emitir_boleto(data.model_dump(exclude_none=True))
+    except Exception as e:
+        logger.error(f"Error registering boleto: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
 
-        resp = await bradesco_service.register_boleto(
-            data.model_dump(exclude_none=True), recipient_email=email, recipient_phone=phone
+    if not resp.get("sucesso"):
+        raise HTTPException(
+            status_code=409 if resp.get("em_registro") else 400,
+            detail=resp.get("erro", "Erro ao registrar boleto"),
         )
 
-        if resp.get("cdErro", 0) != 0:
-            raise HTTPException(
-                status_code=400,
-                detail=resp.get("msgErro", "Erro ao registrar boleto"),
-            )
+    return {
+        "status": "sucesso",
+        "nosso_numero": resp.get("nosso_numero"),
+        "linha_digitavel": resp.get("linha_digitavel"),
+        "ja_emitido": bool(resp.get("ja_emitido")),
+        "bradesco_response": resp.get("bradesco_response"),
+    }
 
-        return {
-            "status": "sucesso",
-            "nosso_numero": resp.get("nuNossoNumero"),
-            "linha_digitavel": resp.get("linhaDigitavel"),
-            "bradesco_response": resp,
-        }
-    except HTTPException:
-        raise
-    except Exception as e:
-        logger.error(f"Error registering boleto: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
+
+class LoteRequest(BaseModel):
+    boletos: list[BoletoCreate]
+    usuario_id: str = "system"
+
+
+@router.post("/lote", response_model=dict)
+async def emitir_lote(data: LoteRequest):
+    """Registers many boletos at once. Safe to resend: invoices (nuFatura)
+    that already have a boleto are not registered again."""
+    boletos = [b.model_dump(exclude_none=True) for b in data.boletos]
+    resp = await boleto_service.emitir_lote(boletos, data.usuario_id)
+    if not resp.get("sucesso"):
+        raise HTTPException(status_code=400, detail=resp.get("erro"))
+    return resp
+
+
+@router.post("/lote/stream")
+async def emitir_lote_stream(data: LoteRequest):
+    """Same as /lote, streaming one NDJSON line per boleto as it is registered
+    and a final {"resumo": ...} line."""
+    boletos = [b.model_dump(exclude_none=True) for b in data.boletos]
+
+    async def ndjson():
+        async for evento in boleto_service.emitir_lote_stream(boletos, data.usuario_id):
+            yield json.dumps(evento, default=str, ensure_ascii=False) + "\n"
+
+    return StreamingResponse(ndjson(), media_type="application/x-ndjson")
 
 
 @router.post("/billing/run-now")
@@ -50,6 +81,15 @@ async def run_billing_now(background_tasks: BackgroundTasks):
     return {"message": "Billing job started in background"}
 
 
+@router.get("/estatisticas")
+async def estatisticas_cobranca(
+    empresa_id: str | None = None,
+    mes: str | None = Query(None, pattern=r"^\d{4}-\d{2}$", description="Mês de vencimento (YYYY-MM)"),
+):
+    """Billing statistics (totals and per month) from the precomputed aggregates."""
+    return await boleto_service.obter_estatisticas(empresa_id, f"{mes}-01" if mes else None)
+
+
 @router.get("/{nosso_numero}/status")
 async def consultar_status(nosso_numero: str):
     """Checks the status of a specific boleto."""
@@ -72,99 +112,63 @@ async def consultar_status(nosso_numero: str):
 @router.post("/webhook")
 async def bradesco_webhook(request: Request):
     """
-    Process Bradesco webhook events (pagamento, baixa, etc.).
-
-    Bradesco sends status updates here for registered boletos.
-    Key status codes:
-      - 13: Pago no dia (liquidação no dia)
-      - 61: Baixa - Título Pago
-      - 06: Liquidado
-      - 02: Baixado / Devolvido
+    Receive Bradesco webhook events (pagamento, baixa, etc.).
+
+    The raw event is appended to the webhook inbox (deduplicated on
+    nosso_numero + cdSituacaoTitulo + timestamp) and acknowledged right away;
+    the inbox processor applies it in the background, in order per boleto.
+    If the event cannot be stored the answer is 503, so Bradesco resends it.
     """
     try:
         data = await request.json()
         logger.info(f"Webhook received: {data}")
+        record_webhook()
 
-        nosso_numero = (
-            data.get("nuNossoNumero")
-            or data.get("nossoNumero")
-            or data.get("titulo", {}).get("nuNossoNumero")
-        )
-
-        if not nosso_numero:
+        if not extract_nosso_numero(data):
             logger.warning("Webhook without nosso_numero, ignoring.")
             return {"status": "ignored", "reason": "missing nosso_numero"}
-
-        status_codigo = str(
-            data.get("cdSituacaoTitulo")
-            or data.get("titulo", {}).get("cdSituacaoTitulo", "")
-        )
-
-        # ── Payment Confirmed ────────────────────────────────────────
-        if status_codigo in ("13", "61", "06"):
-            logger.info(f"Webhook: Payment confirmed for {nosso_numero}")
-
-            try:
-                update_boleto_status(nosso_numero, "pago", data)
-            except Exception as e:
-                logger.error(f"DB update failed for {nosso_numero}: {e}")
-
-            # Extract recipient info from webhook or DB
-            pagador_nome = (
-                data.get("pagador", {}).get("nome")
-                or data.get("titulo", {}).get("nmPagador", "Cliente")
-            )
-            valor = data.get("vlNominalTitulo") or data.get(
-                "titulo", {}).get("vlNominalTitulo", 0
-            )
-            email = data.get("pagador", {}).get("email")
-            phone = data.get("pagador", {}).get("celular")
-
-            await send_boleto_notification(
-                "pago",
-                {
-                    "nomeSacado": pagador_nome,
-                    "valorNominal": valor,
-                    "dataVencimento": data.get("dtVencimentoTitulo", ""),
-                },
-                email,
-                phone,
-            )
-
-            create_log(
-                consulta_id="WEBHOOK_PAGO",
-                nivel="INFO",
-                mensagem=f"Pagamento confirmado via webhook: {nosso_numero}",
-                payload=data,
-            )
-
-            return {"status": "processed", "event": "payment_confirmed"}
-
-        # ── Baixado / Devolvido ──────────────────────────────────────
-        if status_codigo == "02":
-            logger.info(f"Webhook: Boleto baixado/devolvido: {nosso_numero}")
-            try:
-                update_boleto_status(nosso_numero, "baixado", data)
-            except Exception as e:
-                logger.error(f"DB update failed: {e}")
-
-            create_log(
-                consulta_id="WEBHOOK_BAIXA",
-                nivel="INFO",
-                mensagem=f"Boleto baixado via webhook: {nosso_numero}",
-                payload=data,
-            )
-
-            return {"status": "processed", "event": "baixa"}
-
-        # ── Unknown status ───────────────────────────────────────────
-        logger.info(f"Webhook: unhandled status {status_codigo} for {nosso_numero}")
-        return {"status": "received", "unhandled_status": status_codigo}
-
     except Exception as e:
         logger.error(f"Webhook processing error: {e}")
         return {"status": "error", "detail": str(e)}
 
+    try:
+        event_id, duplicate = await webhook_inbox.ingest(data)
+    except Exception as e:
+        # Not stored: make Bradesco redeliver it
+        logger.error(f"Webhook could not be stored in the inbox: {e}")
+        raise HTTPException(status_code=503, detail="Evento não armazenado, reenviar")
+    return {"status": "duplicate" if duplicate else "accepted", "event_id": event_id}
+
+
+@router.get("/webhook/inbox")
+async def listar_webhook_inbox(
+    status: str | None = Query(None, description="pending | processed | failed"),
+    nosso_numero: str | None = None,
+    limit: int = Query(100, ge=1, le=1000),
+    offset: int = Query(0, ge=0),
+):
+    """Lists the received webhook events, newest first."""
+    return await webhook_inbox.list_events(status, nosso_numero, limit, offset)
+
+
+@router.post("/webhook/replay")
+async def reprocessar_webhooks(
+    status: str = Query("failed", description="Events to replay: failed | processed"),
+    nosso_numero: str | None = None,
+):
+    """Processes the webhook events again (default: every failed event)."""
+    replayed = await webhook_inbox.replay(nosso_numero=nosso_numero, status=status)
+    return {"status": "success", "replayed": replayed}
+
+
+@router.post("/webhook/{event_id}/replay")
+async def reprocessar_webhook(event_id: int):
+    """Processes a single webhook event again."""
+    replayed = await webhook_inbox.replay([event_id], status=None)
+    if not replayed:
+        raise HTTPException(status_code=404, detail="Evento não encontrado no inbox de webhooks")
+    return {"status": "success", "replayed": replayed}
+
 
 # ═══════════════════════════════════════════════════════════════════════
 # ESTORNO (Reactivation)
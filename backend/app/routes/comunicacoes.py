@@ -1,6 +1,8 @@
+from datetime import datetime, timedelta
 from fastapi import APIRouter, HTTPException, Query
 from typing import List, Dict, Any
 from app.services.comunicacao import comm_service
+from app.services.notification_queue import notification_queue
 from app.services.settings import dynamic_settings
 
 router = APIRouter(prefix="/api/comunicacao", tags=["Comunicação"])
@@ -8,23 +10,50 @@ router = APIRouter(prefix="/api/comunicacao", tags=["Comunicação"])
 @router.get("/logs", response_model=List[Dict[str, Any]])
 async def get_comm_logs(
     channel: str = Query(None, description="Filtrar por canal (email, whatsapp)"),
-    status: str = Query(None, description="Filtrar por status (sent, failed, pending)")
+    status: str = Query(None, description="Filtrar por status (sent, failed, pending)"),
+    recipient: str = Query(None, description="Filtrar por destinatário (contém)"),
+    since: datetime = Query(None, description="Início do período (ISO 8601)"),
+    until: datetime = Query(None, description="Fim do período (ISO 8601, exclusivo)"),
+    limit: int = Query(500, ge=1, le=5000),
+    offset: int = Query(0, ge=0),
 ):
     """
-    Returns the list of communication logs.
+    Returns the list of communication logs, newest first.
     """
     try:
-        return await comm_service.get_logs(channel=channel, status=status)
+        return await comm_service.get_logs(
+            channel=channel, status=status, recipient=recipient,
+            since=since, until=until, limit=limit, offset=offset,
+        )
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("/stats", response_model=Dict[str, Any])
-async def get_comm_stats():
+async def get_comm_stats(
+    since: datetime = Query(None, description="Início do período (ISO 8601)"),
+    until: datetime = Query(None, description="Fim do período (ISO 8601, exclusivo)"),
+):
     """
-    Returns communication success/failure metrics.
+    Returns communication success/failure metrics (lifetime or for a period).
     """
     try:
-        return await comm_service.get_stats()
+        return await comm_service.get_stats(since=since, until=until)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/stats/timeseries", response_model=List[Dict[str, Any]])
+async def get_comm_timeseries(
+    since: datetime = Query(None, description="Início do período (padrão: últimas 24h)"),
+    until: datetime = Query(None, description="Fim do período (ISO 8601, exclusivo)"),
+    bucket: str = Query("hour", pattern="^(hour|day)$"),
+    channel: str = Query(None, description="Filtrar por canal (email, whatsapp)"),
+):
+    """
+    Returns sent/failed totals per hour or per day.
+    """
+    try:
+        since = since or datetime.now() - timedelta(hours=24)
+        return await comm_service.get_timeseries(since=since, until=until, bucket=bucket, channel=channel)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -41,7 +70,7 @@ async def update_system_settings(new_settings: Dict[str, Any]):
     Updates dynamic system settings.
     """
     try:
-        return dynamic_settings.update_settings(new_settings)
+        return await dynamic_settings.aupdate_settings(new_settings)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -55,3 +84,37 @@ async def clear_comm_logs():
         return {"status": "success", "message": "Logs cleared"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/dead-letters", response_model=List[Dict[str, Any]])
+async def get_dead_letters(
+    limit: int = Query(100, ge=1, le=1000),
+    offset: int = Query(0, ge=0),
+):
+    """
+    Returns notifications that exhausted their retries.
+    """
+    try:
+        return await notification_queue.list_dead_letters(limit=limit, offset=offset)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/dead-letters/replay")
+async def replay_all_dead_letters():
+    """
+    Re-enqueues every dead-letter notification.
+    """
+    try:
+        replayed = await notification_queue.replay_dead_letters()
+        return {"status": "success", "replayed": replayed}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/dead-letters/{task_id}/replay")
+async def replay_dead_letter(task_id: str):
+    """
+    Re-enqueues a single dead-letter notification.
+    """
+    replayed = await notification_queue.replay_dead_letters(task_id)
+    if not replayed:
+        raise HTTPException(status_code=404, detail="Notificação não encontrada na fila de falhas")
+    return {"status": "success", "replayed": replayed}
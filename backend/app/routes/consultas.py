@@ -4,8 +4,8 @@ from __future__ import annotations
 
 from fastapi import APIRouter, HTTPException, Query
 
-from app.database import get_consultas, get_consulta_by_id
-from app.models import ConsultaResponse
+from app.database import get_consultas, get_consultas_page, get_consulta_by_id
+from app.models import ConsultaResponse, ConsultaPage
 
 router = APIRouter(prefix="/api/consultas", tags=["Consultas"])
 
@@ -28,6 +28,24 @@ def list_consultas(
     )
 
 
+@router.get("/page", response_model=ConsultaPage)
+def list_consultas_page(
+    empresa_id: str | None = None,
+    tipo: str | None = None,
+    status: str | None = None,
+    limit: int = Query(50, ge=1, le=200),
+    cursor: str | None = None,
+):
+    """List consultas (newest first) with keyset pagination."""
+    return get_consultas_page(
+        empresa_id=empresa_id,
+        tipo=tipo,
+        status=status,
+        limit=limit,
+        cursor=cursor,
+    )
+
+
 @router.get("/{consulta_id}", response_model=ConsultaResponse)
 def get_consulta(consulta_id: str):
     """Get a single consulta with full details."""
@@ -2,18 +2,22 @@
 
 from __future__ import annotations
 
-import io
 import logging
 from datetime import datetime, timezone
 
-import pandas as pd
 from fastapi import APIRouter, HTTPException, UploadFile, File, Query
+from fastapi.concurrency import run_in_threadpool
+
+from app.config import settings
 
 from app.database import (
     get_empresas,
+    get_empresas_page,
     get_empresa_by_id,
     get_empresa_by_cnpj,
     create_empresa,
+    create_empresas_bulk,
+    get_existing_cnpjs,
     update_empresa,
     delete_empresa,
     clear_all_empresas,
@@ -23,10 +27,12 @@ from app.models import (
     EmpresaCreate,
     EmpresaUpdate,
     EmpresaResponse,
+    EmpresaPage,
     UploadResult,
     ForceQueryRequest,
 )
 from app.services.cnpj import validate_cnpj, clean_cnpj
+from app.services.spreadsheet import iter_spreadsheet_chunks
 
 logger = logging.getLogger(__name__)
 router = APIRouter(prefix="/api/empresas", tags=["Empresas"])
@@ -43,6 +49,24 @@ def list_empresas(
     return get_empresas(ativo=ativo, search=search, limit=limit, offset=offset)
 
 
+@router.get("/page", response_model=EmpresaPage)
+def list_empresas_page(
+    ativo: bool | None = None,
+    search: str | None = None,
+    limit: int = Query(50, ge=1, le=500),
+    cursor: str | None = None,
+    sort: str = Query("razao_social", pattern="^(razao_social|cnpj|created_at)$"),
+    desc: bool = False,
+):
+    """List empresas with keyset pagination, trigram search and sorting.
+
+    Pass the returned ``next_cursor`` back as ``cursor`` to fetch the next page.
+    """
+    return get_empresas_page(
+        ativo=ativo, search=search, limit=limit, cursor=cursor, sort=sort, desc=desc
+    )
+
+
 @router.get("/{empresa_id}", response_model=EmpresaResponse)
 def get_empresa(empresa_id: str):
     """Get a single empresa by ID."""
@@ -123,6 +147,104 @@ def force_query(empresa_id: str, request: ForceQueryRequest):
     return {"message": f"{len(created)} consulta(s) agendada(s)", "consultas": created}
 
 
+def _add_upload_error(result: UploadResult, message: str) -> None:
+    """Record an import error, keeping the list bounded for huge files."""
+    if len(result.erros) < settings.upload_max_errors:
+        result.erros.append(message)
+    elif len(result.erros) == settings.upload_max_errors:
+        result.erros.append("Demais erros omitidos.")
+
+
+def _import_chunk(
+    rows: list[dict],
+    result: UploadResult,
+    periodicidade: str,
+    horario: str,
+) -> None:
+    """Validate a chunk of spreadsheet rows and insert the new empresas in bulk."""
+    candidates: dict[str, dict] = {}
+
+    for row in rows:
+        result.total += 1
+        cnpj_raw = str(row.get("cnpj", "") or "")
+        cnpj = clean_cnpj(cnpj_raw)
+        razao = str(row.get("razao_social", "") or "").strip()
+
+        if not cnpj or not razao:
+            result.invalidas += 1
+            _add_upload_error(result, f"Linha vazia: CNPJ={cnpj_raw}")
+            continue
+
+        if not validate_cnpj(cnpj):
+            result.invalidas += 1
+            _add_upload_error(result, f"CNPJ inválido: {cnpj_raw}")
+            continue
+
+        # Repeated inside the same chunk
+        if cnpj in candidates:
+            result.duplicadas += 1
+            continue
+
+        candidates[cnpj] = {
+            "cnpj": cnpj,
+            "razao_social": razao,
+            "inscricao_estadual_pr": str(row.get("inscricao_estadual_pr", "") or "").strip() or None,
+            "email_notificacao": str(row.get("email_notificacao", "") or "").strip() or None,
+            "whatsapp": str(row.get("whatsapp", "") or "").strip() or None,
+            "periodicidade": periodicidade,
+            "horario": horario,
+            "ativo": True,
+        }
+
+    if not candidates:
+        return
+
+    # Check duplicates for the whole chunk at once
+    existing = get_existing_cnpjs(list(candidates))
+    result.duplicadas += len(existing)
+    novas = [data for cnpj, data in candidates.items() if cnpj not in existing]
+
+    try:
+        result.criadas += len(create_empresas_bulk(novas))
+    except Exception as e:
+        # Fall back to row-by-row so one bad row does not reject the chunk
+        logger.warning(f"Bulk insert failed ({e}); retrying chunk row by row")
+        for empresa_data in novas:
+            try:
+                create_empresa(empresa_data)
+                result.criadas += 1
+            except Exception as row_err:
+                _add_upload_error(result, f"Erro ao salvar {empresa_data['cnpj']}: {str(row_err)}")
+
+
+def _import_spreadsheet(
+    fileobj,
+    filename: str,
+    periodicidade: str,
+    horario: str,
+) -> UploadResult:
+    """Stream the uploaded file chunk by chunk into the insert stage."""
+    result = UploadResult()
+
+    columns, chunks = iter_spreadsheet_chunks(
+        fileobj, filename, chunk_size=settings.upload_chunk_rows
+    )
+
+    if "cnpj" not in columns:
+        raise HTTPException(status_code=400, detail="Coluna 'cnpj' não encontrada no arquivo")
+
+    if "razao_social" not in columns:
+        raise HTTPException(
+            status_code=400,
+            detail="Coluna 'razao_social' não encontrada no arquivo",
+        )
+
+    for rows in chunks:
+        _import_chunk(rows, result, periodicidade, horario)
+
+    return result
+
+
 @router.post("/upload", response_model=UploadResult)
 async def upload_csv(
     file: UploadFile = File(...),
@@ -134,82 +256,20 @@ async def upload_csv(
 
     Expected columns: cnpj, razao_social, inscricao_estadual_pr (optional),
     email_notificacao (optional), whatsapp (optional)
-    """
-    result = UploadResult()
 
+    The file is read in chunks from the spooled upload (never fully in
+    memory) and parsed in a worker thread to keep the event loop free.
+    """
     try:
-        content = await file.read()
-        filename = file.filename or "upload.csv"
-
-        if filename.endswith((".xlsx", ".xls")):
-            df = pd.read_excel(io.BytesIO(content))
-        else:
-            # Try various CSV encodings
-            for encoding in ["utf-8", "latin-1", "cp1252"]:
-                try:
-                    df = pd.read_csv(io.BytesIO(content), encoding=encoding)
-                    break
-                except UnicodeDecodeError:
-                    continue
-            else:
-                raise HTTPException(status_code=400, detail="Encoding do arquivo não reconhecido")
-
-        # Normalize column names
-        df.columns = [c.strip().lower().replace(" ", "_") for c in df.columns]
-
-        if "cnpj" not in df.columns:
-            raise HTTPException(status_code=400, detail="Coluna 'cnpj' não encontrada no arquivo")
-
-        if "razao_social" not in df.columns:
-            raise HTTPException(
-                status_code=400,
-                detail="Coluna 'razao_social' não encontrada no arquivo",
-            )
-
-        result.total = len(df)
-
-        for _, row in df.iterrows():
-            cnpj_raw = str(row.get("cnpj", ""))
-            cnpj = clean_cnpj(cnpj_raw)
-            razao = str(row.get("razao_social", "")).strip()
-
-            if not cnpj or not razao:
-                result.invalidas += 1
-                result.erros.append(f"Linha vazia: CNPJ={cnpj_raw}")
-                continue
-
-            if not validate_cnpj(cnpj):
-                result.invalidas += 1
-                result.erros.append(f"CNPJ inválido: {cnpj_raw}")
-                continue
-
-            # Check duplicate
-            existing = get_empresa_by_cnpj(cnpj)
-            if existing:
-                result.duplicadas += 1
-                continue
-
-            # Create empresa
-            try:
-                empresa_data = {
-                    "cnpj": cnpj,
-                    "razao_social": razao,
-                    "inscricao_estadual_pr": str(row.get("inscricao_estadual_pr", "")).strip() or None,
-                    "email_notificacao": str(row.get("email_notificacao", "")).strip() or None,
-                    "whatsapp": str(row.get("whatsapp", "")).strip() or None,
-                    "periodicidade": periodicidade,
-                    "horario": horario,
-                    "ativo": True,
-                }
-                create_empresa(empresa_data)
-                result.criadas += 1
-            except Exception as e:
-                result.erros.append(f"Erro ao salvar {cnpj}: {str(e)}")
-
+        return await run_in_threadpool(
+            _import_spreadsheet,
+            file.file,
+            file.filename or "upload.csv",
+            periodicidade,
+            horario,
+        )
     except HTTPException:
         raise
     except Exception as e:
         logger.error(f"Upload failed: {e}")
         raise HTTPException(status_code=400, detail=f"Erro ao processar arquivo: {str(e)}")
-
-    return result
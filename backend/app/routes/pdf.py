@@ -1,23 +1,38 @@
 """PDF Certificate generation for CNPJ compliance reports."""
 
+import asyncio
+import copy
 import io
+import json
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from datetime import datetime, timezone, timedelta
-from fastapi import APIRouter, HTTPException
-from fastapi.responses import StreamingResponse
+from functools import lru_cache
+from typing import Literal
+
+from fastapi import APIRouter, HTTPException, Header
+from fastapi.responses import FileResponse, StreamingResponse
+from pydantic import BaseModel
 from reportlab.lib.pagesizes import A4
 from reportlab.lib.units import cm, mm
 from reportlab.lib import colors
 from reportlab.platypus import (
     SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer,
-    HRFlowable, KeepTogether
+    HRFlowable, KeepTogether, PageBreak
 )
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.lib.enums import TA_CENTER, TA_LEFT, TA_RIGHT
 from reportlab.graphics.shapes import Drawing, Circle, String, Rect, Line
 from reportlab.graphics import renderPDF
 
+from app.config import settings
 from app.routes.query import query_cnpj
+from app.services.history import DEFAULT_USER, history_store
+from app.services.pdf_batch import pdf_batch_jobs
+from app.services.pdf_cache import pdf_cache, fingerprint
 
+logger = logging.getLogger(__name__)
 router = APIRouter()
 
 # ─── Color palette ────────────────────────────────────────────────
@@ -57,6 +72,17 @@ def _fmt_date(d):
     return str(d or "N/A")
 
 
+def _fmt_datetime_br(iso):
+    """ISO timestamp in Brasília time, or None when missing/invalid."""
+    try:
+        dt = datetime.fromisoformat(str(iso))
+    except ValueError:
+        return None
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt.astimezone(timezone(timedelta(hours=-3))).strftime("%d/%m/%Y às %H:%M")
+
+
 def _fmt_cnae_code(code):
     c = str(code).zfill(7)
     return f"{c[:2]}.{c[2:4]}-{c[4]}/{c[5:7]}"
@@ -80,8 +106,9 @@ def _get_status_info(status):
         return 'INDISPONÍVEL', GRAY, GRAY_LIGHT, '—'
 
 
+@lru_cache(maxsize=None)
 def _create_seal(score):
-    """Create a compliance seal drawing."""
+    """Create a compliance seal drawing (one per score, reused across documents)."""
     d = Drawing(120, 120)
     
     # Outer circle
@@ -105,97 +132,217 @@ def _create_seal(score):
     return d
 
 
-def create_certificate_pdf(cnpj: str, data: dict) -> bytes:
-    """Generate professional compliance certificate PDF."""
+# ─── Prebuilt styles and static parts ─────────────────────────────
+# Built once per process (the web process and each render worker).
+
+PAGE_WIDTH = A4[0] - 3.6*cm  # Available width
+
+
+def _build_styles() -> dict[str, ParagraphStyle]:
+    styles = getSampleStyleSheet()
+    return {
+        'title': ParagraphStyle(
+            'CertTitle', parent=styles['Heading1'],
+            fontSize=22, textColor=BLUE_PRIMARY,
+            spaceAfter=5, alignment=TA_CENTER,
+            fontName='Helvetica-Bold'
+        ),
+        'subtitle': ParagraphStyle(
+            'CertSubtitle', parent=styles['Normal'],
+            fontSize=11, textColor=GRAY,
+            spaceAfter=15, alignment=TA_CENTER,
+            fontName='Helvetica'
+        ),
+        'heading': ParagraphStyle(
+            'SectionHead', parent=styles['Heading2'],
+            fontSize=13, textColor=BLUE_PRIMARY,
+            spaceAfter=8, spaceBefore=15,
+            fontName='Helvetica-Bold',
+            borderColor=BLUE_PRIMARY,
+            borderWidth=0, borderPadding=0,
+        ),
+        'normal': ParagraphStyle(
+            'CertNormal', parent=styles['Normal'],
+            fontSize=10, spaceAfter=4,
+            fontName='Helvetica',
+        ),
+        'small': ParagraphStyle(
+            'CertSmall', parent=styles['Normal'],
+            fontSize=8, textColor=GRAY,
+            fontName='Helvetica',
+        ),
+        'footer': ParagraphStyle(
+            'CertFooter', parent=styles['Normal'],
+            fontSize=8, textColor=GRAY,
+            alignment=TA_CENTER, spaceAfter=3,
+        ),
+        'analysis': ParagraphStyle(
+            'Analysis', parent=styles['Normal'],
+            fontSize=9, spaceAfter=4,
+            fontName='Helvetica', leading=14,
+        ),
+    }
+
+
+STYLES = _build_styles()
+
+_HEADER_ROW = [
+    ('BACKGROUND', (0, 0), (-1, 0), BLUE_PRIMARY),
+    ('TEXTCOLOR', (0, 0), (-1, 0), WHITE),
+    ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+    ('FONTSIZE', (0, 0), (-1, 0), 10),
+]
+
+META_TABLE_STYLE = TableStyle([
+    ('BACKGROUND', (0, 0), (-1, -1), BLUE_LIGHT),
+    ('TOPPADDING', (0, 0), (-1, -1), 6),
+    ('BOTTOMPADDING', (0, 0), (-1, -1), 6),
+    ('LEFTPADDING', (0, 0), (-1, -1), 10),
+    ('BOX', (0, 0), (-1, -1), 0.5, GRAY_BORDER),
+])
+
+# Campo / Informação tables (endereço, informações fiscais)
+KV_TABLE_STYLE = TableStyle(_HEADER_ROW + [
+    ('FONTNAME', (0, 1), (0, -1), 'Helvetica-Bold'),
+    ('FONTSIZE', (0, 1), (-1, -1), 9),
+    ('BACKGROUND', (0, 1), (0, -1), BLUE_LIGHT),
+    ('GRID', (0, 0), (-1, -1), 0.5, GRAY_BORDER),
+    ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+    ('LEFTPADDING', (0, 0), (-1, -1), 8),
+    ('TOPPADDING', (0, 0), (-1, -1), 5),
+    ('BOTTOMPADDING', (0, 0), (-1, -1), 5),
+])
+
+COMPANY_TABLE_STYLE = TableStyle(KV_TABLE_STYLE.getCommands() + [
+    ('ROWBACKGROUNDS', (1, 1), (1, -1), [WHITE, GRAY_LIGHT]),
+])
+
+CNAE_TABLE_STYLE = TableStyle(_HEADER_ROW + [
+    ('FONTSIZE', (0, 1), (-1, -1), 8),
+    ('BACKGROUND', (0, 1), (0, 1), GREEN_LIGHT),
+    ('FONTNAME', (0, 1), (0, 1), 'Helvetica-Bold'),
+    ('ROWBACKGROUNDS', (0, 2), (-1, -1), [WHITE, GRAY_LIGHT]),
+    ('GRID', (0, 0), (-1, -1), 0.5, GRAY_BORDER),
+    ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+    ('LEFTPADDING', (0, 0), (-1, -1), 6),
+    ('TOPPADDING', (0, 0), (-1, -1), 4),
+    ('BOTTOMPADDING', (0, 0), (-1, -1), 4),
+])
+
+QSA_TABLE_STYLE = TableStyle(_HEADER_ROW + [
+    ('FONTSIZE', (0, 1), (-1, -1), 9),
+    ('ROWBACKGROUNDS', (0, 1), (-1, -1), [WHITE, GRAY_LIGHT]),
+    ('GRID', (0, 0), (-1, -1), 0.5, GRAY_BORDER),
+    ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+    ('LEFTPADDING', (0, 0), (-1, -1), 6),
+    ('TOPPADDING', (0, 0), (-1, -1), 5),
+    ('BOTTOMPADDING', (0, 0), (-1, -1), 5),
+])
+
+CERT_TABLE_COMMANDS = _HEADER_ROW + [
+    ('FONTSIZE', (0, 1), (-1, -1), 9),
+    ('FONTNAME', (1, 1), (1, -1), 'Helvetica-Bold'),
+    ('GRID', (0, 0), (-1, -1), 0.5, GRAY_BORDER),
+    ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+    ('LEFTPADDING', (0, 0), (-1, -1), 8),
+    ('TOPPADDING', (0, 0), (-1, -1), 6),
+    ('BOTTOMPADDING', (0, 0), (-1, -1), 6),
+]
+
+ANALYSIS_TABLE_COMMANDS = [
+    ('BACKGROUND', (0, 0), (-1, -1), GRAY_LIGHT),
+    ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+    ('LEFTPADDING', (0, 0), (-1, -1), 10),
+    ('RIGHTPADDING', (0, 0), (-1, -1), 10),
+    ('TOPPADDING', (0, 0), (-1, -1), 10),
+    ('BOTTOMPADDING', (0, 0), (-1, -1), 10),
+]
+
+# Flowables that never change: parsed once, copied into each document
+# (layout state is kept on the flowable, so a document gets its own copy)
+_HEADER = [
+    HRFlowable(width="100%", thickness=3, color=BLUE_PRIMARY, spaceAfter=15),
+    Paragraph("CERTIFICADO DE CONFORMIDADE", STYLES['title']),
+    Paragraph("Relatório de Situação Cadastral e Regularidade", STYLES['subtitle']),
+]
+_SECTION_RULE = HRFlowable(width="100%", thickness=1, color=BLUE_ACCENT, spaceAfter=8)
+_FOOTER_RULE = HRFlowable(width="100%", thickness=2, color=BLUE_PRIMARY, spaceAfter=10)
+_FOOTER_TITLE = Paragraph("<b>CERTIFICADO DE CONFORMIDADE — IAudit</b>", STYLES['footer'])
+_FOOTER_NOTES = [
+    Paragraph(
+        "Informações obtidas de fontes oficiais: Receita Federal (BrasilAPI) e InfoSimples.",
+        STYLES['footer']
+    ),
+    Paragraph(
+        "<i>Este documento tem caráter informativo e não substitui as certidões oficiais emitidas pelos órgãos competentes.</i>",
+        STYLES['footer']
+    ),
+]
+
+
+def _static(*flowables):
+    return [copy.copy(f) for f in flowables]
+
+
+def _section(title: str) -> list:
+    return [Paragraph(title, STYLES['heading']), copy.copy(_SECTION_RULE)]
+
+
+def _build_pdf(elements: list) -> bytes:
     buffer = io.BytesIO()
     doc = SimpleDocTemplate(
         buffer, pagesize=A4,
         rightMargin=1.8*cm, leftMargin=1.8*cm,
         topMargin=1.5*cm, bottomMargin=1.5*cm
     )
-    
+    doc.build(elements)
+    # getvalue() hands over BytesIO's own buffer (no copy while nothing else writes to it)
+    return buffer.getvalue()
+
+
+def create_certificate_pdf(cnpj: str, data: dict) -> bytes:
+    """Generate professional compliance certificate PDF."""
+    return _build_pdf(_certificate_elements(cnpj, data))
+
+
+def create_certificates_pdf(items: list[tuple[str, dict]]) -> bytes:
+    """One PDF with a certificate per (cnpj, data), each starting on a new page."""
     elements = []
-    styles = getSampleStyleSheet()
-    page_width = A4[0] - 3.6*cm  # Available width
-    
-    # ─── Custom Styles ─────────────────────────────────────────
-    title_style = ParagraphStyle(
-        'CertTitle', parent=styles['Heading1'],
-        fontSize=22, textColor=BLUE_PRIMARY,
-        spaceAfter=5, alignment=TA_CENTER,
-        fontName='Helvetica-Bold'
-    )
-    
-    subtitle_style = ParagraphStyle(
-        'CertSubtitle', parent=styles['Normal'],
-        fontSize=11, textColor=GRAY,
-        spaceAfter=15, alignment=TA_CENTER,
-        fontName='Helvetica'
-    )
-    
-    heading_style = ParagraphStyle(
-        'SectionHead', parent=styles['Heading2'],
-        fontSize=13, textColor=BLUE_PRIMARY,
-        spaceAfter=8, spaceBefore=15,
-        fontName='Helvetica-Bold',
-        borderColor=BLUE_PRIMARY,
-        borderWidth=0, borderPadding=0,
-    )
-    
-    normal_style = ParagraphStyle(
-        'CertNormal', parent=styles['Normal'],
-        fontSize=10, spaceAfter=4,
-        fontName='Helvetica',
-    )
-    
-    small_style = ParagraphStyle(
-        'CertSmall', parent=styles['Normal'],
-        fontSize=8, textColor=GRAY,
-        fontName='Helvetica',
-    )
-    
-    footer_style = ParagraphStyle(
-        'CertFooter', parent=styles['Normal'],
-        fontSize=8, textColor=GRAY,
-        alignment=TA_CENTER, spaceAfter=3,
-    )
+    for i, (cnpj, data) in enumerate(items):
+        if i:
+            elements.append(PageBreak())
+        elements.extend(_certificate_elements(cnpj, data))
+    return _build_pdf(elements)
+
+
+def _certificate_elements(cnpj: str, data: dict) -> list:
+    """Flowables of one compliance certificate."""
+    elements = []
+    page_width = PAGE_WIDTH
+    small_style = STYLES['small']
     
     # ─── Header ────────────────────────────────────────────────
-    # Top border
-    elements.append(HRFlowable(
-        width="100%", thickness=3, color=BLUE_PRIMARY,
-        spaceAfter=15
-    ))
-    
-    elements.append(Paragraph("CERTIFICADO DE CONFORMIDADE", title_style))
-    elements.append(Paragraph("Relatório de Situação Cadastral e Regularidade", subtitle_style))
+    elements.extend(_static(*_HEADER))
     
-    # Meta info
-    tz_br = timezone(timedelta(hours=-3))
-    now = datetime.now(tz_br).strftime("%d/%m/%Y às %H:%M")
+    # Meta info: the time of the query the data comes from, not of this render
+    # (rendered certificates are cached and served again)
+    consultado_em = _fmt_datetime_br(data.get("consultado_em"))
     
     meta_data = [
         [
-            Paragraph(f"<b>Data de Emissão:</b> {now}", small_style),
+            Paragraph(f"<b>Dados consultados em:</b> {consultado_em or 'N/A'}", small_style),
             Paragraph(f"<b>CNPJ:</b> {_fmt_cnpj(data.get('cnpj', cnpj))}", small_style),
         ]
     ]
     meta_table = Table(meta_data, colWidths=[page_width/2, page_width/2])
-    meta_table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (-1, -1), BLUE_LIGHT),
-        ('TOPPADDING', (0, 0), (-1, -1), 6),
-        ('BOTTOMPADDING', (0, 0), (-1, -1), 6),
-        ('LEFTPADDING', (0, 0), (-1, -1), 10),
-        ('BOX', (0, 0), (-1, -1), 0.5, GRAY_BORDER),
-    ]))
+    meta_table.setStyle(META_TABLE_STYLE)
     elements.append(meta_table)
     elements.append(Spacer(1, 0.5*cm))
     
     # ═══════════════════════════════════════════════════════════
     # SECTION 1: DADOS CADASTRAIS
     # ═══════════════════════════════════════════════════════════
-    elements.append(Paragraph("1. DADOS CADASTRAIS", heading_style))
-    elements.append(HRFlowable(width="100%", thickness=1, color=BLUE_ACCENT, spaceAfter=8))
+    elements.extend(_section("1. DADOS CADASTRAIS"))
     
     situacao = data.get('situacao_cadastral', 'N/A')
     
@@ -216,32 +363,14 @@ def create_certificate_pdf(cnpj: str, data: dict) -> bytes:
     ]
     
     company_table = Table(company_rows, colWidths=[5*cm, page_width - 5*cm])
-    company_table.setStyle(TableStyle([
-        # Header
-        ('BACKGROUND', (0, 0), (-1, 0), BLUE_PRIMARY),
-        ('TEXTCOLOR', (0, 0), (-1, 0), WHITE),
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, 0), 10),
-        # Data rows
-        ('FONTNAME', (0, 1), (0, -1), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 1), (-1, -1), 9),
-        ('BACKGROUND', (0, 1), (0, -1), BLUE_LIGHT),
-        ('ROWBACKGROUNDS', (1, 1), (1, -1), [WHITE, GRAY_LIGHT]),
-        # Grid
-        ('GRID', (0, 0), (-1, -1), 0.5, GRAY_BORDER),
-        ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-        ('LEFTPADDING', (0, 0), (-1, -1), 8),
-        ('TOPPADDING', (0, 0), (-1, -1), 5),
-        ('BOTTOMPADDING', (0, 0), (-1, -1), 5),
-    ]))
+    company_table.setStyle(COMPANY_TABLE_STYLE)
     elements.append(company_table)
     elements.append(Spacer(1, 0.4*cm))
     
     # ═══════════════════════════════════════════════════════════
     # SECTION 2: ENDEREÇO
     # ═══════════════════════════════════════════════════════════
-    elements.append(Paragraph("2. ENDEREÇO", heading_style))
-    elements.append(HRFlowable(width="100%", thickness=1, color=BLUE_ACCENT, spaceAfter=8))
+    elements.extend(_section("2. ENDEREÇO"))
     
     tipo_log = data.get('descricao_tipo_de_logradouro', '')
     logr = data.get('logradouro', '')
@@ -260,28 +389,14 @@ def create_certificate_pdf(cnpj: str, data: dict) -> bytes:
     ]
     
     addr_table = Table(addr_rows, colWidths=[5*cm, page_width - 5*cm])
-    addr_table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (-1, 0), BLUE_PRIMARY),
-        ('TEXTCOLOR', (0, 0), (-1, 0), WHITE),
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, 0), 10),
-        ('FONTNAME', (0, 1), (0, -1), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 1), (-1, -1), 9),
-        ('BACKGROUND', (0, 1), (0, -1), BLUE_LIGHT),
-        ('GRID', (0, 0), (-1, -1), 0.5, GRAY_BORDER),
-        ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-        ('LEFTPADDING', (0, 0), (-1, -1), 8),
-        ('TOPPADDING', (0, 0), (-1, -1), 5),
-        ('BOTTOMPADDING', (0, 0), (-1, -1), 5),
-    ]))
+    addr_table.setStyle(KV_TABLE_STYLE)
     elements.append(addr_table)
     elements.append(Spacer(1, 0.4*cm))
     
     # ═══════════════════════════════════════════════════════════
     # SECTION 3: ATIVIDADE ECONÔMICA
     # ═══════════════════════════════════════════════════════════
-    elements.append(Paragraph("3. ATIVIDADES ECONÔMICAS (CNAE)", heading_style))
-    elements.append(HRFlowable(width="100%", thickness=1, color=BLUE_ACCENT, spaceAfter=8))
+    elements.extend(_section("3. ATIVIDADES ECONÔMICAS (CNAE)"))
     
     cnae_rows = [['Tipo', 'Código', 'Descrição']]
     
@@ -297,21 +412,7 @@ def create_certificate_pdf(cnpj: str, data: dict) -> bytes:
         ])
     
     cnae_table = Table(cnae_rows, colWidths=[3*cm, 3.5*cm, page_width - 6.5*cm])
-    cnae_table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (-1, 0), BLUE_PRIMARY),
-        ('TEXTCOLOR', (0, 0), (-1, 0), WHITE),
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, 0), 10),
-        ('FONTSIZE', (0, 1), (-1, -1), 8),
-        ('BACKGROUND', (0, 1), (0, 1), GREEN_LIGHT),
-        ('FONTNAME', (0, 1), (0, 1), 'Helvetica-Bold'),
-        ('ROWBACKGROUNDS', (0, 2), (-1, -1), [WHITE, GRAY_LIGHT]),
-        ('GRID', (0, 0), (-1, -1), 0.5, GRAY_BORDER),
-        ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-        ('LEFTPADDING', (0, 0), (-1, -1), 6),
-        ('TOPPADDING', (0, 0), (-1, -1), 4),
-        ('BOTTOMPADDING', (0, 0), (-1, -1), 4),
-    ]))
+    cnae_table.setStyle(CNAE_TABLE_STYLE)
     elements.append(cnae_table)
     elements.append(Spacer(1, 0.4*cm))
     
@@ -320,8 +421,7 @@ def create_certificate_pdf(cnpj: str, data: dict) -> bytes:
     # ═══════════════════════════════════════════════════════════
     qsa = data.get('qsa', [])
     if qsa:
-        elements.append(Paragraph("4. QUADRO DE SÓCIOS E ADMINISTRADORES", heading_style))
-        elements.append(HRFlowable(width="100%", thickness=1, color=BLUE_ACCENT, spaceAfter=8))
+        elements.extend(_section("4. QUADRO DE SÓCIOS E ADMINISTRADORES"))
         
         qsa_rows = [['Nome', 'Qualificação', 'Entrada', 'Faixa Etária']]
         for socio in qsa:
@@ -335,19 +435,7 @@ def create_certificate_pdf(cnpj: str, data: dict) -> bytes:
         qsa_table = Table(qsa_rows, colWidths=[
             page_width * 0.35, page_width * 0.3, page_width * 0.17, page_width * 0.18
         ])
-        qsa_table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (-1, 0), BLUE_PRIMARY),
-            ('TEXTCOLOR', (0, 0), (-1, 0), WHITE),
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, 0), 10),
-            ('FONTSIZE', (0, 1), (-1, -1), 9),
-            ('ROWBACKGROUNDS', (0, 1), (-1, -1), [WHITE, GRAY_LIGHT]),
-            ('GRID', (0, 0), (-1, -1), 0.5, GRAY_BORDER),
-            ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-            ('LEFTPADDING', (0, 0), (-1, -1), 6),
-            ('TOPPADDING', (0, 0), (-1, -1), 5),
-            ('BOTTOMPADDING', (0, 0), (-1, -1), 5),
-        ]))
+        qsa_table.setStyle(QSA_TABLE_STYLE)
         elements.append(qsa_table)
         elements.append(Spacer(1, 0.4*cm))
     
@@ -355,8 +443,7 @@ def create_certificate_pdf(cnpj: str, data: dict) -> bytes:
     # SECTION 5: INFORMAÇÕES FISCAIS
     # ═══════════════════════════════════════════════════════════
     section_num = 5 if qsa else 4
-    elements.append(Paragraph(f"{section_num}. INFORMAÇÕES FISCAIS E TRIBUTÁRIAS", heading_style))
-    elements.append(HRFlowable(width="100%", thickness=1, color=BLUE_ACCENT, spaceAfter=8))
+    elements.extend(_section(f"{section_num}. INFORMAÇÕES FISCAIS E TRIBUTÁRIAS"))
     
     simples = data.get('opcao_pelo_simples')
     mei = data.get('opcao_pelo_mei')
@@ -377,20 +464,7 @@ def create_certificate_pdf(cnpj: str, data: dict) -> bytes:
         fiscal_rows.append(['Regime Tributário', f"{ultimo.get('forma_de_tributacao', 'N/A')} ({ultimo.get('ano', '')})"])
     
     fiscal_table = Table(fiscal_rows, colWidths=[5*cm, page_width - 5*cm])
-    fiscal_table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (-1, 0), BLUE_PRIMARY),
-        ('TEXTCOLOR', (0, 0), (-1, 0), WHITE),
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, 0), 10),
-        ('FONTNAME', (0, 1), (0, -1), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 1), (-1, -1), 9),
-        ('BACKGROUND', (0, 1), (0, -1), BLUE_LIGHT),
-        ('GRID', (0, 0), (-1, -1), 0.5, GRAY_BORDER),
-        ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-        ('LEFTPADDING', (0, 0), (-1, -1), 8),
-        ('TOPPADDING', (0, 0), (-1, -1), 5),
-        ('BOTTOMPADDING', (0, 0), (-1, -1), 5),
-    ]))
+    fiscal_table.setStyle(KV_TABLE_STYLE)
     elements.append(fiscal_table)
     elements.append(Spacer(1, 0.4*cm))
     
@@ -398,8 +472,7 @@ def create_certificate_pdf(cnpj: str, data: dict) -> bytes:
     # SECTION 6: STATUS DAS CERTIDÕES
     # ═══════════════════════════════════════════════════════════
     section_num += 1
-    elements.append(Paragraph(f"{section_num}. STATUS DAS CERTIDÕES DE REGULARIDADE", heading_style))
-    elements.append(HRFlowable(width="100%", thickness=1, color=BLUE_ACCENT, spaceAfter=8))
+    elements.extend(_section(f"{section_num}. STATUS DAS CERTIDÕES DE REGULARIDADE"))
     
     certidoes = data.get('certidoes', {})
     
@@ -430,19 +503,7 @@ def create_certificate_pdf(cnpj: str, data: dict) -> bytes:
     cert_table = Table(cert_rows, colWidths=[page_width * 0.42, page_width * 0.22, page_width * 0.36])
     
     # Build style
-    cert_style_commands = [
-        ('BACKGROUND', (0, 0), (-1, 0), BLUE_PRIMARY),
-        ('TEXTCOLOR', (0, 0), (-1, 0), WHITE),
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, 0), 10),
-        ('FONTSIZE', (0, 1), (-1, -1), 9),
-        ('FONTNAME', (1, 1), (1, -1), 'Helvetica-Bold'),
-        ('GRID', (0, 0), (-1, -1), 0.5, GRAY_BORDER),
-        ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-        ('LEFTPADDING', (0, 0), (-1, -1), 8),
-        ('TOPPADDING', (0, 0), (-1, -1), 6),
-        ('BOTTOMPADDING', (0, 0), (-1, -1), 6),
-    ]
+    cert_style_commands = list(CERT_TABLE_COMMANDS)
     
     # Color-code status cells
     for i, (_, cert_data_item) in enumerate(cert_items, start=1):
@@ -459,8 +520,7 @@ def create_certificate_pdf(cnpj: str, data: dict) -> bytes:
     # SECTION 7: ANÁLISE DE CONFORMIDADE
     # ═══════════════════════════════════════════════════════════
     section_num += 1
-    elements.append(Paragraph(f"{section_num}. ANÁLISE DE CONFORMIDADE", heading_style))
-    elements.append(HRFlowable(width="100%", thickness=1, color=BLUE_ACCENT, spaceAfter=8))
+    elements.extend(_section(f"{section_num}. ANÁLISE DE CONFORMIDADE"))
     
     # Calculate score
     score = 0
@@ -526,85 +586,212 @@ def create_certificate_pdf(cnpj: str, data: dict) -> bytes:
     {recommendation}
     """
     
-    analysis_style = ParagraphStyle(
-        'Analysis', parent=styles['Normal'],
-        fontSize=9, spaceAfter=4,
-        fontName='Helvetica', leading=14,
-    )
-    
     analysis_data = [
-        [seal, Paragraph(analysis_text, analysis_style)]
+        [seal, Paragraph(analysis_text, STYLES['analysis'])]
     ]
     
     analysis_table = Table(analysis_data, colWidths=[3.5*cm, page_width - 3.5*cm])
-    analysis_table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (-1, -1), GRAY_LIGHT),
-        ('BOX', (0, 0), (-1, -1), 1, class_color),
-        ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-        ('LEFTPADDING', (0, 0), (-1, -1), 10),
-        ('RIGHTPADDING', (0, 0), (-1, -1), 10),
-        ('TOPPADDING', (0, 0), (-1, -1), 10),
-        ('BOTTOMPADDING', (0, 0), (-1, -1), 10),
-    ]))
+    analysis_table.setStyle(TableStyle(ANALYSIS_TABLE_COMMANDS + [('BOX', (0, 0), (-1, -1), 1, class_color)]))
     elements.append(analysis_table)
     elements.append(Spacer(1, 0.8*cm))
     
     # ═══════════════════════════════════════════════════════════
     # FOOTER
     # ═══════════════════════════════════════════════════════════
-    elements.append(HRFlowable(width="100%", thickness=2, color=BLUE_PRIMARY, spaceAfter=10))
-    
-    elements.append(Paragraph(
-        f"<b>CERTIFICADO DE CONFORMIDADE — IAudit</b>",
-        footer_style
-    ))
-    elements.append(Paragraph(
-        f"Emitido em {now} (Horário de Brasília)",
-        footer_style
-    ))
-    elements.append(Paragraph(
-        "Informações obtidas de fontes oficiais: Receita Federal (BrasilAPI) e InfoSimples.",
-        footer_style
-    ))
-    elements.append(Paragraph(
-        "<i>Este documento tem caráter informativo e não substitui as certidões oficiais emitidas pelos órgãos competentes.</i>",
-        footer_style
-    ))
+    footer_style = STYLES['footer']
+    elements.extend(_static(_FOOTER_RULE, _FOOTER_TITLE))
+    if consultado_em:
+        elements.append(Paragraph(
+            f"Dados consultados em {consultado_em} (Horário de Brasília)",
+            footer_style
+        ))
+    elements.extend(_static(*_FOOTER_NOTES))
     elements.append(Paragraph(
         f"<i>Score de conformidade: {score}/100 — Classificação: {classification}</i>",
         footer_style
     ))
     
-    # Build PDF
-    doc.build(elements)
-    buffer.seek(0)
-    return buffer.read()
+    return elements
+
+
+# ─── Rendering (process pool + cache) ────────────────────────────
+
+_render_pool: ProcessPoolExecutor | None = None
+
+
+def _pool() -> ProcessPoolExecutor | None:
+    """Render worker processes (None = render in a thread)."""
+    global _render_pool
+    if _render_pool is None and settings.pdf_render_workers > 0:
+        _render_pool = ProcessPoolExecutor(max_workers=settings.pdf_render_workers)
+    return _render_pool
+
+
+def shutdown_render_pool() -> None:
+    global _render_pool
+    if _render_pool is not None:
+        _render_pool.shutdown(wait=False, cancel_futures=True)
+        _render_pool = None
+
+
+async def _render(fn, *args) -> bytes:
+    loop = asyncio.get_running_loop()
+    try:
+        return await loop.run_in_executor(_pool(), fn, *args)
+    except BrokenProcessPool:
+        # A worker died: start a fresh pool next time, render this one in a thread
+        logger.error("PDF render pool broken, recreating it.")
+        shutdown_render_pool()
+        return await asyncio.to_thread(fn, *args)
+
+
+async def render_certificate(cnpj: str, data: dict) -> bytes:
+    """Certificate PDF for this data: from the cache, or rendered off the event loop."""
+    key = f"{cnpj}-{fingerprint(data)}"
+    cached = await asyncio.to_thread(pdf_cache.get, key)
+    if cached is not None:
+        return cached
+
+    pdf_bytes = await _render(create_certificate_pdf, cnpj, data)
+    await asyncio.to_thread(pdf_cache.put, key, pdf_bytes)
+    return pdf_bytes
+
+
+async def render_certificates(items: list[tuple[str, dict]]) -> bytes:
+    """Merged certificates PDF, rendered off the event loop."""
+    return await _render(create_certificates_pdf, items)
+
+
+async def _certificate_data(cnpj: str, user_id: str, refresh: bool) -> dict:
+    """The CNPJ query to certify: the user's recent search if there is one,
+    otherwise a new query."""
+    if not refresh:
+        data = await asyncio.to_thread(
+            history_store.get_payload, cnpj, user_id, settings.pdf_history_max_age_minutes * 60
+        )
+        if data is not None:
+            return data
+    return await query_cnpj(cnpj)
+
+
+STREAM_CHUNK_BYTES = 64 * 1024
+
+
+async def _chunks(content: bytes):
+    """Stream a rendered PDF as views into its bytes (no per-chunk copies)."""
+    view = memoryview(content)
+    for start in range(0, len(view), STREAM_CHUNK_BYTES):
+        yield view[start:start + STREAM_CHUNK_BYTES]
+
+
+def _clean_cnpj(cnpj: str) -> str:
+    return cnpj.replace(".", "").replace("/", "").replace("-", "").strip()
+
+
+def _valid_cnpj(cnpj: str) -> bool:
+    return len(cnpj) == 14 and cnpj.isdigit()
 
 
 @router.get("/cnpj/{cnpj}")
-async def generate_pdf_report(cnpj: str):
+async def generate_pdf_report(cnpj: str, refresh: bool = False, x_user_id: str = Header(DEFAULT_USER)):
     """Generate compliance certificate PDF for CNPJ."""
-    cnpj_clean = cnpj.replace(".", "").replace("/", "").replace("-", "").strip()
+    cnpj_clean = _clean_cnpj(cnpj)
     
-    if len(cnpj_clean) != 14 or not cnpj_clean.isdigit():
+    if not _valid_cnpj(cnpj_clean):
         raise HTTPException(status_code=400, detail="CNPJ inválido")
     
     try:
-        data = await query_cnpj(cnpj_clean)
+        data = await _certificate_data(cnpj_clean, x_user_id, refresh)
     except HTTPException as e:
         raise e
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erro ao consultar CNPJ: {str(e)}")
     
     try:
-        pdf_bytes = create_certificate_pdf(cnpj_clean, data)
+        pdf_bytes = await render_certificate(cnpj_clean, data)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erro ao gerar certificado: {str(e)}")
     
     return StreamingResponse(
-        io.BytesIO(pdf_bytes),
+        _chunks(pdf_bytes),
         media_type="application/pdf",
         headers={
-            "Content-Disposition": f"attachment; filename=certificado_conformidade_{cnpj_clean}.pdf"
+            "Content-Disposition": f"attachment; filename=certificado_conformidade_{cnpj_clean}.pdf",
+            "Content-Length": str(len(pdf_bytes)),
         }
     )
+
+
+# ─── Batch reports ────────────────────────────────────────────────
+
+class LoteRequest(BaseModel):
+    cnpjs: list[str]
+    formato: Literal["zip", "pdf"] = "zip"
+    refresh: bool = False
+
+
+def _get_job(job_id: str):
+    job = pdf_batch_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Lote não encontrado")
+    return job
+
+
+@router.post("/lote", status_code=202)
+async def create_batch_report(data: LoteRequest, x_user_id: str = Header(DEFAULT_USER)):
+    """Start a batch of compliance certificates (one ZIP, or one merged PDF).
+    Follow it on /lote/{job_id}/stream and download it from /lote/{job_id}/download."""
+    cnpjs = list(dict.fromkeys(_clean_cnpj(c) for c in data.cnpjs))
+    if not cnpjs:
+        raise HTTPException(status_code=400, detail="Nenhum CNPJ informado")
+    if len(cnpjs) > settings.pdf_batch_max_items:
+        raise HTTPException(
+            status_code=400, detail=f"Máximo de {settings.pdf_batch_max_items} CNPJs por lote"
+        )
+
+    async def fetch(cnpj: str) -> dict:
+        if not _valid_cnpj(cnpj):
+            raise ValueError("CNPJ inválido")
+        return await _certificate_data(cnpj, x_user_id, data.refresh)
+
+    job = pdf_batch_jobs.start(cnpjs, data.formato, fetch, render_certificate, render_certificates)
+    return job.summary
+
+
+@router.get("/lote/{job_id}")
+def get_batch_report(job_id: str):
+    """Batch progress, with the CNPJs that failed."""
+    job = _get_job(job_id)
+    erros = [
+        {"cnpj": e["cnpj"], "erro": e["erro"]}
+        for e in job.events if "cnpj" in e and not e["sucesso"]
+    ]
+    return {**job.summary, "erros": erros}
+
+
+@router.get("/lote/{job_id}/stream")
+async def stream_batch_report(job_id: str):
+    """Batch progress as NDJSON: one line per CNPJ and a final summary line."""
+    job = _get_job(job_id)
+
+    async def ndjson():
+        async for evento in job.follow():
+            yield json.dumps(evento, ensure_ascii=False) + "\n"
+
+    return StreamingResponse(ndjson(), media_type="application/x-ndjson")
+
+
+@router.get("/lote/{job_id}/download")
+def download_batch_report(job_id: str):
+    """The batch output, once the job is done."""
+    job = _get_job(job_id)
+    if not job.finished:
+        raise HTTPException(status_code=409, detail="Lote ainda em processamento")
+    if job.status != "done":
+        raise HTTPException(status_code=409, detail="Nenhum certificado gerado neste lote")
+    media_type = "application/zip" if job.formato == "zip" else "application/pdf"
+    return FileResponse(
+        job.path,
+        media_type=media_type,
+        filename=f"certificados_conformidade_{job.id}.{job.formato}",
+    )
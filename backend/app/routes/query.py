@@ -1,8 +1,10 @@
 """IAudit - CNPJ Query routes (BrasilAPI + InfoSimples)."""
 
 import logging
+from datetime import datetime, timezone
+
 import httpx
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, BackgroundTasks, Header, HTTPException
 
 from app.config import settings
 
@@ -163,6 +165,7 @@ async def query_cnpj(cnpj: str) -> dict:
 
     # 3. Build response
     return {
+        "consultado_em": datetime.now(timezone.utc).isoformat(timespec="seconds"),
         "cnpj": brasil_data.get("cnpj", cnpj),
         "razao_social": brasil_data.get("razao_social", ""),
         "nome_fantasia": brasil_data.get("nome_fantasia", ""),
@@ -199,21 +202,34 @@ async def query_cnpj(cnpj: str) -> dict:
     }
 
 
-from app.services.history import load_history, save_to_history
+from app.services.history import DEFAULT_USER, history_store, load_history, save_to_history
 
 @router.get("/history")
-async def get_history():
-    """Retrieve search history."""
-    return load_history()
+def get_history(x_user_id: str = Header(DEFAULT_USER)):
+    """Retrieve the user's search history (index records, no payloads)."""
+    return load_history(x_user_id)
+
+@router.get("/history/{cnpj}")
+def get_history_item(cnpj: str, x_user_id: str = Header(DEFAULT_USER)):
+    """Retrieve the full saved result of a past search."""
+    data = history_store.get_payload(cnpj, x_user_id)
+    if data is None:
+        raise HTTPException(status_code=404, detail="CNPJ não encontrado no histórico")
+    return data
 
 @router.post("/history")
-async def add_history(data: dict):
+async def add_history(data: dict, background_tasks: BackgroundTasks, x_user_id: str = Header(DEFAULT_USER)):
     """Manually add to history."""
-    save_to_history(data)
+    background_tasks.add_task(save_to_history, data, x_user_id)
     return {"status": "ok"}
 
+@router.delete("/history", status_code=204)
+def clear_history(x_user_id: str = Header(DEFAULT_USER)):
+    """Clear the user's search history."""
+    history_store.clear(x_user_id)
+
 @router.get("/cnpj/{cnpj}")
-async def get_cnpj(cnpj: str):
+async def get_cnpj(cnpj: str, background_tasks: BackgroundTasks, x_user_id: str = Header(DEFAULT_USER)):
     """Query CNPJ endpoint - returns company data + certification statuses."""
     # Clean CNPJ
     cnpj_clean = cnpj.replace(".", "").replace("/", "").replace("-", "").strip()
@@ -223,8 +239,8 @@ async def get_cnpj(cnpj: str):
 
     try:
         result = await query_cnpj(cnpj_clean)
-        # Save to history automatically
-        save_to_history(result)
+        # Save to history after the response is sent
+        background_tasks.add_task(save_to_history, result, x_user_id)
         return result
     except HTTPException:
         raise
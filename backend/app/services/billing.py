@@ -1,142 +1,190 @@
-"""IAudit - Recurring Billing Service."""
+"""IAudit - Recurring Billing Service.
 
+A run:
+  1. selects the plans not billed this month, with their empresa, in one query
+  2. keeps the ones whose generation window (vencimento - DAYS_IN_ADVANCE) is open
+  3. claims them with a conditional update + lease, so replicas running the
+     job at the same time never bill the same plan twice
+  4. registers the boletos concurrently through BoletoService's lote emission
+     (nuFatura idempotency, Bradesco rate limit, bulk history)
+  5. marks the billed plans in one update and releases the others
+
+Each run leaves a report with counts and per-phase timings (last_report).
+"""
+
+import asyncio
 import logging
+import os
+import socket
+import time
 from datetime import datetime, timezone, timedelta, date
+
+from app.config import settings
 from app.database import (
-    get_billing_plans, 
-    update_billing_plan, 
+    get_billing_plans_pendentes,
+    claim_billing_plans,
+    finish_billing_plans,
     create_log,
-    get_empresas_ativas
 )
-from app.services.bradesco import bradesco_service
+from app.services.boleto_service import boleto_service
 
 logger = logging.getLogger(__name__)
 
+# Boletos are generated this many days before their due date
+DAYS_IN_ADVANCE = 10
+
+
+def _target_due_date(dia_vencimento: int, today: date) -> date | None:
+    """Upcoming due date for a plan: this month's, or next month's if it has passed."""
+    try:
+        target = date(today.year, today.month, dia_vencimento)
+        if target < today:
+            month, year = today.month + 1, today.year
+            if month > 12:
+                month, year = 1, year + 1
+            target = date(year, month, dia_vencimento)
+    except ValueError:
+        # Short months (e.g. Feb 30) are skipped
+        return None
+    return target
+
+
+def _boleto_payload(plan: dict, empresa: dict, due: date, today: date) -> dict:
+    return {
+        "nuFatura": f"FAT-{today.strftime('%Y%m')}-{plan['id'][:8]}",
+        "empresa_id": plan.get("empresa_id"),
+        "vlNominal": int(plan.get("valor", 0) * 100), # Cents
+        "dataVencimento": due.strftime("%Y-%m-%d"),
+        "pagador_nome": empresa.get("razao_social"),
+        "pagador_documento": empresa.get("cnpj"),
+        "pagador_endereco": f"{empresa.get('logradouro', '')}, {empresa.get('numero', '')} {empresa.get('complemento', '')}".strip(),
+        "pagador_cep": empresa.get("cep", "00000000"),
+        "pagador_uf": empresa.get("uf", "PR"),
+        "pagador_cidade": empresa.get("municipio", "Curitiba"),
+        "pagador_bairro": empresa.get("bairro", "Centro"),
+        "pagador_email": empresa.get("email_notificacao"),
+        "pagador_whatsapp": empresa.get("whatsapp"),
+    }
+
+
 class BillingService:
-    async def process_recurring_billing(self):
+    def __init__(self):
+        # Identifies this replica in billing_plans.claimed_by
+        self.owner = f"{socket.gethostname()}:{os.getpid()}"
+        self.last_report: dict = {}
+        self._lock = asyncio.Lock()
+
+    async def process_recurring_billing(self) -> dict:
         """
         Job to process recurring billing plans.
         Generates boletos X days before due date.
         """
+        if self._lock.locked():
+            logger.warning("Recurring billing already running in this process, skipping.")
+            return self.last_report
+        async with self._lock:
+            return await self._run()
+
+    async def _run(self) -> dict:
         logger.info("=== Job: Process Recurring Billing ===")
-        
-        # Settings
-        DAYS_IN_ADVANCE = 10 
-        
-        plans = get_billing_plans()
-        if not plans:
-            logger.info("No active billing plans found.")
-            return
-
-        today = datetime.now(timezone.utc).date()
-        
-        count_generated = 0
-        
+        started = time.monotonic()
+        now = datetime.now(timezone.utc)
+        today = now.date()
+        month_start = datetime(today.year, today.month, 1, tzinfo=timezone.utc)
+
+        report = {
+            "started_at": now.isoformat(),
+            "owner": self.owner,
+            "pending": 0, "due": 0, "claimed": 0,
+            "generated": 0, "already_emitted": 0, "failed": 0, "skipped": 0,
+            "timings": {},
+        }
+        timings = report["timings"]
+
+        # 1-2. Plans due for generation (empresa embedded)
+        t0 = time.monotonic()
+        plans = await asyncio.to_thread(get_billing_plans_pendentes, month_start)
+        timings["select"] = round(time.monotonic() - t0, 3)
+        report["pending"] = len(plans)
+
+        due: dict[str, tuple[dict, dict, date]] = {}
         for plan in plans:
+            empresa = plan.get("empresas")
+            if not empresa:
+                logger.error(f"Empresa {plan.get('empresa_id')} not found for plan {plan['id']}")
+                report["skipped"] += 1
+                continue
+            target = _target_due_date(plan.get("dia_vencimento", 10), today)
+            if target is None or today < target - timedelta(days=DAYS_IN_ADVANCE):
+                continue
+            due[plan["id"]] = (plan, empresa, target)
+        report["due"] = len(due)
+
+        # 3. Claim
+        claimed: list[str] = []
+        if due:
+            t0 = time.monotonic()
+            claimed = await asyncio.to_thread(
+                claim_billing_plans, list(due), self.owner, now,
+                settings.billing_claim_lease_seconds, month_start,
+            )
+            timings["claim"] = round(time.monotonic() - t0, 3)
+        report["claimed"] = len(claimed)
+
+        # 4. Register
+        processed: list[str] = []
+        if claimed:
+            boletos = [_boleto_payload(*due[plan_id], today) for plan_id in claimed]
+            t0 = time.monotonic()
             try:
-                empresa_id = plan.get("empresa_id")
-                dia_vencimento = plan.get("dia_vencimento", 10)
-                valor = plan.get("valor", 0)
-                last_processed = plan.get("ultimo_processamento")
-                
-                # Check if already processed this month
-                if last_processed:
-                    last_date = datetime.fromisoformat(last_processed).date()
-                    if last_date.month == today.month and last_date.year == today.year:
-                        continue # Already processed for this month
-
-                # Calculate Next Due Date
-                # If today is > due day, move to next month? 
-                # Logic: We generate for the current month if not passed, or next month.
-                # Standard: Generate for "This Month" if (Due Date - DAYS_IN_ADVANCE) <= Today
-                
-                # Let's construct the "Target Due Date" for this month
-                try:
-                    target_due_date = date(today.year, today.month, dia_vencimento)
-                except ValueError: 
-                    # Handle short months (e.g. Feb 30 -> Feb 28/29)
-                    # Simplified: just skip or clamp to last day.
-                    # Proper way: max day of month
-                    continue
-                
-                # If target due date is in the past, maybe we missed it or it's for next month?
-                # If we haven't processed it yet, and it's passed, should we generate? 
-                # Maybe safest is: always aim for "Upcoming" due date.
-                
-                if target_due_date < today:
-                    # Move to next month
-                    month = today.month + 1
-                    year = today.year
-                    if month > 12:
-                        month = 1
-                        year += 1
-                    target_due_date = date(year, month, dia_vencimento)
-                
-                # Check generation window
-                generation_date = target_due_date - timedelta(days=DAYS_IN_ADVANCE)
-                
-                if today >= generation_date:
-                    # Time to generate!
-                    logger.info(f"Generating billing for Plan {plan['id']} (Empresa: {empresa_id}) - Due: {target_due_date}")
-                    
-                    # 1. Fetch Company Data (Mocking join or need a get_empresa)
-                    # For demo, we might need enterprise data for the boleto payload
-                    # We can use database.get_empresa_by_id if we import it, or pass dummy data that BradescoService accepts?
-                    # BradescoService needs pagador info.
-                    
-                    # We need to fetch the company details to fill Key Boleto Data
-                    from app.database import get_empresa_by_id
-                    empresa = get_empresa_by_id(empresa_id)
-                    
-                    if not empresa:
-                        logger.error(f"Empresa {empresa_id} not found for plan {plan['id']}")
+                async for evento in boleto_service.emitir_lote_stream(
+                    boletos, "SYSTEM_BILLING", settings.billing_concurrency
+                ):
+                    if "indice" not in evento:
                         continue
-                        
-                    # Prepare Boleto Payload
-                    # Using empresa data as "Pagador" (assuming B2B billing) or "Beneficiary"? 
-                    # Usually "Empresa" in our DB is the Client who PAYS the boleto (Sacado).
-                    
-                    # Generate a unique invoice number
-                    nu_fatura = f"FAT-{today.strftime('%Y%m')}-{plan['id'][:8]}"
-                    
-                    boleto_data = {
-                        "nuFatura": nu_fatura,
-                        "vlNominal": int(valor * 100), # Cents
-                        "dataVencimento": target_due_date.strftime("%Y-%m-%d"),
-                        "pagador_nome": empresa.get("razao_social"),
-                        "pagador_documento": empresa.get("cnpj"),
-                        "pagador_endereco": f"{empresa.get('logradouro', '')}, {empresa.get('numero', '')} {empresa.get('complemento', '')}".strip(),
-                        "pagador_cep": empresa.get("cep", "00000000"),
-                        "pagador_uf": empresa.get("uf", "PR"),
-                        "pagador_cidade": empresa.get("municipio", "Curitiba"),
-                        "pagador_bairro": empresa.get("bairro", "Centro")
-                    }
-                    
-                    # 2. Call Bradesco Service
-                    resp = await bradesco_service.register_boleto(
-                        boleto_data, 
-                        recipient_email=empresa.get("email_notificacao"),
-                        recipient_phone=empresa.get("whatsapp")
-                    )
-                    
-                    # 3. Log & Update Plan
-                    if resp.get("cdErro", 0) == 0:
-                        count_generated += 1
-                        update_billing_plan(plan["id"], {
-                            "ultimo_processamento": datetime.now(timezone.utc).isoformat()
-                        })
-                        create_log(
-                            consulta_id="SYSTEM_BILLING", 
-                            nivel="INFO", 
-                            mensagem=f"Boleto gerado para {empresa.get('razao_social')}",
-                            payload=resp
-                        )
+                    plan_id = claimed[evento["indice"]]
+                    if evento.get("sucesso"):
+                        processed.append(plan_id)
+                        report["already_emitted" if evento.get("ja_emitido") else "generated"] += 1
                     else:
-                        logger.error(f"Failed to generate boleto for plan {plan['id']}: {resp}")
-                        
-            except Exception as e:
-                logger.error(f"Error processing plan {plan.get('id')}: {e}")
+                        report["failed"] += 1
+                        logger.error(f"Failed to generate boleto for plan {plan_id}: {evento.get('erro')}")
+            finally:
+                timings["emit"] = round(time.monotonic() - t0, 3)
 
-        logger.info(f"Billing Job Complete. Generated {count_generated} boletos.")
+                # 5. Billed plans in one update; the rest are free for the next run
+                done = set(processed)
+                t0 = time.monotonic()
+                try:
+                    await asyncio.to_thread(
+                        finish_billing_plans, processed,
+                        [plan_id for plan_id in claimed if plan_id not in done],
+                        datetime.now(timezone.utc),
+                    )
+                except Exception as e:
+                    logger.error(f"Failed to update billing plans: {e}")
+                timings["update"] = round(time.monotonic() - t0, 3)
+
+        timings["total"] = round(time.monotonic() - started, 3)
+        report["finished_at"] = datetime.now(timezone.utc).isoformat()
+        self.last_report = report
+
+        logger.info(
+            f"Billing Job Complete. Generated {report['generated']} boletos "
+            f"({report['claimed']}/{report['due']} plans claimed, {report['failed']} failed) "
+            f"in {timings['total']}s."
+        )
+        if claimed:
+            try:
+                await asyncio.to_thread(
+                    create_log,
+                    consulta_id="SYSTEM_BILLING",
+                    nivel="INFO",
+                    mensagem=f"Cobrança recorrente: {report['generated']} boletos gerados",
+                    payload=report,
+                )
+            except Exception as e:
+                logger.error(f"Failed to write billing run report: {e}")
+        return report
 
 billing_service = BillingService()
@@ -1,128 +1,158 @@
-"""IAudit - Boleto Vencimento Scheduler (D-1 / D+1).
+"""IAudit - Boleto Vencimento Scheduler (D-1 / D+N).
 
-Daily cron job that scans active boletos and dispatches:
+Daily cron job that dispatches:
   - D-1: "Lembrete de Vencimento" for boletos due tomorrow
-  - D+1: "Aviso de Atraso"       for boletos overdue (past vencimento)
+  - D+N: "Aviso de Atraso"        for boletos overdue by 1, 3, 7 days, then weekly
+
+A run:
+  1. computes the vencimento dates that trigger a reminder today and reads
+     only those boletos, in one indexed query (idx_boletos_vencimento)
+  2. records the reminders in the boleto_lembretes ledger; only the ones not
+     recorded before are sent, so a re-run on the same day never re-sends
+  3. queues all notifications in one write (grouped per recipient) and
+     writes all log entries in one insert
 """
 
 from __future__ import annotations
 
+import asyncio
 import logging
 from datetime import datetime, timezone, timedelta, date
 
 from app.config import settings
 from app.database import (
-    get_boletos_ativos,
-    create_log,
+    get_boletos_por_vencimento,
+    claim_boleto_lembretes,
+    release_boleto_lembretes,
+    create_logs,
 )
-from app.services.notifications import send_boleto_notification
+from app.services.notifications import notification_service
 
 logger = logging.getLogger(__name__)
 
+# Marco -1 is the D-1 reminder; positive marcos are days overdue
+MARCO_D1 = -1
+STATUS_A_VENCER = ("emitido", "01")
+STATUS_ATIVOS = ("emitido", "01", "atraso")
 
-def _parse_date(value) -> date | None:
-    """Parse a date from string or date object."""
-    if isinstance(value, date):
-        return value
-    if isinstance(value, str):
-        try:
-            return datetime.strptime(value[:10], "%Y-%m-%d").date()
-        except ValueError:
-            return None
-    return None
+
+def marcos_atraso(max_dias: int) -> list[int]:
+    """Days overdue that get an "Aviso de Atraso": D+1, D+3, D+7, then weekly."""
+    return [d for d in (1, 3, 7) if d <= max_dias] + list(range(14, max_dias + 1, 7))
+
+
+def _contact(boleto: dict, field: str):
+    """Contact field from the boleto or its joined empresa."""
+    return boleto.get(field) or (boleto.get("empresas") or {}).get(field)
 
 
-async def check_boleto_vencimentos():
+def _notification(boleto: dict, venc_date: date) -> tuple[dict, str | None, str | None]:
+    """Notification payload and recipients for a boleto."""
+    notif_data = {
+        "nomeSacado": boleto.get("pagador_nome", "Cliente"),
+        "valorNominal": boleto.get("vl_nominal") or boleto.get("valor", 0),
+        "dataVencimento": venc_date.strftime("%d/%m/%Y"),
+        "linhaDigitavel": boleto.get("linha_digitavel", ""),
+        "linkPdfBoleto": (
+            f"{settings.backend_url}/api/boleto/pdf/"
+            f"{boleto.get('nosso_numero', boleto.get('id', '?'))}"
+        ),
+    }
+    email = _contact(boleto, "email_notificacao") or boleto.get("pagador_email")
+    phone = _contact(boleto, "whatsapp") or boleto.get("pagador_whatsapp")
+    return notif_data, email, phone
+
+
+async def check_boleto_vencimentos(today: date | None = None) -> dict:
     """
-    Daily cron (07:00) — scans all active boletos for D-1 and D+1 alerts.
+    Daily cron (07:00) — D-1 and D+N alerts for the boletos due for one today.
 
     D-1: status='emitido', data_vencimento = tomorrow
          → "Lembrete de Vencimento"
 
-    D+1: status='emitido' or 'atraso', data_vencimento < today
-         → "Aviso de Atraso" (only first time or weekly reminder)
+    D+N: status='emitido' or 'atraso', N days past data_vencimento
+         → "Aviso de Atraso" (D+1, D+3, D+7, then weekly)
     """
-    logger.info("=== Job: Check Boleto Vencimentos (D-1 / D+1) ===")
+    logger.info("=== Job: Check Boleto Vencimentos (D-1 / D+N) ===")
+    today = today or datetime.now(timezone.utc).date()
+    counts = {"selected": 0, "d1": 0, "atraso": 0, "already_sent": 0, "messages": 0}
+
+    # 1. Which vencimento triggers which marco today
+    marcos = {today + timedelta(days=1): MARCO_D1}
+    for dias in marcos_atraso(settings.notification_atraso_max_days):
+        marcos[today - timedelta(days=dias)] = dias
 
     try:
-        boletos = get_boletos_ativos()
+        boletos = await asyncio.to_thread(get_boletos_por_vencimento, list(marcos), list(STATUS_ATIVOS))
     except Exception as e:
-        logger.error(f"Failed to fetch active boletos: {e}")
-        return
-
-    today = datetime.now(timezone.utc).date()
-    tomorrow = today + timedelta(days=1)
-
-    d1_count = 0
-    d_plus_count = 0
+        logger.error(f"Failed to fetch boletos due for a reminder: {e}")
+        return counts
+    counts["selected"] = len(boletos)
 
+    candidatos: dict[tuple, dict] = {}
     for boleto in boletos:
-        boleto_id = boleto.get("id", "?")
-        status = boleto.get("status", "")
-        vencimento_raw = boleto.get("data_vencimento") or boleto.get("dataVencimento")
-        venc_date = _parse_date(vencimento_raw)
-
-        if not venc_date:
+        venc_date = date.fromisoformat(str(boleto["data_vencimento"])[:10])
+        marco = marcos[venc_date]
+        if marco == MARCO_D1 and boleto.get("status") not in STATUS_A_VENCER:
             continue
+        key = (boleto["id"], venc_date.isoformat(), marco)
+        candidatos[key] = boleto
 
-        # Build notification payload
-        notif_data = {
-            "nomeSacado": boleto.get("pagador_nome", "Cliente"),
-            "valorNominal": boleto.get("vl_nominal") or boleto.get("valor", 0),
-            "dataVencimento": venc_date.strftime("%d/%m/%Y"),
-            "linhaDigitavel": boleto.get("linha_digitavel", ""),
-            "linkPdfBoleto": (
-                f"{settings.backend_url}/api/boleto/pdf/"
-                f"{boleto.get('nosso_numero', boleto_id)}"
-            ),
-        }
-
-        email = boleto.get("email_notificacao") or boleto.get("pagador_email")
-        phone = boleto.get("whatsapp") or boleto.get("pagador_whatsapp")
-
-        # ── D-1: Vence amanhã ────────────────────────────────────────
-        if venc_date == tomorrow and status in ("emitido", "01"):
-            logger.info(f"D-1 alert for boleto {boleto_id} (venc: {venc_date})")
-
+    # 2. Ledger: only reminders not sent before
+    try:
+        novos = await asyncio.to_thread(claim_boleto_lembretes, [
+            {"boleto_id": boleto_id, "data_vencimento": venc, "marco": marco}
+            for boleto_id, venc, marco in candidatos
+        ])
+    except Exception as e:
+        logger.error(f"Failed to record vencimento reminders: {e}")
+        return counts
+    counts["already_sent"] = len(candidatos) - len(novos)
+
+    # 3. Queue and log everything at once
+    notifications, log_entries = [], []
+    for lembrete in novos:
+        boleto_id, marco = lembrete["boleto_id"], lembrete["marco"]
+        boleto = candidatos[(boleto_id, str(lembrete["data_vencimento"])[:10], marco)]
+        notif_data, email, phone = _notification(boleto, date.fromisoformat(str(lembrete["data_vencimento"])[:10]))
+
+        if marco == MARCO_D1:
+            notifications.append(("vencimento_d1", notif_data, email, phone))
+            log_entries.append({
+                "consulta_id": "BOLETO_D1",
+                "nivel": "INFO",
+                "mensagem": f"Lembrete D-1 enviado: {boleto_id}",
+            })
+            counts["d1"] += 1
+        else:
+            notif_data["diasAtraso"] = marco
+            notifications.append(("atraso", notif_data, email, phone))
+            log_entries.append({
+                "consulta_id": "BOLETO_ATRASO",
+                "nivel": "WARN",
+                "mensagem": f"Alerta D+{marco} enviado: {boleto_id}",
+            })
+            counts["atraso"] += 1
+
+    if notifications:
+        try:
+            counts["messages"] = await notification_service.notify_many(notifications)
+        except Exception as e:
+            logger.error(f"Failed to queue vencimento reminders: {e}")
+            # Not queued: free the ledger so the next run sends them
             try:
-                await send_boleto_notification(
-                    "vencimento_d1", notif_data, email, phone
-                )
-                d1_count += 1
-                create_log(
-                    consulta_id="BOLETO_D1",
-                    nivel="INFO",
-                    mensagem=f"Lembrete D-1 enviado: {boleto_id}",
-                )
-            except Exception as e:
-                logger.error(f"D-1 notification failed for {boleto_id}: {e}")
-
-        # ── D+1: Vencido ─────────────────────────────────────────────
-        elif venc_date < today and status in ("emitido", "01", "atraso"):
-            dias_atraso = (today - venc_date).days
-
-            # Notify on D+1, D+3, D+7, then weekly
-            should_notify = dias_atraso in (1, 3, 7) or (dias_atraso > 7 and dias_atraso % 7 == 0)
-
-            if should_notify:
-                logger.info(
-                    f"D+{dias_atraso} alert for boleto {boleto_id} (venc: {venc_date})"
-                )
-                notif_data["diasAtraso"] = dias_atraso
-
-                try:
-                    await send_boleto_notification(
-                        "atraso", notif_data, email, phone
-                    )
-                    d_plus_count += 1
-                    create_log(
-                        consulta_id="BOLETO_ATRASO",
-                        nivel="WARN",
-                        mensagem=f"Alerta D+{dias_atraso} enviado: {boleto_id}",
-                    )
-                except Exception as e:
-                    logger.error(f"D+ notification failed for {boleto_id}: {e}")
+                await asyncio.to_thread(release_boleto_lembretes, novos)
+            except Exception as release_error:
+                logger.error(f"Failed to release vencimento reminders: {release_error}")
+            counts["d1"] = counts["atraso"] = 0
+            return counts
+        try:
+            await asyncio.to_thread(create_logs, log_entries)
+        except Exception as e:
+            logger.error(f"Failed to log vencimento reminders: {e}")
 
     logger.info(
-        f"Vencimento check complete. D-1 sent: {d1_count}, D+ sent: {d_plus_count}"
+        f"Vencimento check complete. D-1 sent: {counts['d1']}, D+ sent: {counts['atraso']} "
+        f"({counts['already_sent']} already sent, {counts['messages']} messages queued)"
     )
+    return counts
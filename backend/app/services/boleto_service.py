@@ -5,13 +5,26 @@ Ported from TypeScript modulo-cobranca/BoletoService.ts
 """
 
 import re
+import asyncio
 import logging
 from datetime import datetime, timezone, date, timedelta
-from typing import Any
+from decimal import Decimal, ROUND_HALF_EVEN
+from typing import Any, AsyncIterator
 
+import numpy as np
+
+from app.config import settings
 from app.services.bradesco import bradesco_service
 from app.services.notifications import send_boleto_notification
-from app.database import create_log
+from app.database import (
+    create_log,
+    create_logs,
+    claim_boleto_fatura,
+    confirm_boleto_fatura,
+    release_boleto_fatura,
+    get_boletos_registrando,
+    get_boleto_aggregates,
+)
 
 logger = logging.getLogger(__name__)
 
@@ -24,6 +37,13 @@ STATUS_CANCELADO = "05"
 STATUS_PAGO_PARCIAL = "62"
 STATUS_PENDENTE = "00"
 
+# Local status of an invoice claimed for emission, not yet confirmed by Bradesco
+STATUS_REGISTRANDO = "registrando"
+
+# Status groups used by the statistics (local names and Bradesco codes)
+STATUS_GRUPO_PAGO = ("pago", STATUS_PAGO)
+STATUS_GRUPO_VENCIDO = ("vencido", "atraso")
+
 MOTIVOS_BAIXA = {
     "1": "Pago em dinheiro",
     "2": "Pago em cheque",
@@ -34,6 +54,29 @@ MOTIVOS_BAIXA = {
     "7": "Outros",
 }
 
+# Boletos per chunk of a lote; history is written once per chunk
+LOTE_CHUNK = 100
+
+
+CENTAVO = Decimal("0.01")
+
+
+def _centavos(valor: float) -> float:
+    """Round a money amount to cents on its decimal value (not the binary float)."""
+    return float(Decimal(repr(valor)).quantize(CENTAVO, rounding=ROUND_HALF_EVEN))
+
+
+def _centavos_array(valores: np.ndarray) -> np.ndarray:
+    """_centavos over an array: NumPy rounding, with Decimal only for the
+    values sitting on a half-cent tie (where binary and decimal can disagree)."""
+    escalados = valores * 100
+    arredondados = np.round(escalados) / 100
+    empates = np.flatnonzero(np.abs(np.abs(escalados - np.trunc(escalados)) - 0.5) < 1e-6)
+    for i in empates.tolist():
+        arredondados[i] = _centavos(float(valores[i]))
+    return arredondados
+
+
 
 class BoletoService:
     """Orchestrates boleto operations: emission, query, cancelation, protest."""
@@ -48,37 +91,88 @@ class BoletoService:
         3. Log history
         4. Trigger notifications
         """
+        resultado, log_entry = await self._emitir(dados, usuario_id)
+        if log_entry:
+            create_log(**log_entry)
+        return resultado
+
+    async def _emitir(self, dados: dict, usuario_id: str) -> tuple[dict, dict | None]:
+        """Emit one boleto; returns the result and its history entry (not written yet).
+
+        nuFatura is the idempotency key: the invoice's boleto row is claimed
+        (status 'registrando', unique nu_fatura) before Bradesco is called, so
+        an invoice that is emitted or being emitted is never sent twice, even
+        by concurrent lotes. A failed lote can simply be resent.
+        """
+        nu_fatura = None
         try:
             # 1. Validate payer data
             pagador_doc = dados.get("pagador_documento", "")
             if pagador_doc and not self.validar_cpf_cnpj(pagador_doc):
-                return {"sucesso": False, "erro": "CPF/CNPJ do pagador inválido"}
+                return {"sucesso": False, "erro": "CPF/CNPJ do pagador inválido"}, None
 
             pagador_nome = dados.get("pagador_nome", "")
             if not pagador_nome:
-                return {"sucesso": False, "erro": "Nome do pagador é obrigatório"}
+                return {"sucesso": False, "erro": "Nome do pagador é obrigatório"}, None
 
             vl_nominal = dados.get("vlNominal", 0)
             if vl_nominal <= 0:
-                return {"sucesso": False, "erro": "Valor deve ser maior que zero"}
+                return {"sucesso": False, "erro": "Valor deve ser maior que zero"}, None
+
+            if dados.get("nuFatura"):
+                boleto, claimed = await asyncio.to_thread(claim_boleto_fatura, {
+                    "nu_fatura": str(dados["nuFatura"]),
+                    "empresa_id": dados.get("empresa_id"),
+                    "vl_nominal": vl_nominal,
+                    "data_vencimento": str(dados.get("dataVencimento")),
+                    "pagador_nome": pagador_nome,
+                })
+                if not claimed:
+                    if boleto.get("status") == STATUS_REGISTRANDO:
+                        return {
+                            "sucesso": False,
+                            "em_registro": True,
+                            "erro": "Boleto desta fatura já está em registro",
+                        }, None
+                    return {
+                        "sucesso": True,
+                        "ja_emitido": True,
+                        "nosso_numero": boleto.get("nosso_numero"),
+                        "linha_digitavel": boleto.get("linha_digitavel", ""),
+                    }, None
+                nu_fatura = str(dados["nuFatura"])
 
             # 2. Call Bradesco
             email = dados.get("pagador_email")
             phone = dados.get("pagador_whatsapp") or dados.get("pagador_celular")
 
-            resp = await bradesco_service.register_boleto(
-                dados,
-                recipient_email=email,
-                recipient_phone=phone
-            )
+            try:
+                resp = await bradesco_service.register_boleto(
+                    dados,
+                    recipient_email=email,
+                    recipient_phone=phone
+                )
+            except Exception:
+                if nu_fatura:
+                    # Unknown outcome (timeout, 5xx): the claim stays 'registrando' so a
+                    # resend cannot register the invoice twice; conciliar_registros
+                    # settles it with Bradesco later
+                    logger.error(
+                        f"[BoletoService] Fatura {nu_fatura}: registro sem resposta do Bradesco, "
+                        "mantida em 'registrando' até conciliação"
+                    )
+                raise
 
             # 3. Check response
             if resp.get("cdErro", 0) != 0:
+                if nu_fatura:
+                    # Refused by Bradesco: free the invoice for a resend
+                    await asyncio.to_thread(release_boleto_fatura, nu_fatura)
                 return {
                     "sucesso": False,
                     "erro": resp.get("msgErro", "Erro ao registrar boleto"),
                     "codigoErro": resp.get("cdErro"),
-                }
+                }, None
 
             # 4. Extract key data
             nosso_numero = resp.get("nuNossoNumero")
@@ -86,12 +180,26 @@ class BoletoService:
             if not linha_digitavel and "listaRegistro" in resp:
                 linha_digitavel = resp["listaRegistro"][0].get("linhaDigitavel", "")
 
-            # 5. Log history
-            create_log(
-                consulta_id="BOLETO_EMISSAO",
-                nivel="INFO",
-                mensagem=f"Boleto emitido: {nosso_numero} por {usuario_id}",
-                payload={
+            # 5. Confirm the claimed row
+            if nu_fatura:
+                try:
+                    await asyncio.to_thread(confirm_boleto_fatura, nu_fatura, {
+                        "nosso_numero": nosso_numero,
+                        "linha_digitavel": linha_digitavel,
+                    })
+                except Exception as e:
+                    # conciliar_registros finds the title at Bradesco and confirms it
+                    logger.error(
+                        f"[BoletoService] Boleto {nosso_numero} emitido mas não salvo "
+                        f"(fatura {nu_fatura} segue em 'registrando' até a conciliação): {e}"
+                    )
+
+            # 6. History entry
+            log_entry = {
+                "consulta_id": "BOLETO_EMISSAO",
+                "nivel": "INFO",
+                "mensagem": f"Boleto emitido: {nosso_numero} por {usuario_id}",
+                "payload": {
                     "nosso_numero": nosso_numero,
                     "valor": vl_nominal,
                     "vencimento": str(dados.get("dataVencimento")),
@@ -99,41 +207,155 @@ class BoletoService:
                     "tipo_alteracao": "REGISTRO",
                     "status_novo": STATUS_PENDENTE,
                     "origem": "API",
-                }
-            )
+                },
+            }
 
             return {
                 "sucesso": True,
                 "nosso_numero": nosso_numero,
                 "linha_digitavel": linha_digitavel,
                 "bradesco_response": resp,
-            }
+            }, log_entry
 
         except Exception as e:
             logger.error(f"[BoletoService] Erro ao emitir: {e}")
-            return {"sucesso": False, "erro": str(e)}
+            return {"sucesso": False, "erro": str(e)}, None
+
+    async def emitir_lote_stream(
+        self, boletos: list[dict], usuario_id: str = "system", concurrency: int | None = None
+    ) -> AsyncIterator[dict]:
+        """Emit a lote concurrently, yielding each result as it finishes and then the summary.
+
+        Items are processed in chunks of LOTE_CHUNK with up to ``concurrency``
+        (default ``boleto_emissao_concurrency``) Bradesco calls in flight;
+        each chunk's history is written in one insert.
+        """
+        if not boletos:
+            yield {"sucesso": False, "erro": "Lista de boletos vazia"}
+            return
+
+        semaforo = asyncio.Semaphore(concurrency or settings.boleto_emissao_concurrency)
+        resumo = {"total": len(boletos), "sucessos": 0, "erros": 0, "ja_emitidos": 0}
+        faturas_vistas: set[str] = set()
+
+        async def emitir_item(indice: int, dados: dict) -> tuple[int, dict, dict | None]:
+            async with semaforo:
+                resultado, log_entry = await self._emitir(dados, usuario_id)
+            return indice, resultado, log_entry
+
+        def contar(resultado: dict) -> None:
+            if not resultado.get("sucesso"):
+                resumo["erros"] += 1
+            else:
+                resumo["sucessos"] += 1
+                resumo["ja_emitidos"] += bool(resultado.get("ja_emitido"))
+
+        for inicio in range(0, len(boletos), LOTE_CHUNK):
+            tarefas = []
+            for indice, dados in enumerate(boletos[inicio:inicio + LOTE_CHUNK], start=inicio):
+                nu_fatura = dados.get("nuFatura")
+                if nu_fatura and str(nu_fatura) in faturas_vistas:
+                    resultado = {"sucesso": False, "erro": f"nuFatura {nu_fatura} repetido no lote"}
+                    contar(resultado)
+                    yield {"indice": indice, "nuFatura": nu_fatura, **resultado}
+                    continue
+                if nu_fatura:
+                    faturas_vistas.add(str(nu_fatura))
+                tarefas.append(asyncio.create_task(emitir_item(indice, dados)))
+
+            logs = []
+            try:
+                for concluida in asyncio.as_completed(tarefas):
+                    indice, resultado, log_entry = await concluida
+                    if log_entry:
+                        logs.append(log_entry)
+                    contar(resultado)
+                    yield {"indice": indice, "nuFatura": boletos[indice].get("nuFatura"), **resultado}
+            finally:
+                # Consumer gone (e.g. client disconnected): stop the rest of the chunk
+                for tarefa in tarefas:
+                    tarefa.cancel()
+                try:
+                    await asyncio.to_thread(create_logs, logs)
+                except Exception as e:
+                    logger.error(f"[BoletoService] Erro ao gravar histórico do lote: {e}")
+
+        yield {"resumo": resumo}
 
     async def emitir_lote(self, boletos: list[dict], usuario_id: str = "system") -> dict:
-        """Emit multiple boletos in batch (max 100)."""
+        """Emit multiple boletos in batch (chunked, concurrent, resumable by nuFatura)."""
         if not boletos:
             return {"sucesso": False, "erro": "Lista de boletos vazia"}
-        if len(boletos) > 100:
-            return {"sucesso": False, "erro": "Limite máximo de 100 boletos por lote"}
-
-        resultados = []
-        for boleto in boletos:
-            resultado = await self.emitir_boleto(boleto, usuario_id)
-            resultados.append(resultado)
 
-        sucessos = sum(1 for r in resultados if r.get("sucesso"))
-        erros = sum(1 for r in resultados if not r.get("sucesso"))
+        resultados, resumo = [], {}
+        async for evento in self.emitir_lote_stream(boletos, usuario_id):
+            if "resumo" in evento:
+                resumo = evento["resumo"]
+            else:
+                resultados.append(evento)
+        resultados.sort(key=lambda r: r["indice"])
 
         return {
             "sucesso": True,
-            "resumo": {"total": len(boletos), "sucessos": sucessos, "erros": erros},
+            "resumo": resumo,
             "resultados": resultados,
         }
 
+    # ========================= RECONCILIATION =========================
+
+    async def conciliar_registros(self) -> dict:
+        """Settle invoices stuck in 'registrando' (no Bradesco answer, or the
+        answer was not saved): confirm the ones Bradesco registered, release
+        the others so they can be sent again.
+
+        Runs on a schedule; claims younger than
+        ``boleto_registro_conciliacao_minutes`` may still be in flight and are
+        left alone. A row Bradesco cannot be asked about stays for the next run.
+        """
+        limite = datetime.now(timezone.utc) - timedelta(minutes=settings.boleto_registro_conciliacao_minutes)
+        pendentes = await asyncio.to_thread(get_boletos_registrando, limite)
+        resumo = {"total": len(pendentes), "confirmados": 0, "liberados": 0, "erros": 0}
+        logs = []
+
+        for boleto in pendentes:
+            nu_fatura = boleto["nu_fatura"]
+            try:
+                titulo = await bradesco_service.consult_fatura(nu_fatura)
+                if titulo is None:
+                    await asyncio.to_thread(release_boleto_fatura, nu_fatura)
+                    resumo["liberados"] += 1
+                    continue
+                nosso_numero = titulo.get("nuNossoNumero")
+                await asyncio.to_thread(confirm_boleto_fatura, nu_fatura, {
+                    "nosso_numero": nosso_numero,
+                    "linha_digitavel": titulo.get("linhaDigitavel", ""),
+                })
+                resumo["confirmados"] += 1
+                logs.append({
+                    "consulta_id": "BOLETO_EMISSAO",
+                    "nivel": "INFO",
+                    "mensagem": f"Boleto emitido: {nosso_numero} (conciliado da fatura {nu_fatura})",
+                    "payload": {
+                        "nosso_numero": nosso_numero,
+                        "nu_fatura": nu_fatura,
+                        "tipo_alteracao": "REGISTRO",
+                        "status_novo": STATUS_PENDENTE,
+                        "origem": "CONCILIACAO",
+                    },
+                })
+            except Exception as e:
+                resumo["erros"] += 1
+                logger.error(f"[BoletoService] Conciliação da fatura {nu_fatura} falhou: {e}")
+
+        if logs:
+            try:
+                await asyncio.to_thread(create_logs, logs)
+            except Exception as e:
+                logger.error(f"[BoletoService] Erro ao gravar histórico da conciliação: {e}")
+        if pendentes:
+            logger.info(f"[BoletoService] Conciliação de registros: {resumo}")
+        return resumo
+
     # ========================= QUERY & UPDATE =========================
 
     async def consultar_e_atualizar(self, nosso_numero: str) -> dict:
@@ -246,9 +468,10 @@ class BoletoService:
         data_vencimento: date,
         percentual_juros_dia: float = 0.0333,
         percentual_multa: float = 2.0,
+        hoje: date | None = None,
     ) -> dict:
         """Calculate updated amount with interest and penalty for overdue boletos."""
-        hoje = date.today()
+        hoje = hoje or date.today()
         if hoje <= data_vencimento:
             return {
                 "dias_atraso": 0,
@@ -258,9 +481,9 @@ class BoletoService:
             }
 
         dias_atraso = (hoje - data_vencimento).days
-        valor_juros = round(valor_nominal * (percentual_juros_dia / 100) * dias_atraso, 2)
-        valor_multa = round(valor_nominal * (percentual_multa / 100), 2)
-        valor_total = round(valor_nominal + valor_juros + valor_multa, 2)
+        valor_juros = _centavos(valor_nominal * (percentual_juros_dia / 100) * dias_atraso)
+        valor_multa = _centavos(valor_nominal * (percentual_multa / 100))
+        valor_total = _centavos(valor_nominal + valor_juros + valor_multa)
 
         return {
             "dias_atraso": dias_atraso,
@@ -269,39 +492,111 @@ class BoletoService:
             "valor_total": valor_total,
         }
 
-    # ========================= STATISTICS =========================
-
     @staticmethod
-    def calcular_estatisticas(boletos: list[dict]) -> dict:
-        """Calculate billing statistics from a list of boletos."""
-        if not boletos:
-            return {
-                "total": 0, "a_vencer": 0, "pagos": 0, "vencidos": 0,
-                "valor_total": 0, "valor_recebido": 0, "valor_pendente": 0,
-                "taxa_recebimento": 0.0,
-            }
+    def calcular_juros_multa_lote(
+        valores_nominais,
+        datas_vencimento,
+        percentual_juros_dia=0.0333,
+        percentual_multa=2.0,
+        hoje: date | None = None,
+    ) -> list[dict]:
+        """calcular_juros_multa over a whole portfolio in one NumPy pass.
+
+        Rates may be a single value or one per boleto; vencimentos may be
+        dates or ISO strings. Results match the single-boleto calculation.
+        """
+        hoje = hoje or date.today()
+        valores = np.asarray(valores_nominais, dtype=np.float64)
+        vencimentos = np.fromiter(
+            (v.toordinal() if isinstance(v, date) else date.fromisoformat(str(v)[:10]).toordinal()
+             for v in datas_vencimento),
+            dtype=np.int64, count=len(valores),
+        )
+        juros_dia = np.broadcast_to(np.asarray(percentual_juros_dia, dtype=np.float64), valores.shape)
+        multa = np.broadcast_to(np.asarray(percentual_multa, dtype=np.float64), valores.shape)
+
+        dias = hoje.toordinal() - vencimentos
+        atraso = dias > 0
+        dias = np.where(atraso, dias, 0)
+        # Same operation order as calcular_juros_multa, so the floats are identical
+        valor_juros = _centavos_array(valores * (juros_dia / 100) * dias)
+        valor_multa = _centavos_array(valores * (multa / 100))
+        valor_total = _centavos_array(valores + valor_juros + valor_multa)
 
-        total = len(boletos)
-        pagos = sum(1 for b in boletos if b.get("status") in ("pago", "61"))
-        vencidos = sum(1 for b in boletos if b.get("status") in ("vencido", "atraso"))
-        a_vencer = total - pagos - vencidos
+        resultados = []
+        for nominal, em_atraso, d, j, m, t in zip(
+            valores_nominais, atraso.tolist(), dias.tolist(),
+            valor_juros.tolist(), valor_multa.tolist(), valor_total.tolist(),
+        ):
+            if em_atraso:
+                resultados.append({"dias_atraso": d, "valor_juros": j, "valor_multa": m, "valor_total": t})
+            else:
+                resultados.append({"dias_atraso": 0, "valor_juros": 0.0, "valor_multa": 0.0, "valor_total": nominal})
+        return resultados
 
-        valor_total = sum(float(b.get("valor", 0)) for b in boletos)
-        valor_recebido = sum(float(b.get("valor", 0)) for b in boletos if b.get("status") in ("pago", "61"))
-        valor_pendente = valor_total - valor_recebido
-        taxa = (pagos / total * 100) if total > 0 else 0.0
+    # ========================= STATISTICS =========================
 
+    @staticmethod
+    def _montar_estatisticas(total: int, pagos: int, vencidos: int, valor_total: float, valor_recebido: float) -> dict:
+        taxa = (pagos / total * 100) if total > 0 else 0.0
         return {
             "total": total,
-            "a_vencer": a_vencer,
+            "a_vencer": total - pagos - vencidos,
             "pagos": pagos,
             "vencidos": vencidos,
             "valor_total": round(valor_total, 2),
             "valor_recebido": round(valor_recebido, 2),
-            "valor_pendente": round(valor_pendente, 2),
+            "valor_pendente": round(valor_total - valor_recebido, 2),
             "taxa_recebimento": round(taxa, 1),
         }
 
+    @staticmethod
+    def calcular_estatisticas(boletos: list[dict]) -> dict:
+        """Calculate billing statistics from a list of boletos."""
+        total = pagos = vencidos = 0
+        valor_total = valor_recebido = 0.0
+        for b in boletos:
+            valor = float(b.get("valor", 0))
+            total += 1
+            valor_total += valor
+            if b.get("status") in STATUS_GRUPO_PAGO:
+                pagos += 1
+                valor_recebido += valor
+            elif b.get("status") in STATUS_GRUPO_VENCIDO:
+                vencidos += 1
+        return BoletoService._montar_estatisticas(total, pagos, vencidos, valor_total, valor_recebido)
+
+    @staticmethod
+    def estatisticas_agregadas(agregados: list[dict]) -> dict:
+        """Same statistics as calcular_estatisticas, from boleto_aggregates rows
+        (one per empresa/mês/status), plus a per-month breakdown."""
+        por_mes: dict[str, list] = {}
+        for row in agregados:
+            # [total, pagos, vencidos, valor_total, valor_recebido] in cents
+            acc = por_mes.setdefault(str(row.get("mes")), [0, 0, 0, 0, 0])
+            qtd, valor = int(row.get("quantidade", 0)), int(row.get("valor_centavos", 0))
+            acc[0] += qtd
+            acc[3] += valor
+            if row.get("status") in STATUS_GRUPO_PAGO:
+                acc[1] += qtd
+                acc[4] += valor
+            elif row.get("status") in STATUS_GRUPO_VENCIDO:
+                acc[2] += qtd
+
+        def montar(acc: list) -> dict:
+            return BoletoService._montar_estatisticas(acc[0], acc[1], acc[2], acc[3] / 100, acc[4] / 100)
+
+        geral = [sum(values) for values in zip(*por_mes.values())] or [0, 0, 0, 0, 0]
+        return {
+            **montar(geral),
+            "por_mes": [{"mes": mes, **montar(acc)} for mes, acc in sorted(por_mes.items())],
+        }
+
+    async def obter_estatisticas(self, empresa_id: str | None = None, mes: str | None = None) -> dict:
+        """Billing statistics from the maintained aggregates (cost independent of the number of boletos)."""
+        agregados = await asyncio.to_thread(get_boleto_aggregates, empresa_id, mes)
+        return self.estatisticas_agregadas(agregados)
+
     # ========================= VALIDATION =========================
 
     @staticmethod
@@ -5,6 +5,9 @@ Features:
   - TLS 1.2 with mandated cipher suite
   - Boleto: register, register-qr-code, alter, cancel (estorno), consult
   - Notification triggers on success events
+  - One long-lived mTLS client (keep-alive pool) shared by every call
+  - Single-flight token refresh, renewed ahead of expiry
+  - Latency / error stats per endpoint (/api/health)
 """
 
 from __future__ import annotations
@@ -17,10 +20,14 @@ import logging
 import asyncio
 from datetime import datetime, timezone
 
+from collections import deque
+
 import httpx
 
 from app.config import settings
 from app.services.notifications import send_boleto_notification
+from app.services.rate_limit import AdaptiveRateLimiter
+from app.utils import percentile
 
 logger = logging.getLogger(__name__)
 
@@ -28,6 +35,10 @@ logger = logging.getLogger(__name__)
 
 SANDBOX_URL = "https://proxy.api.prebanco.com.br"
 PRODUCTION_URL = "https://openapi.bradesco.com.br"
+TOKEN_ENDPOINT = "/auth/server/v1.1/token"
+
+# Samples kept per endpoint for the latency stats
+LATENCY_WINDOW = 500
 
 
 # ─── TLS 1.2 Context ────────────────────────────────────────────────
@@ -59,14 +70,40 @@ def _create_tls_context() -> ssl.SSLContext:
 
 
 def _build_http_client() -> httpx.AsyncClient:
-    """Create an httpx client with TLS 1.2 enforcement."""
+    """Create an httpx client with TLS 1.2 enforcement and a keep-alive pool."""
     tls_ctx = _create_tls_context()
     return httpx.AsyncClient(
         verify=tls_ctx,
         timeout=httpx.Timeout(30.0, connect=10.0),
+        limits=httpx.Limits(
+            max_connections=settings.bradesco_max_connections,
+            max_keepalive_connections=settings.bradesco_max_connections,
+            keepalive_expiry=settings.bradesco_keepalive_seconds,
+        ),
     )
 
 
+class _EndpointStats:
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.latency: deque[float] = deque(maxlen=LATENCY_WINDOW)
+
+    def record(self, seconds: float, error: bool) -> None:
+        self.calls += 1
+        self.errors += error
+        self.latency.append(seconds)
+
+    def as_dict(self) -> dict:
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "latency_p50": percentile(self.latency, 0.50),
+            "latency_p95": percentile(self.latency, 0.95),
+            "latency_max": round(max(self.latency), 3) if self.latency else None,
+        }
+
+
 # ═══════════════════════════════════════════════════════════════════════
 
 class BradescoService:
@@ -76,21 +113,80 @@ class BradescoService:
         self.base_url = SANDBOX_URL if settings.bradesco_sandbox else PRODUCTION_URL
         self._token: str | None = None
         self._token_expires_at: float = 0
+        self._token_refresh_at: float = 0
+        self._token_lock = asyncio.Lock()
+        self._token_refreshes = 0
+        self._client: httpx.AsyncClient | None = None
+        self._endpoints: dict[str, _EndpointStats] = {}
+        # Paces registrations from batch emission and recurring billing
+        self.register_limiter = AdaptiveRateLimiter(
+            rate=settings.bradesco_register_rate_per_second,
+            max_rate=settings.bradesco_register_max_rate_per_second,
+        )
+
+    # ── HTTP ──────────────────────────────────────────────────────────
+
+    def _http(self) -> httpx.AsyncClient:
+        """The shared client; TLS context and cert chain are loaded once."""
+        if self._client is None or self._client.is_closed:
+            self._client = _build_http_client()
+        return self._client
+
+    async def _request(self, method: str, endpoint: str, **kwargs) -> httpx.Response:
+        """Send a request over the pooled client, timing it per endpoint."""
+        stats = self._endpoints.setdefault(endpoint, _EndpointStats())
+        started = time.monotonic()
+        try:
+            resp = await self._http().request(method, f"{self.base_url}{endpoint}", **kwargs)
+        except Exception:
+            stats.record(time.monotonic() - started, error=True)
+            raise
+        stats.record(time.monotonic() - started, error=resp.status_code >= 400)
+        return resp
+
+    async def aclose(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    @property
+    def stats(self) -> dict:
+        return {
+            "pooled_client": self._client is not None and not self._client.is_closed,
+            "token_refreshes": self._token_refreshes,
+            "token_expires_in": (
+                round(self._token_expires_at - time.time()) if self._token else None
+            ),
+            "endpoints": {name: s.as_dict() for name, s in self._endpoints.items()},
+            "register_rate_limit": self.register_limiter.stats,
+        }
 
     # ── Auth ──────────────────────────────────────────────────────────
 
+    def _token_fresh(self) -> bool:
+        return self._token is not None and time.time() < self._token_refresh_at
+
     async def _get_access_token(self) -> str:
-        """Get OAuth2 access token via JWT Profile (RS256)."""
-        if self._token and time.time() < self._token_expires_at - 60:
+        """Get OAuth2 access token via JWT Profile (RS256).
+
+        Only one caller refreshes an expiring token; the others wait for it.
+        """
+        if self._token_fresh():
             return self._token
 
         if not settings.bradesco_client_id or not settings.bradesco_private_key_path:
             logger.warning("Bradesco credentials not fully configured. Using MOCK.")
             return "MOCK_TOKEN"
 
+        async with self._token_lock:
+            if self._token_fresh():  # refreshed while we waited
+                return self._token
+            return await self._refresh_token()
+
+    async def _refresh_token(self) -> str:
         now = int(time.time())
         claims = {
-            "aud": f"{self.base_url}/auth/server/v1.1/token",
+            "aud": f"{self.base_url}{TOKEN_ENDPOINT}",
             "sub": settings.bradesco_client_id,
             "iat": now,
             "exp": now + 3600,
@@ -103,21 +199,21 @@ class BradescoService:
 
             signed_jwt = jwt.encode(claims, private_key, algorithm="RS256")
 
-            async with _build_http_client() as client:
-                data = {
-                    "grant_type": "urn:ietf:params:oauth:grant-type:jwt-bearer",
-                    "assertion": signed_jwt,
-                }
-                resp = await client.post(
-                    f"{self.base_url}/auth/server/v1.1/token", data=data
-                )
-                resp.raise_for_status()
-                token_data = resp.json()
-                self._token = token_data["access_token"]
-                self._token_expires_at = now + int(
-                    token_data.get("expires_in", 3600)
-                )
-                return self._token
+            data = {
+                "grant_type": "urn:ietf:params:oauth:grant-type:jwt-bearer",
+                "assertion": signed_jwt,
+            }
+            resp = await self._request("POST", TOKEN_ENDPOINT, data=data)
+            resp.raise_for_status()
+            token_data = resp.json()
+            expires_in = int(token_data.get("expires_in", 3600))
+            self._token = token_data["access_token"]
+            self._token_expires_at = now + expires_in
+            # Renew ahead of expiry (at most halfway through a short-lived token)
+            margin = min(settings.bradesco_token_refresh_margin_seconds, expires_in // 2)
+            self._token_refresh_at = self._token_expires_at - margin
+            self._token_refreshes += 1
+            return self._token
         except Exception as e:
             logger.error(f"Failed to get Bradesco access token: {e}")
             raise
@@ -194,54 +290,63 @@ class BradescoService:
                 ],
             }
 
-        async with _build_http_client() as client:
-            try:
-                resp = await client.post(
-                    f"{self.base_url}{endpoint}",
-                    json=payload,
-                    headers=self._auth_headers(token),
-                )
-                resp.raise_for_status()
-            except httpx.HTTPStatusError as e:
-                logger.error(f"Bradesco API Error: {e.response.text}")
-                return {"cdErro": e.response.status_code, "msgErro": e.response.text}
-
-            data = resp.json()
-
-            if data.get("cdErro", 0) != 0:
-                logger.error(f"Bradesco business error: {data}")
-                return data
-
-            # Extract key fields
-            linha_digitavel = data.get("linhaDigitavel", "")
-            if not linha_digitavel and "listaRegistro" in data:
-                linha_digitavel = data["listaRegistro"][0].get("linhaDigitavel", "")
-
-            cd_barras = data.get("cdBarras", "")
-            emv_qr = data.get("emv", "")  # QR Code Pix
-
-            # Trigger 'emitido' notification
-            notif_data = {
-                "nomeSacado": boleto_data.get("pagador_nome"),
-                "valorNominal": boleto_data.get("vlNominal"),
-                "dataVencimento": boleto_data.get("dataVencimento"),
-                "linhaDigitavel": linha_digitavel,
-                "qrCodePix": emv_qr,
-                "linkPdfBoleto": (
-                    f"{settings.backend_url}/api/boleto/pdf/"
-                    f"{boleto_data.get('nuFatura')}"
-                ),
-            }
+        await self.register_limiter.acquire()
+        try:
+            resp = await self._request(
+                "POST", endpoint,
+                json=payload,
+                headers=self._auth_headers(token),
+            )
+            resp.raise_for_status()
+        except httpx.HTTPStatusError as e:
+            if e.response.status_code == 429 or e.response.status_code >= 500:
+                self.register_limiter.on_throttle()
+            logger.error(f"Bradesco API Error: {e.response.text}")
+            if e.response.status_code >= 500:
+                # 5xx / gateway timeout: the title may have been registered anyway
+                raise
+            return {"cdErro": e.response.status_code, "msgErro": e.response.text}
+        except httpx.TimeoutException:
+            self.register_limiter.on_throttle()
+            raise
+        self.register_limiter.on_success()
 
-            if recipient_email or recipient_phone:
-                asyncio.create_task(
-                    send_boleto_notification(
-                        "emitido", notif_data, recipient_email, recipient_phone
-                    )
-                )
+        data = resp.json()
 
+        if data.get("cdErro", 0) != 0:
+            logger.error(f"Bradesco business error: {data}")
             return data
 
+        # Extract key fields
+        linha_digitavel = data.get("linhaDigitavel", "")
+        if not linha_digitavel and "listaRegistro" in data:
+            linha_digitavel = data["listaRegistro"][0].get("linhaDigitavel", "")
+
+        cd_barras = data.get("cdBarras", "")
+        emv_qr = data.get("emv", "")  # QR Code Pix
+
+        # Trigger 'emitido' notification
+        notif_data = {
+            "nomeSacado": boleto_data.get("pagador_nome"),
+            "valorNominal": boleto_data.get("vlNominal"),
+            "dataVencimento": boleto_data.get("dataVencimento"),
+            "linhaDigitavel": linha_digitavel,
+            "qrCodePix": emv_qr,
+            "linkPdfBoleto": (
+                f"{settings.backend_url}/api/boleto/pdf/"
+                f"{boleto_data.get('nuFatura')}"
+            ),
+        }
+
+        if recipient_email or recipient_phone:
+            asyncio.create_task(
+                send_boleto_notification(
+                    "emitido", notif_data, recipient_email, recipient_phone
+                )
+            )
+
+        return data
+
     # ── Register Boleto with QR Code ─────────────────────────────────
 
     async def register_boleto_qr_code(self, boleto_data: dict) -> dict:
@@ -252,14 +357,13 @@ class BradescoService:
         if token == "MOCK_TOKEN":
             return {"cdErro": 0, "msgErro": "Sucesso (Mock QR)"}
 
-        async with _build_http_client() as client:
-            resp = await client.post(
-                f"{self.base_url}{endpoint}",
-                json=boleto_data,
-                headers=self._auth_headers(token),
-            )
-            resp.raise_for_status()
-            return resp.json()
+        resp = await self._request(
+            "POST", endpoint,
+            json=boleto_data,
+            headers=self._auth_headers(token),
+        )
+        resp.raise_for_status()
+        return resp.json()
 
     # ── Alter Boleto ─────────────────────────────────────────────────
 
@@ -271,14 +375,13 @@ class BradescoService:
         if token == "MOCK_TOKEN":
             return {"cdErro": 0, "msgErro": "Alteração simulada (Mock)"}
 
-        async with _build_http_client() as client:
-            resp = await client.put(
-                f"{self.base_url}{endpoint}",
-                json=boleto_data,
-                headers=self._auth_headers(token),
-            )
-            resp.raise_for_status()
-            return resp.json()
+        resp = await self._request(
+            "PUT", endpoint,
+            json=boleto_data,
+            headers=self._auth_headers(token),
+        )
+        resp.raise_for_status()
+        return resp.json()
 
     # ── Cancel / Estorno ─────────────────────────────────────────────
 
@@ -329,48 +432,47 @@ class BradescoService:
                 )
             return result
 
-        async with _build_http_client() as client:
-            try:
-                resp = await client.post(
-                    f"{self.base_url}{endpoint}",
-                    json=payload,
-                    headers=self._auth_headers(token),
-                )
-                resp.raise_for_status()
-            except httpx.HTTPStatusError as e:
-                logger.error(f"Estorno API Error: {e.response.text}")
-                return {"cdErro": e.response.status_code, "msgErro": e.response.text}
-
-            data = resp.json()
-
-            # Check for success code CBTT0710
-            if data.get("cdRetorno") == "CBTT0710" or data.get("cdErro", 0) == 0:
-                logger.info(f"Estorno success for {nosso_numero}")
-
-                if (recipient_email or recipient_phone) and boleto_data:
-                    asyncio.create_task(
-                        send_boleto_notification(
-                            "reativado",
-                            {
-                                "nomeSacado": boleto_data.get("pagador_nome", ""),
-                                "valorNominal": boleto_data.get("vlNominal", 0),
-                                "dataVencimento": boleto_data.get(
-                                    "dataVencimento", ""
-                                ),
-                                "linhaDigitavel": boleto_data.get(
-                                    "linhaDigitavel", ""
-                                ),
-                                "linkPdfBoleto": (
-                                    f"{settings.backend_url}/api/boleto/pdf/"
-                                    f"{nosso_numero}"
-                                ),
-                            },
-                            recipient_email,
-                            recipient_phone,
-                        )
+        try:
+            resp = await self._request(
+                "POST", endpoint,
+                json=payload,
+                headers=self._auth_headers(token),
+            )
+            resp.raise_for_status()
+        except httpx.HTTPStatusError as e:
+            logger.error(f"Estorno API Error: {e.response.text}")
+            return {"cdErro": e.response.status_code, "msgErro": e.response.text}
+
+        data = resp.json()
+
+        # Check for success code CBTT0710
+        if data.get("cdRetorno") == "CBTT0710" or data.get("cdErro", 0) == 0:
+            logger.info(f"Estorno success for {nosso_numero}")
+
+            if (recipient_email or recipient_phone) and boleto_data:
+                asyncio.create_task(
+                    send_boleto_notification(
+                        "reativado",
+                        {
+                            "nomeSacado": boleto_data.get("pagador_nome", ""),
+                            "valorNominal": boleto_data.get("vlNominal", 0),
+                            "dataVencimento": boleto_data.get(
+                                "dataVencimento", ""
+                            ),
+                            "linhaDigitavel": boleto_data.get(
+                                "linhaDigitavel", ""
+                            ),
+                            "linkPdfBoleto": (
+                                f"{settings.backend_url}/api/boleto/pdf/"
+                                f"{nosso_numero}"
+                            ),
+                        },
+                        recipient_email,
+                        recipient_phone,
                     )
+                )
 
-            return data
+        return data
 
     # ── Baixar (Write-off, different from Estorno) ───────────────────
 
@@ -389,14 +491,13 @@ class BradescoService:
         if token == "MOCK_TOKEN":
             return {"cdErro": 0, "msgErro": "Baixa simulada (Mock)"}
 
-        async with _build_http_client() as client:
-            resp = await client.post(
-                f"{self.base_url}{endpoint}",
-                json=payload,
-                headers=self._auth_headers(token),
-            )
-            resp.raise_for_status()
-            return resp.json()
+        resp = await self._request(
+            "POST", endpoint,
+            json=payload,
+            headers=self._auth_headers(token),
+        )
+        resp.raise_for_status()
+        return resp.json()
 
     # ── Protest ──────────────────────────────────────────────────────
 
@@ -417,14 +518,13 @@ class BradescoService:
         if token == "MOCK_TOKEN":
             return {"cdErro": 0, "msgErro": "Protesto simulado (Mock)"}
 
-        async with _build_http_client() as client:
-            resp = await client.post(
-                f"{self.base_url}{endpoint}",
-                json=payload,
-                headers=self._auth_headers(token),
-            )
-            resp.raise_for_status()
-            return resp.json()
+        resp = await self._request(
+            "POST", endpoint,
+            json=payload,
+            headers=self._auth_headers(token),
+        )
+        resp.raise_for_status()
+        return resp.json()
 
     # ── Consult Status ───────────────────────────────────────────────
 
@@ -442,33 +542,62 @@ class BradescoService:
         if token == "MOCK_TOKEN":
             return "emitido", {"cdSituacaoTitulo": "01", "mock": True}
 
-        async with _build_http_client() as client:
-            resp = await client.post(
-                f"{self.base_url}{endpoint}",
-                json=payload,
-                headers=self._auth_headers(token),
-            )
-            resp.raise_for_status()
-            data = resp.json()
+        resp = await self._request(
+            "POST", endpoint,
+            json=payload,
+            headers=self._auth_headers(token),
+        )
+        resp.raise_for_status()
+        data = resp.json()
+
+        if not data:
+            return "erro", {}
+
+        # Status code extraction
+        status_codigo = str(data.get("cdSituacaoTitulo", ""))
 
-            if not data:
-                return "erro", {}
+        if "listaTitulo" in data and len(data["listaTitulo"]) > 0:
+            item = data["listaTitulo"][0]
+            status_codigo = str(item.get("cdSituacaoTitulo", ""))
 
-            # Status code extraction
-            status_codigo = str(data.get("cdSituacaoTitulo", ""))
+        # Bradesco status mapping
+        # 13 = Pago no dia, 61 = Baixa por Título Pago, 06 = Liquidado
+        if status_codigo in ("13", "61", "06"):
+            return "pago", data
+        elif status_codigo == "02":  # Baixado / Devolvido
+            return "baixado", data
 
-            if "listaTitulo" in data and len(data["listaTitulo"]) > 0:
-                item = data["listaTitulo"][0]
-                status_codigo = str(item.get("cdSituacaoTitulo", ""))
+        return "emitido", data
 
-            # Bradesco status mapping
-            # 13 = Pago no dia, 61 = Baixa por Título Pago, 06 = Liquidado
-            if status_codigo in ("13", "61", "06"):
-                return "pago", data
-            elif status_codigo == "02":  # Baixado / Devolvido
-                return "baixado", data
+    async def consult_fatura(self, nu_fatura: str) -> dict | None:
+        """The title registered for an invoice (nuCliente = nuFatura), with its
+        nuNossoNumero / linhaDigitavel, or None if Bradesco has none."""
+        token = await self._get_access_token()
 
-            return "emitido", data
+        payload = {
+            "nuNegociacao": settings.bradesco_negociacao.zfill(18),
+            "nuCliente": nu_fatura,
+        }
+
+        endpoint = "/v1/boleto/titulo-consultar"
+
+        if token == "MOCK_TOKEN":
+            return None
+
+        resp = await self._request(
+            "POST", endpoint,
+            json=payload,
+            headers=self._auth_headers(token),
+        )
+        if resp.status_code == 404:
+            return None
+        resp.raise_for_status()
+        data = resp.json() or {}
+
+        titulo = data["listaTitulo"][0] if data.get("listaTitulo") else data
+        if data.get("cdErro", 0) != 0 or not titulo.get("nuNossoNumero"):
+            return None
+        return titulo
 
 
 # ─── Singleton ───────────────────────────────────────────────────────
@@ -1,43 +1,287 @@
+"""IAudit - Communication log store (email / WhatsApp).
+
+Logs are appended to a local SQLite database (WAL) instead of rewriting a
+JSON file on every message:
+  - comm_logs: one row per message, indexed by time, channel and status
+  - comm_counters: lifetime totals per (channel, status), updated on insert
+  - comm_stats_hourly: per-hour totals per (channel, status) for time series
+
+Individual logs are kept for ``comm_log_retention_days``; the counters and
+hourly buckets survive the purge so dashboards stay cheap and accurate.
+"""
+
+import asyncio
 import json
-import os
+import logging
+import threading
+import time
 import uuid
 from datetime import datetime
 from typing import List, Dict, Any
-from app.models import CommunicationLog, CommunicationChannel, CommunicationStatus
 
-LOG_FILE = "backend/data/comm_logs.json"
+from app.config import settings
+from app.models import CommunicationChannel, CommunicationStatus
+from app.utils import sqlite_connect
+
+logger = logging.getLogger(__name__)
+
+LOG_FILE = "backend/data/comm_logs.json"  # legacy store, imported once
+DB_FILE = "backend/data/comm_logs.db"
+
+# How often (at most) a write triggers the retention purge
+PURGE_INTERVAL_SECONDS = 600
+
+_SCHEMA = """
+create table if not exists comm_logs (
+    id text primary key,
+    ts real not null,
+    timestamp text not null,
+    channel text not null,
+    recipient text,
+    subject text,
+    content text,
+    status text not null,
+    error_message text,
+    metadata text
+);
+create index if not exists idx_comm_logs_ts on comm_logs (ts);
+create index if not exists idx_comm_logs_channel_ts on comm_logs (channel, ts);
+create index if not exists idx_comm_logs_status_ts on comm_logs (status, ts);
+
+create table if not exists comm_counters (
+    channel text not null,
+    status text not null,
+    count integer not null default 0,
+    primary key (channel, status)
+);
+
+create table if not exists comm_stats_hourly (
+    bucket integer not null,
+    channel text not null,
+    status text not null,
+    count integer not null default 0,
+    primary key (bucket, channel, status)
+);
+
+create table if not exists comm_meta (
+    key text primary key,
+    value text
+);
+"""
+
+
+def _value(item) -> str:
+    """Enum members -> their value; plain strings pass through."""
+    return getattr(item, "value", item)
+
+
+def _to_epoch(value: datetime | str | None) -> float | None:
+    if value is None:
+        return None
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    return value.timestamp()
+
+
+def _summarize(counts: Dict[str, int]) -> Dict[str, Any]:
+    sent = counts.get(CommunicationStatus.sent.value, 0)
+    failed = counts.get(CommunicationStatus.failed.value, 0)
+    return {
+        "total": sum(counts.values()),
+        "sent": sent,
+        "failed": failed,
+        "success_rate": (sent / (sent + failed) * 100) if (sent + failed) > 0 else 0,
+    }
+
 
 class CommunicationService:
-    def __init__(self):
-        os.makedirs(os.path.dirname(LOG_FILE), exist_ok=True)
-        if not os.path.exists(LOG_FILE):
-            with open(LOG_FILE, "w", encoding="utf-8") as f:
-                json.dump([], f)
+    def __init__(self, db_file: str = DB_FILE, legacy_file: str = LOG_FILE):
+        self._db_file = db_file
+        self._legacy_file = legacy_file
+        self._lock = threading.Lock()
+        self._conn = None
+        self._last_purge = 0.0
+
+    # ── Storage ──────────────────────────────────────────────────────
 
-    def _read_logs(self) -> List[Dict[str, Any]]:
+    def _db(self):
+        if self._conn is None:
+            self._conn = sqlite_connect(self._db_file)
+            self._conn.executescript(_SCHEMA)
+            self._import_legacy()
+        return self._conn
+
+    def _import_legacy(self) -> None:
+        """Import the old comm_logs.json once, so existing history is kept."""
+        conn = self._conn
+        if conn.execute("select 1 from comm_meta where key = 'legacy_imported'").fetchone():
+            return
         try:
-            with open(LOG_FILE, "r", encoding="utf-8") as f:
-                return json.load(f)
+            with open(self._legacy_file, "r", encoding="utf-8") as f:
+                logs = json.load(f)
         except Exception:
-            return []
+            logs = []
+
+        with conn:
+            for log in reversed(logs):  # file is newest-first
+                try:
+                    self._insert(conn, log)
+                except Exception as e:
+                    logger.warning(f"Skipping legacy comm log {log.get('id')}: {e}")
+            conn.execute("insert or replace into comm_meta (key, value) values ('legacy_imported', ?)",
+                         (datetime.now().isoformat(),))
+        if logs:
+            logger.info(f"Imported {len(logs)} communication logs from {self._legacy_file}")
+
+    @staticmethod
+    def _insert(conn, log: Dict[str, Any]) -> None:
+        ts = _to_epoch(log["timestamp"])
+        channel, status = _value(log["channel"]), _value(log["status"])
+        inserted = conn.execute(
+            "insert or ignore into comm_logs "
+            "(id, ts, timestamp, channel, recipient, subject, content, status, error_message, metadata) "
+            "values (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                log["id"], ts, log["timestamp"], channel, log.get("recipient"), log.get("subject"),
+                log.get("content"), status, log.get("error_message"),
+                json.dumps(log.get("metadata") or {}, default=str),
+            ),
+        ).rowcount
+        if not inserted:
+            return
+        conn.execute(
+            "insert into comm_counters (channel, status, count) values (?, ?, 1) "
+            "on conflict (channel, status) do update set count = count + 1",
+            (channel, status),
+        )
+        conn.execute(
+            "insert into comm_stats_hourly (bucket, channel, status, count) values (?, ?, ?, 1) "
+            "on conflict (bucket, channel, status) do update set count = count + 1",
+            (int(ts // 3600) * 3600, channel, status),
+        )
+
+    def _purge_expired(self, conn) -> None:
+        cutoff = time.time() - settings.comm_log_retention_days * 86400
+        deleted = conn.execute("delete from comm_logs where ts < ?", (cutoff,)).rowcount
+        if deleted:
+            logger.info(f"Purged {deleted} communication logs older than {settings.comm_log_retention_days} days")
+
+    @staticmethod
+    def _row_to_log(row) -> Dict[str, Any]:
+        log = dict(row)
+        log.pop("ts", None)
+        log["metadata"] = json.loads(log["metadata"]) if log["metadata"] else {}
+        return log
+
+    # ── Sync implementations (run in a worker thread) ────────────────
 
-    def _write_logs(self, logs: List[Dict[str, Any]]):
-        with open(LOG_FILE, "w", encoding="utf-8") as f:
-            json.dump(logs, f, indent=2, default=str)
+    def _log_sync(self, *logs: Dict[str, Any]) -> None:
+        with self._lock:
+            conn = self._db()
+            with conn:
+                for log in logs:
+                    self._insert(conn, log)
+                now = time.monotonic()
+                if now - self._last_purge >= PURGE_INTERVAL_SECONDS:
+                    self._last_purge = now
+                    self._purge_expired(conn)
+
+    def _get_logs_sync(self, channel, status, recipient, since, until, limit, offset) -> List[Dict[str, Any]]:
+        clauses, params = [], []
+        if channel:
+            clauses.append("channel = ?")
+            params.append(_value(channel))
+        if status:
+            clauses.append("status = ?")
+            params.append(_value(status))
+        if since is not None:
+            clauses.append("ts >= ?")
+            params.append(_to_epoch(since))
+        if until is not None:
+            clauses.append("ts < ?")
+            params.append(_to_epoch(until))
+        if recipient:
+            clauses.append("recipient like ?")
+            params.append(f"%{recipient}%")
+
+        where = f"where {' and '.join(clauses)}" if clauses else ""
+        sql = f"select * from comm_logs {where} order by ts desc limit ? offset ?"
+        with self._lock:
+            rows = self._db().execute(sql, (*params, limit, offset)).fetchall()
+        return [self._row_to_log(r) for r in rows]
+
+    def _get_stats_sync(self, since, until) -> Dict[str, Any]:
+        with self._lock:
+            conn = self._db()
+            if since is None and until is None:
+                rows = conn.execute("select channel, status, count from comm_counters").fetchall()
+            else:
+                lo = int(_to_epoch(since) // 3600) * 3600 if since is not None else 0
+                hi = _to_epoch(until) if until is not None else float("inf")
+                rows = conn.execute(
+                    "select channel, status, sum(count) as count from comm_stats_hourly "
+                    "where bucket >= ? and bucket < ? group by channel, status",
+                    (lo, hi),
+                ).fetchall()
+
+        totals: Dict[str, int] = {}
+        by_channel: Dict[str, Dict[str, int]] = {}
+        for row in rows:
+            totals[row["status"]] = totals.get(row["status"], 0) + row["count"]
+            channel_counts = by_channel.setdefault(row["channel"], {})
+            channel_counts[row["status"]] = channel_counts.get(row["status"], 0) + row["count"]
+
+        return {
+            **_summarize(totals),
+            "by_channel": {channel: _summarize(counts) for channel, counts in by_channel.items()},
+        }
+
+    def _get_timeseries_sync(self, since, until, bucket_seconds, channel) -> List[Dict[str, Any]]:
+        clauses, params = ["bucket >= ?"], [int(_to_epoch(since) // 3600) * 3600]
+        if until is not None:
+            clauses.append("bucket < ?")
+            params.append(_to_epoch(until))
+        if channel:
+            clauses.append("channel = ?")
+            params.append(_value(channel))
+
+        sql = (
+            f"select (bucket / {bucket_seconds}) * {bucket_seconds} as period, status, sum(count) as count "
+            f"from comm_stats_hourly where {' and '.join(clauses)} group by period, status order by period"
+        )
+        with self._lock:
+            rows = self._db().execute(sql, params).fetchall()
+
+        series: Dict[int, Dict[str, int]] = {}
+        for row in rows:
+            series.setdefault(row["period"], {})[row["status"]] = row["count"]
+        return [
+            {"periodo": datetime.fromtimestamp(period).isoformat(), **_summarize(counts)}
+            for period, counts in series.items()
+        ]
+
+    def _clear_sync(self) -> None:
+        with self._lock:
+            conn = self._db()
+            with conn:
+                conn.execute("delete from comm_logs")
+                conn.execute("delete from comm_counters")
+                conn.execute("delete from comm_stats_hourly")
+
+    # ── Public API ───────────────────────────────────────────────────
 
     async def log_message(
-        self, 
-        channel: CommunicationChannel, 
-        recipient: str, 
-        content: str, 
-        status: CommunicationStatus, 
+        self,
+        channel: CommunicationChannel,
+        recipient: str,
+        content: str,
+        status: CommunicationStatus,
         subject: str = None,
         error_message: str = None,
         metadata: dict = None
     ) -> str:
-        logs = self._read_logs()
         log_id = str(uuid.uuid4())
-        
+
         new_log = {
             "id": log_id,
             "timestamp": datetime.now().isoformat(),
@@ -49,36 +293,65 @@ class CommunicationService:
             "error_message": error_message,
             "metadata": metadata or {}
         }
-        
-        logs.insert(0, new_log)  # Newest first
-        self._write_logs(logs[:500])  # Keep last 500 logs
+
+        await asyncio.to_thread(self._log_sync, new_log)
         return log_id
 
-    async def get_logs(self, channel: str = None, status: str = None) -> List[Dict[str, Any]]:
-        logs = self._read_logs()
-        if channel:
-            logs = [l for l in logs if l["channel"] == channel]
-        if status:
-            logs = [l for l in logs if l["status"] == status]
-        return logs
-
-    async def get_stats(self) -> Dict[str, Any]:
-        logs = self._read_logs()
-        total = len(logs)
-        if total == 0:
-            return {"total": 0, "sent": 0, "failed": 0, "success_rate": 0}
-            
-        sent = len([l for l in logs if l["status"] == CommunicationStatus.sent])
-        failed = len([l for l in logs if l["status"] == CommunicationStatus.failed])
-        
-        return {
-            "total": total,
-            "sent": sent,
-            "failed": failed,
-            "success_rate": (sent / (sent + failed) * 100) if (sent + failed) > 0 else 0
-        }
+    async def log_messages(self, entries: List[Dict[str, Any]]) -> List[str]:
+        """Bulk log_message: entries take the same keyword arguments, one transaction."""
+        now = datetime.now().isoformat()
+        logs = [
+            {
+                "id": str(uuid.uuid4()),
+                "timestamp": now,
+                "channel": entry["channel"],
+                "recipient": entry["recipient"],
+                "subject": entry.get("subject"),
+                "content": entry["content"],
+                "status": entry["status"],
+                "error_message": entry.get("error_message"),
+                "metadata": entry.get("metadata") or {},
+            }
+            for entry in entries
+        ]
+        if logs:
+            await asyncio.to_thread(self._log_sync, *logs)
+        return [log["id"] for log in logs]
+
+    async def get_logs(
+        self,
+        channel: str = None,
+        status: str = None,
+        recipient: str = None,
+        since: datetime | str | None = None,
+        until: datetime | str | None = None,
+        limit: int = 500,
+        offset: int = 0,
+    ) -> List[Dict[str, Any]]:
+        return await asyncio.to_thread(
+            self._get_logs_sync, channel, status, recipient, since, until, limit, offset
+        )
+
+    async def get_stats(
+        self,
+        since: datetime | str | None = None,
+        until: datetime | str | None = None,
+    ) -> Dict[str, Any]:
+        """Totals from the incremental counters (or hourly buckets for a time range)."""
+        return await asyncio.to_thread(self._get_stats_sync, since, until)
+
+    async def get_timeseries(
+        self,
+        since: datetime | str,
+        until: datetime | str | None = None,
+        bucket: str = "hour",
+        channel: str = None,
+    ) -> List[Dict[str, Any]]:
+        """Sent/failed per hour or per day, aggregated server-side."""
+        bucket_seconds = 86400 if bucket == "day" else 3600
+        return await asyncio.to_thread(self._get_timeseries_sync, since, until, bucket_seconds, channel)
 
     async def clear_logs(self):
-        self._write_logs([])
+        await asyncio.to_thread(self._clear_sync)
 
 comm_service = CommunicationService()
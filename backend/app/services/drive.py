@@ -2,9 +2,10 @@
 
 from __future__ import annotations
 
-import io
+import asyncio
 import logging
 import os
+import tempfile
 from datetime import datetime
 
 import httpx
@@ -18,6 +19,11 @@ logger = logging.getLogger(__name__)
 
 SCOPES = ["https://www.googleapis.com/auth/drive.file"]
 
+# Downloaded certificates are spooled to disk past this size
+SPOOL_MAX_BYTES = 1024 * 1024
+# Resumable upload chunk (must be a multiple of 256 KB)
+UPLOAD_CHUNK_BYTES = 1024 * 1024
+
 
 class GoogleDriveService:
     """Manages PDF uploads to Google Drive with structured folder hierarchy."""
@@ -142,51 +148,75 @@ class GoogleDriveService:
             return None
 
         try:
-            # Download PDF
-            async with httpx.AsyncClient(timeout=60.0) as client:
-                response = await client.get(pdf_url)
-                response.raise_for_status()
-                pdf_bytes = response.content
-
-            # Build folder structure
-            folder_id = self._build_folder_path(tipo, cnpj)
-            if not folder_id:
-                logger.error("Failed to create Drive folder structure.")
-                return None
-
-            # Build filename
-            date_str = (data or datetime.now()).strftime("%Y-%m-%d_%H%M%S")
-            filename = f"{date_str}_certidao.pdf"
-
-            # Upload file
-            file_metadata = {
-                "name": filename,
-                "parents": [folder_id],
-            }
-            media = MediaIoBaseUpload(
-                io.BytesIO(pdf_bytes),
-                mimetype="application/pdf",
-                resumable=True,
-            )
-            file = (
-                service.files()
-                .create(body=file_metadata, media_body=media, fields="id,webViewLink")
-                .execute()
-            )
-
-            # Make shareable
-            service.permissions().create(
-                fileId=file["id"],
-                body={"type": "anyone", "role": "reader"},
-            ).execute()
+            spool = await self._download(pdf_url)
+        except Exception as e:
+            logger.error(f"Google Drive upload failed: {e}")
+            return None
 
-            link = file.get("webViewLink", "")
-            logger.info(f"PDF uploaded to Drive: {filename} -> {link}")
-            return link
+        # Build filename
+        date_str = (data or datetime.now()).strftime("%Y-%m-%d_%H%M%S")
+        filename = f"{date_str}_certidao.pdf"
 
+        try:
+            # The Drive client is synchronous: keep it off the event loop
+            return await asyncio.to_thread(self._upload, spool, tipo, cnpj, filename)
         except Exception as e:
             logger.error(f"Google Drive upload failed: {e}")
             return None
+        finally:
+            spool.close()
+
+    @staticmethod
+    async def _download(pdf_url: str) -> tempfile.SpooledTemporaryFile:
+        """Stream the PDF into a spooled temp file (memory, then disk past SPOOL_MAX_BYTES)."""
+        spool = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_BYTES)
+        try:
+            async with httpx.AsyncClient(timeout=60.0) as client:
+                async with client.stream("GET", pdf_url) as response:
+                    response.raise_for_status()
+                    async for chunk in response.aiter_bytes():
+                        spool.write(chunk)
+        except BaseException:
+            spool.close()
+            raise
+        spool.seek(0)
+        return spool
+
+    def _upload(self, spool, tipo: str, cnpj: str, filename: str) -> str | None:
+        service = self._get_service()
+
+        # Build folder structure
+        folder_id = self._build_folder_path(tipo, cnpj)
+        if not folder_id:
+            logger.error("Failed to create Drive folder structure.")
+            return None
+
+        # Upload file, read from the spool chunk by chunk
+        file_metadata = {
+            "name": filename,
+            "parents": [folder_id],
+        }
+        media = MediaIoBaseUpload(
+            spool,
+            mimetype="application/pdf",
+            chunksize=UPLOAD_CHUNK_BYTES,
+            resumable=True,
+        )
+        file = (
+            service.files()
+            .create(body=file_metadata, media_body=media, fields="id,webViewLink")
+            .execute()
+        )
+
+        # Make shareable
+        service.permissions().create(
+            fileId=file["id"],
+            body={"type": "anyone", "role": "reader"},
+        ).execute()
+
+        link = file.get("webViewLink", "")
+        logger.info(f"PDF uploaded to Drive: {filename} -> {link}")
+        return link
 
 
 # Module-level singleton
@@ -1,45 +1,180 @@
+"""IAudit - CNPJ search history.
+
+Each search keeps a small index row per (user, cnpj) -- razao_social and
+timestamp -- while the full ``query_cnpj`` payload is stored once,
+zlib-compressed, keyed by its content hash. Listing the history never
+touches the payloads, and trimming to ``history_max_entries`` only removes
+the rows past the limit, so the cost doesn't grow with the history size.
+"""
+
+import hashlib
 import json
-import os
 import logging
+import os
+import threading
+import time
+import zlib
 from datetime import datetime
 
+from app.config import settings
+from app.utils import sqlite_connect
+
 logger = logging.getLogger(__name__)
 
-HISTORY_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), "data", "history.json")
-
-def load_history():
-    """Charge history from local JSON file."""
-    if not os.path.exists(HISTORY_FILE):
-        return []
-    try:
-        with open(HISTORY_FILE, "r", encoding="utf-8") as f:
-            return json.load(f)
-    except Exception as e:
-        logger.error(f"Erro ao carregar histórico: {e}")
-        return []
-
-def save_to_history(data: dict):
-    """Save a search result to the history file, maintaining only the last 20 uniq searches."""
-    history = load_history()
-    cnpj = data.get("cnpj")
-    
-    # Remove if already exists to move to top
-    history = [item for item in history if item.get("cnpj") != cnpj]
-    
-    # Add new item at the beginning
-    history.insert(0, {
-        "cnpj": cnpj,
-        "razao_social": data.get("razao_social", "Nome não disponível"),
-        "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M"),
-        "data": data
-    })
-    
-    # Keep only last 20
-    history = history[:20]
-    
-    try:
-        os.makedirs(os.path.dirname(HISTORY_FILE), exist_ok=True)
-        with open(HISTORY_FILE, "w", encoding="utf-8") as f:
-            json.dump(history, f, indent=2, ensure_ascii=False)
-    except Exception as e:
-        logger.error(f"Erro ao salvar histórico: {e}")
+DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), "data")
+HISTORY_FILE = os.path.join(DATA_DIR, "history.json")  # legacy store, imported once
+HISTORY_DB = os.path.join(DATA_DIR, "history.db")
+
+DEFAULT_USER = "default"
+
+_SCHEMA = """
+create table if not exists history_entries (
+    user_id text not null,
+    cnpj text not null,
+    razao_social text,
+    timestamp text not null,
+    ts real not null,
+    payload_hash text not null,
+    primary key (user_id, cnpj)
+);
+create index if not exists idx_history_user_ts on history_entries (user_id, ts desc);
+create index if not exists idx_history_payload on history_entries (payload_hash);
+
+create table if not exists history_payloads (
+    hash text primary key,
+    data blob not null
+);
+
+create table if not exists history_meta (
+    key text primary key,
+    value text
+);
+"""
+
+
+class HistoryStore:
+    def __init__(self, db_file: str = HISTORY_DB, legacy_file: str = HISTORY_FILE):
+        self._db_file = db_file
+        self._legacy_file = legacy_file
+        self._lock = threading.Lock()
+        self._conn = None
+
+    def _db(self):
+        if self._conn is None:
+            self._conn = sqlite_connect(self._db_file)
+            self._conn.executescript(_SCHEMA)
+            self._import_legacy()
+        return self._conn
+
+    def _import_legacy(self) -> None:
+        conn = self._conn
+        if conn.execute("select 1 from history_meta where key = 'legacy_imported'").fetchone():
+            return
+        items = []
+        if os.path.exists(self._legacy_file):
+            try:
+                with open(self._legacy_file, "r", encoding="utf-8") as f:
+                    items = json.load(f)
+            except Exception as e:
+                logger.error(f"Erro ao importar histórico antigo: {e}")
+
+        with conn:
+            for item in reversed(items):  # file is newest-first
+                if item.get("data"):
+                    self._insert(conn, DEFAULT_USER, item["data"])
+            conn.execute("insert or replace into history_meta (key, value) values ('legacy_imported', ?)",
+                         (datetime.now().isoformat(),))
+
+    @staticmethod
+    def _insert(conn, user_id: str, data: dict) -> None:
+        raw = json.dumps(data, ensure_ascii=False, sort_keys=True, default=str).encode("utf-8")
+        payload_hash = hashlib.sha256(raw).hexdigest()
+        conn.execute(
+            "insert or ignore into history_payloads (hash, data) values (?, ?)",
+            (payload_hash, zlib.compress(raw, 6)),
+        )
+        conn.execute(
+            "insert or replace into history_entries "
+            "(user_id, cnpj, razao_social, timestamp, ts, payload_hash) values (?, ?, ?, ?, ?, ?)",
+            (
+                user_id,
+                data.get("cnpj"),
+                data.get("razao_social", "Nome não disponível"),
+                datetime.now().strftime("%Y-%m-%d %H:%M"),
+                time.time(),
+                payload_hash,
+            ),
+        )
+
+    @staticmethod
+    def _trim(conn, user_id: str, keep: int) -> None:
+        dropped = conn.execute(
+            "delete from history_entries where rowid in ("
+            "  select rowid from history_entries where user_id = ? order by ts desc limit -1 offset ?"
+            ") returning payload_hash",
+            (user_id, keep),
+        ).fetchall()
+        for (payload_hash,) in {tuple(row) for row in dropped}:
+            conn.execute(
+                "delete from history_payloads where hash = ? "
+                "and not exists (select 1 from history_entries where payload_hash = ?)",
+                (payload_hash, payload_hash),
+            )
+
+    # ── Public API ───────────────────────────────────────────────────
+
+    def save(self, data: dict, user_id: str = DEFAULT_USER) -> None:
+        """Record a search (moves the CNPJ to the top) and trim old entries."""
+        if not data or not data.get("cnpj"):
+            return
+        try:
+            with self._lock:
+                conn = self._db()
+                with conn:
+                    self._insert(conn, user_id, data)
+                    self._trim(conn, user_id, settings.history_max_entries)
+        except Exception as e:
+            logger.error(f"Erro ao salvar histórico: {e}")
+
+    def recent(self, user_id: str = DEFAULT_USER, limit: int | None = None) -> list[dict]:
+        """Index records, newest first (no payloads)."""
+        limit = limit or settings.history_max_entries
+        with self._lock:
+            rows = self._db().execute(
+                "select cnpj, razao_social, timestamp from history_entries "
+                "where user_id = ? order by ts desc limit ?",
+                (user_id, limit),
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def get_payload(self, cnpj: str, user_id: str = DEFAULT_USER, max_age: float | None = None) -> dict | None:
+        """Full query_cnpj result saved for a CNPJ (searched within ``max_age`` seconds), or None."""
+        min_ts = time.time() - max_age if max_age is not None else 0
+        with self._lock:
+            row = self._db().execute(
+                "select p.data from history_entries e join history_payloads p on p.hash = e.payload_hash "
+                "where e.user_id = ? and e.cnpj = ? and e.ts >= ?",
+                (user_id, cnpj, min_ts),
+            ).fetchone()
+        if row is None:
+            return None
+        return json.loads(zlib.decompress(row["data"]))
+
+    def clear(self, user_id: str = DEFAULT_USER) -> None:
+        with self._lock:
+            conn = self._db()
+            with conn:
+                self._trim(conn, user_id, 0)
+
+
+history_store = HistoryStore()
+
+
+def load_history(user_id: str = DEFAULT_USER) -> list[dict]:
+    """Search history index for a user, newest first."""
+    return history_store.recent(user_id)
+
+
+def save_to_history(data: dict, user_id: str = DEFAULT_USER):
+    """Save a search result to the user's history."""
+    history_store.save(data, user_id)
@@ -1,105 +1,301 @@
-"""IAudit - Boleto Monitoring Service."""
+"""IAudit - Boleto Monitoring Service.
+
+Polls Bradesco for the status of every active boleto:
+  - boletos are checked by a bounded pool of workers, paced by an adaptive
+    (AIMD) rate limit that backs off when Bradesco answers 429/5xx
+  - overdue and nearly-due boletos are checked first
+  - a run that is still in progress makes the next one skip instead of overlapping
+
+Each boleto carries a ``next_check_at``: boletos around their vencimento
+are checked hourly, far-off and long-overdue ones daily, and paid/baixado
+ones (including those confirmed by webhook) never. While Bradesco webhooks
+are arriving, polling is only a safety net and intervals are stretched.
+A run only reads the boletos that are due, and writes the status changes it
+found in one bulk update (keyed by nosso_numero) before notifying.
+"""
 
 import logging
 import asyncio
-from datetime import datetime, timezone, date
+import time
+from datetime import datetime, timezone, date, timedelta
+
+import httpx
+
 from app.config import settings
 from app.database import (
-    get_boletos_ativos, # Need to implement this in database.py
-    update_boleto_status, # Need to implement this in database.py
+    get_boletos_para_consulta,
+    schedule_boleto_checks,
+    update_boletos_status,
     create_log
 )
 from app.services.bradesco import bradesco_service
 from app.services.notifications import send_boleto_notification
+from app.services.rate_limit import AdaptiveRateLimiter
 
 logger = logging.getLogger(__name__)
 
+# Shared across runs so the learned rate carries over
+bradesco_limiter = AdaptiveRateLimiter(
+    rate=settings.boleto_monitor_rate_per_second,
+    max_rate=settings.boleto_monitor_max_rate_per_second,
+)
+
+_run_lock = asyncio.Lock()
+_last_run: dict = {}
+_last_webhook_at: float | None = None
+
+# Re-check after a failed query
+RETRY_AFTER = timedelta(minutes=15)
+UNREGISTERED_RETRY = timedelta(hours=6)
+# Webhooks arriving: polling only as a safety net
+WEBHOOK_STRETCH = 4
+MAX_INTERVAL = timedelta(hours=24)
+
+
+def _parse_date(value) -> date | None:
+    if isinstance(value, date):
+        return value
+    if isinstance(value, str):
+        try:
+            return datetime.strptime(value[:10], "%Y-%m-%d").date()
+        except ValueError:
+            return None
+    return None
+
+
+def record_webhook() -> None:
+    """Called by the Bradesco webhook route on every delivery."""
+    global _last_webhook_at
+    _last_webhook_at = time.time()
+
+
+def webhooks_active() -> bool:
+    return (
+        _last_webhook_at is not None
+        and time.time() - _last_webhook_at < settings.boleto_webhook_healthy_hours * 3600
+    )
+
+
+def next_check_at(status: str | None, vencimento, now: datetime, webhooks: bool = False) -> datetime | None:
+    """When to query a boleto again; None = stop polling (final status)."""
+    if status not in ("emitido", "atraso"):
+        return None
+
+    venc = _parse_date(vencimento)
+    if venc is None:
+        interval = timedelta(hours=6)
+    else:
+        days = (venc - now.date()).days
+        if days > 7:
+            interval = timedelta(hours=24)  # only an early payment can change it
+        elif days > 1:
+            interval = timedelta(hours=6)
+        elif days >= -5:
+            interval = timedelta(hours=1)   # due window and bank settlement (D+1..D+3)
+        elif days >= -30:
+            interval = timedelta(hours=6)
+        else:
+            interval = timedelta(hours=24)
+
+    if webhooks:
+        interval = min(interval * WEBHOOK_STRETCH, MAX_INTERVAL)
+    return now + interval
+
+
+def _sweep_order(boleto: dict):
+    """Oldest vencimento first: overdue, then nearly due; undated last."""
+    venc = _parse_date(boleto.get("data_vencimento"))
+    return (venc is None, venc or date.max)
+
+
+def _contact(boleto: dict, field: str):
+    """Contact field from the boleto or its joined empresa."""
+    return boleto.get(field) or (boleto.get("empresas") or {}).get(field)
+
+
+def _is_overload(error: Exception) -> bool:
+    if isinstance(error, httpx.TimeoutException):
+        return True
+    if isinstance(error, httpx.HTTPStatusError):
+        code = error.response.status_code
+        return code == 429 or code >= 500
+    return False
+
+
+def monitor_stats() -> dict:
+    """Last run summary and the current adaptive rate (for /api/health)."""
+    return {
+        "running": _run_lock.locked(),
+        "last_run": _last_run,
+        "webhooks_active": webhooks_active(),
+        "rate_limit": bradesco_limiter.stats,
+    }
+
+
 async def monitor_boletos():
     """
     Periodic job to check status of active boletos.
     Active boletos are those with status 'emitido' or 'atraso'.
     """
+    if _run_lock.locked():
+        logger.warning("Monitor Boletos: previous run still in progress, skipping.")
+        return
+    async with _run_lock:
+        await _run_monitor()
+
+
+async def _run_monitor():
     logger.info("=== Job: Monitor Boletos ===")
-    
-    # This function needs to be added to database.py
-    # For now, let's assume we can fetch them.
-    # We might need to execute a raw query if not available.
+    now = datetime.now(timezone.utc)
+
     try:
-        boletos = get_boletos_ativos() 
-    except NameError:
-        logger.warning("get_boletos_ativos not implemented yet.")
+        boletos = await asyncio.to_thread(
+            get_boletos_para_consulta, now, settings.boleto_monitor_max_per_run
+        )
+    except Exception as e:
+        logger.error(f"Failed to fetch boletos due for a status check: {e}")
         return
 
-    logger.info(f"Checking status for {len(boletos)} boletos.")
+    schedule: dict[str | None, list[str]] = {}
+    # Not registered yet (no nosso_numero): look again later, not every run
+    unregistered = [b["id"] for b in boletos if not b.get("nosso_numero")]
+    if unregistered:
+        schedule[(now + UNREGISTERED_RETRY).isoformat()] = unregistered
 
-    for boleto in boletos:
-        # Avoid rate limits
-        await asyncio.sleep(0.5)
-        
-        boleto_id = boleto["id"]
-        nosso_numero = boleto.get("nosso_numero")
-        current_status = boleto.get("status")
-        vencimento = boleto.get("data_vencimento") # date object or string
-        
-        if not nosso_numero:
-            continue
+    boletos = sorted((b for b in boletos if b.get("nosso_numero")), key=_sweep_order)
+    logger.info(f"Checking status for {len(boletos)} boletos due.")
 
-        try:
-            # 1. Consult Bradesco
-            new_status_code, bradesco_data = await bradesco_service.consult_status(nosso_numero)
-            
-            # 2. Status Transition Logic
-            
-            # Case A: Payment Confirmed
-            if new_status_code == "pago" and current_status != "pago":
-                logger.info(f"Boleto {boleto_id} paid.")
-                update_boleto_status(boleto_id, "pago", bradesco_data)
-                
-                # Trigger Notification
-                await send_boleto_notification(
-                    "pago", 
-                    {
-                        "nomeSacado": boleto.get("pagador_nome"),
-                        "valorNominal": boleto.get("vl_nominal"),
-                        "dataVencimento": vencimento,
-                        "linkBoleto": "", # No link needed for receipt usually
-                    },
-                    boleto.get("email_notificacao"), # Need to join with empresa data
-                    boleto.get("whatsapp")
-                )
-                continue
-
-            # Case B: Overdue Detection (Local check + Status)
-            # If Bradesco says "emitido" (01) but date > vencimento
-            if new_status_code == "emitido":
-                if isinstance(vencimento, str):
-                    venc_date = datetime.strptime(vencimento, "%Y-%m-%d").date()
-                else:
-                    venc_date = vencimento
-                
-                today = datetime.now(timezone.utc).date()
-                
-                if today > venc_date and current_status != "atraso":
-                    logger.info(f"Boleto {boleto_id} is overdue.")
-                    update_boleto_status(boleto_id, "atraso", bradesco_data)
-                    
-                    # Trigger Notification
-                    await send_boleto_notification(
-                        "atraso", 
-                        {
-                            "nomeSacado": boleto.get("pagador_nome"),
-                            "valorNominal": boleto.get("vl_nominal"),
-                            "dataVencimento": vencimento,
-                            "linkBoleto": f"{settings.api_host}/api/boleto/pdf/{boleto.get('nosso_numero')}",
-                            "linhaDigitavel": boleto.get("linha_digitavel")
-                        },
-                        boleto.get("email_notificacao"),
-                        boleto.get("whatsapp")
-                    )
-
-            # Case C: Baixado/Devolvido
-            if new_status_code == "baixado" and current_status != "baixado":
-                 update_boleto_status(boleto_id, "baixado", bradesco_data)
+    counts = {"checked": 0, "pago": 0, "atraso": 0, "baixado": 0, "errors": 0}
+    changes: dict[str, list[dict]] = {}
+    webhooks = webhooks_active()
+    pending = iter(boletos)
+    started = time.monotonic()
+
+    def plan(boleto: dict, next_at: datetime | None) -> None:
+        schedule.setdefault(next_at.isoformat() if next_at else None, []).append(boleto["id"])
 
+    async def worker():
+        # Workers share one iterator, so boletos are taken in sweep order
+        for boleto in pending:
+            status, changed = await _check_boleto(boleto)
+            counts["checked"] += 1
+            if status is None:
+                counts["errors"] += 1
+                plan(boleto, now + RETRY_AFTER)
+            elif changed:
+                changes.setdefault(status, []).append(boleto)
+            else:
+                plan(boleto, next_check_at(status, boleto.get("data_vencimento"), now, webhooks))
+
+    workers = max(1, min(settings.boleto_monitor_concurrency, len(boletos)))
+    await asyncio.gather(*(worker() for _ in range(workers)))
+
+    # Status changes: one UPDATE per status, then the notifications
+    if changes:
+        try:
+            await asyncio.to_thread(
+                update_boletos_status,
+                {status: [b["nosso_numero"] for b in changed] for status, changed in changes.items()},
+            )
         except Exception as e:
-            logger.error(f"Failed to monitor boleto {boleto_id}: {e}")
+            logger.error(f"Failed to store boleto status changes: {e}")
+            for changed in changes.values():
+                counts["errors"] += len(changed)
+                for boleto in changed:
+                    plan(boleto, now + RETRY_AFTER)
+        else:
+            for status, changed in changes.items():
+                counts[status] += len(changed)
+                for boleto in changed:
+                    plan(boleto, next_check_at(status, boleto.get("data_vencimento"), now, webhooks))
+                    await _notify(status, boleto)
+
+    try:
+        await asyncio.to_thread(schedule_boleto_checks, schedule, now)
+    except Exception as e:
+        logger.error(f"Failed to store the next status checks: {e}")
+
+    _last_run.clear()
+    _last_run.update({
+        **counts,
+        "finished_at": datetime.now(timezone.utc).isoformat(),
+        "duration_seconds": round(time.monotonic() - started, 2),
+    })
+    logger.info(
+        f"Monitor Boletos: {counts['checked']} checked in {_last_run['duration_seconds']}s "
+        f"({counts['pago']} pagos, {counts['atraso']} em atraso, {counts['baixado']} baixados, "
+        f"{counts['errors']} erros; rate {bradesco_limiter.rate:.1f}/s)"
+    )
+
+
+async def _check_boleto(boleto: dict) -> tuple[str | None, bool]:
+    """Query one boleto and work out its status transition.
+
+    Returns (status after the check, whether it changed); status is None on
+    error. The change itself is stored in bulk by the caller.
+    """
+    boleto_id = boleto["id"]
+    current_status = boleto.get("status")
+
+    await bradesco_limiter.acquire()
+    try:
+        new_status_code, _ = await bradesco_service.consult_status(boleto["nosso_numero"])
+    except Exception as e:
+        if _is_overload(e):
+            bradesco_limiter.on_throttle()
+        logger.error(f"Failed to monitor boleto {boleto_id}: {e}")
+        return None, False
+    bradesco_limiter.on_success()
+
+    # Case A: Payment Confirmed
+    if new_status_code == "pago" and current_status != "pago":
+        logger.info(f"Boleto {boleto_id} paid.")
+        return "pago", True
+
+    # Case B: Overdue Detection (Local check + Status)
+    # If Bradesco says "emitido" (01) but date > vencimento
+    if new_status_code == "emitido":
+        venc_date = _parse_date(boleto.get("data_vencimento"))
+        today = datetime.now(timezone.utc).date()
+        if venc_date and today > venc_date and current_status != "atraso":
+            logger.info(f"Boleto {boleto_id} is overdue.")
+            return "atraso", True
+
+    # Case C: Baixado/Devolvido
+    if new_status_code == "baixado" and current_status != "baixado":
+        return "baixado", True
+
+    return current_status, False
+
+
+async def _notify(status: str, boleto: dict) -> None:
+    """Tell the pagador about a stored status change (pago / atraso)."""
+    vencimento = boleto.get("data_vencimento") # date object or string
+    try:
+        if status == "pago":
+            await send_boleto_notification(
+                "pago",
+                {
+                    "nomeSacado": boleto.get("pagador_nome"),
+                    "valorNominal": boleto.get("vl_nominal"),
+                    "dataVencimento": vencimento,
+                    "linkBoleto": "", # No link needed for receipt usually
+                },
+                _contact(boleto, "email_notificacao"),
+                _contact(boleto, "whatsapp")
+            )
+        elif status == "atraso":
+            await send_boleto_notification(
+                "atraso",
+                {
+                    "nomeSacado": boleto.get("pagador_nome"),
+                    "valorNominal": boleto.get("vl_nominal"),
+                    "dataVencimento": vencimento,
+                    "linkBoleto": f"{settings.api_host}/api/boleto/pdf/{boleto['nosso_numero']}",
+                    "linhaDigitavel": boleto.get("linha_digitavel")
+                },
+                _contact(boleto, "email_notificacao"),
+                _contact(boleto, "whatsapp")
+            )
+    except Exception as e:
+        logger.error(f"Failed to notify status {status} for boleto {boleto['id']}: {e}")
@@ -0,0 +1,99 @@
+"""IAudit - Notification coalescing per recipient.
+
+Bursts of events for the same recipient (e.g. several reminders for one
+client) are held for a short window and released as one message: a single
+event goes out unchanged, several become a digest. Each flushed group is handed to ``emit`` -- the
+NotificationService enqueues it on the persistent delivery queue.
+
+Buffered events live in memory only for the window; ``flush()`` releases
+everything and is called on shutdown. A crash inside the window loses them,
+so the NotificationService only coalesces non-transactional events. Jobs
+that hold a whole batch (vencimento scan, robot alerts) group it up front
+with ``NotificationService.notify_many`` instead.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable
+
+logger = logging.getLogger(__name__)
+
+# emit(channel, recipient, items) where items = [{"event": ..., "data": {...}}, ...]
+EmitCallback = Callable[[str, str, list[dict[str, Any]]], Awaitable[None]]
+
+
+class NotificationCoalescer:
+    """Groups events per (channel, recipient) within ``window`` seconds."""
+
+    def __init__(self, emit: EmitCallback, window: float = 30.0, max_items: int = 50):
+        self._emit = emit
+        self.window = window
+        self.max_items = max_items
+        self._pending: dict[tuple[str, str], tuple[str, list[dict[str, Any]]]] = {}
+        self._timers: dict[tuple[str, str], asyncio.TimerHandle] = {}
+        self._flushing: set[asyncio.Task] = set()
+        self._stats = {"events": 0, "messages": 0, "digests": 0, "saved_sends": 0}
+
+    @property
+    def stats(self) -> dict:
+        return {
+            **self._stats,
+            "buffered": sum(len(items) for _, items in self._pending.values()),
+            "recipients": len(self._pending),
+            "window_seconds": self.window,
+        }
+
+    @staticmethod
+    def _key(channel: str, recipient: str) -> tuple[str, str]:
+        return channel, recipient.strip().lower()
+
+    async def add(self, channel: str, recipient: str, event: str, data: dict[str, Any]) -> None:
+        """Buffer an event; the group is emitted when the window closes or fills up."""
+        self._stats["events"] += 1
+        item = {"event": event, "data": data}
+        if self.window <= 0:
+            await self._send(channel, recipient, [item])
+            return
+
+        key = self._key(channel, recipient)
+        if key not in self._pending:
+            self._pending[key] = (recipient, [])
+            self._timers[key] = asyncio.get_running_loop().call_later(self.window, self._flush_later, key)
+        items = self._pending[key][1]
+        items.append(item)
+        if len(items) >= self.max_items:
+            await self._flush_key(key)
+
+    def _flush_later(self, key: tuple[str, str]) -> None:
+        task = asyncio.create_task(self._flush_key(key))
+        self._flushing.add(task)
+        task.add_done_callback(self._flushing.discard)
+
+    async def _flush_key(self, key: tuple[str, str]) -> None:
+        timer = self._timers.pop(key, None)
+        if timer is not None:
+            timer.cancel()
+        pending = self._pending.pop(key, None)
+        if pending is not None:
+            recipient, items = pending
+            await self._send(key[0], recipient, items)
+
+    async def _send(self, channel: str, recipient: str, items: list[dict[str, Any]]) -> None:
+        self._stats["messages"] += 1
+        if len(items) > 1:
+            self._stats["digests"] += 1
+            self._stats["saved_sends"] += len(items) - 1
+            logger.info(f"Digest {channel} → {recipient}: {len(items)} eventos em 1 mensagem")
+        try:
+            await self._emit(channel, recipient, items)
+        except Exception as e:
+            logger.error(f"Failed to enqueue {channel} notification for {recipient}: {e}")
+
+    async def flush(self) -> None:
+        """Emit every buffered group now (shutdown / tests)."""
+        for key in list(self._pending):
+            await self._flush_key(key)
+        if self._flushing:
+            await asyncio.gather(*self._flushing, return_exceptions=True)
@@ -2,16 +2,38 @@
 
 Provides resilient delivery by retrying failed sends (Twilio/SMTP)
 without external dependencies like Redis or Celery.
+
+Each channel has its own queue and pool of workers, so a slow or failing
+provider never blocks the other channel. Failed tasks are parked in a
+delay heap and a single timer task moves them back to their queue when the
+backoff expires -- workers never sleep on a retry.
+
+Tasks are plain data (channel, event, recipient, payload) delivered by a
+handler registered per channel, and every task is persisted to a local
+SQLite file until it is delivered. Pending and delayed tasks are recovered
+on startup; tasks that exhaust their retries stay in the dead-letter set
+until they are replayed. A handler may also defer a task (DeferDelivery),
+e.g. when a provider quota is exhausted: it is parked until the given time
+without using up an attempt.
 """
 
 from __future__ import annotations
 
 import asyncio
+import heapq
+import itertools
+import json
 import logging
+import os
+import threading
 import time
+from collections import deque
 from dataclasses import dataclass, field
 from typing import Any, Callable, Awaitable
 
+from app.config import settings
+from app.utils import percentile, sqlite_connect
+
 logger = logging.getLogger(__name__)
 
 # ─── Config ──────────────────────────────────────────────────────────
@@ -20,124 +42,564 @@ MAX_RETRIES = 3
 BASE_DELAY_SECONDS = 1.0   # 1s → 2s → 4s
 MAX_DELAY_SECONDS = 16.0
 
+CHANNELS = ("email", "whatsapp")
+
+# Samples kept per channel for the latency stats
+LATENCY_WINDOW = 500
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), "data")
+QUEUE_DB = os.path.join(DATA_DIR, "notification_queue.db")
+
+
+class DeferDelivery(Exception):
+    """Handler result: not sent now, try again in ``delay`` seconds (no attempt used)."""
+
+    def __init__(self, delay: float, reason: str = ""):
+        super().__init__(reason or f"deferred {delay:.0f}s")
+        self.delay = delay
+
 
 @dataclass
 class NotificationTask:
-    """A unit of work for the queue."""
+    """A unit of work for the queue (serializable: no callables)."""
     task_id: str
     channel: str                          # "email" | "whatsapp"
-    send_fn: Callable[..., Awaitable[bool]]  # async callable
-    args: tuple = ()
-    kwargs: dict = field(default_factory=dict)
+    event: str                            # template event: "emitido", "atraso", ...
+    recipient: str
+    payload: dict[str, Any] = field(default_factory=dict)
     attempt: int = 0
     created_at: float = field(default_factory=time.time)
     last_error: str | None = None
 
 
+NotificationHandler = Callable[[NotificationTask], Awaitable[bool]]
+# Returns one result per task: True (sent), False or the exception raised
+BatchNotificationHandler = Callable[[list[NotificationTask]], Awaitable[list[bool | Exception]]]
+
+
+# ─── Persistence ─────────────────────────────────────────────────────
+
+_SCHEMA = """
+create table if not exists notification_tasks (
+    task_id text primary key,
+    channel text not null,
+    event text not null,
+    recipient text not null,
+    payload text not null,
+    attempt integer not null default 0,
+    status text not null,              -- pending | delayed | dead
+    due_at real,
+    created_at real not null,
+    updated_at real not null,
+    last_error text
+);
+create index if not exists idx_notification_tasks_status on notification_tasks (status, due_at);
+"""
+
+
+class _TaskStore:
+    """SQLite-backed record of every task not yet delivered."""
+
+    def __init__(self, db_file: str):
+        self._db_file = db_file
+        self._lock = threading.Lock()
+        self._conn = None
+
+    def _db(self):
+        if self._conn is None:
+            self._conn = sqlite_connect(self._db_file)
+            self._conn.executescript(_SCHEMA)
+        return self._conn
+
+    def _write(self, sql: str, params: tuple) -> None:
+        with self._lock:
+            conn = self._db()
+            with conn:
+                conn.execute(sql, params)
+
+    @staticmethod
+    def _to_task(row) -> NotificationTask:
+        return NotificationTask(
+            task_id=row["task_id"],
+            channel=row["channel"],
+            event=row["event"],
+            recipient=row["recipient"],
+            payload=json.loads(row["payload"]),
+            attempt=row["attempt"],
+            created_at=row["created_at"],
+            last_error=row["last_error"],
+        )
+
+    def add(self, task: NotificationTask) -> None:
+        self._write(
+            "insert or replace into notification_tasks "
+            "(task_id, channel, event, recipient, payload, attempt, status, due_at, created_at, updated_at, last_error) "
+            "values (?, ?, ?, ?, ?, ?, 'pending', null, ?, ?, ?)",
+            (task.task_id, task.channel, task.event, task.recipient,
+             json.dumps(task.payload, default=str), task.attempt, task.created_at, time.time(), task.last_error),
+        )
+
+    def add_many(self, tasks: list[NotificationTask]) -> None:
+        """Persist many tasks in one transaction."""
+        now = time.time()
+        with self._lock:
+            conn = self._db()
+            with conn:
+                conn.executemany(
+                    "insert or replace into notification_tasks "
+                    "(task_id, channel, event, recipient, payload, attempt, status, due_at, created_at, updated_at, last_error) "
+                    "values (?, ?, ?, ?, ?, ?, 'pending', null, ?, ?, ?)",
+                    [(t.task_id, t.channel, t.event, t.recipient, json.dumps(t.payload, default=str),
+                      t.attempt, t.created_at, now, t.last_error) for t in tasks],
+                )
+
+    def mark_delayed(self, task: NotificationTask, due_at: float) -> None:
+        self._write(
+            "update notification_tasks set status = 'delayed', attempt = ?, due_at = ?, "
+            "last_error = ?, updated_at = ? where task_id = ?",
+            (task.attempt, due_at, task.last_error, time.time(), task.task_id),
+        )
+
+    def mark_dead(self, task: NotificationTask) -> None:
+        self._write(
+            "update notification_tasks set status = 'dead', attempt = ?, due_at = null, "
+            "last_error = ?, updated_at = ? where task_id = ?",
+            (task.attempt, task.last_error, time.time(), task.task_id),
+        )
+
+    def delete_many(self, task_ids: list[str]) -> None:
+        with self._lock:
+            conn = self._db()
+            with conn:
+                conn.executemany("delete from notification_tasks where task_id = ?", [(t,) for t in task_ids])
+
+    def load_active(self) -> list[tuple[NotificationTask, float | None]]:
+        """Pending and delayed tasks (with their due time), oldest first."""
+        with self._lock:
+            rows = self._db().execute(
+                "select * from notification_tasks where status in ('pending', 'delayed') order by created_at"
+            ).fetchall()
+        return [(self._to_task(r), r["due_at"] if r["status"] == "delayed" else None) for r in rows]
+
+    def count_dead(self) -> int:
+        with self._lock:
+            return self._db().execute(
+                "select count(*) from notification_tasks where status = 'dead'"
+            ).fetchone()[0]
+
+    def list_dead(self, limit: int, offset: int) -> list[dict[str, Any]]:
+        with self._lock:
+            rows = self._db().execute(
+                "select * from notification_tasks where status = 'dead' "
+                "order by updated_at desc limit ? offset ?",
+                (limit, offset),
+            ).fetchall()
+        return [
+            {**{k: row[k] for k in row.keys() if k not in ("payload", "status", "due_at")},
+             "payload": json.loads(row["payload"])}
+            for row in rows
+        ]
+
+    def revive(self, task_id: str | None = None) -> list[NotificationTask]:
+        """Move dead tasks (one, or all) back to pending with a fresh attempt count."""
+        with self._lock:
+            conn = self._db()
+            with conn:
+                if task_id:
+                    rows = conn.execute(
+                        "select * from notification_tasks where status = 'dead' and task_id = ?", (task_id,)
+                    ).fetchall()
+                else:
+                    rows = conn.execute("select * from notification_tasks where status = 'dead'").fetchall()
+                conn.executemany(
+                    "update notification_tasks set status = 'pending', attempt = 0, updated_at = ? where task_id = ?",
+                    [(time.time(), r["task_id"]) for r in rows],
+                )
+        tasks = [self._to_task(r) for r in rows]
+        for task in tasks:
+            task.attempt = 0
+        return tasks
+
+
+class _ChannelState:
+    """Queue, concurrency limit and counters of a single channel."""
+
+    def __init__(self, workers: int, concurrency: int):
+        self.queue: asyncio.Queue[NotificationTask] = asyncio.Queue()
+        self.workers = workers
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.concurrency = concurrency
+        self.in_flight = 0
+        self.send_latency: deque[float] = deque(maxlen=LATENCY_WINDOW)
+        self.delivery_latency: deque[float] = deque(maxlen=LATENCY_WINDOW)
+
+
 class NotificationQueue:
     """In-process async retry queue.
 
     Usage:
         queue = NotificationQueue()
+        queue.register_handler("email", deliver_email)
         asyncio.create_task(queue.start_worker())
 
         await queue.enqueue(NotificationTask(
             task_id="boleto-123-email",
             channel="email",
-            send_fn=send_email,
-            args=("user@example.com", "Subject", "<html>..."),
+            event="emitido",
+            recipient="user@example.com",
+            payload={"nomeSacado": "...", "valorNominal": 15000},
         ))
     """
 
-    def __init__(self, max_retries: int = MAX_RETRIES):
-        self._queue: asyncio.Queue[NotificationTask] = asyncio.Queue()
+    def __init__(
+        self,
+        max_retries: int = MAX_RETRIES,
+        workers_per_channel: int | None = None,
+        channel_concurrency: dict[str, int] | None = None,
+        db_file: str = QUEUE_DB,
+    ):
         self._max_retries = max_retries
+        self._store = _TaskStore(db_file)
+        self._handlers: dict[str, NotificationHandler] = {}
+        self._batch_handlers: dict[str, BatchNotificationHandler] = {}
+        self._batch_sizes: dict[str, int] = {}
+        self._workers_per_channel = workers_per_channel or settings.notification_workers_per_channel
+        self._channel_concurrency = channel_concurrency or {
+            "email": settings.notification_email_concurrency,
+            "whatsapp": settings.notification_whatsapp_concurrency,
+        }
+        self._channels: dict[str, _ChannelState] = {}
         self._running = False
-        self._stats = {"enqueued": 0, "sent": 0, "failed": 0}
+        self._active = asyncio.Event()
+        self._active.set()
+        self._tasks: list[asyncio.Task] = []
+        self._spawned: set[str] = set()
+
+        # Delay heap: (due_at epoch, seq, task)
+        self._delayed: list[tuple[float, int, NotificationTask]] = []
+        self._delay_seq = itertools.count()
+        self._delay_changed = asyncio.Event()
+
+        self._stats = {"enqueued": 0, "sent": 0, "failed": 0, "retried": 0, "deferred": 0, "recovered": 0}
+        self._dead_letters = 0
+        # Ids of tasks currently held in memory (queued, in flight or delayed)
+        self._held: set[str] = set()
         # Optional: callback for persisting final failures
         self._on_failure: Callable | None = None
 
     # ── Public API ───────────────────────────────────────────────────
 
+    def register_handler(self, channel: str, handler: NotificationHandler) -> None:
+        """Set the coroutine that delivers tasks of a channel (returns success)."""
+        self._handlers[channel] = handler
+
+    def register_batch_handler(self, channel: str, handler: BatchNotificationHandler, max_batch: int) -> None:
+        """Deliver up to ``max_batch`` ready tasks of a channel in one call
+        (e.g. one SMTP session or one Resend batch request)."""
+        self._batch_handlers[channel] = handler
+        self._batch_sizes[channel] = max(1, max_batch)
+
     async def enqueue(self, task: NotificationTask) -> None:
-        """Add a notification to the queue."""
-        await self._queue.put(task)
+        """Persist a notification and add it to the queue."""
+        task.payload = json.loads(json.dumps(task.payload, default=str))
+        # Held before the row exists, so a concurrent _recover() can't queue it twice
+        self._held.add(task.task_id)
+        try:
+            await asyncio.to_thread(self._store.add, task)
+        except Exception:
+            self._held.discard(task.task_id)
+            raise
+        await self._channel(task.channel).queue.put(task)
         self._stats["enqueued"] += 1
         logger.debug(f"[Queue] Enqueued {task.task_id} ({task.channel})")
 
+    async def enqueue_many(self, tasks: list[NotificationTask]) -> None:
+        """Persist many notifications in one write, then add them to the queue."""
+        if not tasks:
+            return
+        for task in tasks:
+            task.payload = json.loads(json.dumps(task.payload, default=str))
+        ids = [task.task_id for task in tasks]
+        self._held.update(ids)
+        try:
+            await asyncio.to_thread(self._store.add_many, tasks)
+        except Exception:
+            self._held.difference_update(ids)
+            raise
+        for task in tasks:
+            await self._channel(task.channel).queue.put(task)
+        self._stats["enqueued"] += len(tasks)
+        logger.debug(f"[Queue] Enqueued {len(tasks)} tasks")
+
     async def start_worker(self) -> None:
-        """Start the consumer loop. Call once at app startup."""
+        """Recover persisted tasks, then start the workers and the retry timer.
+        Call once at app startup."""
         if self._running:
             return
+        await self._recover()
         self._running = True
-        logger.info("[Queue] Notification worker started.")
-        while self._running:
-            try:
-                task = await asyncio.wait_for(self._queue.get(), timeout=5.0)
-                await self._process(task)
-                self._queue.task_done()
-            except asyncio.TimeoutError:
-                continue
-            except asyncio.CancelledError:
-                break
-            except Exception as e:
-                logger.error(f"[Queue] Worker error: {e}")
+        for channel in CHANNELS:
+            self._channel(channel)
+        self._tasks.append(asyncio.create_task(self._timer_loop()))
+        logger.info(
+            f"[Queue] Notification workers started: {self._workers_per_channel} per channel "
+            f"({', '.join(self._channels)})."
+        )
+        try:
+            await asyncio.gather(*self._tasks)
+        except asyncio.CancelledError:
+            pass
+        finally:
+            for task in self._tasks:
+                task.cancel()
+            self._tasks.clear()
+            self._spawned.clear()
+            self._running = False
 
     def stop_worker(self) -> None:
-        """Signal the worker to stop."""
+        """Signal the workers to stop."""
         self._running = False
+        for task in self._tasks:
+            task.cancel()
         logger.info("[Queue] Worker stopping...")
 
+    def set_paused(self, paused: bool) -> None:
+        """Hold (or release) delivery. Tasks keep accumulating while paused."""
+        if paused == self.paused:
+            return
+        if paused:
+            self._active.clear()
+        else:
+            self._active.set()
+        logger.info(f"[Queue] Delivery {'paused' if paused else 'resumed'}.")
+
+    @property
+    def paused(self) -> bool:
+        return not self._active.is_set()
+
     def set_failure_callback(self, callback: Callable) -> None:
         """Set a callback for tasks that exhaust all retries."""
         self._on_failure = callback
 
+    async def list_dead_letters(self, limit: int = 100, offset: int = 0) -> list[dict[str, Any]]:
+        """Tasks that exhausted their retries, most recent first."""
+        return await asyncio.to_thread(self._store.list_dead, limit, offset)
+
+    async def replay_dead_letters(self, task_id: str | None = None) -> int:
+        """Re-enqueue one dead task (or all of them). Returns how many."""
+        tasks = await asyncio.to_thread(self._store.revive, task_id)
+        for task in tasks:
+            self._held.add(task.task_id)
+            await self._channel(task.channel).queue.put(task)
+        self._dead_letters = max(0, self._dead_letters - len(tasks))
+        if tasks:
+            logger.info(f"[Queue] Replaying {len(tasks)} dead-letter task(s).")
+        return len(tasks)
+
     @property
     def stats(self) -> dict:
-        return {**self._stats, "pending": self._queue.qsize()}
+        delayed_by_channel: dict[str, int] = {}
+        for _, _, task in self._delayed:
+            delayed_by_channel[task.channel] = delayed_by_channel.get(task.channel, 0) + 1
+
+        channels = {}
+        for name, state in self._channels.items():
+            channels[name] = {
+                "depth": state.queue.qsize(),
+                "in_flight": state.in_flight,
+                "delayed": delayed_by_channel.get(name, 0),
+                "workers": state.workers,
+                "concurrency": state.concurrency,
+                "send_latency_p50": percentile(state.send_latency, 0.50),
+                "send_latency_p95": percentile(state.send_latency, 0.95),
+                "delivery_latency_p95": percentile(state.delivery_latency, 0.95),
+            }
+
+        return {
+            **self._stats,
+            "pending": sum(c["depth"] for c in channels.values()),
+            "delayed": len(self._delayed),
+            "dead_letters": self._dead_letters,
+            "paused": self.paused,
+            "channels": channels,
+        }
 
     # ── Internal ─────────────────────────────────────────────────────
 
-    async def _process(self, task: NotificationTask) -> None:
-        """Try to send; requeue with backoff on failure."""
-        task.attempt += 1
+    def _channel(self, name: str) -> _ChannelState:
+        state = self._channels.get(name)
+        if state is None:
+            concurrency = self._channel_concurrency.get(name, self._workers_per_channel)
+            state = _ChannelState(self._workers_per_channel, concurrency)
+            self._channels[name] = state
+        if self._running and name not in self._spawned:
+            self._spawn_workers(name, state)
+        return state
+
+    def _spawn_workers(self, name: str, state: _ChannelState) -> None:
+        self._spawned.add(name)
+        for i in range(state.workers):
+            self._tasks.append(asyncio.create_task(self._worker(name, state), name=f"queue-{name}-{i}"))
+
+    async def _worker(self, name: str, state: _ChannelState) -> None:
+        while self._running:
+            try:
+                await self._active.wait()
+                task = await asyncio.wait_for(state.queue.get(), timeout=5.0)
+            except asyncio.TimeoutError:
+                continue
+            except asyncio.CancelledError:
+                break
+
+            # Drain whatever else is ready, up to the channel's batch size
+            batch = [task]
+            max_batch = self._batch_sizes.get(name, 1)
+            while len(batch) < max_batch:
+                try:
+                    batch.append(state.queue.get_nowait())
+                except asyncio.QueueEmpty:
+                    break
+
+            try:
+                async with state.semaphore:
+                    state.in_flight += len(batch)
+                    try:
+                        await self._process(batch, state)
+                    finally:
+                        state.in_flight -= len(batch)
+            except asyncio.CancelledError:
+                break
+            except Exception as e:
+                logger.error(f"[Queue] Worker error ({name}): {e}")
+            finally:
+                for _ in batch:
+                    state.queue.task_done()
+
+    async def _recover(self) -> None:
+        """Reload tasks persisted by a previous run."""
+        active = await asyncio.to_thread(self._store.load_active)
+        active = [(task, due_at) for task, due_at in active if task.task_id not in self._held]
+        self._dead_letters = await asyncio.to_thread(self._store.count_dead)
+        for task, due_at in active:
+            self._held.add(task.task_id)
+            if due_at is not None and due_at > time.time():
+                self._push_delayed(task, due_at)
+            else:
+                await self._channel(task.channel).queue.put(task)
+        self._stats["recovered"] += len(active)
+        if active:
+            logger.info(f"[Queue] Recovered {len(active)} pending notification(s) from {self._store._db_file}.")
+
+    async def _timer_loop(self) -> None:
+        """Move delayed tasks back to their channel queue once they are due."""
+        while self._running:
+            self._delay_changed.clear()
+            now = time.time()
+            while self._delayed and self._delayed[0][0] <= now:
+                _, _, task = heapq.heappop(self._delayed)
+                await self._channel(task.channel).queue.put(task)
+
+            timeout = self._delayed[0][0] - now if self._delayed else None
+            try:
+                await asyncio.wait_for(self._delay_changed.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    def _push_delayed(self, task: NotificationTask, due_at: float) -> None:
+        heapq.heappush(self._delayed, (due_at, next(self._delay_seq), task))
+        self._delay_changed.set()
+
+    async def _deliver(self, batch: list[NotificationTask]) -> list[bool | Exception]:
+        channel = batch[0].channel
+        batch_handler = self._batch_handlers.get(channel)
+        if batch_handler is not None:
+            return await batch_handler(batch)
+
+        handler = self._handlers.get(channel)
+        if handler is None:
+            raise RuntimeError(f"no handler registered for channel '{channel}'")
+        results: list[bool | Exception] = []
+        for task in batch:
+            try:
+                results.append(await handler(task))
+            except DeferDelivery as deferral:
+                results.append(deferral)
+        return results
+
+    async def _process(self, batch: list[NotificationTask], state: _ChannelState) -> None:
+        """Try to send; park failures in the delay heap with backoff."""
+        for task in batch:
+            task.attempt += 1
+        started = time.monotonic()
         try:
-            success = await task.send_fn(*task.args, **task.kwargs)
-            if success:
+            results = await self._deliver(batch)
+        except Exception as e:
+            results = [e] * len(batch)
+        state.send_latency.append((time.monotonic() - started) / len(batch))
+
+        delivered = []
+        for task, result in zip(batch, results):
+            if result is True:
+                delivered.append(task)
+            elif isinstance(result, DeferDelivery):
+                await self._defer(task, result)
+            else:
+                error = result if isinstance(result, Exception) else RuntimeError("handler returned False")
+                await self._handle_failure(task, error)
+
+        if delivered:
+            now = time.time()
+            for task in delivered:
                 self._stats["sent"] += 1
+                state.delivery_latency.append(now - task.created_at)
+                self._held.discard(task.task_id)
                 logger.info(
                     f"[Queue] ✓ Delivered {task.task_id} ({task.channel}) "
                     f"on attempt {task.attempt}"
                 )
-                return
+            try:
+                await asyncio.to_thread(self._store.delete_many, [t.task_id for t in delivered])
+            except Exception as e:
+                logger.error(f"[Queue] Could not clear {len(delivered)} delivered task(s): {e}")
 
-            raise RuntimeError("send_fn returned False")
+    async def _defer(self, task: NotificationTask, deferral: DeferDelivery) -> None:
+        task.attempt -= 1
+        self._stats["deferred"] += 1
+        logger.info(f"[Queue] Deferred {task.task_id} for {deferral.delay:.0f}s: {deferral}")
+        due_at = time.time() + deferral.delay
+        await asyncio.to_thread(self._store.mark_delayed, task, due_at)
+        self._push_delayed(task, due_at)
 
-        except Exception as e:
-            task.last_error = str(e)
-            logger.warning(
-                f"[Queue] ✗ {task.task_id} attempt {task.attempt}/{self._max_retries}: {e}"
-            )
+    async def _handle_failure(self, task: NotificationTask, error: Exception) -> None:
+        task.last_error = str(error)
+        logger.warning(
+            f"[Queue] ✗ {task.task_id} attempt {task.attempt}/{self._max_retries}: {error}"
+        )
 
-            if task.attempt < self._max_retries:
-                delay = min(
-                    BASE_DELAY_SECONDS * (2 ** (task.attempt - 1)),
-                    MAX_DELAY_SECONDS,
-                )
-                logger.info(f"[Queue] Retrying {task.task_id} in {delay}s...")
-                await asyncio.sleep(delay)
-                await self._queue.put(task)
-            else:
-                self._stats["failed"] += 1
-                logger.error(
-                    f"[Queue] ✗ FINAL FAIL {task.task_id} after {task.attempt} attempts: "
-                    f"{task.last_error}"
-                )
-                if self._on_failure:
-                    try:
-                        await self._on_failure(task)
-                    except Exception as cb_err:
-                        logger.error(f"[Queue] Failure callback error: {cb_err}")
+        if task.attempt < self._max_retries:
+            delay = min(
+                BASE_DELAY_SECONDS * (2 ** (task.attempt - 1)),
+                MAX_DELAY_SECONDS,
+            )
+            logger.info(f"[Queue] Retrying {task.task_id} in {delay}s...")
+            self._stats["retried"] += 1
+            due_at = time.time() + delay
+            await asyncio.to_thread(self._store.mark_delayed, task, due_at)
+            self._push_delayed(task, due_at)
+        else:
+            self._stats["failed"] += 1
+            self._dead_letters += 1
+            self._held.discard(task.task_id)
+            await asyncio.to_thread(self._store.mark_dead, task)
+            logger.error(
+                f"[Queue] ✗ FINAL FAIL {task.task_id} after {task.attempt} attempts: "
+                f"{task.last_error}"
+            )
+            if self._on_failure:
+                try:
+                    await self._on_failure(task)
+                except Exception as cb_err:
+                    logger.error(f"[Queue] Failure callback error: {cb_err}")
 
 
 # ─── Singleton ───────────────────────────────────────────────────────
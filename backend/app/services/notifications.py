@@ -6,26 +6,35 @@ Architecture:
     └── SMTPEmailProvider
 
     NotificationService  ← orchestrates providers + retry queue
+      └── NotificationCoalescer  ← one digest per recipient per window
+
+    Each provider backend has a ProviderLimiter (rate + daily quota).
 """
 
 from __future__ import annotations
 
+import asyncio
 import logging
-import smtplib
 import uuid
+from datetime import datetime, timezone
 from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from typing import Any
 
-from twilio.rest import Client
-from twilio.base.exceptions import TwilioRestException
+import httpx
 
 from app.config import settings
 from app.models import CommunicationChannel, CommunicationStatus
 from app.services.comunicacao import comm_service
 from app.services.settings import dynamic_settings
+from app.services.notification_coalescer import NotificationCoalescer
+from app.services.rate_limit import ProviderLimiter, is_transactional
+from app.services.smtp_pool import SMTPConnectionPool
+from app.services.templates import ALERT_EVENT, DIGEST_EVENT, template_engine
 from app.services.notification_queue import (
+    DeferDelivery,
     NotificationQueue,
     NotificationTask,
     notification_queue,
@@ -38,219 +47,14 @@ logger = logging.getLogger(__name__)
 # 1. TEMPLATES
 # ═══════════════════════════════════════════════════════════════════════
 
-def _format_currency(value: int | float) -> str:
-    """Format cents or float to BRL currency string."""
-    try:
-        val_float = float(value) / 100 if isinstance(value, int) else float(value)
-        return f"R$ {val_float:,.2f}".replace(",", "X").replace(".", ",").replace("X", ".")
-    except (ValueError, TypeError):
-        return "R$ 0,00"
-
-
-# ─── Email HTML Templates ────────────────────────────────────────────
-
-_EMAIL_COLORS = {
-    "emitido": "#3b82f6",
-    "pago": "#22c55e",
-    "atraso": "#ef4444",
-    "vencimento_d1": "#f59e0b",
-    "reativado": "#8b5cf6",
-}
-
-_EMAIL_TITLES = {
-    "emitido": "Novo Boleto Disponível",
-    "pago": "Pagamento Confirmado",
-    "atraso": "Aviso de Atraso",
-    "vencimento_d1": "Lembrete de Vencimento",
-    "reativado": "Boleto Reativado",
-}
-
-_EMAIL_SUBJECTS = {
-    "emitido": "Nova Fatura IAudit — Boleto Disponível",
-    "pago": "Confirmação de Pagamento — IAudit",
-    "atraso": "ALERTA: Fatura em Atraso — IAudit",
-    "vencimento_d1": "Lembrete: Vencimento Amanhã — IAudit",
-    "reativado": "Fatura Reativada — IAudit",
-}
-
-
-def _build_email_body(event: str, data: dict[str, Any]) -> str:
-    """Build the inner HTML body block for each event type."""
-    nome = data.get("nomeSacado", "Cliente")
-    valor = _format_currency(data.get("valorNominal", 0))
-    vencimento = data.get("dataVencimento", "")
-    linha = data.get("linhaDigitavel", "")
-    qr_pix = data.get("qrCodePix", "")
-    link_pdf = data.get("linkPdfBoleto", data.get("linkBoleto", "#"))
-    color = _EMAIL_COLORS.get(event, "#3b82f6")
-
-    if event == "emitido":
-        pix_block = ""
-        if qr_pix:
-            pix_block = f"""
-            <p style="margin-top: 15px;"><b>Pix Copia e Cola:</b></p>
-            <div style="background: #e2e8f0; padding: 10px; font-family: monospace; font-size: 0.8rem; word-break: break-all; border-radius: 4px;">
-                {qr_pix}
-            </div>
-            """
-        return f"""
-            <p>Olá <b>{nome}</b>,</p>
-            <p>Sua fatura IAudit referente aos serviços de monitoramento fiscal está disponível.</p>
-            <div style="background: #f8fafc; padding: 15px; border-radius: 8px; margin: 20px 0;">
-                <p style="margin: 5px 0;"><b>Valor:</b> {valor}</p>
-                <p style="margin: 5px 0;"><b>Vencimento:</b> {vencimento}</p>
-            </div>
-            <p>Linha digitável:</p>
-            <div style="background: #e2e8f0; padding: 10px; font-family: monospace; text-align: center; border-radius: 4px;">
-                {linha}
-            </div>
-            {pix_block}
-            <p style="text-align: center; margin-top: 25px;">
-                <a href="{link_pdf}" style="background-color: {color}; color: white; padding: 12px 24px; text-decoration: none; border-radius: 6px; font-weight: bold;">
-                    Baixar Boleto PDF
-                </a>
-            </p>
-        """
-
-    if event == "pago":
-        return f"""
-            <p>Olá <b>{nome}</b>,</p>
-            <p>Confirmamos o recebimento do pagamento do seu boleto.</p>
-            <div style="background: #dcfce7; padding: 15px; border-radius: 8px; margin: 20px 0; color: #166534;">
-                <p style="margin: 5px 0;"><b>Valor Pago:</b> {valor}</p>
-                <p style="margin: 5px 0;"><b>Obrigado por manter sua conta em dia!</b></p>
-            </div>
-        """
-
-    if event == "atraso":
-        return f"""
-            <p>Olá <b>{nome}</b>,</p>
-            <p>Não identificamos o pagamento do boleto com vencimento em <b>{vencimento}</b>.</p>
-            <div style="background: #fee2e2; padding: 15px; border-radius: 8px; margin: 20px 0; color: #991b1b;">
-                <p style="margin: 5px 0;"><b>Valor:</b> {valor}</p>
-                <p style="margin: 5px 0;">Após o vencimento incidem juros de 0,033%/dia e multa de 2%. Regularize para evitar suspensão dos serviços.</p>
-            </div>
-            <p style="text-align: center; margin-top: 25px;">
-                <a href="{link_pdf}" style="background-color: {color}; color: white; padding: 12px 24px; text-decoration: none; border-radius: 6px; font-weight: bold;">
-                    Visualizar Boleto
-                </a>
-            </p>
-        """
-
-    if event == "vencimento_d1":
-        return f"""
-            <p>Olá <b>{nome}</b>,</p>
-            <p>Lembrete: seu boleto vence <b>amanhã ({vencimento})</b>.</p>
-            <div style="background: #fef3c7; padding: 15px; border-radius: 8px; margin: 20px 0; color: #92400e;">
-                <p style="margin: 5px 0;"><b>Valor:</b> {valor}</p>
-                <p style="margin: 5px 0;">Evite juros e multa pagando dentro do prazo.</p>
-            </div>
-            <p>Linha digitável:</p>
-            <div style="background: #e2e8f0; padding: 10px; font-family: monospace; text-align: center; border-radius: 4px;">
-                {linha}
-            </div>
-        """
-
-    if event == "reativado":
-        return f"""
-            <p>Olá <b>{nome}</b>,</p>
-            <p>O boleto abaixo foi <b>reativado</b> e está disponível para pagamento.</p>
-            <div style="background: #ede9fe; padding: 15px; border-radius: 8px; margin: 20px 0; color: #5b21b6;">
-                <p style="margin: 5px 0;"><b>Valor:</b> {valor}</p>
-                <p style="margin: 5px 0;"><b>Vencimento:</b> {vencimento}</p>
-            </div>
-            <p style="text-align: center; margin-top: 25px;">
-                <a href="{link_pdf}" style="background-color: {_EMAIL_COLORS['reativado']}; color: white; padding: 12px 24px; text-decoration: none; border-radius: 6px; font-weight: bold;">
-                    Visualizar Boleto
-                </a>
-            </p>
-        """
-
-    return f"<p>Notificação sobre seu boleto: {_EMAIL_TITLES.get(event, 'IAudit')}</p>"
-
-
 def build_boleto_email_html(event: str, data: dict[str, Any]) -> str:
     """Build full HTML email for boleto events."""
-    color = _EMAIL_COLORS.get(event, "#3b82f6")
-    title = _EMAIL_TITLES.get(event, "Notificação IAudit")
-    body_content = _build_email_body(event, data)
-
-    return f"""
-    <html>
-    <body style="font-family: 'Segoe UI', Arial, sans-serif; background-color: #f1f5f9; margin: 0; padding: 40px 0;">
-        <div style="max-width: 600px; margin: 0 auto; background: white; border-radius: 12px; box-shadow: 0 4px 6px -1px rgba(0,0,0,0.1); overflow: hidden;">
-            <div style="background-color: {color}; padding: 20px; text-align: center;">
-                <h2 style="color: white; margin: 0; font-size: 24px;">{title}</h2>
-            </div>
-            <div style="padding: 30px; color: #334155; line-height: 1.6;">
-                {body_content}
-                <hr style="border: 0; border-top: 1px solid #e2e8f0; margin: 30px 0;">
-                <p style="font-size: 12px; color: #94a3b8; text-align: center;">
-                    IAudit — Automação Fiscal Inteligente<br>
-                    Este é um email automático, por favor não responda.
-                </p>
-            </div>
-        </div>
-    </body>
-    </html>
-    """
-
+    return template_engine.render_email(event, data)
 
-# ─── WhatsApp Text Templates ─────────────────────────────────────────
 
 def build_whatsapp_message(event: str, data: dict[str, Any]) -> str:
     """Build WhatsApp text message with emojis and bold."""
-    nome = data.get("nomeSacado", "Cliente")
-    valor = _format_currency(data.get("valorNominal", 0))
-    vencimento = data.get("dataVencimento", "")
-    linha = data.get("linhaDigitavel", "")
-    qr_pix = data.get("qrCodePix", "")
-    link_pdf = data.get("linkPdfBoleto", data.get("linkBoleto", ""))
-
-    if event == "emitido":
-        pix_line = f"\n💳 *Pix Copia e Cola:*\n{qr_pix}" if qr_pix else ""
-        return (
-            f"📄 *Nova Fatura IAudit*\n\n"
-            f"Olá {nome}, seu boleto foi gerado.\n\n"
-            f"*Valor:* {valor}\n"
-            f"*Vencimento:* {vencimento}\n\n"
-            f"📎 *PDF:* {link_pdf}\n\n"
-            f"👇 *Linha Digitável:*\n{linha}"
-            f"{pix_line}"
-        )
-
-    if event == "pago":
-        return (
-            f"✅ *Pagamento Confirmado — IAudit*\n\n"
-            f"Olá {nome}, confirmamos o pagamento de *{valor}*.\n"
-            f"Obrigado por manter sua conta em dia!"
-        )
-
-    if event == "atraso":
-        return (
-            f"⚠️ *Aviso de Atraso — IAudit*\n\n"
-            f"Olá {nome}, o boleto de *{valor}* venceu em *{vencimento}*.\n"
-            f"Após o vencimento incidem juros e multa.\n\n"
-            f"📎 *2ª Via:* {link_pdf}"
-        )
-
-    if event == "vencimento_d1":
-        return (
-            f"🔔 *Lembrete de Vencimento — IAudit*\n\n"
-            f"Olá {nome}, seu boleto de *{valor}* vence *amanhã ({vencimento})*.\n"
-            f"Evite juros pagando dentro do prazo.\n\n"
-            f"👇 *Linha Digitável:*\n{linha}"
-        )
-
-    if event == "reativado":
-        return (
-            f"🔄 *Boleto Reativado — IAudit*\n\n"
-            f"Olá {nome}, seu boleto de *{valor}* foi reativado e está pronto para pagamento.\n\n"
-            f"*Vencimento:* {vencimento}\n"
-            f"📎 *PDF:* {link_pdf}"
-        )
-
-    return f"IAudit: Notificação sobre boleto {valor}."
+    return template_engine.render_whatsapp(event, data)
 
 
 # ═══════════════════════════════════════════════════════════════════════
@@ -260,6 +64,9 @@ def build_whatsapp_message(event: str, data: dict[str, Any]) -> str:
 class NotificationProvider(ABC):
     """Abstract base for notification channels."""
 
+    # Rate / daily quota of the backend that sends first (None = unlimited)
+    limiter: ProviderLimiter | None = None
+
     @abstractmethod
     async def send(self, recipient: str, subject: str, body: str) -> bool:
         ...
@@ -269,72 +76,264 @@ class NotificationProvider(ABC):
     def channel_name(self) -> str:
         ...
 
+    async def send_batch(
+        self, messages: list[tuple[str, str, str]], transactional: list[bool] | None = None
+    ) -> list[bool]:
+        """Send (recipient, subject, body) messages; one result per message.
+
+        ``transactional`` flags each message's priority, for providers with a
+        fallback backend that has its own quota.
+        """
+        return list(await asyncio.gather(*(self.send(*m) for m in messages)))
+
+    def admit(self, transactional: bool = False, count: int = 1) -> bool:
+        """Reserve daily quota before sending; False means wait for the reset.
+        Providers give the quota back for messages they fail to deliver."""
+        return self.limiter is None or self.limiter.admit(count, transactional)
+
+    def quota_reset_in(self) -> float:
+        return self.limiter.quota.seconds_until_reset() if self.limiter else 60.0
+
+    @property
+    def rate_limits(self) -> dict:
+        return {self.limiter.name: self.limiter.stats} if self.limiter else {}
+
+    async def maintain(self) -> None:
+        """Periodic connection upkeep (no-op by default)."""
+
+    async def aclose(self) -> None:
+        """Release pooled connections (called on shutdown)."""
+
 
 class SMTPEmailProvider(NotificationProvider):
-    """Send email via Resend (primary) or SMTP/Gmail (fallback)."""
+    """Send email via Resend (primary) or SMTP/Gmail (fallback).
+
+    Resend is called over a pooled async HTTP client (batch endpoint for
+    bursts); SMTP goes through a pool of logged-in sessions driven from a
+    small dedicated thread pool, so neither stalls the event loop.
+    """
+
+    RESEND_URL = "https://api.resend.com/emails"
+    RESEND_BATCH_URL = "https://api.resend.com/emails/batch"
+    RESEND_BATCH_LIMIT = 100
+
+    def __init__(self):
+        self._http: httpx.AsyncClient | None = None
+        self._resend_slots = asyncio.Semaphore(settings.resend_max_concurrency)
+        self._smtp_slots = asyncio.Semaphore(settings.smtp_max_concurrency)
+        self._smtp_executor = ThreadPoolExecutor(
+            max_workers=settings.smtp_max_concurrency, thread_name_prefix="smtp"
+        )
+        self._smtp_pool: SMTPConnectionPool | None = None
+        reserve = settings.notification_quota_reserve_ratio
+        self.resend_limiter = ProviderLimiter(
+            "resend", settings.resend_rate_per_second, settings.resend_daily_quota, reserve
+        )
+        self.smtp_limiter = ProviderLimiter(
+            "smtp", settings.smtp_rate_per_second, settings.smtp_daily_quota, reserve
+        )
 
     @property
     def channel_name(self) -> str:
         return "email"
 
+    @property
+    def limiter(self) -> ProviderLimiter:
+        return self.resend_limiter if settings.resend_api_key else self.smtp_limiter
+
+    @property
+    def rate_limits(self) -> dict:
+        return {"resend": self.resend_limiter.stats, "smtp": self.smtp_limiter.stats}
+
+    def _client(self) -> httpx.AsyncClient:
+        if self._http is None:
+            self._http = httpx.AsyncClient(
+                timeout=15,
+                limits=httpx.Limits(
+                    max_connections=settings.resend_max_concurrency,
+                    max_keepalive_connections=settings.resend_max_concurrency,
+                ),
+                headers={"Authorization": f"Bearer {settings.resend_api_key}"},
+            )
+        return self._http
+
+    def _pool(self) -> SMTPConnectionPool:
+        if self._smtp_pool is None:
+            self._smtp_pool = SMTPConnectionPool(
+                settings.smtp_host,
+                settings.smtp_port,
+                settings.smtp_user,
+                settings.smtp_password,
+                size=settings.smtp_max_concurrency,
+                noop_interval=settings.smtp_noop_interval_seconds,
+                idle_timeout=settings.smtp_idle_timeout_seconds,
+            )
+        return self._smtp_pool
+
+    @staticmethod
+    def _resend_payload(recipient: str, subject: str, body: str) -> dict:
+        return {
+            "from": settings.email_from,
+            "to": [recipient],
+            "subject": subject,
+            "html": body,
+        }
+
+    async def _send_resend(self, recipient: str, subject: str, body: str) -> None:
+        await self.resend_limiter.throttle()
+        async with self._resend_slots:
+            resp = await self._client().post(self.RESEND_URL, json=self._resend_payload(recipient, subject, body))
+        resp.raise_for_status()
+
+    async def _send_resend_batch(self, messages: list[tuple[str, str, str]]) -> None:
+        """One request for up to RESEND_BATCH_LIMIT emails (all-or-nothing)."""
+        await self.resend_limiter.throttle()  # the API rate limit is per request
+        async with self._resend_slots:
+            resp = await self._client().post(
+                self.RESEND_BATCH_URL, json=[self._resend_payload(*m) for m in messages]
+            )
+        resp.raise_for_status()
+
+    @staticmethod
+    def _build_message(recipient: str, subject: str, body: str) -> MIMEMultipart:
+        msg = MIMEMultipart("alternative")
+        msg["From"] = settings.email_from
+        msg["To"] = recipient
+        msg["Subject"] = subject
+        msg.attach(MIMEText(body, "html"))
+        return msg
+
+    async def _send_smtp_many(self, messages: list[tuple[str, str, str]]) -> list[Exception | None]:
+        msgs = [self._build_message(*m) for m in messages]
+        await self.smtp_limiter.throttle(len(msgs))
+        async with self._smtp_slots:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._smtp_executor, self._pool().send_many, msgs)
+
     async def send(self, recipient: str, subject: str, body: str) -> bool:
-        # 1. Try Resend
-        if settings.resend_api_key:
-            try:
-                import resend
-                resend.api_key = settings.resend_api_key
-                resend.Emails.send({
-                    "from": settings.email_from,
-                    "to": [recipient],
-                    "subject": subject,
-                    "html": body,
-                })
-                logger.info(f"Email sent via Resend to {recipient}")
-                return True
-            except Exception as e:
-                logger.error(f"Resend failed: {e}. Trying SMTP.")
+        return (await self.send_batch([(recipient, subject, body)]))[0]
+
+    async def send_batch(
+        self, messages: list[tuple[str, str, str]], transactional: list[bool] | None = None
+    ) -> list[bool]:
+        results = [False] * len(messages)
+        pending = list(range(len(messages)))
+        urgent = transactional or [False] * len(messages)
 
-        # 2. SMTP fallback
+        # 1. Try Resend (single endpoint for one message, batch endpoint otherwise)
+        if settings.resend_api_key:
+            for start in range(0, len(messages), self.RESEND_BATCH_LIMIT):
+                chunk = messages[start:start + self.RESEND_BATCH_LIMIT]
+                try:
+                    if len(chunk) == 1:
+                        await self._send_resend(*chunk[0])
+                    else:
+                        await self._send_resend_batch(chunk)
+                    for i in range(start, start + len(chunk)):
+                        results[i] = True
+                    logger.info(f"Email sent via Resend to {len(chunk)} recipient(s)")
+                except Exception as e:
+                    # Not sent by Resend: its quota (reserved by the caller) goes back
+                    self.resend_limiter.refund(len(chunk))
+                    logger.error(f"Resend failed: {e}. Trying SMTP.")
+            pending = [i for i, ok in enumerate(results) if not ok]
+
+        if not pending:
+            return results
+
+        # 2. SMTP fallback (one pooled session for the whole batch)
         if settings.smtp_user and settings.smtp_password:
+            # Quota was admitted against Resend; the fallback counts against SMTP's
+            # own, with each message's priority (reminders keep off the reserve)
+            if settings.resend_api_key:
+                admitted = []
+                for priority in (True, False):
+                    group = [i for i in pending if urgent[i] == priority]
+                    if group and self.smtp_limiter.admit(len(group), transactional=priority):
+                        admitted.extend(group)
+                if len(admitted) < len(pending):
+                    logger.warning(
+                        f"SMTP daily quota reached; {len(pending) - len(admitted)} email(s) left for retry."
+                    )
+                pending = sorted(admitted)
+                if not pending:
+                    return results
             try:
-                msg = MIMEMultipart("alternative")
-                msg["From"] = settings.email_from
-                msg["To"] = recipient
-                msg["Subject"] = subject
-                msg.attach(MIMEText(body, "html"))
-
-                with smtplib.SMTP(settings.smtp_host, settings.smtp_port) as server:
-                    server.ehlo()
-                    server.starttls()
-                    server.ehlo()
-                    server.login(settings.smtp_user, settings.smtp_password)
-                    server.send_message(msg)
-
-                logger.info(f"Email sent via SMTP to {recipient}")
-                return True
+                errors = await self._send_smtp_many([messages[i] for i in pending])
             except Exception as e:
-                logger.error(f"SMTP failed: {e}")
-                return False
-
+                errors = [e] * len(pending)
+            for i, error in zip(pending, errors):
+                if error is None:
+                    results[i] = True
+                    logger.info(f"Email sent via SMTP to {messages[i][0]}")
+                else:
+                    logger.error(f"SMTP failed for {messages[i][0]}: {error}")
+            self.smtp_limiter.refund(sum(1 for error in errors if error is not None))
+            return results
+
+        if not settings.resend_api_key:
+            self.smtp_limiter.refund(len(pending))
         logger.warning("No email provider configured.")
-        return False
+        return results
+
+    async def maintain(self) -> None:
+        """Periodic NOOP health check of the idle SMTP sessions."""
+        if self._smtp_pool is not None:
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(self._smtp_executor, self._smtp_pool.health_check)
+
+    async def aclose(self) -> None:
+        if self._http is not None:
+            await self._http.aclose()
+            self._http = None
+        if self._smtp_pool is not None:
+            self._smtp_pool.close()
+        self._smtp_executor.shutdown(wait=False)
 
 
 class TwilioWhatsAppProvider(NotificationProvider):
-    """Send WhatsApp message via Twilio."""
+    """Send WhatsApp message via the Twilio REST API (pooled async HTTP)."""
+
+    API_URL = "https://api.twilio.com/2010-04-01/Accounts/{sid}/Messages.json"
+
+    def __init__(self):
+        self._http: httpx.AsyncClient | None = None
+        self._slots = asyncio.Semaphore(settings.twilio_max_concurrency)
+        self.limiter = ProviderLimiter(
+            "twilio",
+            settings.twilio_rate_per_second,
+            settings.twilio_daily_quota,
+            settings.notification_quota_reserve_ratio,
+        )
 
     @property
     def channel_name(self) -> str:
         return "whatsapp"
 
+    def _client(self) -> httpx.AsyncClient:
+        if self._http is None:
+            self._http = httpx.AsyncClient(
+                timeout=15,
+                limits=httpx.Limits(
+                    max_connections=settings.twilio_max_concurrency,
+                    max_keepalive_connections=settings.twilio_max_concurrency,
+                ),
+                auth=(settings.twilio_account_sid, settings.twilio_auth_token),
+            )
+        return self._http
+
     async def send(self, recipient: str, subject: str, body: str) -> bool:
+        sent = await self._send(recipient, body)
+        if not sent:
+            self.limiter.refund()  # reserved by admit(), not delivered
+        return sent
+
+    async def _send(self, recipient: str, body: str) -> bool:
         if not settings.twilio_account_sid or not settings.twilio_auth_token:
             logger.warning("Twilio credentials missing.")
             return False
 
         try:
-            client = Client(settings.twilio_account_sid, settings.twilio_auth_token)
-
             # Normalize number → whatsapp:+55XXXXXXXXXXX
             if not recipient.startswith("whatsapp:"):
                 clean_num = "".join(filter(str.isdigit, recipient))
@@ -342,38 +341,63 @@ class TwilioWhatsAppProvider(NotificationProvider):
                     clean_num = "55" + clean_num
                 recipient = f"whatsapp:+{clean_num}"
 
-            msg = client.messages.create(
-                from_=settings.twilio_from_number,
-                body=body,   # subject ignored for WhatsApp
-                to=recipient,
-            )
-            logger.info(f"WhatsApp sent to {recipient}. SID: {msg.sid}")
+            await self.limiter.throttle()
+            async with self._slots:
+                resp = await self._client().post(
+                    self.API_URL.format(sid=settings.twilio_account_sid),
+                    data={
+                        "From": settings.twilio_from_number,
+                        "Body": body,   # subject ignored for WhatsApp
+                        "To": recipient,
+                    },
+                )
+
+            if resp.status_code >= 400:
+                try:
+                    detail = resp.json().get("message", resp.text)
+                except ValueError:
+                    detail = resp.text
+                logger.error(f"Twilio API Error ({resp.status_code}): {detail}")
+                return False
+
+            logger.info(f"WhatsApp sent to {recipient}. SID: {resp.json().get('sid')}")
             return True
 
-        except TwilioRestException as e:
-            logger.error(f"Twilio API Error: {e}")
-            return False
         except Exception as e:
             logger.error(f"Twilio General Error: {e}")
             return False
 
+    async def aclose(self) -> None:
+        if self._http is not None:
+            await self._http.aclose()
+            self._http = None
+
 
 # ═══════════════════════════════════════════════════════════════════════
 # 3. NOTIFICATION SERVICE (Orchestrator)
 # ═══════════════════════════════════════════════════════════════════════
 
 class NotificationService:
-    """Unified notification dispatcher with queue-based retry."""
+    """Unified notification dispatcher with coalescing and queue-based retry."""
 
     def __init__(
         self,
         email_provider: NotificationProvider | None = None,
         whatsapp_provider: NotificationProvider | None = None,
         queue: NotificationQueue | None = None,
+        coalesce_window: float | None = None,
     ):
         self.email = email_provider or SMTPEmailProvider()
         self.whatsapp = whatsapp_provider or TwilioWhatsAppProvider()
         self.queue = queue or notification_queue
+        self.coalescer = NotificationCoalescer(
+            self._enqueue,
+            settings.notification_coalesce_window_seconds if coalesce_window is None else coalesce_window,
+            settings.notification_digest_max_items,
+        )
+        self.queue.register_handler("email", self._deliver_email)
+        self.queue.register_batch_handler("email", self._deliver_email_batch, settings.email_batch_size)
+        self.queue.register_handler("whatsapp", self._deliver_whatsapp)
 
     async def notify(
         self,
@@ -382,42 +406,169 @@ class NotificationService:
         recipient_email: str | None = None,
         recipient_phone: str | None = None,
     ) -> None:
-        """Dispatch notification to all applicable channels via the queue."""
+        """Dispatch notification to all applicable channels.
+
+        Transactional events (pago, emitido, alerta...) go straight to the
+        persistent queue, so a restart cannot lose them; the others are
+        coalesced per recipient first (held in memory for the window).
+        """
         # Check global kill switch
         settings_dict = dynamic_settings.get_settings()
         if not settings_dict.get("mensagens_ativas", True):
             logger.info("Global messaging disabled via dynamic settings.")
             return
 
-        # Email
+        targets = []
         if recipient_email:
-            subject = _EMAIL_SUBJECTS.get(event, "Notificação IAudit")
-            html = build_boleto_email_html(event, data)
+            targets.append(("email", recipient_email))
+        if recipient_phone and settings.twilio_account_sid:
+            targets.append(("whatsapp", recipient_phone))
 
-            await self.queue.enqueue(NotificationTask(
-                task_id=f"{event}-email-{uuid.uuid4().hex[:8]}",
-                channel="email",
-                send_fn=self._send_email_and_log,
-                args=(recipient_email, subject, html, event),
-            ))
+        for channel, recipient in targets:
+            if is_transactional(event):
+                await self._enqueue(channel, recipient, [{"event": event, "data": data}])
+            else:
+                await self.coalescer.add(channel, recipient, event, data)
 
-        # WhatsApp
-        if recipient_phone and settings.twilio_account_sid:
-            text_msg = build_whatsapp_message(event, data)
+    async def notify_many(self, notifications: list[tuple[str, dict[str, Any], str | None, str | None]]) -> int:
+        """Dispatch many (event, data, email, phone) notifications at once.
+
+        For jobs that already hold the whole batch (e.g. the daily vencimento
+        scan): events are grouped per recipient here, like the coalescer
+        would, and every resulting message is queued in one write. Returns
+        the number of messages queued.
+        """
+        settings_dict = dynamic_settings.get_settings()
+        if not settings_dict.get("mensagens_ativas", True):
+            logger.info("Global messaging disabled via dynamic settings.")
+            return 0
+
+        groups: dict[tuple[str, str], tuple[str, list[dict[str, Any]]]] = {}
+        for event, data, email, phone in notifications:
+            targets = []
+            if email:
+                targets.append(("email", email))
+            if phone and settings.twilio_account_sid:
+                targets.append(("whatsapp", phone))
+            for channel, recipient in targets:
+                key = (channel, recipient.strip().lower())
+                groups.setdefault(key, (recipient, []))[1].append({"event": event, "data": data})
+
+        max_items = self.coalescer.max_items
+        tasks = [
+            self._task(channel, recipient, items[i:i + max_items])
+            for (channel, _), (recipient, items) in groups.items()
+            for i in range(0, len(items), max_items)
+        ]
+        await self.queue.enqueue_many(tasks)
+        return len(tasks)
+
+    @staticmethod
+    def _task(channel: str, recipient: str, items: list[dict[str, Any]]) -> NotificationTask:
+        """One event as-is, several as a digest."""
+        if len(items) == 1:
+            event, payload = items[0]["event"], items[0]["data"]
+        else:
+            event, payload = DIGEST_EVENT, {"itens": items}
+        return NotificationTask(
+            task_id=f"{event}-{channel}-{uuid.uuid4().hex}",
+            channel=channel,
+            event=event,
+            recipient=recipient,
+            payload=payload,
+        )
 
-            await self.queue.enqueue(NotificationTask(
-                task_id=f"{event}-whatsapp-{uuid.uuid4().hex[:8]}",
-                channel="whatsapp",
-                send_fn=self._send_whatsapp_and_log,
-                args=(recipient_phone, text_msg, event),
-            ))
+    async def _enqueue(self, channel: str, recipient: str, items: list[dict[str, Any]]) -> None:
+        """Queue one message (a single event, or a coalesced group)."""
+        await self.queue.enqueue(self._task(channel, recipient, items))
+
+    async def flush(self) -> None:
+        """Enqueue everything still held by the coalescer."""
+        await self.coalescer.flush()
+
+    @property
+    def rate_limits(self) -> dict:
+        return {**self.email.rate_limits, **self.whatsapp.rate_limits}
+
+    async def restore_quota_usage(self) -> None:
+        """Seed today's quota usage from the communication log (after a restart).
+        Only delivered messages count: failed sends gave their quota back."""
+        midnight = datetime.combine(datetime.now(timezone.utc).date(), datetime.min.time(), timezone.utc)
+        stats = await comm_service.get_stats(since=midnight)
+        for provider in (self.email, self.whatsapp):
+            sent_today = stats["by_channel"].get(provider.channel_name, {}).get("sent", 0)
+            if provider.limiter is not None:
+                provider.limiter.quota.used = max(provider.limiter.quota.used, sent_today)
+
+    @staticmethod
+    def _admit(provider: NotificationProvider, task: NotificationTask) -> DeferDelivery | None:
+        """Quota check: None to send now, or a deferral until the quota resets."""
+        if provider.admit(is_transactional(task.event, task.payload)):
+            return None
+        return DeferDelivery(provider.quota_reset_in(), f"{provider.channel_name} daily quota reached")
+
+    async def aclose(self) -> None:
+        """Close provider connection pools."""
+        await self.email.aclose()
+        await self.whatsapp.aclose()
+
+    # ── Queue handlers (render at delivery time) ─────────────────────
+
+    async def _deliver_email(self, task: NotificationTask) -> bool:
+        deferral = self._admit(self.email, task)
+        if deferral is not None:
+            raise deferral
+        subject, html = template_engine.render_email_message(task.event, task.payload)
+        return await self._send_email_and_log(
+            task.recipient, subject, html, task.event, is_transactional(task.event, task.payload)
+        )
+
+    async def _deliver_email_batch(self, tasks: list[NotificationTask]) -> list[bool | Exception]:
+        results: list[bool | Exception] = [False] * len(tasks)
+        admitted = []
+        for i, task in enumerate(tasks):
+            deferral = self._admit(self.email, task)
+            if deferral is None:
+                admitted.append(i)
+            else:
+                results[i] = deferral
+        if not admitted:
+            return results
+
+        messages = [
+            (tasks[i].recipient, *template_engine.render_email_message(tasks[i].event, tasks[i].payload))
+            for i in admitted
+        ]
+        sent = await self.email.send_batch(
+            messages, [is_transactional(tasks[i].event, tasks[i].payload) for i in admitted]
+        )
+        for i, ok in zip(admitted, sent):
+            results[i] = ok
+        await comm_service.log_messages([
+            {
+                "channel": CommunicationChannel.email,
+                "recipient": recipient,
+                "subject": subject,
+                "content": f"Template: {tasks[i].event}",
+                "status": CommunicationStatus.sent if ok else CommunicationStatus.failed,
+            }
+            for i, (recipient, subject, _), ok in zip(admitted, messages, sent)
+        ])
+        return results
+
+    async def _deliver_whatsapp(self, task: NotificationTask) -> bool:
+        deferral = self._admit(self.whatsapp, task)
+        if deferral is not None:
+            raise deferral
+        text_msg = template_engine.render_whatsapp_message(task.event, task.payload)
+        return await self._send_whatsapp_and_log(task.recipient, text_msg, task.event)
 
     # ── Internal: send + log ─────────────────────────────────────────
 
     async def _send_email_and_log(
-        self, recipient: str, subject: str, html: str, event: str
+        self, recipient: str, subject: str, html: str, event: str, transactional: bool = False
     ) -> bool:
-        success = await self.email.send(recipient, subject, html)
+        success = (await self.email.send_batch([(recipient, subject, html)], [transactional]))[0]
         await comm_service.log_message(
             channel=CommunicationChannel.email,
             recipient=recipient,
@@ -457,37 +608,41 @@ async def send_boleto_notification(
 
 # ── Legacy Alert (kept for scheduler.py compatibility) ───────────────
 
-async def send_alert_email(empresa: dict, consulta: dict) -> bool:
-    """Alert when CND is negative or FGTS is irregular."""
+def _alert_notification(empresa: dict, consulta: dict) -> tuple[str, dict[str, Any], str, None] | None:
+    """(event, data, email, phone) of an alert, or None without an alert email."""
     to_email = empresa.get("email_notificacao")
     if not to_email:
-        return False
+        return None
 
-    tipo = consulta.get("tipo", "")
-    situacao = consulta.get("situacao", "").upper()
-
-    subject = f"🚨 Alerta: {tipo.upper()} — {empresa.get('razao_social')}"
-    html = f"""
-    <html>
-    <body style="font-family: Arial, sans-serif; padding: 20px;">
-        <h2>🚨 Alerta Fiscal: {tipo}</h2>
-        <p>Empresa: {empresa.get('razao_social')}</p>
-        <p>CNPJ: {empresa.get('cnpj')}</p>
-        <p>Situação: <b style="color:red">{situacao}</b></p>
-        <hr>
-        <p style="font-size: 12px; color: #94a3b8;">IAudit — Automação Fiscal</p>
-    </body>
-    </html>
-    """
+    razao_social = empresa.get("razao_social")
+    return ALERT_EVENT, {
+        "empresa": razao_social,
+        "razao_social": razao_social,
+        "cnpj": empresa.get("cnpj"),
+        "tipo": consulta.get("tipo", ""),
+        "situacao": consulta.get("situacao", ""),
+    }, to_email, None
 
-    provider = SMTPEmailProvider()
-    success = await provider.send(to_email, subject, html)
-
-    await comm_service.log_message(
-        channel=CommunicationChannel.email,
-        recipient=to_email,
-        subject=subject,
-        content="Alert Email",
-        status=CommunicationStatus.sent if success else CommunicationStatus.failed,
-    )
-    return success
+
+async def send_alert_email(empresa: dict, consulta: dict) -> bool:
+    """Alert when CND is negative or FGTS is irregular.
+
+    Alerts are transactional: this one is queued on its own right away.
+    Batch jobs use ``send_alert_emails`` so a client gets one digest for all
+    of its filiais. Returns True once the alert is accepted.
+    """
+    notification = _alert_notification(empresa, consulta)
+    if notification is None:
+        return False
+    await notification_service.notify(*notification)
+    return True
+
+
+async def send_alert_emails(alerts: list[tuple[dict, dict]]) -> int:
+    """Queue the (empresa, consulta) alerts of a robot run in one write,
+    one message (a digest for several) per recipient. Returns the number
+    of messages queued."""
+    notifications = [n for n in (_alert_notification(e, c) for e, c in alerts) if n is not None]
+    if not notifications:
+        return 0
+    return await notification_service.notify_many(notifications)
@@ -0,0 +1,234 @@
+"""IAudit - Batch compliance certificate jobs.
+
+A batch turns a list of CNPJs into one download: a ZIP with a certificate
+per CNPJ, or a single merged PDF. It runs in the background:
+  1. the query data of each CNPJ is loaded (the caller's fetch: recent
+     history first, upstream otherwise), at most ``pdf_batch_concurrency``
+     at a time
+  2. ZIP: each certificate is rendered (PDF cache + render processes) and
+     added to the archive as soon as it is ready;
+     PDF: all certificates are rendered into one document
+  3. the output is written under data/pdf_batches and kept for
+     ``pdf_batch_ttl_minutes``
+
+Progress is kept per job as a list of events (one per CNPJ, then a final
+one) that clients can poll or follow as NDJSON.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import time
+import uuid
+import zipfile
+from typing import Awaitable, Callable
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), "data")
+PDF_BATCH_DIR = os.path.join(DATA_DIR, "pdf_batches")
+
+FORMATOS = ("zip", "pdf")
+
+Fetch = Callable[[str], Awaitable[dict]]
+Render = Callable[[str, dict], Awaitable[bytes]]
+RenderMerged = Callable[[list[tuple[str, dict]]], Awaitable[bytes]]
+
+
+def _error(e: Exception) -> str:
+    return str(getattr(e, "detail", None) or e)
+
+
+class PdfBatchJob:
+    def __init__(self, cnpjs: list[str], formato: str):
+        self.id = uuid.uuid4().hex
+        self.cnpjs = cnpjs
+        self.formato = formato
+        self.created_at = time.time()
+        self.finished_at: float | None = None
+        self.status = "running"  # running | done | failed
+        self.done = 0
+        self.failed = 0
+        self.path: str | None = None
+        self.events: list[dict] = []
+        self._changed = asyncio.Condition()
+
+    @property
+    def finished(self) -> bool:
+        return self.status != "running"
+
+    @property
+    def summary(self) -> dict:
+        return {
+            "job_id": self.id,
+            "formato": self.formato,
+            "status": self.status,
+            "total": len(self.cnpjs),
+            "concluidos": self.done,
+            "falhas": self.failed,
+        }
+
+    async def _emit(self, event: dict, status: str | None = None) -> None:
+        async with self._changed:
+            if status:
+                self.status = status
+                self.finished_at = time.time()
+            self.events.append(event)
+            self._changed.notify_all()
+
+    async def _item(self, cnpj: str, error: Exception | None = None) -> None:
+        self.done += 1
+        event = {"cnpj": cnpj, "sucesso": error is None, "concluidos": self.done, "total": len(self.cnpjs)}
+        if error is not None:
+            self.failed += 1
+            event["erro"] = _error(error)
+        await self._emit(event)
+
+    async def follow(self):
+        """Progress events, from the first one, until the job finishes."""
+        sent = 0
+        while True:
+            async with self._changed:
+                await self._changed.wait_for(lambda: len(self.events) > sent or self.finished)
+                new = self.events[sent:]
+            sent += len(new)
+            for event in new:
+                yield event
+            if self.finished and sent >= len(self.events):
+                return
+
+
+class PdfBatchJobs:
+    def __init__(self, directory: str = PDF_BATCH_DIR):
+        self._dir = directory
+        self._jobs: dict[str, PdfBatchJob] = {}
+        self._tasks: set[asyncio.Task] = set()
+
+    @property
+    def stats(self) -> dict:
+        return {
+            "jobs": len(self._jobs),
+            "running": sum(1 for job in self._jobs.values() if not job.finished),
+        }
+
+    def get(self, job_id: str) -> PdfBatchJob | None:
+        return self._jobs.get(job_id)
+
+    def start(
+        self, cnpjs: list[str], formato: str, fetch: Fetch, render: Render, render_merged: RenderMerged
+    ) -> PdfBatchJob:
+        """Create a job and run it in the background."""
+        self._expire()
+        job = PdfBatchJob(cnpjs, formato)
+        self._jobs[job.id] = job
+        task = asyncio.create_task(self._run(job, fetch, render, render_merged))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return job
+
+    def stop(self) -> None:
+        for task in list(self._tasks):
+            task.cancel()
+
+    def _expire(self) -> None:
+        """Forget finished jobs past their TTL and delete their files."""
+        cutoff = time.time() - settings.pdf_batch_ttl_minutes * 60
+        for job_id, job in list(self._jobs.items()):
+            if job.finished and job.finished_at < cutoff:
+                del self._jobs[job_id]
+                if job.path:
+                    self._remove(job.path)
+        # Files left by a previous process
+        try:
+            with os.scandir(self._dir) as entries:
+                for entry in entries:
+                    job_id = entry.name.split(".")[0]
+                    if job_id not in self._jobs and entry.stat().st_mtime < cutoff:
+                        self._remove(entry.path)
+        except FileNotFoundError:
+            pass
+
+    @staticmethod
+    def _remove(path: str) -> None:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    async def _run(self, job: PdfBatchJob, fetch: Fetch, render: Render, render_merged: RenderMerged) -> None:
+        started = time.monotonic()
+        path = os.path.join(self._dir, f"{job.id}.{job.formato}")
+        semaphore = asyncio.Semaphore(settings.pdf_batch_concurrency)
+
+        async def certificate(cnpj: str) -> tuple[str, dict | None, bytes | None, Exception | None]:
+            async with semaphore:
+                try:
+                    data = await fetch(cnpj)
+                    pdf = await render(cnpj, data) if job.formato == "zip" else None
+                except Exception as e:
+                    return cnpj, None, None, e
+            return cnpj, data, pdf, None
+
+        try:
+            os.makedirs(self._dir, exist_ok=True)
+            tasks = [asyncio.create_task(certificate(cnpj)) for cnpj in job.cnpjs]
+            try:
+                if job.formato == "zip":
+                    await self._write_zip(job, tasks, path)
+                else:
+                    await self._write_merged(job, tasks, path, render_merged)
+            finally:
+                for task in tasks:
+                    task.cancel()
+        except asyncio.CancelledError:
+            self._remove(path)
+            raise
+        except Exception as e:
+            logger.error(f"[PdfBatch] Job {job.id} failed: {e}")
+            self._remove(path)
+            await job._emit({**job.summary, "status": "failed", "erro": _error(e)}, status="failed")
+            return
+
+        job.path = path
+        status = "done" if job.failed < len(job.cnpjs) else "failed"
+        await job._emit({**job.summary, "status": status}, status=status)
+        logger.info(
+            f"[PdfBatch] Job {job.id}: {job.done - job.failed}/{len(job.cnpjs)} certificates "
+            f"({job.formato}) in {time.monotonic() - started:.1f}s"
+        )
+
+    async def _write_zip(self, job: PdfBatchJob, tasks: list[asyncio.Task], path: str) -> None:
+        with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as archive:
+            for next_done in asyncio.as_completed(tasks):
+                cnpj, _, pdf, error = await next_done
+                if error is None:
+                    await asyncio.to_thread(archive.writestr, f"certificado_conformidade_{cnpj}.pdf", pdf)
+                await job._item(cnpj, error)
+
+    async def _write_merged(
+        self, job: PdfBatchJob, tasks: list[asyncio.Task], path: str, render_merged: RenderMerged
+    ) -> None:
+        loaded: dict[str, dict] = {}
+        for next_done in asyncio.as_completed(tasks):
+            cnpj, data, _, error = await next_done
+            if error is None:
+                loaded[cnpj] = data
+            await job._item(cnpj, error)
+        if not loaded:
+            return
+
+        await job._emit({"etapa": "gerando_pdf", "certificados": len(loaded)})
+        pdf = await render_merged([(cnpj, loaded[cnpj]) for cnpj in job.cnpjs if cnpj in loaded])
+
+        def write():
+            with open(path, "wb") as f:
+                f.write(pdf)
+
+        await asyncio.to_thread(write)
+
+
+pdf_batch_jobs = PdfBatchJobs()
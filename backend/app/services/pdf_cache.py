@@ -0,0 +1,145 @@
+"""IAudit - Rendered PDF cache.
+
+PDFs are cached by a key derived from what they were rendered from (e.g.
+cnpj + fingerprint of the query data): a small in-memory LRU in front of a
+size-bounded disk directory, where the least recently used files are evicted
+first. Entries older than ``pdf_cache_ttl_hours`` are rendered again.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), "data")
+PDF_CACHE_DIR = os.path.join(DATA_DIR, "pdf_cache")
+
+
+def fingerprint(data: dict) -> str:
+    """Stable hash of a JSON-like payload."""
+    raw = json.dumps(data, sort_keys=True, ensure_ascii=False, default=str).encode("utf-8")
+    return hashlib.sha256(raw).hexdigest()[:32]
+
+
+class PdfCache:
+    def __init__(
+        self,
+        directory: str = PDF_CACHE_DIR,
+        memory_items: int = settings.pdf_cache_memory_items,
+        disk_bytes: int = settings.pdf_cache_disk_mb * 1024 * 1024,
+        ttl_seconds: float = settings.pdf_cache_ttl_hours * 3600,
+    ):
+        self._dir = directory
+        self.memory_items = memory_items
+        self.disk_bytes = disk_bytes
+        self.ttl_seconds = ttl_seconds
+        self._memory: OrderedDict[str, tuple[float, bytes]] = OrderedDict()
+        self._lock = threading.Lock()
+        self._disk_used: int | None = None  # computed on first write
+        self._stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "disk_evictions": 0}
+
+    @property
+    def stats(self) -> dict:
+        return {**self._stats, "memory_items": len(self._memory), "disk_bytes": self._disk_used}
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self._dir, f"{key}.pdf")
+
+    def get(self, key: str) -> bytes | None:
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None and now - entry[0] < self.ttl_seconds:
+                self._memory.move_to_end(key)
+                self._stats["memory_hits"] += 1
+                return entry[1]
+            self._memory.pop(key, None)
+
+        path = self._path(key)
+        try:
+            created = os.stat(path).st_mtime
+            if now - created >= self.ttl_seconds:
+                raise FileNotFoundError(path)
+            with open(path, "rb") as f:
+                pdf = f.read()
+            os.utime(path, (now, created))  # atime = last use, for eviction
+        except FileNotFoundError:
+            self._stats["misses"] += 1
+            return None
+        except OSError as e:
+            logger.warning(f"[PdfCache] Failed to read {path}: {e}")
+            self._stats["misses"] += 1
+            return None
+
+        self._stats["disk_hits"] += 1
+        self._remember(key, pdf, created)
+        return pdf
+
+    def put(self, key: str, pdf: bytes) -> None:
+        now = time.time()
+        self._remember(key, pdf, now)
+        try:
+            os.makedirs(self._dir, exist_ok=True)
+            tmp = f"{self._path(key)}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp, "wb") as f:
+                f.write(pdf)
+            with self._lock:
+                try:
+                    replaced = os.stat(self._path(key)).st_size
+                except FileNotFoundError:
+                    replaced = 0
+                os.replace(tmp, self._path(key))
+        except OSError as e:
+            logger.warning(f"[PdfCache] Failed to store {key}: {e}")
+            return
+        with self._lock:
+            if self._disk_used is None:
+                self._disk_used = self._scan()[1]
+            else:
+                self._disk_used += len(pdf) - replaced
+            if self._disk_used > self.disk_bytes:
+                self._evict()
+
+    def _remember(self, key: str, pdf: bytes, created: float) -> None:
+        with self._lock:
+            self._memory[key] = (created, pdf)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_items:
+                self._memory.popitem(last=False)
+
+    def _scan(self) -> tuple[list[tuple[float, int, str]], int]:
+        """(last use, size, path) of every cached file, and their total size."""
+        files = []
+        with os.scandir(self._dir) as entries:
+            for entry in entries:
+                if entry.name.endswith(".pdf"):
+                    st = entry.stat()
+                    files.append((st.st_atime, st.st_size, entry.path))
+        return files, sum(size for _, size, _ in files)
+
+    def _evict(self) -> None:
+        """Drop least recently used files until the directory is 90% of its budget."""
+        files, used = self._scan()
+        target = self.disk_bytes * 0.9
+        for _, size, path in sorted(files):
+            if used <= target:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            used -= size
+            self._stats["disk_evictions"] += 1
+        self._disk_used = used
+
+
+pdf_cache = PdfCache()
@@ -0,0 +1,199 @@
+"""IAudit - Outbound rate limiting for notification providers.
+
+Each provider backend (Resend, SMTP, Twilio) gets a ProviderLimiter:
+  - TokenBucket: smooths sends to the provider's per-second rate, so a burst
+    is spread out instead of being rejected and burning retries
+  - DailyQuota: counts sends per UTC day; the last ``reserve_ratio`` of the
+    quota is kept for transactional events (pago, emitido, ...), so
+    reminders wait for the next day while payments still go out
+
+Usage is kept in memory and re-seeded from the communication log at startup.
+
+AdaptiveRateLimiter paces calls to upstreams with no published limit
+(Bradesco status queries) with AIMD: it speeds up while calls succeed and
+halves the rate when the upstream answers 429/5xx.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any
+
+# Events that must not wait behind reminders when a quota runs low
+TRANSACTIONAL_EVENTS = frozenset({"pago", "emitido", "reativado", "alerta"})
+
+
+def is_transactional(event: str, payload: dict[str, Any] | None = None) -> bool:
+    """Transactional event, or a digest containing one."""
+    if event == "digest" and payload:
+        return any(item.get("event") in TRANSACTIONAL_EVENTS for item in payload.get("itens", []))
+    return event in TRANSACTIONAL_EVENTS
+
+
+class TokenBucket:
+    """Token bucket refilled at ``rate`` tokens/s, holding up to ``capacity``.
+
+    ``acquire`` reserves tokens immediately (the balance may go negative) and
+    sleeps off the debt, so concurrent callers are served in order without a
+    lock and batches larger than the capacity still work.
+    """
+
+    def __init__(self, rate: float, capacity: float | None = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self._tokens = self.capacity
+        self._last = time.monotonic()
+
+    def reserve(self, tokens: float = 1) -> float:
+        """Take ``tokens`` now; returns how long the caller must wait."""
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+        self._last = now
+        self._tokens -= tokens
+        return -self._tokens / self.rate if self._tokens < 0 else 0.0
+
+    async def acquire(self, tokens: float = 1) -> None:
+        wait = self.reserve(tokens)
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+
+def _utc_today():
+    return datetime.now(timezone.utc).date()
+
+
+class DailyQuota:
+    """Sends per UTC day; ``limit <= 0`` means unlimited."""
+
+    def __init__(self, limit: int, reserve_ratio: float = 0.1):
+        self.limit = limit
+        self.reserve_ratio = reserve_ratio
+        self.used = 0
+        self._day = _utc_today()
+
+    def _roll(self) -> None:
+        today = _utc_today()
+        if today != self._day:
+            self._day, self.used = today, 0
+
+    def try_consume(self, count: int = 1, transactional: bool = False) -> bool:
+        """Count ``count`` sends if the quota allows them for this priority."""
+        if self.limit <= 0:
+            return True
+        self._roll()
+        ceiling = self.limit if transactional else int(self.limit * (1 - self.reserve_ratio))
+        if self.used + count > ceiling:
+            return False
+        self.used += count
+        return True
+
+    def refund(self, count: int = 1) -> None:
+        """Give back sends that were counted but not delivered."""
+        self._roll()
+        self.used = max(0, self.used - count)
+
+    def seconds_until_reset(self) -> float:
+        now = datetime.now(timezone.utc)
+        midnight = datetime.combine(now.date() + timedelta(days=1), datetime.min.time(), timezone.utc)
+        return (midnight - now).total_seconds()
+
+    @property
+    def stats(self) -> dict:
+        self._roll()
+        return {"limit": self.limit, "used": self.used, "reserve_ratio": self.reserve_ratio}
+
+
+class ProviderLimiter:
+    """Rate + daily quota for one provider backend."""
+
+    def __init__(self, name: str, rate_per_second: float, daily_limit: int, reserve_ratio: float = 0.1):
+        self.name = name
+        self.bucket = TokenBucket(rate_per_second) if rate_per_second > 0 else None
+        self.quota = DailyQuota(daily_limit, reserve_ratio)
+        self._stats = {"admitted": 0, "deferred": 0, "refunded": 0, "throttled_seconds": 0.0}
+
+    def admit(self, count: int = 1, transactional: bool = False) -> bool:
+        """Reserve daily quota for ``count`` sends; False means defer."""
+        if self.quota.try_consume(count, transactional):
+            self._stats["admitted"] += count
+            return True
+        self._stats["deferred"] += count
+        return False
+
+    def refund(self, count: int = 1) -> None:
+        """Return quota reserved by ``admit`` for sends that failed."""
+        if count > 0:
+            self.quota.refund(count)
+            self._stats["refunded"] += count
+
+    async def throttle(self, count: int = 1) -> None:
+        """Wait for the provider's per-second rate."""
+        if self.bucket is None:
+            return
+        wait = self.bucket.reserve(count)
+        if wait > 0:
+            self._stats["throttled_seconds"] += wait
+            await asyncio.sleep(wait)
+
+    @property
+    def stats(self) -> dict:
+        return {
+            **self._stats,
+            "throttled_seconds": round(self._stats["throttled_seconds"], 3),
+            "rate_per_second": self.bucket.rate if self.bucket else None,
+            "daily": self.quota.stats,
+        }
+
+
+class AdaptiveRateLimiter:
+    """AIMD rate limit for an upstream API without a published rate.
+
+    Starts at ``rate`` requests/s, adds ``increase`` per successful call up to
+    ``max_rate`` and multiplies by ``decrease`` (at most once per
+    ``cooldown`` seconds) when the upstream signals overload.
+    """
+
+    def __init__(
+        self,
+        rate: float,
+        max_rate: float,
+        min_rate: float = 0.5,
+        increase: float = 0.1,
+        decrease: float = 0.5,
+        cooldown: float = 1.0,
+    ):
+        self.max_rate = max_rate
+        self.min_rate = min_rate
+        self.increase = increase
+        self.decrease = decrease
+        self.cooldown = cooldown
+        self.bucket = TokenBucket(rate, capacity=1)
+        self._last_decrease = 0.0
+        self._stats = {"successes": 0, "throttled": 0, "decreases": 0}
+
+    @property
+    def rate(self) -> float:
+        return self.bucket.rate
+
+    async def acquire(self) -> None:
+        await self.bucket.acquire()
+
+    def on_success(self) -> None:
+        self._stats["successes"] += 1
+        self.bucket.rate = min(self.max_rate, self.bucket.rate + self.increase)
+
+    def on_throttle(self) -> None:
+        """Upstream overload (429 / 5xx / timeout): back off multiplicatively."""
+        self._stats["throttled"] += 1
+        now = time.monotonic()
+        if now - self._last_decrease < self.cooldown:
+            return  # in-flight calls failing together count as one signal
+        self._last_decrease = now
+        self._stats["decreases"] += 1
+        self.bucket.rate = max(self.min_rate, self.bucket.rate * self.decrease)
+
+    @property
+    def stats(self) -> dict:
+        return {**self._stats, "rate_per_second": round(self.bucket.rate, 2), "max_rate_per_second": self.max_rate}
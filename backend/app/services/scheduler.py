@@ -17,20 +17,29 @@ from app.database import (
 )
 from app.services.infosimples import infosimples_client
 from app.services.drive import drive_service
-from app.services.notifications import send_alert_email
+from app.services.notifications import send_alert_email, send_alert_emails
 from app.services.settings import dynamic_settings
 
 logger = logging.getLogger(__name__)
 
 
-async def process_single_consulta(consulta: dict) -> None:
+async def _alert(alerts: list | None, empresa: dict, consulta: dict) -> None:
+    """Collect the alert for the run's batch, or send it now."""
+    if alerts is not None:
+        alerts.append((empresa, consulta))
+    else:
+        await send_alert_email(empresa, consulta)
+
+
+async def process_single_consulta(consulta: dict, alerts: list | None = None) -> None:
     """
     Process a single consultation:
     1. Mark as 'processando'
     2. Call InfoSimples API
     3. Upload PDF to Drive
     4. Update result in Supabase
-    5. Send alert if negative/irregular
+    5. Send alert if negative/irregular (added to ``alerts`` when given,
+       so the caller sends a run's alerts together)
     """
     consulta_id = consulta["id"]
     tipo = consulta["tipo"]
@@ -95,7 +104,7 @@ async def process_single_consulta(consulta: dict) -> None:
         if situacao in ("negativa", "irregular"):
             create_log(consulta_id, "aviso", f"ALERTA: situação {situacao}")
             try:
-                await send_alert_email(empresa, {**consulta, **update_data})
+                await _alert(alerts, empresa, {**consulta, **update_data})
             except Exception as e:
                 logger.error(f"Alert email failed: {e}")
                 create_log(consulta_id, "erro", f"Envio de email de alerta falhou: {e}")
@@ -116,7 +125,7 @@ async def process_single_consulta(consulta: dict) -> None:
 
             # Send alert for persistent errors
             try:
-                await send_alert_email(empresa, {
+                await _alert(alerts, empresa, {
                     **consulta,
                     "situacao": "erro",
                     "tipo": tipo,
@@ -154,8 +163,19 @@ async def process_pending_queries():
 
         all_queries = pending + retryable
 
-        for consulta in all_queries:
-            await process_single_consulta(consulta)
+        # Alerts are sent once the run is over: one digest per client, not
+        # one email per filial
+        alerts: list[tuple[dict, dict]] = []
+        try:
+            for consulta in all_queries:
+                await process_single_consulta(consulta, alerts)
+        finally:
+            if alerts:
+                try:
+                    messages = await send_alert_emails(alerts)
+                    logger.info(f"Queued {len(alerts)} alerts in {messages} messages")
+                except Exception as e:
+                    logger.error(f"Alert emails failed: {e}")
 
     except Exception as e:
         logger.error(f"process_pending_queries failed: {e}")
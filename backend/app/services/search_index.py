@@ -0,0 +1,87 @@
+"""IAudit - In-memory n-gram search index (DEMO / local backend).
+
+Mirrors what pg_trgm gives the Supabase backend: substring search on
+razao_social and CNPJ without scanning every row. Each document is split
+into character trigrams; a query intersects the posting lists of its own
+trigrams and only the surviving candidates are verified.
+"""
+
+from __future__ import annotations
+
+import re
+import unicodedata
+
+_CNPJ_QUERY = re.compile(r"[\d./\-\s]+")
+
+
+def normalize_text(value) -> str:
+    """Lowercase and strip accents: 'Açúcar São' -> 'acucar sao'."""
+    text = unicodedata.normalize("NFKD", str(value or ""))
+    return "".join(ch for ch in text if not unicodedata.combining(ch)).lower().strip()
+
+
+def is_cnpj_query(query: str) -> bool:
+    """True when the query looks like a (partial) CNPJ rather than a name."""
+    return bool(query) and any(ch.isdigit() for ch in query) and bool(_CNPJ_QUERY.fullmatch(query))
+
+
+class NgramIndex:
+    """Trigram index over (razao_social, cnpj) keyed by document id."""
+
+    def __init__(self, n: int = 3):
+        self.n = n
+        self._postings: dict[str, set[str]] = {}
+        self._docs: dict[str, tuple[str, str]] = {}
+
+    def __len__(self) -> int:
+        return len(self._docs)
+
+    def _grams(self, text: str) -> set[str]:
+        if len(text) < self.n:
+            return set()
+        return {text[i:i + self.n] for i in range(len(text) - self.n + 1)}
+
+    def add(self, doc_id: str, razao_social: str, cnpj: str) -> None:
+        """Index (or re-index) a document."""
+        if doc_id in self._docs:
+            self.remove(doc_id)
+        name = normalize_text(razao_social)
+        digits = "".join(filter(str.isdigit, str(cnpj or "")))
+        self._docs[doc_id] = (name, digits)
+        for gram in self._grams(name) | self._grams(digits):
+            self._postings.setdefault(gram, set()).add(doc_id)
+
+    def remove(self, doc_id: str) -> None:
+        """Drop a document from the index."""
+        doc = self._docs.pop(doc_id, None)
+        if doc is None:
+            return
+        for gram in self._grams(doc[0]) | self._grams(doc[1]):
+            posting = self._postings.get(gram)
+            if posting is not None:
+                posting.discard(doc_id)
+                if not posting:
+                    del self._postings[gram]
+
+    def clear(self) -> None:
+        self._postings.clear()
+        self._docs.clear()
+
+    def search(self, query: str) -> set[str]:
+        """Return ids whose razao_social (or CNPJ digits) contain the query."""
+        if is_cnpj_query(query):
+            needle, field = "".join(filter(str.isdigit, query)), 1
+        else:
+            needle, field = normalize_text(query), 0
+        if not needle:
+            return set(self._docs)
+
+        grams = self._grams(needle)
+        if not grams:
+            # Query shorter than n: nothing to intersect, verify every doc
+            candidates = self._docs.keys()
+        else:
+            postings = sorted((self._postings.get(g, set()) for g in grams), key=len)
+            candidates = set.intersection(*postings) if postings[0] else set()
+
+        return {doc_id for doc_id in candidates if needle in self._docs[doc_id][field]}
@@ -1,6 +1,28 @@
+"""IAudit - Dynamic settings with an in-memory cache and change notifications.
+
+Settings live in ``settings.json`` (local/DEMO) or in the ``app_settings``
+table (Supabase, shared by every replica). Reads are served from memory and
+never block on I/O (they run on the event loop, e.g. in ``notify``):
+  - ``refresh`` loads the sources at startup; until then the local file is used
+  - ``watch`` re-reads them in the background every
+    ``settings_watch_interval_seconds`` (the file only when its mtime changes)
+  - ``update_settings`` / ``aupdate_settings`` refresh the cache immediately
+
+Subscribers registered with ``subscribe`` are called with the changed keys
+whenever a refresh detects a difference, so long-running components
+(scheduler, notification queue) react without polling the file themselves.
+"""
+
+import asyncio
 import json
+import logging
 import os
-from typing import Dict, Any
+import threading
+from typing import Dict, Any, Callable
+
+from app.config import settings as app_settings
+
+logger = logging.getLogger(__name__)
 
 SETTINGS_FILE = "backend/data/settings.json"
 
@@ -16,35 +38,170 @@ DEFAULT_SETTINGS = {
     "template_wa_alerta": "🚨 IAudit Alerta: Empresa {empresa} possui pendência {tipo}. Situação: {situacao}.",
 }
 
+SettingsCallback = Callable[[Dict[str, Any], Dict[str, Any]], None]
+
+
 class DynamicSettingsService:
-    def __init__(self):
-        os.makedirs(os.path.dirname(SETTINGS_FILE), exist_ok=True)
-        if not os.path.exists(SETTINGS_FILE):
+    def __init__(self, path: str = SETTINGS_FILE):
+        self._path = path
+        self._lock = threading.Lock()
+        self._cache: Dict[str, Any] | None = None
+        self._file_mtime: float | None = None
+        self._db_version: str | None = None
+        self._subscribers: list[SettingsCallback] = []
+
+        os.makedirs(os.path.dirname(self._path), exist_ok=True)
+        if not os.path.exists(self._path):
             self._write_settings(DEFAULT_SETTINGS)
 
+    # ── Sources ──────────────────────────────────────────────────────
+
     def _read_settings(self) -> Dict[str, Any]:
         try:
-            with open(SETTINGS_FILE, "r", encoding="utf-8") as f:
+            with open(self._path, "r", encoding="utf-8") as f:
                 data = json.load(f)
                 # Merge with defaults for missing keys
                 return {**DEFAULT_SETTINGS, **data}
         except Exception:
-            return DEFAULT_SETTINGS
+            return dict(DEFAULT_SETTINGS)
 
     def _write_settings(self, settings: Dict[str, Any]):
-        with open(SETTINGS_FILE, "w", encoding="utf-8") as f:
+        with open(self._path, "w", encoding="utf-8") as f:
             json.dump(settings, f, indent=2)
 
+    def _file_mtime_now(self) -> float | None:
+        try:
+            return os.stat(self._path).st_mtime
+        except OSError:
+            return None
+
+    def _read_db(self) -> Dict[str, Any] | None:
+        """Fetch the shared settings row. None when running without a DB."""
+        from app.database import get_app_settings
+
+        try:
+            row = get_app_settings()
+        except Exception as e:
+            logger.warning(f"Could not read app_settings from DB: {e}")
+            return None
+        if row is None:
+            return None
+        self._db_version = str(row.get("updated_at"))
+        return {**DEFAULT_SETTINGS, **(row.get("data") or {})}
+
+    # ── Cache ────────────────────────────────────────────────────────
+
+    def _reload(self) -> Dict[str, Any]:
+        """
+        Re-read the sources (blocking: DB query / file read) and refresh the
+        cache. Returns the changed keys (empty dict when nothing changed).
+        Never calls subscribers.
+        """
+        with self._lock:
+            fresh = self._read_db()
+
+            if fresh is None and self._db_version is None:
+                mtime = self._file_mtime_now()
+                if self._cache is None or mtime != self._file_mtime:
+                    self._file_mtime = mtime
+                    fresh = self._read_settings()
+
+            if fresh is None:
+                return {}
+
+            previous = self._cache or {}
+            self._cache = fresh
+            if not previous:
+                return {}
+            return {k: v for k, v in fresh.items() if previous.get(k) != v}
+
+    def _notify(self, changed: Dict[str, Any]) -> None:
+        if not changed:
+            return
+        logger.info(f"Dynamic settings changed: {sorted(changed)}")
+        current = dict(self._cache or DEFAULT_SETTINGS)
+        for callback in list(self._subscribers):
+            try:
+                callback(changed, current)
+            except Exception as e:
+                logger.error(f"Settings subscriber {callback!r} failed: {e}")
+
+    def _current(self) -> Dict[str, Any]:
+        if self._cache is None:
+            # Not refreshed yet (import time, scripts): the local file only
+            with self._lock:
+                if self._cache is None:
+                    self._file_mtime = self._file_mtime_now()
+                    self._cache = self._read_settings()
+        return self._cache
+
+    # ── Public API ───────────────────────────────────────────────────
+
     def get_settings(self) -> Dict[str, Any]:
-        return self._read_settings()
+        return dict(self._current())
+
+    def get(self, key: str, default: Any = None) -> Any:
+        return self._current().get(key, default)
+
+    def refresh(self) -> Dict[str, Any]:
+        """Load the sources now (blocking) and notify subscribers; returns the changed keys."""
+        changed = self._reload()
+        self._notify(changed)
+        return changed
 
     def update_settings(self, new_settings: Dict[str, Any]) -> Dict[str, Any]:
-        current = self._read_settings()
-        updated = {**current, **new_settings}
-        self._write_settings(updated)
-        return updated
+        updated, changed = self._update(new_settings)
+        self._notify(changed)
+        return dict(updated)
+
+    async def aupdate_settings(self, new_settings: Dict[str, Any]) -> Dict[str, Any]:
+        """``update_settings`` with the DB/file writes off the event loop
+        (subscribers still run on it)."""
+        updated, changed = await asyncio.to_thread(self._update, new_settings)
+        self._notify(changed)
+        return dict(updated)
+
+    def _update(self, new_settings: Dict[str, Any]) -> tuple[Dict[str, Any], Dict[str, Any]]:
+        from app.database import save_app_settings
+
+        self._reload()
+        with self._lock:
+            current = self._cache or self._read_settings()
+            updated = {**current, **new_settings}
+            self._write_settings(updated)
+            self._file_mtime = self._file_mtime_now()
+            try:
+                save_app_settings(updated)
+            except Exception as e:
+                logger.error(f"Could not save app_settings to DB: {e}")
+            changed = {k: v for k, v in updated.items() if current.get(k) != v}
+            self._cache = updated
+        return updated, changed
 
     def is_robo_ativo(self) -> bool:
-        return self._read_settings().get("robo_ativo", True)
+        return self._current().get("robo_ativo", True)
+
+    def subscribe(self, callback: SettingsCallback) -> None:
+        """Register ``callback(changed, current)`` for settings changes."""
+        self._subscribers.append(callback)
+
+    def unsubscribe(self, callback: SettingsCallback) -> None:
+        if callback in self._subscribers:
+            self._subscribers.remove(callback)
+
+    async def watch(self, interval: float | None = None) -> None:
+        """Poll the sources in the background so subscribers fire promptly
+        even when nobody reads the settings (e.g. edits on another replica)."""
+        interval = interval or app_settings.settings_watch_interval_seconds
+        while True:
+            try:
+                changed = await asyncio.to_thread(self._reload)
+                self._notify(changed)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Settings watch error: {e}")
+            await asyncio.sleep(interval)
+
 
 dynamic_settings = DynamicSettingsService()
@@ -0,0 +1,172 @@
+"""IAudit - Pooled SMTP connections.
+
+Keeps authenticated SMTP sessions open between messages instead of doing
+connect + STARTTLS + login for every email. Connections idle for a while
+are checked with NOOP before reuse, dropped after ``idle_timeout`` and
+re-established transparently when the server closes them.
+
+All methods are blocking; callers run them in a thread pool.
+"""
+
+from __future__ import annotations
+
+import logging
+import queue
+import smtplib
+import threading
+import time
+from email.message import Message
+
+logger = logging.getLogger(__name__)
+
+
+class _PooledConnection:
+    def __init__(self, server: smtplib.SMTP):
+        self.server = server
+        self.last_used = time.monotonic()
+
+    def close(self) -> None:
+        try:
+            self.server.quit()
+        except Exception:
+            try:
+                self.server.close()
+            except Exception:
+                pass
+
+
+class SMTPConnectionPool:
+    """Thread-safe pool of logged-in ``smtplib.SMTP`` sessions."""
+
+    def __init__(
+        self,
+        host: str,
+        port: int,
+        user: str,
+        password: str,
+        size: int = 4,
+        noop_interval: float = 30.0,
+        idle_timeout: float = 240.0,
+        timeout: float = 30.0,
+    ):
+        self.host = host
+        self.port = port
+        self.user = user
+        self.password = password
+        self.size = size
+        self.noop_interval = noop_interval
+        self.idle_timeout = idle_timeout
+        self.timeout = timeout
+
+        self._idle: queue.LifoQueue[_PooledConnection] = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+        self._stats = {"connects": 0, "reused": 0, "reconnects": 0, "sent": 0}
+
+    @property
+    def stats(self) -> dict:
+        return {**self._stats, "idle": self._idle.qsize(), "size": self.size}
+
+    # ── Connections ──────────────────────────────────────────────────
+
+    def _connect(self) -> _PooledConnection:
+        server = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        server.ehlo()
+        server.starttls()
+        server.ehlo()
+        server.login(self.user, self.password)
+        self._stats["connects"] += 1
+        return _PooledConnection(server)
+
+    @staticmethod
+    def _is_alive(conn: _PooledConnection) -> bool:
+        try:
+            return conn.server.noop()[0] == 250
+        except Exception:
+            return False
+
+    def _acquire(self) -> _PooledConnection:
+        self._slots.acquire()
+        try:
+            while True:
+                try:
+                    conn = self._idle.get_nowait()
+                except queue.Empty:
+                    return self._connect()
+
+                idle_for = time.monotonic() - conn.last_used
+                if idle_for > self.idle_timeout:
+                    conn.close()
+                    continue
+                if idle_for > self.noop_interval and not self._is_alive(conn):
+                    conn.close()
+                    continue
+                self._stats["reused"] += 1
+                return conn
+        except Exception:
+            self._slots.release()
+            raise
+
+    def _release(self, conn: _PooledConnection | None) -> None:
+        if conn is not None:
+            conn.last_used = time.monotonic()
+            self._idle.put(conn)
+        self._slots.release()
+
+    # ── Sending ──────────────────────────────────────────────────────
+
+    def send_many(self, messages: list[Message]) -> list[Exception | None]:
+        """Send messages over one pooled session. Returns None (sent) or the
+        error per message; a dropped connection is re-opened once per message."""
+        results: list[Exception | None] = []
+        conn = self._acquire()
+        try:
+            for msg in messages:
+                try:
+                    try:
+                        conn.server.send_message(msg)
+                    except (smtplib.SMTPServerDisconnected, ConnectionError, OSError):
+                        conn.close()
+                        conn = None
+                        conn = self._connect()
+                        self._stats["reconnects"] += 1
+                        conn.server.send_message(msg)
+                    self._stats["sent"] += 1
+                    results.append(None)
+                except Exception as e:
+                    results.append(e)
+                    if conn is None:
+                        # Could not reconnect: fail the rest of the batch fast
+                        results.extend(e for _ in messages[len(results):])
+                        break
+        finally:
+            self._release(conn)
+        return results
+
+    def send(self, msg: Message) -> None:
+        error = self.send_many([msg])[0]
+        if error is not None:
+            raise error
+
+    # ── Maintenance ──────────────────────────────────────────────────
+
+    def health_check(self) -> None:
+        """NOOP idle sessions; close the dead and the expired ones."""
+        keep = []
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            if time.monotonic() - conn.last_used > self.idle_timeout or not self._is_alive(conn):
+                conn.close()
+            else:
+                keep.append(conn)
+        for conn in reversed(keep):
+            self._idle.put(conn)
+
+    def close(self) -> None:
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
@@ -0,0 +1,161 @@
+"""IAudit - Streaming spreadsheet reader for empresa imports.
+
+Reads CSV and XLSX uploads in fixed-size row chunks so that memory stays
+flat regardless of file size:
+  - CSV: encoding detected from a small sample, then pandas chunked reader
+  - XLSX: openpyxl read-only mode (rows are streamed from the zip)
+  - XLS: legacy format, loaded by pandas (no streaming reader available)
+"""
+
+from __future__ import annotations
+
+import codecs
+import io
+import logging
+from typing import BinaryIO, Iterator
+
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+SAMPLE_SIZE = 64 * 1024
+CANDIDATE_ENCODINGS = ("utf-8", "cp1252", "latin-1")
+
+
+def normalize_column(name) -> str:
+    """Normalize a header cell: 'Razao Social ' -> 'razao_social'."""
+    return str(name or "").strip().lower().replace(" ", "_")
+
+
+def detect_encoding(sample: bytes) -> str:
+    """
+    Detect the text encoding of a CSV from its first bytes.
+
+    The sample may end in the middle of a multi-byte character, so an
+    incremental decoder is used without flushing the final state.
+    """
+    if sample.startswith(codecs.BOM_UTF8):
+        return "utf-8-sig"
+
+    for encoding in CANDIDATE_ENCODINGS:
+        decoder = codecs.getincrementaldecoder(encoding)()
+        try:
+            decoder.decode(sample, final=False)
+            return encoding
+        except UnicodeDecodeError:
+            continue
+    return "latin-1"
+
+
+def _cell_to_str(value) -> str:
+    """Convert a spreadsheet cell to the string form used by the importer."""
+    if value is None:
+        return ""
+    # Excel stores numeric CNPJs/phones as floats (11222333000181.0)
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return str(value).strip()
+
+
+def _text_stream(fileobj: BinaryIO, encoding: str) -> io.TextIOWrapper:
+    fileobj.seek(0)
+    return io.TextIOWrapper(fileobj, encoding=encoding, errors="replace", newline="")
+
+
+def _iter_csv(fileobj: BinaryIO, chunk_size: int) -> tuple[list[str], Iterator[list[dict]]]:
+    encoding = detect_encoding(fileobj.read(SAMPLE_SIZE))
+    logger.info(f"Upload CSV encoding detected: {encoding}")
+
+    header_stream = _text_stream(fileobj, encoding)
+    try:
+        columns = [normalize_column(c) for c in pd.read_csv(header_stream, nrows=0).columns]
+    finally:
+        # Detach so the wrapper does not close the underlying upload file
+        header_stream.detach()
+
+    def chunks() -> Iterator[list[dict]]:
+        stream = _text_stream(fileobj, encoding)
+        try:
+            reader = pd.read_csv(
+                stream,
+                chunksize=chunk_size,
+                dtype=str,
+                keep_default_na=False,
+            )
+            for df in reader:
+                df.columns = columns
+                yield df.to_dict("records")
+        finally:
+            stream.detach()
+
+    return columns, chunks()
+
+
+def _iter_xlsx(fileobj: BinaryIO, chunk_size: int) -> tuple[list[str], Iterator[list[dict]]]:
+    from openpyxl import load_workbook
+
+    fileobj.seek(0)
+    workbook = load_workbook(fileobj, read_only=True, data_only=True)
+    rows = workbook.active.iter_rows(values_only=True)
+
+    header = next(rows, None)
+    if header is None:
+        workbook.close()
+        return [], iter(())
+    columns = [normalize_column(c) for c in header]
+
+    def chunks() -> Iterator[list[dict]]:
+        try:
+            batch: list[dict] = []
+            for values in rows:
+                if not values or all(v is None for v in values):
+                    continue
+                batch.append({
+                    col: _cell_to_str(val) for col, val in zip(columns, values)
+                })
+                if len(batch) >= chunk_size:
+                    yield batch
+                    batch = []
+            if batch:
+                yield batch
+        finally:
+            workbook.close()
+
+    return columns, chunks()
+
+
+def _iter_xls(fileobj: BinaryIO, chunk_size: int) -> tuple[list[str], Iterator[list[dict]]]:
+    fileobj.seek(0)
+    df = pd.read_excel(fileobj, dtype=str, keep_default_na=False)
+    df.columns = [normalize_column(c) for c in df.columns]
+    columns = list(df.columns)
+
+    def chunks() -> Iterator[list[dict]]:
+        for start in range(0, len(df), chunk_size):
+            yield df.iloc[start:start + chunk_size].to_dict("records")
+
+    return columns, chunks()
+
+
+def iter_spreadsheet_chunks(
+    fileobj: BinaryIO,
+    filename: str,
+    chunk_size: int = 1000,
+) -> tuple[list[str], Iterator[list[dict]]]:
+    """
+    Open an uploaded spreadsheet for chunked reading.
+
+    Args:
+        fileobj: Seekable binary file (e.g. ``UploadFile.file``).
+        filename: Original filename, used to pick the reader.
+        chunk_size: Maximum number of rows per yielded chunk.
+
+    Returns:
+        Tuple of (normalized column names, iterator of row-dict chunks).
+    """
+    name = (filename or "").lower()
+    if name.endswith(".xlsx"):
+        return _iter_xlsx(fileobj, chunk_size)
+    if name.endswith(".xls"):
+        return _iter_xls(fileobj, chunk_size)
+    return _iter_csv(fileobj, chunk_size)
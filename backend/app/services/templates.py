@@ -0,0 +1,469 @@
+"""IAudit - Precompiled notification templates.
+
+Email and WhatsApp templates are compiled once per event into a single
+generated f-string function: the static parts (layout, colors, titles,
+footer) are baked in as constants and the placeholders read the boleto
+payload directly, so a render is one string build instead of formatting
+the body and then the layout for every message.
+
+The editable ``template_wa_*`` entries from the dynamic settings override
+the built-in WhatsApp text when they are customized; they are recompiled
+when the settings change.
+"""
+
+from __future__ import annotations
+
+import logging
+import string
+from typing import Any
+
+from app.services.settings import DEFAULT_SETTINGS, dynamic_settings
+
+logger = logging.getLogger(__name__)
+
+
+# ─── Currency ────────────────────────────────────────────────────────
+
+def format_brl(value: int | float | str) -> str:
+    """Format cents (int) or reais (float/str) as 'R$ 1.234,56'."""
+    try:
+        val_float = value / 100 if isinstance(value, int) else float(value)
+        # "_" grouping avoids the placeholder swap: two replaces instead of three
+        return f"R$ {val_float:_.2f}".replace(".", ",").replace("_", ".")
+    except (ValueError, TypeError):
+        return "R$ 0,00"
+
+
+# ─── Payload fields ──────────────────────────────────────────────────
+
+def _pix_block(qr_pix: str) -> str:
+    return _PIX_BLOCK.render({"qr_pix": qr_pix}) if qr_pix else ""
+
+
+def _pix_line(qr_pix: str) -> str:
+    return f"\n💳 *Pix Copia e Cola:*\n{qr_pix}" if qr_pix else ""
+
+
+_HELPERS = {"_brl": format_brl, "_pix_block": _pix_block, "_pix_line": _pix_line}
+
+# Placeholder -> expression over the boleto payload (``_get`` = payload.get)
+EMAIL_FIELDS = {
+    "nome": "_get('nomeSacado', 'Cliente')",
+    "valor": "_brl(_get('valorNominal', 0))",
+    "vencimento": "_get('dataVencimento', '')",
+    "linha": "_get('linhaDigitavel', '')",
+    "pix_block": "_pix_block(_get('qrCodePix', ''))",
+    "link_pdf": "_get('linkPdfBoleto', _get('linkBoleto', '#'))",
+}
+
+WHATSAPP_FIELDS = {
+    **EMAIL_FIELDS,
+    "link_pdf": "_get('linkPdfBoleto', _get('linkBoleto', ''))",
+    "pix_line": "_pix_line(_get('qrCodePix', ''))",
+    "empresa": "_get('empresa', '')",
+    "tipo": "_get('tipo', '')",
+    "situacao": "_get('situacao', '')",
+}
+
+# The template_wa_* texts write the currency symbol themselves ("R$ {valor}")
+CUSTOM_WHATSAPP_FIELDS = {**WHATSAPP_FIELDS, "valor": "_brl(_get('valorNominal', 0))[3:]"}
+
+
+# ─── Compiled templates ──────────────────────────────────────────────
+
+def _escape(text: str) -> str:
+    """Protect literal braces of static text from the template parser."""
+    return text.replace("{", "{{").replace("}", "}}")
+
+
+class CompiledTemplate:
+    """``str.format``-style template compiled once into an f-string function.
+
+    ``fields`` maps each placeholder to a Python expression over ``_get``
+    (the payload's ``dict.get``) and the helpers in ``_HELPERS``; without it
+    placeholders are read from the payload by name. Literal chunks go into the
+    generated code as string constants (repr) and placeholder names / format
+    specs as globals, so custom templates cannot inject code. Placeholders
+    without a resolver render as empty text.
+    Raises ValueError for malformed templates (unbalanced braces).
+    """
+
+    __slots__ = ("source", "_render")
+
+    _parser = string.Formatter()
+
+    def __init__(self, source: str, fields: dict[str, str] | None = None):
+        self.source = source
+        namespace: dict[str, Any] = {"__builtins__": {}, **_HELPERS}
+        chunks = []
+        for i, (literal, field, spec, _) in enumerate(self._parser.parse(source)):
+            if literal:
+                chunks.append(repr(literal))
+            if field is None:
+                continue
+            if fields is None:
+                namespace[f"_f{i}"] = field
+                expr = f"_get(_f{i}, '')"
+            else:
+                expr = fields.get(field, "''")
+            if spec:
+                namespace[f"_s{i}"] = spec
+                chunks.append(f'f"{{{expr}:{{_s{i}}}}}"')
+            else:
+                chunks.append(f'f"{{{expr}}}"')
+        self._render = eval(f"lambda _get: ({' '.join(chunks) or repr('')})", namespace)
+
+    def render(self, data: dict[str, Any]) -> str:
+        return self._render(data.get)
+
+
+# ─── Email templates ─────────────────────────────────────────────────
+
+EMAIL_COLORS = {
+    "emitido": "#3b82f6",
+    "pago": "#22c55e",
+    "atraso": "#ef4444",
+    "vencimento_d1": "#f59e0b",
+    "reativado": "#8b5cf6",
+}
+
+EMAIL_TITLES = {
+    "emitido": "Novo Boleto Disponível",
+    "pago": "Pagamento Confirmado",
+    "atraso": "Aviso de Atraso",
+    "vencimento_d1": "Lembrete de Vencimento",
+    "reativado": "Boleto Reativado",
+}
+
+EMAIL_SUBJECTS = {
+    "emitido": "Nova Fatura IAudit — Boleto Disponível",
+    "pago": "Confirmação de Pagamento — IAudit",
+    "atraso": "ALERTA: Fatura em Atraso — IAudit",
+    "vencimento_d1": "Lembrete: Vencimento Amanhã — IAudit",
+    "reativado": "Fatura Reativada — IAudit",
+}
+
+# Placeholders: {nome} {valor} {vencimento} {linha} {pix_block} {link_pdf}; @@COLOR@@ is baked in
+_EMAIL_BODIES = {
+    "emitido": """
+            <p>Olá <b>{nome}</b>,</p>
+            <p>Sua fatura IAudit referente aos serviços de monitoramento fiscal está disponível.</p>
+            <div style="background: #f8fafc; padding: 15px; border-radius: 8px; margin: 20px 0;">
+                <p style="margin: 5px 0;"><b>Valor:</b> {valor}</p>
+                <p style="margin: 5px 0;"><b>Vencimento:</b> {vencimento}</p>
+            </div>
+            <p>Linha digitável:</p>
+            <div style="background: #e2e8f0; padding: 10px; font-family: monospace; text-align: center; border-radius: 4px;">
+                {linha}
+            </div>
+            {pix_block}
+            <p style="text-align: center; margin-top: 25px;">
+                <a href="{link_pdf}" style="background-color: @@COLOR@@; color: white; padding: 12px 24px; text-decoration: none; border-radius: 6px; font-weight: bold;">
+                    Baixar Boleto PDF
+                </a>
+            </p>
+        """,
+    "pago": """
+            <p>Olá <b>{nome}</b>,</p>
+            <p>Confirmamos o recebimento do pagamento do seu boleto.</p>
+            <div style="background: #dcfce7; padding: 15px; border-radius: 8px; margin: 20px 0; color: #166534;">
+                <p style="margin: 5px 0;"><b>Valor Pago:</b> {valor}</p>
+                <p style="margin: 5px 0;"><b>Obrigado por manter sua conta em dia!</b></p>
+            </div>
+        """,
+    "atraso": """
+            <p>Olá <b>{nome}</b>,</p>
+            <p>Não identificamos o pagamento do boleto com vencimento em <b>{vencimento}</b>.</p>
+            <div style="background: #fee2e2; padding: 15px; border-radius: 8px; margin: 20px 0; color: #991b1b;">
+                <p style="margin: 5px 0;"><b>Valor:</b> {valor}</p>
+                <p style="margin: 5px 0;">Após o vencimento incidem juros de 0,033%/dia e multa de 2%. Regularize para evitar suspensão dos serviços.</p>
+            </div>
+            <p style="text-align: center; margin-top: 25px;">
+                <a href="{link_pdf}" style="background-color: @@COLOR@@; color: white; padding: 12px 24px; text-decoration: none; border-radius: 6px; font-weight: bold;">
+                    Visualizar Boleto
+                </a>
+            </p>
+        """,
+    "vencimento_d1": """
+            <p>Olá <b>{nome}</b>,</p>
+            <p>Lembrete: seu boleto vence <b>amanhã ({vencimento})</b>.</p>
+            <div style="background: #fef3c7; padding: 15px; border-radius: 8px; margin: 20px 0; color: #92400e;">
+                <p style="margin: 5px 0;"><b>Valor:</b> {valor}</p>
+                <p style="margin: 5px 0;">Evite juros e multa pagando dentro do prazo.</p>
+            </div>
+            <p>Linha digitável:</p>
+            <div style="background: #e2e8f0; padding: 10px; font-family: monospace; text-align: center; border-radius: 4px;">
+                {linha}
+            </div>
+        """,
+    "reativado": """
+            <p>Olá <b>{nome}</b>,</p>
+            <p>O boleto abaixo foi <b>reativado</b> e está disponível para pagamento.</p>
+            <div style="background: #ede9fe; padding: 15px; border-radius: 8px; margin: 20px 0; color: #5b21b6;">
+                <p style="margin: 5px 0;"><b>Valor:</b> {valor}</p>
+                <p style="margin: 5px 0;"><b>Vencimento:</b> {vencimento}</p>
+            </div>
+            <p style="text-align: center; margin-top: 25px;">
+                <a href="{link_pdf}" style="background-color: @@COLOR@@; color: white; padding: 12px 24px; text-decoration: none; border-radius: 6px; font-weight: bold;">
+                    Visualizar Boleto
+                </a>
+            </p>
+        """,
+}
+
+_PIX_BLOCK = CompiledTemplate("""
+            <p style="margin-top: 15px;"><b>Pix Copia e Cola:</b></p>
+            <div style="background: #e2e8f0; padding: 10px; font-family: monospace; font-size: 0.8rem; word-break: break-all; border-radius: 4px;">
+                {qr_pix}
+            </div>
+            """)
+
+_EMAIL_LAYOUT = """
+    <html>
+    <body style="font-family: 'Segoe UI', Arial, sans-serif; background-color: #f1f5f9; margin: 0; padding: 40px 0;">
+        <div style="max-width: 600px; margin: 0 auto; background: white; border-radius: 12px; box-shadow: 0 4px 6px -1px rgba(0,0,0,0.1); overflow: hidden;">
+            <div style="background-color: @@COLOR@@; padding: 20px; text-align: center;">
+                <h2 style="color: white; margin: 0; font-size: 24px;">@@TITLE@@</h2>
+            </div>
+            <div style="padding: 30px; color: #334155; line-height: 1.6;">
+                @@BODY@@
+                <hr style="border: 0; border-top: 1px solid #e2e8f0; margin: 30px 0;">
+                <p style="font-size: 12px; color: #94a3b8; text-align: center;">
+                    IAudit — Automação Fiscal Inteligente<br>
+                    Este é um email automático, por favor não responda.
+                </p>
+            </div>
+        </div>
+    </body>
+    </html>
+    """
+
+
+_ALERT_SUBJECT = CompiledTemplate("🚨 Alerta: {tipo_upper} — {razao_social}")
+
+_ALERT_EMAIL = CompiledTemplate("""
+    <html>
+    <body style="font-family: Arial, sans-serif; padding: 20px;">
+        <h2>🚨 Alerta Fiscal: {tipo}</h2>
+        <p>Empresa: {razao_social}</p>
+        <p>CNPJ: {cnpj}</p>
+        <p>Situação: <b style="color:red">{situacao}</b></p>
+        <hr>
+        <p style="font-size: 12px; color: #94a3b8;">IAudit — Automação Fiscal</p>
+    </body>
+    </html>
+    """)
+
+
+def _compile_layout(color: str, title: str, body: str, fields: dict[str, str] | None) -> CompiledTemplate:
+    return CompiledTemplate(
+        _EMAIL_LAYOUT
+        .replace("@@COLOR@@", color)
+        .replace("@@TITLE@@", _escape(title))
+        .replace("@@BODY@@", body.replace("@@COLOR@@", color)),
+        fields,
+    )
+
+
+def _compile_email(event: str) -> CompiledTemplate:
+    body = _EMAIL_BODIES.get(event)
+    if body is None:
+        body = _escape(f"<p>Notificação sobre seu boleto: {EMAIL_TITLES.get(event, 'IAudit')}</p>")
+    return _compile_layout(
+        EMAIL_COLORS.get(event, "#3b82f6"), EMAIL_TITLES.get(event, "Notificação IAudit"), body, EMAIL_FIELDS
+    )
+
+
+# ─── Digests ─────────────────────────────────────────────────────────
+
+ALERT_EVENT = "alerta"    # certidão negativa / FGTS irregular
+DIGEST_EVENT = "digest"   # several coalesced events for one recipient
+
+_DIGEST_EMAIL = _compile_layout("#0f172a", "Resumo de Notificações", """
+            <p>Olá <b>{nome}</b>,</p>
+            <p>Reunimos {total} atualizações recentes em uma única mensagem:</p>
+            <table style="width: 100%; border-collapse: collapse; font-size: 14px;">{linhas}
+            </table>
+        """, None)
+
+_DIGEST_ROW = CompiledTemplate("""
+                <tr>
+                    <td style="padding: 8px; border-bottom: 1px solid #e2e8f0;"><b style="color: {cor};">{titulo}</b></td>
+                    <td style="padding: 8px; border-bottom: 1px solid #e2e8f0;">{detalhe}</td>
+                    <td style="padding: 8px; border-bottom: 1px solid #e2e8f0;">{link}</td>
+                </tr>""")
+
+
+def _digest_email_row(item: dict[str, Any]) -> str:
+    event, data = item["event"], item["data"]
+    get = data.get
+    if event == ALERT_EVENT:
+        return _DIGEST_ROW.render({
+            "cor": "#ef4444",
+            "titulo": f"Alerta Fiscal: {get('tipo', '')}",
+            "detalhe": f"{get('razao_social')} (CNPJ {get('cnpj')}) — "
+                       f"<b style=\"color:red\">{str(get('situacao', '')).upper()}</b>",
+            "link": "",
+        })
+    link_pdf = get("linkPdfBoleto", get("linkBoleto"))
+    return _DIGEST_ROW.render({
+        "cor": EMAIL_COLORS.get(event, "#3b82f6"),
+        "titulo": EMAIL_TITLES.get(event, "Notificação IAudit"),
+        "detalhe": f"{format_brl(get('valorNominal', 0))} — vencimento {get('dataVencimento', '')}",
+        "link": f'<a href="{link_pdf}">PDF</a>' if link_pdf else "",
+    })
+
+
+def _digest_whatsapp_line(item: dict[str, Any]) -> str:
+    event, data = item["event"], item["data"]
+    get = data.get
+    if event == ALERT_EVENT:
+        return f"\n• *Alerta {get('tipo', '')}*: {get('empresa', '')} — {str(get('situacao', '')).upper()}"
+    line = f"\n• *{EMAIL_TITLES.get(event, 'Notificação')}*: {format_brl(get('valorNominal', 0))}"
+    if get("dataVencimento"):
+        line += f" — venc. {get('dataVencimento')}"
+    link_pdf = get("linkPdfBoleto", get("linkBoleto"))
+    return f"{line}\n  📎 {link_pdf}" if link_pdf else line
+
+
+def _digest_name(items: list[dict[str, Any]]) -> str:
+    for item in items:
+        if item["event"] != ALERT_EVENT and item["data"].get("nomeSacado"):
+            return item["data"]["nomeSacado"]
+    return "Cliente"
+
+
+# ─── WhatsApp templates ──────────────────────────────────────────────
+
+# Placeholders: {nome} {valor} {vencimento} {linha} {link_pdf} {pix_line}
+_WHATSAPP_BUILTIN = {
+    "emitido": (
+        "📄 *Nova Fatura IAudit*\n\n"
+        "Olá {nome}, seu boleto foi gerado.\n\n"
+        "*Valor:* {valor}\n"
+        "*Vencimento:* {vencimento}\n\n"
+        "📎 *PDF:* {link_pdf}\n\n"
+        "👇 *Linha Digitável:*\n{linha}"
+        "{pix_line}"
+    ),
+    "pago": (
+        "✅ *Pagamento Confirmado — IAudit*\n\n"
+        "Olá {nome}, confirmamos o pagamento de *{valor}*.\n"
+        "Obrigado por manter sua conta em dia!"
+    ),
+    "atraso": (
+        "⚠️ *Aviso de Atraso — IAudit*\n\n"
+        "Olá {nome}, o boleto de *{valor}* venceu em *{vencimento}*.\n"
+        "Após o vencimento incidem juros e multa.\n\n"
+        "📎 *2ª Via:* {link_pdf}"
+    ),
+    "vencimento_d1": (
+        "🔔 *Lembrete de Vencimento — IAudit*\n\n"
+        "Olá {nome}, seu boleto de *{valor}* vence *amanhã ({vencimento})*.\n"
+        "Evite juros pagando dentro do prazo.\n\n"
+        "👇 *Linha Digitável:*\n{linha}"
+    ),
+    "reativado": (
+        "🔄 *Boleto Reativado — IAudit*\n\n"
+        "Olá {nome}, seu boleto de *{valor}* foi reativado e está pronto para pagamento.\n\n"
+        "*Vencimento:* {vencimento}\n"
+        "📎 *PDF:* {link_pdf}"
+    ),
+    ALERT_EVENT: (
+        "🚨 *Alerta Fiscal — IAudit*\n\n"
+        "Empresa {empresa} possui pendência *{tipo}*.\n"
+        "Situação: *{situacao}*"
+    ),
+}
+
+_WHATSAPP_FALLBACK = CompiledTemplate("IAudit: Notificação sobre boleto {valor}.", WHATSAPP_FIELDS)
+
+# Dynamic settings key -> event it overrides (only when customized)
+WHATSAPP_SETTING_EVENTS = {
+    "template_wa_cobranca": "emitido",
+    "template_wa_atraso": "atraso",
+    "template_wa_alerta": ALERT_EVENT,
+}
+
+
+def _builtin_whatsapp() -> dict[str, CompiledTemplate]:
+    return {event: CompiledTemplate(text, WHATSAPP_FIELDS) for event, text in _WHATSAPP_BUILTIN.items()}
+
+
+class TemplateEngine:
+    """Email/WhatsApp templates compiled per event, rendered from boleto payloads."""
+
+    def __init__(self):
+        self._email = {event: _compile_email(event) for event in EMAIL_TITLES}
+        self._whatsapp = _builtin_whatsapp()
+
+    # ── Dynamic settings overrides ───────────────────────────────────
+
+    def load_overrides(self, current: dict[str, Any]) -> None:
+        """(Re)compile WhatsApp texts customized in the dynamic settings."""
+        whatsapp = _builtin_whatsapp()
+        for key, event in WHATSAPP_SETTING_EVENTS.items():
+            text = current.get(key)
+            if not text or text == DEFAULT_SETTINGS.get(key):
+                continue
+            try:
+                whatsapp[event] = CompiledTemplate(text, CUSTOM_WHATSAPP_FIELDS)
+            except ValueError as e:
+                logger.error(f"Template '{key}' inválido, usando o padrão: {e}")
+        self._whatsapp = whatsapp
+
+    def on_settings_change(self, changed: dict[str, Any], current: dict[str, Any]) -> None:
+        if any(key in WHATSAPP_SETTING_EVENTS for key in changed):
+            self.load_overrides(current)
+
+    # ── Rendering ────────────────────────────────────────────────────
+
+    def email_subject(self, event: str) -> str:
+        return EMAIL_SUBJECTS.get(event, "Notificação IAudit")
+
+    def render_email(self, event: str, data: dict[str, Any]) -> str:
+        template = self._email.get(event)
+        if template is None:  # unknown events get the generic body, compiled once
+            template = self._email[event] = _compile_email(event)
+        return template.render(data)
+
+    def render_whatsapp(self, event: str, data: dict[str, Any]) -> str:
+        return self._whatsapp.get(event, _WHATSAPP_FALLBACK).render(data)
+
+    def render_email_message(self, event: str, data: dict[str, Any]) -> tuple[str, str]:
+        """(subject, html) for any queued email event, digests and alerts included."""
+        if event == DIGEST_EVENT:
+            items = data["itens"]
+            return f"Resumo IAudit — {len(items)} notificações", _DIGEST_EMAIL.render({
+                "nome": _digest_name(items),
+                "total": len(items),
+                "linhas": "".join(_digest_email_row(item) for item in items),
+            })
+        if event == ALERT_EVENT:
+            return self.render_alert_email(data, data)
+        return self.email_subject(event), self.render_email(event, data)
+
+    def render_whatsapp_message(self, event: str, data: dict[str, Any]) -> str:
+        """Text for any queued WhatsApp event, digests included."""
+        if event == DIGEST_EVENT:
+            items = data["itens"]
+            lines = "".join(_digest_whatsapp_line(item) for item in items)
+            return f"📬 *Resumo IAudit* — {len(items)} atualizações\n{lines}"
+        return self.render_whatsapp(event, data)
+
+    def render_alert_email(self, empresa: dict[str, Any], consulta: dict[str, Any]) -> tuple[str, str]:
+        """(subject, html) for a negative CND / irregular FGTS alert."""
+        tipo = consulta.get("tipo", "")
+        fields = {
+            "tipo": tipo,
+            "tipo_upper": tipo.upper(),
+            "situacao": consulta.get("situacao", "").upper(),
+            "razao_social": empresa.get("razao_social"),
+            "cnpj": empresa.get("cnpj"),
+        }
+        return _ALERT_SUBJECT.render(fields), _ALERT_EMAIL.render(fields)
+
+
+template_engine = TemplateEngine()
+# Overrides are loaded at startup (main.lifespan), after the settings refresh
+dynamic_settings.subscribe(template_engine.on_settings_change)
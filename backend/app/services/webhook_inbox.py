@@ -0,0 +1,426 @@
+"""IAudit - Bradesco webhook inbox.
+
+The webhook route only appends the raw event to a local SQLite inbox and
+answers; the processing (DB update, notification, log) happens here, in the
+background:
+  - events are deduplicated on (nosso_numero, cdSituacaoTitulo, timestamp),
+    so Bradesco resending an event is acknowledged without side effects
+  - events of the same boleto are handled one at a time, in arrival order;
+    different boletos are handled concurrently
+  - a failing event is retried with backoff and holds back the later events
+    of its boleto; after ``max_attempts`` it is parked as 'failed'. The
+    handler is told when it runs an event for the last time
+    (``last_attempt``), to apply what it can instead of failing again
+  - any event (failed or processed) can be replayed
+"""
+
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from typing import Any, Awaitable, Callable
+
+from app.config import settings
+from app.database import update_boleto_status, create_log
+from app.services.notifications import send_boleto_notification
+from app.utils import sqlite_connect
+
+logger = logging.getLogger(__name__)
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), "data")
+INBOX_DB = os.path.join(DATA_DIR, "webhook_inbox.db")
+
+# Events read per processing pass
+BATCH_SIZE = 200
+# Retry backoff: BASE_DELAY * 2^(attempt-1), capped
+BASE_DELAY_SECONDS = 30
+MAX_DELAY_SECONDS = 3600
+# Wake up at least this often to pick up retries that became due
+POLL_INTERVAL_SECONDS = 15
+
+# Payload fields that carry the event time, in order of preference
+_TIMESTAMP_FIELDS = ("dtHrSituacao", "dataHoraSituacao", "dtPagamento", "dataHora", "timestamp")
+
+# handler(payload, last_attempt)
+EventHandler = Callable[[dict, bool], Awaitable[None]]
+
+
+def extract_nosso_numero(data: dict) -> str | None:
+    return (
+        data.get("nuNossoNumero")
+        or data.get("nossoNumero")
+        or data.get("titulo", {}).get("nuNossoNumero")
+    )
+
+
+def extract_status_codigo(data: dict) -> str:
+    return str(
+        data.get("cdSituacaoTitulo")
+        or data.get("titulo", {}).get("cdSituacaoTitulo", "")
+    )
+
+
+def dedup_key(data: dict) -> str:
+    """(nosso_numero, cdSituacaoTitulo, timestamp); payload hash when there is no timestamp."""
+    titulo = data.get("titulo", {})
+    timestamp = next((str(src[f]) for f in _TIMESTAMP_FIELDS for src in (data, titulo) if src.get(f)), None)
+    if timestamp is None:
+        timestamp = hashlib.sha256(json.dumps(data, sort_keys=True, default=str).encode()).hexdigest()[:16]
+    return f"{extract_nosso_numero(data)}|{extract_status_codigo(data)}|{timestamp}"
+
+
+# ─── Persistence ─────────────────────────────────────────────────────
+
+_SCHEMA = """
+create table if not exists webhook_inbox (
+    id integer primary key autoincrement,
+    dedup_key text not null unique,
+    nosso_numero text not null,
+    status_codigo text,
+    payload text not null,
+    status text not null default 'pending',   -- pending | processed | failed
+    attempts integer not null default 0,
+    next_attempt_at real not null default 0,
+    received_at real not null,
+    processed_at real,
+    last_error text
+);
+create index if not exists idx_webhook_inbox_status on webhook_inbox (status, next_attempt_at, id);
+create index if not exists idx_webhook_inbox_boleto on webhook_inbox (nosso_numero, id);
+"""
+
+
+class _InboxStore:
+    """Append-only SQLite inbox (WAL: an insert is sub-millisecond)."""
+
+    def __init__(self, db_file: str):
+        self._db_file = db_file
+        self._lock = threading.Lock()
+        self._conn = None
+
+    def _db(self):
+        if self._conn is None:
+            self._conn = sqlite_connect(self._db_file)
+            self._conn.executescript(_SCHEMA)
+        return self._conn
+
+    @staticmethod
+    def _to_event(row) -> dict[str, Any]:
+        return {**{k: row[k] for k in row.keys() if k != "payload"}, "payload": json.loads(row["payload"])}
+
+    def add(self, key: str, nosso_numero: str, status_codigo: str, data: dict) -> tuple[int, bool]:
+        """Append an event; returns (id, duplicate)."""
+        with self._lock:
+            conn = self._db()
+            with conn:
+                cur = conn.execute(
+                    "insert or ignore into webhook_inbox "
+                    "(dedup_key, nosso_numero, status_codigo, payload, received_at) values (?, ?, ?, ?, ?)",
+                    (key, nosso_numero, status_codigo, json.dumps(data, default=str), time.time()),
+                )
+                if cur.rowcount:
+                    return cur.lastrowid, False
+                row = conn.execute("select id from webhook_inbox where dedup_key = ?", (key,)).fetchone()
+                return row["id"], True
+
+    def due(self, now: float, limit: int) -> list[dict[str, Any]]:
+        """Pending events ready to run, oldest first, skipping boletos whose
+        earlier event is still waiting for a retry (keeps per-boleto order)."""
+        with self._lock:
+            rows = self._db().execute(
+                "select * from webhook_inbox w where w.status = 'pending' and w.next_attempt_at <= ? "
+                "and not exists (select 1 from webhook_inbox p where p.nosso_numero = w.nosso_numero "
+                "and p.status = 'pending' and p.id < w.id and p.next_attempt_at > ?) "
+                "order by w.id limit ?",
+                (now, now, limit),
+            ).fetchall()
+        return [self._to_event(r) for r in rows]
+
+    def _write(self, sql: str, params: tuple) -> None:
+        with self._lock:
+            conn = self._db()
+            with conn:
+                conn.execute(sql, params)
+
+    def mark_processed(self, event_id: int, attempts: int) -> None:
+        self._write(
+            "update webhook_inbox set status = 'processed', attempts = ?, processed_at = ?, last_error = null "
+            "where id = ?",
+            (attempts, time.time(), event_id),
+        )
+
+    def mark_retry(self, event_id: int, attempts: int, next_attempt_at: float, error: str) -> None:
+        self._write(
+            "update webhook_inbox set attempts = ?, next_attempt_at = ?, last_error = ? where id = ?",
+            (attempts, next_attempt_at, error, event_id),
+        )
+
+    def mark_failed(self, event_id: int, attempts: int, error: str) -> None:
+        self._write(
+            "update webhook_inbox set status = 'failed', attempts = ?, last_error = ? where id = ?",
+            (attempts, error, event_id),
+        )
+
+    @staticmethod
+    def _filters(event_ids, nosso_numero, status) -> tuple[str, list]:
+        clauses, params = [], []
+        if event_ids:
+            clauses.append(f"id in ({','.join('?' * len(event_ids))})")
+            params.extend(event_ids)
+        if nosso_numero:
+            clauses.append("nosso_numero = ?")
+            params.append(nosso_numero)
+        if status:
+            clauses.append("status = ?")
+            params.append(status)
+        return (f"where {' and '.join(clauses)}" if clauses else ""), params
+
+    def list(self, status, nosso_numero, limit: int, offset: int) -> list[dict[str, Any]]:
+        where, params = self._filters(None, nosso_numero, status)
+        with self._lock:
+            rows = self._db().execute(
+                f"select * from webhook_inbox {where} order by id desc limit ? offset ?", (*params, limit, offset)
+            ).fetchall()
+        return [self._to_event(r) for r in rows]
+
+    def requeue(self, event_ids, nosso_numero, status) -> int:
+        """Set matching events back to pending with a fresh attempt count."""
+        where, params = self._filters(event_ids, nosso_numero, status)
+        with self._lock:
+            conn = self._db()
+            with conn:
+                return conn.execute(
+                    f"update webhook_inbox set status = 'pending', attempts = 0, next_attempt_at = 0 {where}",
+                    params,
+                ).rowcount
+
+    def counts(self) -> dict[str, int]:
+        with self._lock:
+            rows = self._db().execute("select status, count(*) as n from webhook_inbox group by status").fetchall()
+        return {r["status"]: r["n"] for r in rows}
+
+
+# ─── Inbox ───────────────────────────────────────────────────────────
+
+class WebhookInbox:
+    """Durable inbox + background processor for webhook events."""
+
+    def __init__(
+        self,
+        handler: EventHandler | None = None,
+        db_file: str = INBOX_DB,
+        concurrency: int = settings.webhook_inbox_concurrency,
+        max_attempts: int = settings.webhook_inbox_max_attempts,
+    ):
+        self.handler = handler
+        self.concurrency = concurrency
+        self.max_attempts = max_attempts
+        self._store = _InboxStore(db_file)
+        self._wakeup = asyncio.Event()
+        self._running = False
+        self._stats = {"received": 0, "duplicates": 0, "processed": 0, "retried": 0, "failed": 0}
+
+    @property
+    def stats(self) -> dict:
+        counts = self._store.counts()
+        return {**self._stats, "pending": counts.get("pending", 0), "failed_total": counts.get("failed", 0)}
+
+    async def ingest(self, data: dict) -> tuple[int, bool]:
+        """Persist a raw event (deduplicated); returns (event id, duplicate)."""
+        event_id, duplicate = await asyncio.to_thread(
+            self._store.add, dedup_key(data), extract_nosso_numero(data), extract_status_codigo(data), data
+        )
+        self._stats["duplicates" if duplicate else "received"] += 1
+        if not duplicate:
+            self._wakeup.set()
+        return event_id, duplicate
+
+    async def list_events(
+        self, status: str | None = None, nosso_numero: str | None = None, limit: int = 100, offset: int = 0
+    ) -> list[dict[str, Any]]:
+        return await asyncio.to_thread(self._store.list, status, nosso_numero, limit, offset)
+
+    async def replay(
+        self, event_ids: list[int] | None = None, nosso_numero: str | None = None, status: str | None = "failed"
+    ) -> int:
+        """Process matching events again (default: every failed event)."""
+        replayed = await asyncio.to_thread(self._store.requeue, event_ids, nosso_numero, status)
+        if replayed:
+            logger.info(f"[Webhook] Replaying {replayed} event(s)")
+            self._wakeup.set()
+        return replayed
+
+    # ── Processing ───────────────────────────────────────────────────
+
+    async def run(self) -> None:
+        """Process the inbox until stopped. Call once at app startup."""
+        if self._running:
+            return
+        self._running = True
+        self._wakeup.set()  # events left over from before a restart
+        try:
+            while self._running:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=POLL_INTERVAL_SECONDS)
+                except asyncio.TimeoutError:
+                    pass
+                self._wakeup.clear()
+                while await self._drain_once():
+                    pass
+        except asyncio.CancelledError:
+            pass
+        finally:
+            self._running = False
+
+    def stop(self) -> None:
+        self._running = False
+        self._wakeup.set()
+
+    async def _drain_once(self) -> bool:
+        """One pass over the due events; True if there may be more."""
+        events = await asyncio.to_thread(self._store.due, time.time(), BATCH_SIZE)
+        if not events:
+            return False
+
+        by_boleto: dict[str, list[dict]] = {}
+        for event in events:
+            by_boleto.setdefault(event["nosso_numero"], []).append(event)
+
+        slots = asyncio.Semaphore(self.concurrency)
+
+        async def run_boleto(boleto_events: list[dict]) -> None:
+            async with slots:
+                for event in boleto_events:
+                    if not await self._process(event):
+                        break  # later events of this boleto wait for the retry
+
+        await asyncio.gather(*(run_boleto(evs) for evs in by_boleto.values()))
+        return len(events) == BATCH_SIZE
+
+    async def _process(self, event: dict) -> bool:
+        """Run one event; False if it is waiting for a retry."""
+        attempts = event["attempts"] + 1
+        try:
+            if self.handler is None:
+                raise RuntimeError("no webhook handler registered")
+            await self.handler(event["payload"], attempts >= self.max_attempts)
+        except Exception as e:
+            if attempts >= self.max_attempts:
+                self._stats["failed"] += 1
+                logger.error(f"[Webhook] Event {event['id']} ({event['nosso_numero']}) failed for good: {e}")
+                await asyncio.to_thread(self._store.mark_failed, event["id"], attempts, str(e))
+                return True  # parked: the boleto's next events may proceed
+            self._stats["retried"] += 1
+            delay = min(BASE_DELAY_SECONDS * 2 ** (attempts - 1), MAX_DELAY_SECONDS)
+            logger.warning(f"[Webhook] Event {event['id']} ({event['nosso_numero']}) failed, retry in {delay}s: {e}")
+            await asyncio.to_thread(self._store.mark_retry, event["id"], attempts, time.time() + delay, str(e))
+            return False
+
+        self._stats["processed"] += 1
+        await asyncio.to_thread(self._store.mark_processed, event["id"], attempts)
+        return True
+
+
+# ─── Bradesco events ─────────────────────────────────────────────────
+
+async def _log(**entry) -> None:
+    """Best-effort history entry: once a notification went out, a failed log
+    write must not make the inbox retry the event (and notify again)."""
+    try:
+        await asyncio.to_thread(create_log, **entry)
+    except Exception as e:
+        logger.error(f"Webhook: failed to write log {entry.get('consulta_id')}: {e}")
+
+
+async def _update_status(nosso_numero: str, status: str, data: dict, last_attempt: bool) -> None:
+    boleto = await asyncio.to_thread(update_boleto_status, nosso_numero, status, data, source="webhook")
+    if boleto:
+        return
+    if not last_attempt:
+        # Not stored yet (the webhook can beat the emission's insert): retry later
+        raise LookupError(f"boleto {nosso_numero} not found")
+    # Still missing: record it and go on with the notification and log
+    logger.warning(f"Webhook: boleto {nosso_numero} not found, status '{status}' not stored")
+    await _log(
+        consulta_id="WEBHOOK_SEM_BOLETO",
+        nivel="WARN",
+        mensagem=f"Webhook para boleto não cadastrado: {nosso_numero} ({status})",
+        payload=data,
+    )
+
+
+async def process_bradesco_event(data: dict, last_attempt: bool = False) -> None:
+    """
+    Apply a Bradesco webhook event (pagamento, baixa, etc.).
+
+    Key status codes:
+      - 13: Pago no dia (liquidação no dia)
+      - 61: Baixa - Título Pago
+      - 06: Liquidado
+      - 02: Baixado / Devolvido
+
+    Raises on failure so the inbox retries the event. A boleto that is not
+    stored is retried too (the emission may still be writing it); on the last
+    attempt the event is applied without the DB update.
+    """
+    nosso_numero = extract_nosso_numero(data)
+    status_codigo = extract_status_codigo(data)
+
+    # ── Payment Confirmed ────────────────────────────────────────
+    if status_codigo in ("13", "61", "06"):
+        logger.info(f"Webhook: Payment confirmed for {nosso_numero}")
+        await _update_status(nosso_numero, "pago", data, last_attempt)
+
+        # Extract recipient info from webhook
+        pagador_nome = (
+            data.get("pagador", {}).get("nome")
+            or data.get("titulo", {}).get("nmPagador", "Cliente")
+        )
+        valor = data.get("vlNominalTitulo") or data.get(
+            "titulo", {}).get("vlNominalTitulo", 0
+        )
+        email = data.get("pagador", {}).get("email")
+        phone = data.get("pagador", {}).get("celular")
+
+        await send_boleto_notification(
+            "pago",
+            {
+                "nomeSacado": pagador_nome,
+                "valorNominal": valor,
+                "dataVencimento": data.get("dtVencimentoTitulo", ""),
+            },
+            email,
+            phone,
+        )
+
+        await _log(
+            consulta_id="WEBHOOK_PAGO",
+            nivel="INFO",
+            mensagem=f"Pagamento confirmado via webhook: {nosso_numero}",
+            payload=data,
+        )
+        return
+
+    # ── Baixado / Devolvido ──────────────────────────────────────
+    if status_codigo == "02":
+        logger.info(f"Webhook: Boleto baixado/devolvido: {nosso_numero}")
+        await _update_status(nosso_numero, "baixado", data, last_attempt)
+
+        await _log(
+            consulta_id="WEBHOOK_BAIXA",
+            nivel="INFO",
+            mensagem=f"Boleto baixado via webhook: {nosso_numero}",
+            payload=data,
+        )
+        return
+
+    # ── Unknown status ───────────────────────────────────────────
+    logger.info(f"Webhook: unhandled status {status_codigo} for {nosso_numero}")
+
+
+webhook_inbox = WebhookInbox(handler=process_bradesco_event)
@@ -1 +1,47 @@
 """IAudit - Utility functions."""
+
+from __future__ import annotations
+
+import base64
+import json
+import os
+import sqlite3
+from typing import Iterable
+
+
+def encode_cursor(values: list) -> str:
+    """Encode keyset pagination values into an opaque URL-safe cursor."""
+    raw = json.dumps(values, default=str, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str | None) -> list | None:
+    """Decode a cursor produced by encode_cursor. Returns None if invalid."""
+    if not cursor:
+        return None
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+    except (ValueError, TypeError):
+        return None
+    return values if isinstance(values, list) else None
+
+
+def sqlite_connect(path: str) -> sqlite3.Connection:
+    """Open a local SQLite store tuned for many small writes (WAL, shared across threads)."""
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+
+def percentile(samples: Iterable[float], pct: float) -> float | None:
+    """Nearest-rank percentile of a latency window (None when empty)."""
+    ordered = sorted(samples)
+    if not ordered:
+        return None
+    return round(ordered[min(len(ordered) - 1, int(len(ordered) * pct))], 3)
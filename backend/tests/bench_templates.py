@@ -0,0 +1,46 @@
+"""IAudit - Notification template micro-benchmark.
+
+Renders a bulk batch of boleto notifications (all events, email and
+WhatsApp) with the compiled templates and prints the throughput per
+channel. Run with: python tests/bench_templates.py [count]
+"""
+
+import sys
+import os
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from app.services.templates import TemplateEngine
+
+EVENTS = ("emitido", "pago", "atraso", "vencimento_d1", "reativado")
+
+
+def _boletos(count: int) -> list[dict]:
+    return [
+        {
+            "nomeSacado": f"Cliente {i}",
+            "valorNominal": 10000 + i,
+            "dataVencimento": "2026-01-10",
+            "linhaDigitavel": f"23790.12345 60000.{i:06d}",
+            "qrCodePix": f"00020126pix{i}" if i % 2 else "",
+            "linkPdfBoleto": f"https://exemplo.com/{i}.pdf",
+        }
+        for i in range(count)
+    ]
+
+
+def _bench(label: str, render, boletos: list[dict]) -> None:
+    start = time.perf_counter()
+    for i, data in enumerate(boletos):
+        render(EVENTS[i % len(EVENTS)], data)
+    elapsed = time.perf_counter() - start
+    print(f"{label:<9} {len(boletos)} mensagens em {elapsed * 1000:.1f} ms ({len(boletos) / elapsed:,.0f}/s)")
+
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    engine = TemplateEngine()
+    boletos = _boletos(count)
+    _bench("email", engine.render_email, boletos)
+    _bench("whatsapp", engine.render_whatsapp, boletos)
@@ -0,0 +1,93 @@
+"""IAudit - Recurring billing run tests."""
+
+import asyncio
+import sys
+import os
+import threading
+from datetime import date
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import app.services.billing as billing
+import app.services.boleto_service as bs
+from app.services.billing import BillingService, _target_due_date
+
+
+def test_target_due_date():
+    """Test the upcoming due date rolls to next month and skips impossible days."""
+    assert _target_due_date(15, date(2026, 3, 10)) == date(2026, 3, 15)
+    assert _target_due_date(5, date(2026, 12, 10)) == date(2027, 1, 5)
+    assert _target_due_date(30, date(2026, 2, 10)) is None
+
+
+def test_replicas_never_bill_a_plan_twice():
+    """Test two concurrent runs split the due plans through claims and update them in bulk."""
+    today = date.today()
+    due_day = min(today.day + 5, 28) if today.day <= 23 else today.day
+    plans = {
+        f"{i:08d}-plan": {
+            "id": f"{i:08d}-plan", "empresa_id": f"emp-{i}", "valor": 150.0, "dia_vencimento": due_day,
+            "empresas": {"razao_social": f"Empresa {i}", "email_notificacao": f"e{i}@x.com"},
+        }
+        for i in range(40)
+    }
+    plans["late-plan"] = {**plans["00000000-plan"], "id": "late-plan", "empresas": None}
+    claims, finished, registered = {}, [], []
+    lock = threading.Lock()
+
+    def claim(plan_ids, owner, now, lease_seconds, month_start):
+        with lock:
+            won = [pid for pid in plan_ids if pid not in claims]
+            claims.update((pid, owner) for pid in won)
+            return won
+
+    def finish(processed, released, processed_at):
+        with lock:
+            finished.append((len(processed), len(released)))
+
+    async def register_boleto(dados, recipient_email=None, recipient_phone=None):
+        registered.append(dados["nuFatura"])
+        await asyncio.sleep(0.001)
+        return {"cdErro": 0, "nuNossoNumero": dados["nuFatura"][-8:], "linhaDigitavel": "2379"}
+
+    originals = (billing.get_billing_plans_pendentes, billing.claim_billing_plans, billing.finish_billing_plans,
+                 billing.create_log, bs.claim_boleto_fatura, bs.confirm_boleto_fatura, bs.create_logs,
+                 bs.bradesco_service.register_boleto)
+    billing.get_billing_plans_pendentes = lambda month_start: list(plans.values())
+    billing.claim_billing_plans = claim
+    billing.finish_billing_plans = finish
+    billing.create_log = lambda **kwargs: None
+    bs.claim_boleto_fatura = lambda data: (data, True)
+    bs.confirm_boleto_fatura = lambda nu_fatura, data: data
+    bs.create_logs = lambda entries: None
+    bs.bradesco_service.register_boleto = register_boleto
+    try:
+        replica_a, replica_b = BillingService(), BillingService()
+        replica_b.owner = "replica-b"
+
+        async def scenario():
+            return await asyncio.gather(replica_a.process_recurring_billing(), replica_b.process_recurring_billing())
+
+        report_a, report_b = asyncio.run(scenario())
+    finally:
+        (billing.get_billing_plans_pendentes, billing.claim_billing_plans, billing.finish_billing_plans,
+         billing.create_log, bs.claim_boleto_fatura, bs.confirm_boleto_fatura, bs.create_logs,
+         bs.bradesco_service.register_boleto) = originals
+
+    assert len(registered) == len(set(registered)) == 40
+    assert report_a["claimed"] + report_b["claimed"] == 40
+    assert report_a["generated"] + report_b["generated"] == 40
+    assert report_a["skipped"] == report_b["skipped"] == 1
+    busy = [r for r in (report_a, report_b) if r["claimed"]]
+    assert sorted(finished) == sorted((r["claimed"], 0) for r in busy)  # one bulk update per run
+    assert all({"select", "claim", "emit", "update", "total"} <= set(r["timings"]) for r in busy)
+
+
+if __name__ == "__main__":
+    test_target_due_date()
+    print("✅ test_target_due_date passed")
+
+    test_replicas_never_bill_a_plan_twice()
+    print("✅ test_replicas_never_bill_a_plan_twice passed")
+
+    print("\n🎉 All tests passed!")
@@ -0,0 +1,90 @@
+"""IAudit - Batch boleto emission tests."""
+
+import asyncio
+import sys
+import os
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import app.services.boleto_service as bs
+from app.services.boleto_service import boleto_service
+
+
+def _boleto(i: int) -> dict:
+    return {"nuFatura": f"FAT-{i:04d}", "vlNominal": 10000 + i, "dataVencimento": "2026-03-10", "pagador_nome": "Cliente"}
+
+
+def test_lote_concurrent_chunked_and_resumable():
+    """Test a large lote is emitted concurrently in chunks, a resend only retries the failures and
+    concurrent lotes never register an invoice twice."""
+    stored, log_writes, registered = {}, [], []
+    state = {"active": 0, "peak": 0, "fail": {"FAT-0120"}}
+
+    async def register_boleto(dados, recipient_email=None, recipient_phone=None):
+        registered.append(dados["nuFatura"])
+        state["active"] += 1
+        state["peak"] = max(state["peak"], state["active"])
+        await asyncio.sleep(0.001)
+        state["active"] -= 1
+        if dados["nuFatura"] in state["fail"]:
+            return {"cdErro": 500, "msgErro": "indisponível"}
+        return {"cdErro": 0, "nuNossoNumero": dados["nuFatura"][-4:], "linhaDigitavel": "2379"}
+
+    def claim(data):
+        if data["nu_fatura"] in stored:
+            return stored[data["nu_fatura"]], False
+        stored[data["nu_fatura"]] = data
+        return data, True
+
+    originals = (bs.claim_boleto_fatura, bs.confirm_boleto_fatura, bs.release_boleto_fatura, bs.create_logs,
+                 bs.bradesco_service.register_boleto, bs.settings.boleto_emissao_concurrency)
+    bs.claim_boleto_fatura = claim
+    bs.confirm_boleto_fatura = lambda nu_fatura, data: stored[nu_fatura].update(data, status="emitido")
+    bs.release_boleto_fatura = lambda nu_fatura: stored.pop(nu_fatura)
+    bs.create_logs = lambda entries: log_writes.append(len(entries))
+    bs.bradesco_service.register_boleto = register_boleto
+    bs.settings.boleto_emissao_concurrency = 5
+    try:
+        boletos = [_boleto(i) for i in range(250)] + [_boleto(7)]
+
+        async def stream():
+            return [evento async for evento in boleto_service.emitir_lote_stream(boletos)]
+
+        eventos = asyncio.run(stream())
+        assert eventos[-1] == {"resumo": {"total": 251, "sucessos": 249, "erros": 2, "ja_emitidos": 0}}
+        assert len(eventos) == 252 and state["peak"] == 5
+        assert log_writes == [100, 99, 50]  # one history insert per chunk
+        assert len(registered) == 250
+
+        # Resend the whole lote after the failure is fixed: only FAT-0120 goes to Bradesco
+        state["fail"].clear()
+        registered.clear()
+        resp = asyncio.run(boleto_service.emitir_lote(boletos[:250]))
+        assert registered == ["FAT-0120"]
+        assert resp["resumo"] == {"total": 250, "sucessos": 250, "erros": 0, "ja_emitidos": 249}
+        assert [r["indice"] for r in resp["resultados"]] == list(range(250))
+        assert resp["resultados"][120]["nosso_numero"] == "0120"
+
+        # Two lotes racing on the same new invoices: each one reaches Bradesco once
+        registered.clear()
+        novos = [_boleto(i) for i in range(300, 320)]
+
+        async def concorrentes():
+            return await asyncio.gather(boleto_service.emitir_lote(novos), boleto_service.emitir_lote(novos))
+
+        resp_a, resp_b = asyncio.run(concorrentes())
+        assert sorted(registered) == [b["nuFatura"] for b in novos]
+        for a, b in zip(resp_a["resultados"], resp_b["resultados"]):
+            emitidos = [r for r in (a, b) if r["sucesso"] and not r.get("ja_emitido")]
+            assert len(emitidos) == 1
+            assert all(r is emitidos[0] or r.get("ja_emitido") or r.get("em_registro") for r in (a, b))
+    finally:
+        (bs.claim_boleto_fatura, bs.confirm_boleto_fatura, bs.release_boleto_fatura, bs.create_logs,
+         bs.bradesco_service.register_boleto, bs.settings.boleto_emissao_concurrency) = originals
+
+
+if __name__ == "__main__":
+    test_lote_concurrent_chunked_and_resumable()
+    print("✅ test_lote_concurrent_chunked_and_resumable passed")
+
+    print("\n🎉 All tests passed!")
@@ -0,0 +1,112 @@
+"""IAudit - Boleto status monitoring tests."""
+
+import asyncio
+import sys
+import os
+from datetime import date, datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import httpx
+
+import app.services.monitoring as monitoring
+from app.services.rate_limit import AdaptiveRateLimiter
+
+
+def test_adaptive_rate_limit():
+    """Test the rate grows on success and halves once per overload burst."""
+    limiter = AdaptiveRateLimiter(rate=4, max_rate=5, increase=0.5, cooldown=60)
+    for _ in range(4):
+        limiter.on_success()
+    assert limiter.rate == 5
+    limiter.on_throttle()
+    limiter.on_throttle()  # same burst: no second decrease
+    assert limiter.rate == 2.5
+    assert limiter.stats["decreases"] == 1 and limiter.stats["throttled"] == 2
+
+
+def test_concurrent_sweep_in_vencimento_order_without_overlap():
+    """Test boletos are queried concurrently, oldest vencimento first, changes are stored in bulk, and runs do not overlap."""
+    today = date.today()
+    boletos = [
+        {"id": f"b{i}", "nosso_numero": f"{i:011d}", "status": "emitido",
+         "data_vencimento": (today + timedelta(days=offset)).isoformat()}
+        for i, offset in enumerate([30, -5, 2, 10, -1, 1])
+    ]
+    queried, updated, notified, scheduled, state = [], [], [], {}, {"active": 0, "peak": 0}
+
+    async def consult_status(nosso_numero):
+        queried.append(nosso_numero)
+        state["active"] += 1
+        state["peak"] = max(state["peak"], state["active"])
+        await asyncio.sleep(0.05)
+        state["active"] -= 1
+        if nosso_numero == f"{3:011d}":
+            request = httpx.Request("POST", "https://bradesco")
+            raise httpx.HTTPStatusError("busy", request=request, response=httpx.Response(429, request=request))
+        return "emitido", {}
+
+    async def notify(tipo, dados, email=None, phone=None):
+        assert updated  # only after the bulk update
+        notified.append(tipo)
+
+    originals = (monitoring.get_boletos_para_consulta, monitoring.schedule_boleto_checks, monitoring.update_boletos_status,
+                 monitoring.send_boleto_notification, monitoring.bradesco_service.consult_status,
+                 monitoring.bradesco_limiter, monitoring.settings.boleto_monitor_concurrency)
+    monitoring.get_boletos_para_consulta = lambda now, limit=None: list(boletos)
+    monitoring.schedule_boleto_checks = lambda schedule, checked_at: scheduled.update(schedule)
+    monitoring.update_boletos_status = lambda changes: updated.append({k: sorted(v) for k, v in changes.items()})
+    monitoring.send_boleto_notification = notify
+    monitoring.bradesco_service.consult_status = consult_status
+    monitoring.bradesco_limiter = AdaptiveRateLimiter(rate=1000, max_rate=1000)
+    monitoring.settings.boleto_monitor_concurrency = 3
+    try:
+        async def scenario():
+            await asyncio.gather(monitoring.monitor_boletos(), monitoring.monitor_boletos())
+
+        asyncio.run(scenario())
+    finally:
+        (monitoring.get_boletos_para_consulta, monitoring.schedule_boleto_checks, monitoring.update_boletos_status,
+         monitoring.send_boleto_notification, monitoring.bradesco_service.consult_status,
+         monitoring.bradesco_limiter, monitoring.settings.boleto_monitor_concurrency) = originals
+
+    assert queried == [f"{i:011d}" for i in (1, 4, 5, 2, 3, 0)]  # second run skipped
+    assert state["peak"] == 3
+    assert updated == [{"atraso": [f"{1:011d}", f"{4:011d}"]}]  # one bulk update by nosso_numero
+    assert notified == ["atraso", "atraso"]
+    next_by_id = {bid: next_at for next_at, ids in scheduled.items() for bid in ids}
+    assert len(next_by_id) == 6 and len(set(next_by_id.values())) == 4  # one update per polling tier
+    stats = monitoring.monitor_stats()
+    assert not stats["running"]
+    assert (stats["last_run"]["checked"], stats["last_run"]["atraso"], stats["last_run"]["errors"]) == (6, 2, 1)
+
+
+
+def test_next_check_schedule():
+    """Test polling intervals follow vencimento proximity, final status and webhooks."""
+    now = datetime(2026, 3, 10, 12, 0, tzinfo=timezone.utc)
+
+    def hours(status, days_to_venc, webhooks=False):
+        venc = (now.date() + timedelta(days=days_to_venc)).isoformat()
+        next_at = monitoring.next_check_at(status, venc, now, webhooks)
+        return None if next_at is None else (next_at - now).total_seconds() / 3600
+
+    assert hours("emitido", 25) == 24
+    assert hours("emitido", 5) == 6
+    assert hours("emitido", 0) == hours("atraso", -3) == 1
+    assert hours("atraso", -10) == 6 and hours("atraso", -90) == 24
+    assert hours("pago", 0) is None and hours("baixado", -3) is None
+    assert hours("emitido", 0, webhooks=True) == 4 and hours("emitido", 25, webhooks=True) == 24
+
+
+if __name__ == "__main__":
+    test_adaptive_rate_limit()
+    print("✅ test_adaptive_rate_limit passed")
+
+    test_concurrent_sweep_in_vencimento_order_without_overlap()
+    print("✅ test_concurrent_sweep_in_vencimento_order_without_overlap passed")
+
+    test_next_check_schedule()
+    print("✅ test_next_check_schedule passed")
+
+    print("\n🎉 All tests passed!")
@@ -0,0 +1,158 @@
+"""IAudit - Boleto access layer tests (DEMO mode)."""
+
+import asyncio
+import sys
+import os
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import app.database as db
+import app.services.boleto_service as bs
+from app.services.boleto_service import BoletoService
+
+
+def test_boletos_keyed_by_nosso_numero():
+    """Test DEMO boletos are found and updated by nosso_numero, one at a time and in bulk."""
+    originals = (db.DEMO_MODE, db.DEMO_BOLETOS, db.DB_FILE)
+    with tempfile.TemporaryDirectory() as tmpdir:
+        db.DEMO_MODE = True
+        db.DB_FILE = os.path.join(tmpdir, "local_db.json")
+        db.DEMO_BOLETOS = [
+            {"id": "b1", "nosso_numero": "00000000001", "nu_fatura": "FAT-1", "status": "emitido"},
+            {"id": "b2", "nosso_numero": "00000000002", "nu_fatura": "FAT-2", "status": "emitido"},
+        ]
+        db._demo_reset_boletos_index()
+        try:
+            created = db.create_boleto({"nosso_numero": "00000000003", "nu_fatura": "FAT-3"})
+            assert db.get_boleto_by_nosso_numero("00000000003") is created
+            assert db.get_boleto_by_fatura("FAT-1")["id"] == "b1"
+
+            paid = db.update_boleto_status("00000000001", "pago", source="webhook")
+            assert paid["status"] == "pago" and paid["next_check_at"] is None and paid["webhook_confirmed_at"]
+            assert db.update_boleto_status("b2", "pago") is None  # ids are not nosso_numeros
+
+            updated = db.update_boletos_status({"atraso": ["00000000002", "00000000003", "99999999999"]})
+            assert updated == 2
+            assert [b["status"] for b in db.DEMO_BOLETOS] == ["pago", "atraso", "atraso"]
+
+            db.schedule_boleto_checks({"2026-03-10T12:00:00+00:00": ["b2"]}, db.datetime.now(db.timezone.utc))
+            assert db.get_boleto_by_nosso_numero("00000000002")["next_check_at"] == "2026-03-10T12:00:00+00:00"
+        finally:
+            db.DEMO_MODE, db.DEMO_BOLETOS, db.DB_FILE = originals
+            db._demo_reset_boletos_index()
+
+
+def test_fatura_claim_confirm_release():
+    """Test an invoice is claimed once, confirmed with its nosso_numero, and released only while registering."""
+    originals = (db.DEMO_MODE, db.DEMO_BOLETOS, db.DB_FILE)
+    with tempfile.TemporaryDirectory() as tmpdir:
+        db.DEMO_MODE = True
+        db.DB_FILE = os.path.join(tmpdir, "local_db.json")
+        db.DEMO_BOLETOS = []
+        db._demo_reset_boletos_index()
+        try:
+            row, claimed = db.claim_boleto_fatura({"nu_fatura": "FAT-1", "vl_nominal": 1000})
+            assert claimed and row["status"] == "registrando"
+            again, claimed = db.claim_boleto_fatura({"nu_fatura": "FAT-1", "vl_nominal": 1000})
+            assert not claimed and again is row
+
+            db.claim_boleto_fatura({"nu_fatura": "FAT-2", "vl_nominal": 2000})
+            db.release_boleto_fatura("FAT-2")
+            assert db.get_boleto_by_fatura("FAT-2") is None
+            assert db.claim_boleto_fatura({"nu_fatura": "FAT-2", "vl_nominal": 2000})[1]
+
+            confirmed = db.confirm_boleto_fatura("FAT-1", {"nosso_numero": "00000000001", "linha_digitavel": "2379"})
+            assert confirmed["status"] == "emitido"
+            assert db.get_boleto_by_nosso_numero("00000000001") is row
+            db.release_boleto_fatura("FAT-1")  # emitted: kept
+            assert db.get_boleto_by_fatura("FAT-1") is row
+            assert db.confirm_boleto_fatura("FAT-1", {"nosso_numero": "x"}) is None
+        finally:
+            db.DEMO_MODE, db.DEMO_BOLETOS, db.DB_FILE = originals
+            db._demo_reset_boletos_index()
+
+
+def test_stale_registrations_reconciled():
+    """Test old 'registrando' claims are confirmed when Bradesco has the title and released otherwise."""
+    originals = (db.DEMO_MODE, db.DEMO_BOLETOS, db.DB_FILE, bs.bradesco_service.consult_fatura)
+    antigo = (db.datetime.now(db.timezone.utc) - db.timedelta(hours=1)).isoformat()
+
+    async def consult_fatura(nu_fatura):
+        if nu_fatura == "FAT-4":
+            raise TimeoutError("Bradesco fora do ar")
+        return {"nuNossoNumero": "00000000001", "linhaDigitavel": "2379"} if nu_fatura == "FAT-1" else None
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        db.DEMO_MODE = True
+        db.DB_FILE = os.path.join(tmpdir, "local_db.json")
+        db.DEMO_BOLETOS = []
+        db._demo_reset_boletos_index()
+        bs.bradesco_service.consult_fatura = consult_fatura
+        try:
+            for fatura in ("FAT-1", "FAT-2", "FAT-3", "FAT-4"):
+                db.claim_boleto_fatura({"nu_fatura": fatura, "vl_nominal": 1000})
+            for fatura in ("FAT-1", "FAT-2", "FAT-4"):
+                db.get_boleto_by_fatura(fatura)["created_at"] = antigo
+
+            resumo = asyncio.run(BoletoService().conciliar_registros())
+
+            assert resumo == {"total": 3, "confirmados": 1, "liberados": 1, "erros": 1}
+            assert db.get_boleto_by_nosso_numero("00000000001")["status"] == "emitido"
+            assert db.get_boleto_by_fatura("FAT-2") is None
+            assert db.get_boleto_by_fatura("FAT-3")["status"] == "registrando"  # may still be in flight
+            assert db.get_boleto_by_fatura("FAT-4")["status"] == "registrando"  # next run
+        finally:
+            db.DEMO_MODE, db.DEMO_BOLETOS, db.DB_FILE, bs.bradesco_service.consult_fatura = originals
+            db._demo_reset_boletos_index()
+
+
+def test_aggregates_follow_status_changes():
+    """Test the DEMO rollup tracks inserts and status changes and matches a full recount."""
+    originals = (db.DEMO_MODE, db.DEMO_BOLETOS, db.DB_FILE)
+    with tempfile.TemporaryDirectory() as tmpdir:
+        db.DEMO_MODE = True
+        db.DB_FILE = os.path.join(tmpdir, "local_db.json")
+        db.DEMO_BOLETOS = [
+            {"id": "b1", "empresa_id": "e1", "nosso_numero": "1", "status": "emitido",
+             "vl_nominal": 10000, "data_vencimento": "2026-03-10"},
+        ]
+        db._demo_reset_boletos_index()
+        try:
+            db.create_boleto({"empresa_id": "e1", "nosso_numero": "2", "nu_fatura": "F2",
+                              "vl_nominal": 25050, "data_vencimento": "2026-03-20"})
+            db.create_boleto({"empresa_id": "e2", "nosso_numero": "3", "nu_fatura": "F3",
+                              "vl_nominal": 5000, "data_vencimento": "2026-04-05"})
+            db.update_boleto_status("1", "pago")
+            db.update_boletos_status({"atraso": ["2"]})
+
+            stats = BoletoService.estatisticas_agregadas(db.get_boleto_aggregates())
+            recount = BoletoService.calcular_estatisticas(
+                [{"status": b["status"], "valor": b["vl_nominal"] / 100} for b in db.DEMO_BOLETOS]
+            )
+            assert {k: v for k, v in stats.items() if k != "por_mes"} == recount
+            assert (stats["pagos"], stats["vencidos"], stats["a_vencer"], stats["valor_recebido"]) == (1, 1, 1, 100.0)
+            assert [m["mes"] for m in stats["por_mes"]] == ["2026-03-01", "2026-04-01"]
+
+            march_e1 = BoletoService.estatisticas_agregadas(db.get_boleto_aggregates("e1", "2026-03-01"))
+            assert (march_e1["total"], march_e1["valor_total"], march_e1["valor_pendente"]) == (2, 350.5, 250.5)
+            assert BoletoService.estatisticas_agregadas([])["total"] == 0
+        finally:
+            db.DEMO_MODE, db.DEMO_BOLETOS, db.DB_FILE = originals
+            db._demo_reset_boletos_index()
+
+
+if __name__ == "__main__":
+    test_boletos_keyed_by_nosso_numero()
+    print("✅ test_boletos_keyed_by_nosso_numero passed")
+
+    test_fatura_claim_confirm_release()
+    print("✅ test_fatura_claim_confirm_release passed")
+
+    test_stale_registrations_reconciled()
+    print("✅ test_stale_registrations_reconciled passed")
+
+    test_aggregates_follow_status_changes()
+    print("✅ test_aggregates_follow_status_changes passed")
+
+    print("\n🎉 All tests passed!")
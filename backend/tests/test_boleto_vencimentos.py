@@ -0,0 +1,85 @@
+"""IAudit - D-1 / D+N vencimento reminder tests."""
+
+import asyncio
+import sys
+import os
+import tempfile
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import app.database as db
+import app.services.boleto_scheduler as scheduler
+from app.services.boleto_scheduler import check_boleto_vencimentos, marcos_atraso
+from app.services.notification_queue import NotificationQueue
+from app.services.notifications import NotificationService
+
+
+def test_marcos_atraso():
+    """Test overdue reminders fall on D+1, D+3, D+7 and then weekly up to the horizon."""
+    assert marcos_atraso(30) == [1, 3, 7, 14, 21, 28]
+    assert marcos_atraso(2) == [1]
+
+
+def test_rerun_never_double_sends():
+    """Test only boletos on a reminder date are selected, queued in one write, and a re-run sends nothing."""
+    today = date(2026, 3, 10)
+
+    def boleto(i, dias, status="emitido", email="cliente@x.com"):
+        return {"id": f"b{i}", "nosso_numero": f"{i:011d}", "status": status, "vl_nominal": 10000,
+                "data_vencimento": (today + timedelta(days=dias)).isoformat(),
+                "empresas": {"email_notificacao": email}}
+
+    boletos = [
+        boleto(1, 1),                                # D-1
+        boleto(2, 1, status="atraso"),               # not a D-1 reminder
+        boleto(3, -3, status="atraso"),              # D+3
+        boleto(4, -14, email="outro@x.com"),         # D+14
+        boleto(5, -5),                               # no reminder today
+        boleto(6, -1, status="pago"),                # paid
+    ]
+    logs, enqueue_calls = [], []
+    originals = (db.DEMO_MODE, db.DEMO_BOLETOS, db.DEMO_LEMBRETES, db.DB_FILE,
+                 scheduler.notification_service, scheduler.create_logs)
+
+    async def scenario(queue_file):
+        queue = NotificationQueue(db_file=queue_file)
+        enqueue_many = queue.enqueue_many
+
+        async def counting_enqueue_many(tasks):
+            enqueue_calls.append(len(tasks))
+            await enqueue_many(tasks)
+
+        queue.enqueue_many = counting_enqueue_many
+        scheduler.notification_service = NotificationService(queue=queue, coalesce_window=0)
+        first = await check_boleto_vencimentos(today)
+        second = await check_boleto_vencimentos(today)
+        return first, second, queue.stats
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        db.DEMO_MODE = True
+        db.DB_FILE = os.path.join(tmpdir, "local_db.json")
+        db.DEMO_BOLETOS = boletos
+        db.DEMO_LEMBRETES = set()
+        scheduler.create_logs = lambda entries: logs.append([e["consulta_id"] for e in entries])
+        try:
+            first, second, stats = asyncio.run(scenario(os.path.join(tmpdir, "queue.db")))
+        finally:
+            (db.DEMO_MODE, db.DEMO_BOLETOS, db.DEMO_LEMBRETES, db.DB_FILE,
+             scheduler.notification_service, scheduler.create_logs) = originals
+
+    assert (first["selected"], first["d1"], first["atraso"]) == (4, 1, 2)
+    assert first["messages"] == 2  # b1 + b3 share a recipient: one digest
+    assert enqueue_calls == [2] and stats["enqueued"] == 2
+    assert logs == [["BOLETO_D1", "BOLETO_ATRASO", "BOLETO_ATRASO"]]
+    assert (second["d1"], second["atraso"], second["already_sent"], second["messages"]) == (0, 0, 3, 0)
+
+
+if __name__ == "__main__":
+    test_marcos_atraso()
+    print("✅ test_marcos_atraso passed")
+
+    test_rerun_never_double_sends()
+    print("✅ test_rerun_never_double_sends passed")
+
+    print("\n🎉 All tests passed!")
@@ -0,0 +1,107 @@
+"""IAudit - Bradesco client tests."""
+
+import asyncio
+import sys
+import os
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import httpx
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+
+from app.config import settings
+from app.services.bradesco import BradescoService, TOKEN_ENDPOINT
+
+
+def _write_private_key(path: str) -> None:
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    with open(path, "wb") as f:
+        f.write(key.private_bytes(
+            serialization.Encoding.PEM,
+            serialization.PrivateFormat.PKCS8,
+            serialization.NoEncryption(),
+        ))
+
+
+def test_single_flight_token_and_endpoint_stats():
+    """Test concurrent calls share one token refresh and one pooled client."""
+    token_requests = []
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        if request.url.path == TOKEN_ENDPOINT:
+            token_requests.append(time.monotonic())
+            await asyncio.sleep(0.05)
+            return httpx.Response(200, json={"access_token": f"tok-{len(token_requests)}", "expires_in": 3600})
+        assert request.headers["Authorization"] == f"Bearer tok-{len(token_requests)}"
+        return httpx.Response(200, json={"cdSituacaoTitulo": "13"})
+
+    async def scenario():
+        service = BradescoService()
+        service._client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        client = service._client
+
+        results = await asyncio.gather(*(service.consult_status(f"{i:011d}") for i in range(10)))
+        assert [status for status, _ in results] == ["pago"] * 10
+        assert len(token_requests) == 1
+        assert service._http() is client
+
+        # Inside the refresh margin: renewed once, ahead of expiry
+        service._token_refresh_at = time.time() - 1
+        await asyncio.gather(*(service.consult_status("00000000001") for _ in range(5)))
+        assert len(token_requests) == 2
+
+        stats = service.stats
+        assert stats["token_refreshes"] == 2
+        assert stats["endpoints"][TOKEN_ENDPOINT]["calls"] == 2
+        consult = stats["endpoints"]["/v1/boleto/titulo-consultar"]
+        assert (consult["calls"], consult["errors"]) == (15, 0) and consult["latency_p95"] is not None
+
+        await service.aclose()
+        assert client.is_closed and not service.stats["pooled_client"]
+
+    original = (settings.bradesco_client_id, settings.bradesco_private_key_path)
+    with tempfile.TemporaryDirectory() as tmpdir:
+        key_path = os.path.join(tmpdir, "bradesco.key")
+        _write_private_key(key_path)
+        settings.bradesco_client_id, settings.bradesco_private_key_path = "client-id", key_path
+        try:
+            asyncio.run(scenario())
+        finally:
+            settings.bradesco_client_id, settings.bradesco_private_key_path = original
+
+
+def test_register_keeps_unknown_outcomes_as_errors():
+    """Test a 5xx on registration raises (outcome unknown) while a 4xx is returned as a refusal."""
+    statuses = iter([504, 422])
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(next(statuses), text="erro")
+
+    async def scenario():
+        service = BradescoService()
+        service._token, service._token_refresh_at = "tok", time.time() + 3600
+        service._client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        boleto = {"nuFatura": "FAT-1", "vlNominal": 1000, "dataVencimento": "2026-03-10"}
+        try:
+            await service.register_boleto(boleto)
+            raise AssertionError("a 504 must not look like a refusal")
+        except httpx.HTTPStatusError as e:
+            assert e.response.status_code == 504
+        refused = await service.register_boleto(boleto)
+        assert refused["cdErro"] == 422
+        await service.aclose()
+
+    asyncio.run(scenario())
+
+
+if __name__ == "__main__":
+    test_single_flight_token_and_endpoint_stats()
+    print("✅ test_single_flight_token_and_endpoint_stats passed")
+
+    test_register_keeps_unknown_outcomes_as_errors()
+    print("✅ test_register_keeps_unknown_outcomes_as_errors passed")
+
+    print("\n🎉 All tests passed!")
@@ -0,0 +1,60 @@
+"""IAudit - Communication log store tests."""
+
+import asyncio
+import json
+import sys
+import os
+import tempfile
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from app.models import CommunicationChannel, CommunicationStatus
+from app.services.comunicacao import CommunicationService
+
+
+def test_filters_and_counters():
+    """Test indexed filters and incremental stats over a legacy import."""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        legacy = os.path.join(tmpdir, "comm_logs.json")
+        two_days_ago = datetime.now() - timedelta(days=2)
+        with open(legacy, "w", encoding="utf-8") as f:
+            json.dump([{
+                "id": "old", "timestamp": two_days_ago.isoformat(), "channel": "email",
+                "recipient": "antigo@empresa.com", "content": "x", "status": "failed",
+            }], f)
+
+        service = CommunicationService(os.path.join(tmpdir, "comm_logs.db"), legacy)
+
+        async def scenario():
+            for i in range(6):
+                await service.log_message(
+                    CommunicationChannel.whatsapp if i % 2 else CommunicationChannel.email,
+                    f"cliente{i}@empresa.com", "conteudo",
+                    CommunicationStatus.sent if i < 4 else CommunicationStatus.failed,
+                )
+
+            stats = await service.get_stats()
+            assert (stats["total"], stats["sent"], stats["failed"]) == (7, 4, 3)
+            assert stats["by_channel"]["email"]["total"] == 4
+
+            recent = await service.get_stats(since=datetime.now() - timedelta(hours=1))
+            assert recent["total"] == 6
+
+            failed_email = await service.get_logs(channel="email", status="failed")
+            assert [log["recipient"] for log in failed_email] == ["cliente4@empresa.com", "antigo@empresa.com"]
+
+            old = await service.get_logs(until=datetime.now() - timedelta(days=1))
+            assert [log["id"] for log in old] == ["old"]
+
+            await service.clear_logs()
+            assert (await service.get_stats())["total"] == 0
+
+        asyncio.run(scenario())
+
+
+if __name__ == "__main__":
+    test_filters_and_counters()
+    print("✅ test_filters_and_counters passed")
+
+    print("\n🎉 All tests passed!")
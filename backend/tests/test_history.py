@@ -0,0 +1,49 @@
+"""IAudit - Search history store tests."""
+
+import sys
+import os
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from app.config import settings
+from app.services.history import HistoryStore
+
+
+def _result(cnpj: str, nome: str) -> dict:
+    return {"cnpj": cnpj, "razao_social": nome, "certidoes": {"cnd_federal": {"situacao": "regular"}}}
+
+
+def test_history_index_and_payloads():
+    """Test per-user ordering, trimming and payload lookup."""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        store = HistoryStore(os.path.join(tmpdir, "history.db"), os.path.join(tmpdir, "history.json"))
+        original_max = settings.history_max_entries
+        settings.history_max_entries = 3
+        try:
+            for i in range(5):
+                store.save(_result(f"1122233300018{i}", f"Empresa {i}"), "ana")
+            store.save(_result("11222333000182", "Empresa 2"), "ana")  # moves to the top
+            store.save(_result("00623904000173", "Outra"), "bruno")
+
+            recent = store.recent("ana")
+            assert [r["cnpj"] for r in recent] == ["11222333000182", "11222333000184", "11222333000183"]
+            assert "data" not in recent[0]
+            assert [r["cnpj"] for r in store.recent("bruno")] == ["00623904000173"]
+
+            assert store.get_payload("11222333000184", "ana")["razao_social"] == "Empresa 4"
+            assert store.get_payload("11222333000180", "ana") is None
+
+            store.clear("ana")
+            assert store.recent("ana") == []
+            orphans = store._db().execute("select count(*) from history_payloads").fetchone()[0]
+            assert orphans == 1  # only bruno's payload is left
+        finally:
+            settings.history_max_entries = original_max
+
+
+if __name__ == "__main__":
+    test_history_index_and_payloads()
+    print("✅ test_history_index_and_payloads passed")
+
+    print("\n🎉 All tests passed!")
@@ -0,0 +1,50 @@
+"""IAudit - Interest and penalty calculation tests."""
+
+import random
+import sys
+import os
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from app.services.boleto_service import BoletoService
+
+
+def test_single_boleto_rounding():
+    """Test amounts are rounded on their decimal value and not-yet-due boletos are untouched."""
+    hoje = date(2026, 3, 10)
+    assert BoletoService.calcular_juros_multa(1000.0, date(2026, 3, 10), hoje=hoje) == {
+        "dias_atraso": 0, "valor_juros": 0.0, "valor_multa": 0.0, "valor_total": 1000.0,
+    }
+    r = BoletoService.calcular_juros_multa(1000.0, date(2026, 3, 1), hoje=hoje)
+    assert r == {"dias_atraso": 9, "valor_juros": 3.0, "valor_multa": 20.0, "valor_total": 1023.0}
+    # 133.75 * 2% = 2.675: binary round() gives 2.67, the decimal value rounds to 2.68
+    assert BoletoService.calcular_juros_multa(133.75, date(2026, 3, 9), hoje=hoje)["valor_multa"] == 2.68
+
+
+def test_lote_matches_single_item():
+    """Test the vectorized portfolio calculation matches calcular_juros_multa boleto by boleto."""
+    rng = random.Random(42)
+    hoje = date(2026, 3, 10)
+    valores = [round(rng.uniform(10, 50000), 2) for _ in range(20000)]
+    vencimentos = [hoje + timedelta(days=rng.randint(-400, 60)) for _ in valores]
+    juros = [rng.choice([0.0333, 0.05, 0.1]) for _ in valores]
+
+    lote = BoletoService.calcular_juros_multa_lote(
+        valores, [v.isoformat() for v in vencimentos], juros, 2.0, hoje=hoje
+    )
+    assert lote == [
+        BoletoService.calcular_juros_multa(v, d, j, 2.0, hoje=hoje)
+        for v, d, j in zip(valores, vencimentos, juros)
+    ]
+    assert BoletoService.calcular_juros_multa_lote([], [], hoje=hoje) == []
+
+
+if __name__ == "__main__":
+    test_single_boleto_rounding()
+    print("✅ test_single_boleto_rounding passed")
+
+    test_lote_matches_single_item()
+    print("✅ test_lote_matches_single_item passed")
+
+    print("\n🎉 All tests passed!")
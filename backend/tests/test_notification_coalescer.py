@@ -0,0 +1,169 @@
+"""IAudit - Notification coalescing tests."""
+
+import asyncio
+import sys
+import os
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import app.services.notifications as notifications
+import app.services.scheduler as scheduler
+from app.services.notification_coalescer import NotificationCoalescer
+from app.services.notification_queue import NotificationQueue
+from app.services.notifications import NotificationService
+from app.services.templates import ALERT_EVENT, DIGEST_EVENT, template_engine
+
+
+def _boleto(i: int) -> dict:
+    return {"nomeSacado": "Filial", "valorNominal": 10000 + i, "dataVencimento": "10/01/2026"}
+
+
+def test_events_grouped_per_recipient():
+    """Test a burst per recipient becomes one digest and single events pass through."""
+    async def scenario():
+        emitted = []
+
+        async def emit(channel, recipient, items):
+            emitted.append((channel, recipient, [item["event"] for item in items]))
+
+        coalescer = NotificationCoalescer(emit, window=0.05, max_items=10)
+        for i in range(3):
+            await coalescer.add("email", "Cliente@Empresa.com", "atraso", _boleto(i))
+        await coalescer.add("email", "cliente@empresa.com", ALERT_EVENT, {"tipo": "cnd_federal"})
+        await coalescer.add("email", "outro@empresa.com", "pago", _boleto(9))
+        await coalescer.add("whatsapp", "+5511999990000", "atraso", _boleto(1))
+        assert emitted == [] and coalescer.stats["buffered"] == 6
+
+        await asyncio.sleep(0.1)
+        assert sorted(emitted) == [
+            ("email", "Cliente@Empresa.com", ["atraso", "atraso", "atraso", ALERT_EVENT]),
+            ("email", "outro@empresa.com", ["pago"]),
+            ("whatsapp", "+5511999990000", ["atraso"]),
+        ]
+        stats = coalescer.stats
+        assert (stats["events"], stats["messages"], stats["digests"], stats["saved_sends"]) == (6, 3, 1, 3)
+        assert stats["buffered"] == 0
+
+    asyncio.run(scenario())
+
+
+def test_max_items_and_flush():
+    """Test a full group is emitted immediately and flush() drains the rest."""
+    async def scenario():
+        emitted = []
+
+        async def emit(channel, recipient, items):
+            emitted.append(len(items))
+
+        coalescer = NotificationCoalescer(emit, window=60, max_items=3)
+        for i in range(4):
+            await coalescer.add("email", "a@empresa.com", "emitido", _boleto(i))
+        assert emitted == [3]
+        await coalescer.flush()
+        assert emitted == [3, 1]
+
+        direct = NotificationCoalescer(emit, window=0)
+        await direct.add("email", "b@empresa.com", "pago", _boleto(0))
+        assert emitted == [3, 1, 1]
+
+    asyncio.run(scenario())
+
+
+def test_digest_rendering():
+    """Test digest email/WhatsApp list every coalesced event."""
+    items = [
+        {"event": "atraso", "data": {**_boleto(0), "linkPdfBoleto": "https://x/1.pdf"}},
+        {"event": ALERT_EVENT, "data": {"empresa": "ACME", "razao_social": "ACME", "cnpj": "1", "tipo": "fgts", "situacao": "irregular"}},
+    ]
+    subject, html = template_engine.render_email_message(DIGEST_EVENT, {"itens": items})
+    assert subject == "Resumo IAudit — 2 notificações"
+    assert "Olá <b>Filial</b>" in html and "R$ 100,00" in html and "https://x/1.pdf" in html
+    assert "Alerta Fiscal: fgts" in html and "IRREGULAR" in html
+
+    text = template_engine.render_whatsapp_message(DIGEST_EVENT, {"itens": items})
+    assert text.startswith("📬 *Resumo IAudit* — 2 atualizações")
+    assert "*Aviso de Atraso*: R$ 100,00" in text and "*Alerta fgts*: ACME — IRREGULAR" in text
+
+    subject, html = template_engine.render_email_message(ALERT_EVENT, items[1]["data"])
+    assert subject == "🚨 Alerta: FGTS — ACME" and "IRREGULAR" in html
+
+
+def test_transactional_events_skip_the_buffer():
+    """Test pago/emitido reach the persistent queue at once while reminders are coalesced."""
+    async def scenario(queue_file):
+        queue = NotificationQueue(db_file=queue_file)
+        service = NotificationService(queue=queue, coalesce_window=60)
+        await service.notify("pago", _boleto(0), "cliente@empresa.com")
+        await service.notify("emitido", _boleto(2), "cliente@empresa.com")
+        await service.notify("atraso", _boleto(1), "cliente@empresa.com")
+        durable, buffered = queue.stats["enqueued"], service.coalescer.stats["buffered"]
+        await service.flush()
+        return durable, buffered, queue.stats["enqueued"]
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        durable, buffered, total = asyncio.run(scenario(os.path.join(tmpdir, "queue.db")))
+    assert (durable, buffered, total) == (2, 1, 3)
+
+
+def test_robot_run_sends_one_alert_digest_per_client():
+    """Test a robot run alerting on several filiais of one client queues a single digest."""
+    filiais = [
+        {"id": f"c{i}", "tipo": "cnd_federal", "tentativas": 0, "empresas": {
+            "cnpj": f"112223330001{i:02d}", "razao_social": f"Filial {i}",
+            "email_notificacao": "Cliente@Empresa.com" if i < 3 else "outro@empresa.com",
+        }}
+        for i in range(4)
+    ]
+
+    async def consultar(cnpj):
+        return {"situacao": "negativa", "resultado_json": {}}
+
+    async def scenario(queue_file):
+        queue = NotificationQueue(db_file=queue_file)
+        notifications.notification_service = NotificationService(queue=queue, coalesce_window=60)
+        await scheduler.process_pending_queries()
+        return queue
+
+    originals = (
+        notifications.notification_service, scheduler.get_consultas_pendentes, scheduler.get_consultas_retry,
+        scheduler.update_consulta, scheduler.create_log, scheduler.infosimples_client.consultar_cnd_federal,
+    )
+    scheduler.get_consultas_pendentes = lambda: filiais
+    scheduler.get_consultas_retry = lambda: []
+    scheduler.update_consulta = lambda *args: None
+    scheduler.create_log = lambda *args: None
+    scheduler.infosimples_client.consultar_cnd_federal = consultar
+    try:
+        with tempfile.TemporaryDirectory() as tmpdir:
+            queue = asyncio.run(scenario(os.path.join(tmpdir, "queue.db")))
+            tasks = sorted((task for task, _ in queue._store.load_active()), key=lambda t: t.recipient)
+    finally:
+        (
+            notifications.notification_service, scheduler.get_consultas_pendentes, scheduler.get_consultas_retry,
+            scheduler.update_consulta, scheduler.create_log, scheduler.infosimples_client.consultar_cnd_federal,
+        ) = originals
+
+    assert [(t.recipient, t.event) for t in tasks] == [
+        ("Cliente@Empresa.com", DIGEST_EVENT), ("outro@empresa.com", ALERT_EVENT),
+    ]
+    assert [item["data"]["cnpj"] for item in tasks[0].payload["itens"]] == [f["empresas"]["cnpj"] for f in filiais[:3]]
+
+
+if __name__ == "__main__":
+    test_events_grouped_per_recipient()
+    print("✅ test_events_grouped_per_recipient passed")
+
+    test_max_items_and_flush()
+    print("✅ test_max_items_and_flush passed")
+
+    test_digest_rendering()
+    print("✅ test_digest_rendering passed")
+
+    test_transactional_events_skip_the_buffer()
+    print("✅ test_transactional_events_skip_the_buffer passed")
+
+    test_robot_run_sends_one_alert_digest_per_client()
+    print("✅ test_robot_run_sends_one_alert_digest_per_client passed")
+
+    print("\n🎉 All tests passed!")
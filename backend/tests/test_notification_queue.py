@@ -0,0 +1,109 @@
+"""IAudit - Notification queue tests."""
+
+import asyncio
+import sys
+import os
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import app.services.notification_queue as nq
+from app.services.notification_queue import NotificationQueue, NotificationTask
+
+
+def _task(task_id: str, recipient: str) -> NotificationTask:
+    return NotificationTask(task_id, "email", "emitido", recipient, {"valorNominal": 15000})
+
+
+def test_retry_does_not_block_other_messages():
+    """Test a failing recipient is parked for backoff while others are delivered."""
+    async def scenario(db_file):
+        queue = NotificationQueue(workers_per_channel=2, db_file=db_file)
+        delivered = []
+        attempts = {"falha": 0}
+
+        async def deliver(task):
+            if task.recipient.startswith("falha"):
+                attempts["falha"] += 1
+                return attempts["falha"] >= 2
+            delivered.append((task.recipient, time.monotonic()))
+            return True
+
+        queue.register_handler("email", deliver)
+        runner = asyncio.create_task(queue.start_worker())
+
+        started = time.monotonic()
+        await queue.enqueue(_task("falha", "falha@empresa.com"))
+        for i in range(5):
+            await queue.enqueue(_task(f"ok-{i}", f"ok{i}@empresa.com"))
+
+        await asyncio.sleep(0.2)
+        assert len(delivered) == 5
+        assert max(t for _, t in delivered) - started < nq.BASE_DELAY_SECONDS
+        assert queue.stats["delayed"] == 1
+
+        await asyncio.sleep(nq.BASE_DELAY_SECONDS + 0.2)
+        stats = queue.stats
+        assert (stats["sent"], stats["retried"], stats["delayed"]) == (6, 1, 0)
+        assert stats["channels"]["email"]["depth"] == 0
+
+        queue.stop_worker()
+        await runner
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        asyncio.run(scenario(os.path.join(tmpdir, "queue.db")))
+
+
+def test_recovery_and_dead_letters():
+    """Test undelivered tasks survive a restart and dead letters can be replayed."""
+    async def first_run(db_file):
+        queue = NotificationQueue(max_retries=1, db_file=db_file)
+
+        async def failing(task):
+            return False
+
+        queue.register_handler("email", failing)
+        await queue.enqueue(_task("pendente", "a@empresa.com"))  # never started: stays pending
+        runner = asyncio.create_task(queue.start_worker())
+        await asyncio.sleep(0.2)
+        assert queue.stats["dead_letters"] == 1
+        queue.stop_worker()
+        await runner
+
+    async def second_run(db_file):
+        queue = NotificationQueue(db_file=db_file)
+        delivered = []
+
+        async def deliver(task):
+            delivered.append((task.task_id, task.payload["valorNominal"]))
+            return True
+
+        queue.register_handler("email", deliver)
+        dead = await queue.list_dead_letters()
+        assert [d["task_id"] for d in dead] == ["pendente"]
+
+        runner = asyncio.create_task(queue.start_worker())
+        assert await queue.replay_dead_letters("pendente") == 1
+        await asyncio.sleep(0.2)
+        assert delivered == [("pendente", 15000)]
+        assert await queue.list_dead_letters() == []
+        queue.stop_worker()
+        await runner
+
+        assert queue._store.load_active() == []
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        db_file = os.path.join(tmpdir, "queue.db")
+        asyncio.run(first_run(db_file))
+        asyncio.run(second_run(db_file))
+
+
+if __name__ == "__main__":
+    test_retry_does_not_block_other_messages()
+    print("✅ test_retry_does_not_block_other_messages passed")
+
+    test_recovery_and_dead_letters()
+    print("✅ test_recovery_and_dead_letters passed")
+
+    print("\n🎉 All tests passed!")
@@ -0,0 +1,101 @@
+"""IAudit - Batch compliance certificate job tests."""
+
+import asyncio
+import sys
+import os
+import tempfile
+import zipfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import app.routes.pdf as pdf
+from app.config import settings
+from app.services.pdf_batch import PdfBatchJobs
+
+
+def _data(cnpj: str) -> dict:
+    return {
+        "cnpj": cnpj, "razao_social": f"Empresa {cnpj}", "situacao_cadastral": "ATIVA",
+        "cnae_fiscal": 6201501, "cnae_fiscal_descricao": "Desenvolvimento de software", "certidoes": {},
+    }
+
+
+async def _fetch(cnpj: str) -> dict:
+    if cnpj.endswith("99"):
+        raise ValueError("CNPJ não encontrado")
+    await asyncio.sleep(0.001)
+    return _data(cnpj)
+
+
+def test_zip_batch_progress_and_archive():
+    """Test a ZIP batch renders every CNPJ, reports each one and the failures, and keeps its file."""
+    cnpjs = [f"112223330001{i:02d}" for i in range(20)] + ["11222333000199"]
+    rendered = []
+
+    async def render(cnpj, data):
+        rendered.append(cnpj)
+        return b"%PDF-" + cnpj.encode()
+
+    async def render_merged(items):
+        raise AssertionError("ZIP batches render certificates one by one")
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        jobs = PdfBatchJobs(tmpdir)
+
+        async def scenario():
+            job = jobs.start(cnpjs, "zip", _fetch, render, render_merged)
+            events = [event async for event in job.follow()]
+            return job, events
+
+        job, events = asyncio.run(scenario())
+        with zipfile.ZipFile(job.path) as archive:
+            names = archive.namelist()
+            first = archive.read(f"certificado_conformidade_{cnpjs[0]}.pdf")
+
+    assert job.status == "done" and job.done == 21 and job.failed == 1
+    assert len(names) == 20 and first == b"%PDF-" + cnpjs[0].encode()
+    assert sorted(rendered) == cnpjs[:20]
+    items = [e for e in events if "cnpj" in e]
+    assert [e["concluidos"] for e in items] == list(range(1, 22))
+    assert [e["erro"] for e in items if not e["sucesso"]] == ["CNPJ não encontrado"]
+    assert events[-1]["status"] == "done" and events[-1]["falhas"] == 1
+
+
+def test_merged_batch_renders_one_document():
+    """Test a merged batch renders all certificates together, in the requested order."""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        original_workers = settings.pdf_render_workers
+        settings.pdf_render_workers = 0  # render in a thread
+        try:
+            jobs = PdfBatchJobs(tmpdir)
+            cnpjs = ["11222333000181", "00623904000173", "11222333000199"]
+            merged = []
+
+            async def render_merged(items):
+                merged.append([cnpj for cnpj, _ in items])
+                return await pdf.render_certificates(items)
+
+            async def scenario():
+                job = jobs.start(cnpjs, "pdf", _fetch, pdf.render_certificate, render_merged)
+                events = [event async for event in job.follow()]
+                return job, events
+
+            job, events = asyncio.run(scenario())
+            with open(job.path, "rb") as f:
+                content = f.read()
+        finally:
+            settings.pdf_render_workers = original_workers
+
+    assert merged == [cnpjs[:2]]
+    assert content.startswith(b"%PDF") and job.status == "done"
+    assert {"etapa": "gerando_pdf", "certificados": 2} in events
+
+
+if __name__ == "__main__":
+    test_zip_batch_progress_and_archive()
+    print("✅ test_zip_batch_progress_and_archive passed")
+
+    test_merged_batch_renders_one_document()
+    print("✅ test_merged_batch_renders_one_document passed")
+
+    print("\n🎉 All tests passed!")
@@ -0,0 +1,133 @@
+"""IAudit - Compliance certificate rendering and PDF cache tests."""
+
+import asyncio
+import sys
+import os
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import app.routes.pdf as pdf
+from app.config import settings
+from app.services.pdf_cache import PdfCache, fingerprint
+
+
+def _data(situacao: str = "ATIVA") -> dict:
+    return {
+        "cnpj": "11222333000181",
+        "razao_social": "Empresa Teste LTDA",
+        "situacao_cadastral": situacao,
+        "capital_social": 50000,
+        "cnaes_secundarios": [{"codigo": 6201501, "descricao": "Desenvolvimento de software"}],
+        "qsa": [{"nome_socio": "Fulano", "qualificacao_socio": "Sócio-Administrador"}],
+        "certidoes": {"cnd_federal": {"status": "regular"}, "fgts": {"status": "irregular"}},
+    }
+
+
+def test_fingerprint_is_stable():
+    """Test the fingerprint ignores key order and changes with the data."""
+    assert fingerprint({"a": 1, "b": [1, 2]}) == fingerprint({"b": [1, 2], "a": 1})
+    assert fingerprint(_data()) != fingerprint(_data("BAIXADA"))
+
+
+def test_cache_memory_disk_and_eviction():
+    """Test LRU memory hits, disk hits after a restart, LRU disk eviction and TTL expiry."""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        cache = PdfCache(tmpdir, memory_items=2, disk_bytes=2500, ttl_seconds=3600)
+        for i in range(3):
+            cache.put(f"k{i}", bytes([i]) * 1000)
+            os.utime(os.path.join(tmpdir, f"k{i}.pdf"), (time.time() - 100 + i, time.time()))
+
+        # k0 is the least recently used file: evicted to bring the directory under budget
+        assert not os.path.exists(os.path.join(tmpdir, "k0.pdf"))
+        assert cache.stats["disk_evictions"] == 1
+        assert cache.get("k2") == bytes([2]) * 1000
+        assert cache.stats["memory_hits"] == 1
+
+        restarted = PdfCache(tmpdir, memory_items=2, disk_bytes=2500, ttl_seconds=3600)
+        assert restarted.get("k1") == bytes([1]) * 1000
+        assert restarted.get("k0") is None
+        assert restarted.stats["disk_hits"] == 1 and restarted.stats["misses"] == 1
+
+        expired = PdfCache(tmpdir, memory_items=2, disk_bytes=2500, ttl_seconds=0)
+        assert expired.get("k1") is None
+
+
+def test_cache_overwrite_keeps_disk_usage():
+    """Test storing a key again replaces its size in the disk usage instead of adding to it."""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        cache = PdfCache(tmpdir, memory_items=2, disk_bytes=2500, ttl_seconds=3600)
+        cache.put("k0", b"0" * 1000)
+        cache.put("k1", b"1" * 1000)
+        for _ in range(3):
+            cache.put("k1", b"1" * 600)
+        assert cache.stats["disk_bytes"] == 1600
+        assert cache.stats["disk_evictions"] == 0 and cache.get("k0") is not None
+
+
+def test_render_certificate_uses_pool_and_cache():
+    """Test certificates render in worker processes and identical data is served from the cache."""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        original_cache, original_workers = pdf.pdf_cache, settings.pdf_render_workers
+        pdf.pdf_cache = PdfCache(tmpdir, memory_items=4, disk_bytes=10 * 1024 * 1024, ttl_seconds=3600)
+        settings.pdf_render_workers = 1
+        try:
+            async def scenario():
+                first = await pdf.render_certificate("11222333000181", _data())
+                again = await pdf.render_certificate("11222333000181", _data())
+                other = await pdf.render_certificate("11222333000181", _data("BAIXADA"))
+                return first, again, other
+
+            first, again, other = asyncio.run(scenario())
+            assert pdf._render_pool is not None
+            stats = pdf.pdf_cache.stats
+        finally:
+            pdf.shutdown_render_pool()
+            pdf.pdf_cache, settings.pdf_render_workers = original_cache, original_workers
+
+    assert first.startswith(b"%PDF") and other.startswith(b"%PDF")
+    assert again == first
+    assert stats["memory_hits"] == 1 and stats["misses"] == 2
+
+
+def _texts(flowables) -> list[str]:
+    """Paragraph texts of a certificate, tables included."""
+    texts = []
+    for f in flowables:
+        if hasattr(f, "text"):
+            texts.append(f.text)
+        for row in getattr(f, "_cellvalues", []):
+            texts.extend(_texts(row))
+    return texts
+
+
+def test_certificate_shows_query_time_not_render_time():
+    """Test the certificate is stamped with the query time from the data, so cached copies stay accurate."""
+    data = {**_data(), "consultado_em": "2026-10-19T12:30:00+00:00"}
+    texts = _texts(pdf._certificate_elements("11222333000181", data))
+    assert any("Dados consultados em:</b> 19/10/2026 às 09:30" in t for t in texts)
+    assert "Dados consultados em 19/10/2026 às 09:30 (Horário de Brasília)" in texts
+    assert not any("Emitido em" in t or "Emissão" in t for t in texts)
+
+    legacy = _texts(pdf._certificate_elements("11222333000181", _data()))
+    assert any("Dados consultados em:</b> N/A" in t for t in legacy)
+
+
+if __name__ == "__main__":
+    test_fingerprint_is_stable()
+    print("✅ test_fingerprint_is_stable passed")
+
+    test_cache_memory_disk_and_eviction()
+    print("✅ test_cache_memory_disk_and_eviction passed")
+
+    test_cache_overwrite_keeps_disk_usage()
+    print("✅ test_cache_overwrite_keeps_disk_usage passed")
+
+    test_render_certificate_uses_pool_and_cache()
+    print("✅ test_render_certificate_uses_pool_and_cache passed")
+
+    test_certificate_shows_query_time_not_render_time()
+    print("✅ test_certificate_shows_query_time_not_render_time passed")
+
+    print("\n🎉 All tests passed!")
@@ -0,0 +1,121 @@
+"""IAudit - Notification rate limiting tests."""
+
+import asyncio
+import sys
+import os
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from app.config import settings
+from app.services.notification_queue import DeferDelivery, NotificationQueue, NotificationTask
+from app.services.notifications import SMTPEmailProvider
+from app.services.rate_limit import DailyQuota, ProviderLimiter, TokenBucket, is_transactional
+
+
+def test_token_bucket_paces_bursts():
+    """Test a burst beyond the bucket capacity is spread at the configured rate."""
+    async def scenario():
+        bucket = TokenBucket(rate=20, capacity=2)
+        started = time.monotonic()
+        await asyncio.gather(*(bucket.acquire() for _ in range(6)))
+        return time.monotonic() - started
+
+    elapsed = asyncio.run(scenario())
+    assert 0.15 <= elapsed < 0.5  # 4 tokens of debt at 20/s
+
+
+def test_quota_reserve_for_transactional():
+    """Test reminders stop at the reserve while transactional events use the full quota."""
+    quota = DailyQuota(limit=10, reserve_ratio=0.2)
+    assert all(quota.try_consume() for _ in range(8))
+    assert not quota.try_consume()
+    assert quota.try_consume(2, transactional=True)
+    assert not quota.try_consume(transactional=True)
+    assert quota.stats["used"] == 10
+
+    limiter = ProviderLimiter("twilio", rate_per_second=0, daily_limit=0)
+    assert limiter.admit(1000) and limiter.stats["daily"]["used"] == 0
+
+    assert is_transactional("pago") and not is_transactional("atraso")
+    assert is_transactional("digest", {"itens": [{"event": "atraso"}, {"event": "emitido"}]})
+    assert not is_transactional("digest", {"itens": [{"event": "vencimento"}]})
+
+
+def test_deferred_task_keeps_its_attempts():
+    """Test a deferred task is parked and later delivered without using a retry."""
+    async def scenario(db_file):
+        queue = NotificationQueue(max_retries=1, db_file=db_file)
+        calls = []
+
+        async def deliver(task):
+            calls.append(task.attempt)
+            if len(calls) < 3:
+                raise DeferDelivery(0.05, "quota")
+            return True
+
+        queue.register_handler("whatsapp", deliver)
+        runner = asyncio.create_task(queue.start_worker())
+        await queue.enqueue(NotificationTask("t1", "whatsapp", "atraso", "+5511999990000", {}))
+
+        await asyncio.sleep(0.5)
+        stats = queue.stats
+        assert calls == [1, 1, 1]
+        assert (stats["sent"], stats["deferred"], stats["retried"], stats["dead_letters"]) == (1, 2, 0, 0)
+
+        queue.stop_worker()
+        await runner
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        asyncio.run(scenario(os.path.join(tmpdir, "queue.db")))
+
+
+def test_smtp_fallback_priority_and_refunds():
+    """Test the SMTP fallback admits each email with its own priority and failed sends give quota back."""
+    provider = SMTPEmailProvider()
+    provider.resend_limiter = ProviderLimiter("resend", 0, 100, 0.2)
+    provider.smtp_limiter = ProviderLimiter("smtp", 0, 10, 0.2)
+    assert provider.smtp_limiter.admit(8)  # reminders are at the reserve
+    sent_smtp = []
+
+    async def resend_down(messages):
+        raise RuntimeError("503")
+
+    async def smtp_send_many(messages):
+        sent_smtp.extend(recipient for recipient, _, _ in messages)
+        return [None, RuntimeError("550")]
+
+    provider._send_resend_batch = resend_down
+    provider._send_smtp_many = smtp_send_many
+    original = settings.resend_api_key, settings.smtp_user, settings.smtp_password
+    settings.resend_api_key, settings.smtp_user, settings.smtp_password = "re_x", "user", "pass"
+    try:
+        messages = [("a@x.com", "s", "b"), ("b@x.com", "s", "b"), ("c@x.com", "s", "b")]
+        assert provider.admit(count=3)
+        results = asyncio.run(provider.send_batch(messages, [True, False, True]))
+    finally:
+        settings.resend_api_key, settings.smtp_user, settings.smtp_password = original
+        provider._smtp_executor.shutdown(wait=False)
+
+    assert results == [True, False, False]
+    assert sent_smtp == ["a@x.com", "c@x.com"]  # the reminder waits for tomorrow's quota
+    assert provider.resend_limiter.stats["daily"]["used"] == 0
+    assert provider.smtp_limiter.stats["daily"]["used"] == 9
+    assert provider.smtp_limiter.stats["refunded"] == 1
+
+
+if __name__ == "__main__":
+    test_token_bucket_paces_bursts()
+    print("✅ test_token_bucket_paces_bursts passed")
+
+    test_quota_reserve_for_transactional()
+    print("✅ test_quota_reserve_for_transactional passed")
+
+    test_deferred_task_keeps_its_attempts()
+    print("✅ test_deferred_task_keeps_its_attempts passed")
+
+    test_smtp_fallback_priority_and_refunds()
+    print("✅ test_smtp_fallback_priority_and_refunds passed")
+
+    print("\n🎉 All tests passed!")
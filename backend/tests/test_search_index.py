@@ -0,0 +1,107 @@
+"""IAudit - N-gram search index and cursor tests."""
+
+import sys
+import os
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import app.database as db
+from app.services.search_index import NgramIndex
+from app.utils import encode_cursor, decode_cursor
+
+
+def _build_index() -> NgramIndex:
+    index = NgramIndex()
+    index.add("1", "Padaria São João Ltda", "11.222.333/0001-81")
+    index.add("2", "Mercado Azul", "00623904000173")
+    index.add("3", "Açougue São Jorge", "12345678000199")
+    return index
+
+
+def test_search_razao_social():
+    """Test accent/case-insensitive substring search on razao_social."""
+    index = _build_index()
+    assert index.search("sao jo") == {"1", "3"}
+    assert index.search("AÇOUGUE") == {"3"}
+    assert index.search("az") == {"2"}  # shorter than a trigram
+    assert index.search("inexistente") == set()
+
+
+def test_search_cnpj():
+    """Test CNPJ search matches digits regardless of formatting."""
+    index = _build_index()
+    assert index.search("11222333") == {"1"}
+    assert index.search("006.239") == {"2"}
+
+
+def test_reindex_and_remove():
+    """Test that updates replace the old postings."""
+    index = _build_index()
+    index.add("2", "Mercado Verde", "00623904000173")
+    assert index.search("azul") == set()
+    assert index.search("verde") == {"2"}
+    index.remove("2")
+    assert index.search("verde") == set()
+    assert len(index) == 2
+
+
+class _NoScan(list):
+    def __iter__(self):
+        raise AssertionError("DEMO search must not scan every empresa")
+
+
+def test_demo_page_search_uses_the_index():
+    """Test a DEMO page search reads only the matching rows from the index, with cursors."""
+    originals = (db.DEMO_MODE, db.DEMO_EMPRESAS, db.DB_FILE)
+    with tempfile.TemporaryDirectory() as tmpdir:
+        db.DEMO_MODE = True
+        db.DB_FILE = os.path.join(tmpdir, "local_db.json")
+        db.DEMO_EMPRESAS = [
+            {"id": f"e{i:03d}", "razao_social": f"{'Padaria' if i % 10 == 0 else 'Mercado'} {i:03d}",
+             "cnpj": f"{i:014d}", "ativo": i % 20 != 0}
+            for i in range(200)
+        ]
+        db._demo_reset_empresas_index()
+        try:
+            db._demo_empresas_index()
+            db.DEMO_EMPRESAS = _NoScan(db.DEMO_EMPRESAS)
+
+            first = db.get_empresas_page(search="padaria", limit=15)
+            second = db.get_empresas_page(search="padaria", limit=15, cursor=first["next_cursor"])
+            assert [e["razao_social"] for e in first["items"] + second["items"]] == [
+                f"Padaria {i:03d}" for i in range(0, 200, 10)
+            ]
+            assert second["next_cursor"] is None and first["total_estimate"] == 20
+            ativos = db.get_empresas_page(search="padaria", ativo=True, limit=50)
+            assert len(ativos["items"]) == ativos["total_estimate"] == 10
+        finally:
+            db.DEMO_MODE, db.DEMO_EMPRESAS, db.DB_FILE = originals
+            db._demo_reset_empresas_index()
+
+
+def test_cursor_roundtrip():
+    """Test cursor encoding and invalid cursor handling."""
+    cursor = encode_cursor(["Empresa Ação", "7e51801f"])
+    assert decode_cursor(cursor) == ["Empresa Ação", "7e51801f"]
+    assert decode_cursor("%%%") is None
+    assert decode_cursor(None) is None
+
+
+if __name__ == "__main__":
+    test_search_razao_social()
+    print("✅ test_search_razao_social passed")
+
+    test_search_cnpj()
+    print("✅ test_search_cnpj passed")
+
+    test_reindex_and_remove()
+    print("✅ test_reindex_and_remove passed")
+
+    test_demo_page_search_uses_the_index()
+    print("✅ test_demo_page_search_uses_the_index passed")
+
+    test_cursor_roundtrip()
+    print("✅ test_cursor_roundtrip passed")
+
+    print("\n🎉 All tests passed!")
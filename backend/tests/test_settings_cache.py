@@ -0,0 +1,100 @@
+"""IAudit - Dynamic settings cache tests."""
+
+import asyncio
+import json
+import sys
+import os
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import app.database as db
+from app.services.settings import DynamicSettingsService
+
+
+def _service(tmpdir):
+    return DynamicSettingsService(os.path.join(tmpdir, "settings.json"))
+
+
+def test_cache_and_mtime_invalidation():
+    """Test reads are served from memory and an external file edit is picked up on refresh."""
+    original = db.DEMO_MODE
+    db.DEMO_MODE = True
+    try:
+        with tempfile.TemporaryDirectory() as tmpdir:
+            service = _service(tmpdir)
+            assert service.is_robo_ativo() is True
+
+            changes = []
+            service.subscribe(lambda changed, current: changes.append(changed))
+
+            with open(service._path, "w", encoding="utf-8") as f:
+                json.dump({"robo_ativo": False}, f)
+            os.utime(service._path, (time.time() + 5, time.time() + 5))
+
+            # Still cached until the background refresh
+            assert service.is_robo_ativo() is True
+            assert service.refresh() == {"robo_ativo": False}
+            assert service.is_robo_ativo() is False
+            assert changes == [{"robo_ativo": False}]
+            assert service.refresh() == {}  # mtime unchanged: not re-read
+    finally:
+        db.DEMO_MODE = original
+
+
+def test_reads_never_query_the_db():
+    """Test get_settings serves the DB settings from memory; only refresh queries the DB."""
+    original = (db.DEMO_MODE, db.get_app_settings)
+    queries = []
+
+    def get_app_settings():
+        queries.append(1)
+        return {"data": {"mensagens_ativas": False}, "updated_at": f"v{len(queries)}"}
+
+    db.DEMO_MODE, db.get_app_settings = False, get_app_settings
+    try:
+        with tempfile.TemporaryDirectory() as tmpdir:
+            service = _service(tmpdir)
+            assert service.get("mensagens_ativas") is True and queries == []  # local file before startup
+
+            service.refresh()
+            for _ in range(100):
+                assert service.get_settings()["mensagens_ativas"] is False
+            assert queries == [1]
+    finally:
+        db.DEMO_MODE, db.get_app_settings = original
+
+
+def test_update_notifies_subscribers():
+    """Test explicit updates refresh the cache and notify only changed keys."""
+    original = db.DEMO_MODE
+    db.DEMO_MODE = True
+    try:
+        with tempfile.TemporaryDirectory() as tmpdir:
+            service = _service(tmpdir)
+            changes = []
+            service.subscribe(lambda changed, current: changes.append((changed, current["mensagens_ativas"])))
+
+            service.update_settings({"mensagens_ativas": False, "robo_ativo": True})
+            asyncio.run(service.aupdate_settings({"mensagens_ativas": False}))
+
+            assert changes == [({"mensagens_ativas": False}, False)]
+            assert service.get("mensagens_ativas") is False
+            with open(service._path, encoding="utf-8") as f:
+                assert json.load(f)["mensagens_ativas"] is False
+    finally:
+        db.DEMO_MODE = original
+
+
+if __name__ == "__main__":
+    test_cache_and_mtime_invalidation()
+    print("✅ test_cache_and_mtime_invalidation passed")
+
+    test_reads_never_query_the_db()
+    print("✅ test_reads_never_query_the_db passed")
+
+    test_update_notifies_subscribers()
+    print("✅ test_update_notifies_subscribers passed")
+
+    print("\n🎉 All tests passed!")
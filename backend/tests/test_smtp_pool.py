@@ -0,0 +1,87 @@
+"""IAudit - SMTP connection pool tests."""
+
+import smtplib
+import sys
+import os
+from email.message import EmailMessage
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import app.services.smtp_pool as smtp_pool
+from app.services.smtp_pool import SMTPConnectionPool
+
+
+class FakeSMTP:
+    """Stands in for smtplib.SMTP; records logins and deliveries."""
+    logins = 0
+    sent = []
+    drop_next = False
+
+    def __init__(self, host, port, timeout=None):
+        self.alive = True
+
+    def ehlo(self):
+        pass
+
+    def starttls(self):
+        pass
+
+    def login(self, user, password):
+        FakeSMTP.logins += 1
+
+    def noop(self):
+        if not self.alive:
+            raise smtplib.SMTPServerDisconnected()
+        return (250, b"OK")
+
+    def send_message(self, msg):
+        if FakeSMTP.drop_next or not self.alive:
+            FakeSMTP.drop_next = False
+            self.alive = False
+            raise smtplib.SMTPServerDisconnected("Connection unexpectedly closed")
+        FakeSMTP.sent.append(msg["To"])
+
+    def quit(self):
+        self.alive = False
+
+    close = quit
+
+
+def _msg(to: str) -> EmailMessage:
+    msg = EmailMessage()
+    msg["To"] = to
+    msg.set_content("x")
+    return msg
+
+
+def test_pool_reuses_and_reconnects():
+    """Test sessions are reused across sends and re-opened when dropped."""
+    original = smtp_pool.smtplib.SMTP
+    smtp_pool.smtplib.SMTP = FakeSMTP
+    try:
+        pool = SMTPConnectionPool("smtp.test", 587, "u", "p", size=2, noop_interval=0)
+
+        assert pool.send_many([_msg("a@x"), _msg("b@x"), _msg("c@x")]) == [None, None, None]
+        pool.send(_msg("d@x"))
+        assert FakeSMTP.logins == 1
+        assert pool.stats["reused"] == 1
+
+        FakeSMTP.drop_next = True
+        assert pool.send_many([_msg("e@x"), _msg("f@x")]) == [None, None]
+        assert FakeSMTP.logins == 2
+        assert pool.stats["reconnects"] == 1
+        assert FakeSMTP.sent == ["a@x", "b@x", "c@x", "d@x", "e@x", "f@x"]
+
+        # Dead idle sessions are dropped by the health check
+        pool._idle.queue[0].server.alive = False
+        pool.health_check()
+        assert pool.stats["idle"] == 0
+    finally:
+        smtp_pool.smtplib.SMTP = original
+
+
+if __name__ == "__main__":
+    test_pool_reuses_and_reconnects()
+    print("✅ test_pool_reuses_and_reconnects passed")
+
+    print("\n🎉 All tests passed!")
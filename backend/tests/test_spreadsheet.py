@@ -0,0 +1,67 @@
+"""IAudit - Streaming spreadsheet reader tests."""
+
+import io
+import sys
+import os
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from openpyxl import Workbook
+
+from app.services.spreadsheet import detect_encoding, iter_spreadsheet_chunks
+
+
+def test_detect_encoding():
+    """Test encoding detection from partial samples."""
+    assert detect_encoding("Razão Social".encode("utf-8")) == "utf-8"
+    # Sample cut in the middle of a multi-byte character
+    assert detect_encoding("São".encode("utf-8")[:2]) == "utf-8"
+    assert detect_encoding("São Paulo".encode("cp1252")) == "cp1252"
+    assert detect_encoding(b"\xef\xbb\xbfcnpj") == "utf-8-sig"
+
+
+def test_csv_chunks():
+    """Test chunked CSV reading keeps leading zeros and normalizes headers."""
+    lines = ["CNPJ,Razao Social"] + [f"00623904000{i:03d},Empresa {i}" for i in range(25)]
+    content = "\n".join(lines).encode("cp1252")
+
+    columns, chunks = iter_spreadsheet_chunks(io.BytesIO(content), "empresas.csv", chunk_size=10)
+    chunks = list(chunks)
+
+    assert columns == ["cnpj", "razao_social"]
+    assert [len(c) for c in chunks] == [10, 10, 5]
+    assert chunks[0][0] == {"cnpj": "00623904000000", "razao_social": "Empresa 0"}
+
+
+def test_xlsx_chunks():
+    """Test read-only XLSX reading converts numeric cells to plain digits."""
+    wb = Workbook()
+    ws = wb.active
+    ws.append(["cnpj", "razao_social"])
+    ws.append([11222333000181, "Empresa A"])
+    ws.append([None, None])
+    ws.append(["00623904000173", "Empresa B"])
+    buffer = io.BytesIO()
+    wb.save(buffer)
+
+    columns, chunks = iter_spreadsheet_chunks(buffer, "empresas.xlsx", chunk_size=1)
+    chunks = list(chunks)
+
+    assert columns == ["cnpj", "razao_social"]
+    assert chunks == [
+        [{"cnpj": "11222333000181", "razao_social": "Empresa A"}],
+        [{"cnpj": "00623904000173", "razao_social": "Empresa B"}],
+    ]
+
+
+if __name__ == "__main__":
+    test_detect_encoding()
+    print("✅ test_detect_encoding passed")
+
+    test_csv_chunks()
+    print("✅ test_csv_chunks passed")
+
+    test_xlsx_chunks()
+    print("✅ test_xlsx_chunks passed")
+
+    print("\n🎉 All tests passed!")
@@ -0,0 +1,82 @@
+"""IAudit - Notification template engine tests."""
+
+import sys
+import os
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from app.services.settings import DEFAULT_SETTINGS
+from app.services.templates import TemplateEngine, format_brl
+
+BOLETO = {
+    "nomeSacado": "Ana",
+    "valorNominal": 123456,
+    "dataVencimento": "2026-01-10",
+    "linhaDigitavel": "23790.12345 60000.000001",
+    "qrCodePix": "00020126{pix}",
+    "linkPdfBoleto": "https://exemplo.com/boleto.pdf",
+}
+
+
+def test_format_brl():
+    """Test cents, reais and invalid values."""
+    assert format_brl(123456) == "R$ 1.234,56"
+    assert format_brl(5) == "R$ 0,05"
+    assert format_brl(-5050) == "R$ -50,50"
+    assert format_brl(1234567.891) == "R$ 1.234.567,89"
+    assert format_brl("99.9") == "R$ 99,90"
+    assert format_brl("abc") == "R$ 0,00"
+    assert format_brl(None) == "R$ 0,00"
+
+
+def test_compiled_templates():
+    """Test email/WhatsApp rendering, literal braces in data and cents vs reais."""
+    engine = TemplateEngine()
+    html = engine.render_email("emitido", BOLETO)
+    assert "Novo Boleto Disponível" in html and "#3b82f6" in html
+    assert "R$ 1.234,56" in html and "00020126{pix}" in html and "Pix Copia e Cola" in html
+    assert "Pix Copia e Cola" not in engine.render_email("emitido", {**BOLETO, "qrCodePix": ""})
+    assert "Notificação sobre seu boleto: IAudit" in engine.render_email("outro", BOLETO)
+
+    text = engine.render_whatsapp("pago", BOLETO)
+    assert text.startswith("✅ *Pagamento Confirmado") and "*R$ 1.234,56*" in text
+    assert engine.render_whatsapp("outro", {}) == "IAudit: Notificação sobre boleto R$ 0,00."
+
+    assert "R$ 0,01" in engine.render_whatsapp("pago", {"valorNominal": 1})
+    assert "R$ 1,00" in engine.render_whatsapp("pago", {"valorNominal": 1.0})
+
+    subject, html = engine.render_alert_email(
+        {"razao_social": "ACME", "cnpj": "11222333000181"}, {"tipo": "cnd_federal", "situacao": "positiva"}
+    )
+    assert subject == "🚨 Alerta: CND_FEDERAL — ACME" and "POSITIVA" in html
+
+
+def test_settings_overrides():
+    """Test customized template_wa_* texts, defaults and invalid templates."""
+    engine = TemplateEngine()
+    engine.load_overrides(DEFAULT_SETTINGS)
+    assert engine.render_whatsapp("emitido", BOLETO).startswith("📄 *Nova Fatura IAudit*")
+
+    engine.on_settings_change(
+        {"template_wa_cobranca": "x"},
+        {**DEFAULT_SETTINGS, "template_wa_cobranca": "Vence {vencimento}: R$ {valor} {desconhecido}"},
+    )
+    assert engine.render_whatsapp("emitido", BOLETO) == "Vence 2026-01-10: R$ 1.234,56 "
+    assert engine.render_whatsapp("alerta", {"empresa": "ACME"}).startswith("🚨 *Alerta Fiscal — IAudit*")
+
+    engine.load_overrides({**DEFAULT_SETTINGS, "template_wa_atraso": "Atraso {vencimento"})
+    assert engine.render_whatsapp("atraso", BOLETO).startswith("⚠️ *Aviso de Atraso")
+    assert engine.render_whatsapp("emitido", BOLETO).startswith("📄 *Nova Fatura IAudit*")
+
+
+if __name__ == "__main__":
+    test_format_brl()
+    print("✅ test_format_brl passed")
+
+    test_compiled_templates()
+    print("✅ test_compiled_templates passed")
+
+    test_settings_overrides()
+    print("✅ test_settings_overrides passed")
+
+    print("\n🎉 All tests passed!")
@@ -0,0 +1,203 @@
+"""IAudit - Webhook inbox tests."""
+
+import asyncio
+import sys
+import os
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import app.services.webhook_inbox as wi
+from app.services.webhook_inbox import WebhookInbox, dedup_key
+
+
+def _event(nosso_numero: str, codigo: str, ts: str) -> dict:
+    return {"nuNossoNumero": nosso_numero, "cdSituacaoTitulo": codigo, "dtHrSituacao": ts}
+
+
+def test_dedup_key():
+    """Test events are keyed on nosso_numero, status and timestamp, nested or not."""
+    assert dedup_key(_event("123", "13", "2026-03-10T10:00:00")) == "123|13|2026-03-10T10:00:00"
+    nested = {"titulo": {"nuNossoNumero": "123", "cdSituacaoTitulo": "13", "dtHrSituacao": "2026-03-10T10:00:00"}}
+    assert dedup_key(nested) == "123|13|2026-03-10T10:00:00"
+    # No timestamp: identical payloads collapse, different ones do not
+    assert dedup_key({"nuNossoNumero": "1", "x": 1}) == dedup_key({"x": 1, "nuNossoNumero": "1"})
+    assert dedup_key({"nuNossoNumero": "1", "x": 1}) != dedup_key({"nuNossoNumero": "1", "x": 2})
+
+
+def test_ingest_dedups_and_processes_in_order_per_boleto():
+    """Test resent events are acknowledged once and each boleto's events run in arrival order."""
+    handled = []
+
+    async def handler(data, last_attempt):
+        await asyncio.sleep(0.001 if data["nuNossoNumero"] == "A" else 0)
+        handled.append((data["nuNossoNumero"], data["cdSituacaoTitulo"]))
+
+    async def scenario(db_file):
+        inbox = WebhookInbox(handler, db_file=db_file)
+        first = await inbox.ingest(_event("A", "02", "t1"))
+        assert first[1] is False
+        assert await inbox.ingest(_event("A", "02", "t1")) == (first[0], True)
+        await inbox.ingest(_event("B", "13", "t1"))
+        await inbox.ingest(_event("A", "13", "t2"))
+        assert await inbox._drain_once() is False
+        return inbox
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        inbox = asyncio.run(scenario(os.path.join(tmpdir, "inbox.db")))
+        assert sorted(handled) == [("A", "02"), ("A", "13"), ("B", "13")]
+        assert [e for e in handled if e[0] == "A"] == [("A", "02"), ("A", "13")]
+        stats = inbox.stats
+        assert (stats["received"], stats["duplicates"], stats["processed"], stats["pending"]) == (3, 1, 3, 0)
+
+
+def test_failures_hold_back_the_boleto_then_park_and_replay():
+    """Test a failing event blocks later events of its boleto, is parked as failed, and replays."""
+    state = {"broken": True}
+    handled = []
+
+    async def handler(data, last_attempt):
+        if state["broken"] and data["cdSituacaoTitulo"] == "02":
+            raise RuntimeError("db down")
+        handled.append((data["nuNossoNumero"], data["cdSituacaoTitulo"]))
+
+    async def scenario(db_file):
+        inbox = WebhookInbox(handler, db_file=db_file, max_attempts=2)
+        await inbox.ingest(_event("A", "02", "t1"))
+        await inbox.ingest(_event("A", "13", "t2"))
+        await inbox.ingest(_event("B", "13", "t1"))
+
+        await inbox._drain_once()
+        assert handled == [("B", "13")]  # A/13 waits behind the retry of A/02
+        [retry] = await inbox.list_events(status="pending", nosso_numero="A", limit=1, offset=1)
+        assert retry["attempts"] == 1 and retry["last_error"] == "db down"
+
+        # Second failure parks the event; the boleto's next event is released
+        inbox._store._write("update webhook_inbox set next_attempt_at = 0", ())
+        await inbox._drain_once()
+        assert handled == [("B", "13"), ("A", "13")]
+        [failed] = await inbox.list_events(status="failed")
+        assert failed["payload"]["cdSituacaoTitulo"] == "02"
+
+        state["broken"] = False
+        assert await inbox.replay() == 1
+        await inbox._drain_once()
+        assert handled[-1] == ("A", "02")
+        assert await inbox.replay([failed["id"]], status=None) == 1  # processed events replay too
+        assert await inbox.replay([9999], status=None) == 0
+        return inbox.stats
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        stats = asyncio.run(scenario(os.path.join(tmpdir, "inbox.db")))
+        assert (stats["retried"], stats["failed"], stats["failed_total"]) == (1, 1, 0)
+
+
+def test_bradesco_event_retries_on_db_failure():
+    """Test the Bradesco handler raises when the boleto update fails, so the inbox retries."""
+    original = wi.update_boleto_status
+
+    def broken(*args, **kwargs):
+        raise ConnectionError("supabase down")
+
+    wi.update_boleto_status = broken
+    try:
+        asyncio.run(wi.process_bradesco_event(_event("A", "02", "t1")))
+    except ConnectionError:
+        pass
+    else:
+        raise AssertionError("expected the DB failure to propagate")
+    finally:
+        wi.update_boleto_status = original
+
+
+def test_bradesco_payment_for_missing_boleto():
+    """Test a payment for a boleto that is not stored is retried, then notified and logged on the last attempt."""
+    notified, logs = [], []
+
+    async def notify(event_type, data, email=None, phone=None):
+        notified.append(event_type)
+
+    originals = (wi.update_boleto_status, wi.send_boleto_notification, wi.create_log)
+    wi.update_boleto_status = lambda *args, **kwargs: None
+    wi.send_boleto_notification = notify
+    wi.create_log = lambda **kwargs: logs.append(kwargs["consulta_id"])
+    try:
+        try:
+            asyncio.run(wi.process_bradesco_event(_event("A", "13", "t1")))
+        except LookupError:
+            pass
+        else:
+            raise AssertionError("expected a retry while the boleto may still be stored")
+        assert notified == [] and logs == []
+
+        asyncio.run(wi.process_bradesco_event(_event("A", "13", "t1"), last_attempt=True))
+        assert notified == ["pago"]
+        assert logs == ["WEBHOOK_SEM_BOLETO", "WEBHOOK_PAGO"]
+    finally:
+        wi.update_boleto_status, wi.send_boleto_notification, wi.create_log = originals
+
+
+def test_bradesco_payment_log_failure_does_not_retry():
+    """Test a failed log write after the "pago" notification does not fail the event (no second notification)."""
+    notified = []
+
+    async def notify(event_type, data, email=None, phone=None):
+        notified.append(event_type)
+
+    def broken_log(**kwargs):
+        raise ConnectionError("supabase down")
+
+    originals = (wi.update_boleto_status, wi.send_boleto_notification, wi.create_log)
+    wi.update_boleto_status = lambda *args, **kwargs: {"status": "pago"}
+    wi.send_boleto_notification = notify
+    wi.create_log = broken_log
+    try:
+        asyncio.run(wi.process_bradesco_event(_event("A", "13", "t1")))
+    finally:
+        wi.update_boleto_status, wi.send_boleto_notification, wi.create_log = originals
+    assert notified == ["pago"]
+
+
+def test_webhook_route_rejects_unstored_events():
+    """Test the webhook answers 503 when the event cannot be stored, so Bradesco redelivers it."""
+    from fastapi import FastAPI
+    from fastapi.testclient import TestClient
+    import app.routes.cobrancas as cobrancas
+
+    async def broken_ingest(data):
+        raise OSError("disk full")
+
+    api = FastAPI()
+    api.include_router(cobrancas.router)
+    original = cobrancas.webhook_inbox.ingest
+    cobrancas.webhook_inbox.ingest = broken_ingest
+    try:
+        resp = TestClient(api).post("/webhook", json=_event("A", "13", "t1"))
+    finally:
+        cobrancas.webhook_inbox.ingest = original
+    assert resp.status_code == 503
+
+
+if __name__ == "__main__":
+    test_dedup_key()
+    print("✅ test_dedup_key passed")
+
+    test_ingest_dedups_and_processes_in_order_per_boleto()
+    print("✅ test_ingest_dedups_and_processes_in_order_per_boleto passed")
+
+    test_failures_hold_back_the_boleto_then_park_and_replay()
+    print("✅ test_failures_hold_back_the_boleto_then_park_and_replay passed")
+
+    test_bradesco_event_retries_on_db_failure()
+    print("✅ test_bradesco_event_retries_on_db_failure passed")
+
+    test_bradesco_payment_for_missing_boleto()
+    print("✅ test_bradesco_payment_for_missing_boleto passed")
+
+    test_bradesco_payment_log_failure_does_not_retry()
+    print("✅ test_bradesco_payment_log_failure_does_not_retry passed")
+
+    test_webhook_route_rejects_unstored_events()
+    print("✅ test_webhook_route_rejects_unstored_events passed")
+
+    print("\n🎉 All tests passed!")
@@ -200,15 +200,15 @@ with st.sidebar:
             """, unsafe_allow_html=True)
             
             if st.button("Visualizar", key=f"hist_btn_{cnpj_item}", use_container_width=True):
-                # Update data and sync input widget directly
-                st.session_state['dados_empresa'] = item['data']
+                # Full result is fetched on demand (history list only has the index)
+                st.session_state['dados_empresa'] = item.get('data') or fetch(f"/api/query/history/{cnpj_item}")
                 st.session_state['cnpj_input_widget'] = cnpj_item
                 st.rerun()
                 
     st.markdown("---")
     if st.button("Limpar Histórico", use_container_width=True):
         st.session_state['search_history'] = []
-        # Optional: Add backend endpoint to clear history if needed
+        delete("/api/query/history")
         st.rerun()
 
 
@@ -1150,14 +1150,28 @@ if status_filter == "Ativas":
 elif status_filter == "Inativas":
     ativo_filter = False
 
-params = {"limit": 200}
+params = {"limit": 50}
 if ativo_filter is not None:
     params["ativo"] = ativo_filter
 if search:
     params["search"] = search
 
+# Keyset pagination: one cursor per visited page, reset when filters change
+filter_key = (ativo_filter, search)
+if st.session_state.get("empresas_filter_key") != filter_key:
+    st.session_state.empresas_filter_key = filter_key
+    st.session_state.empresas_cursors = [None]
+cursors = st.session_state.empresas_cursors
+if cursors[-1]:
+    params["cursor"] = cursors[-1]
+
 with st.spinner("Carregando empresas..."):
-    empresas = fetch("/api/empresas", params)
+    page = fetch("/api/empresas/page", params)
+
+# Offline fallback returns a plain list of mock companies
+if isinstance(page, list):
+    page = {"items": page, "next_cursor": None, "total_estimate": len(page)}
+empresas = page["items"] if page else None
 
 if empresas:
     # Get latest consulta status for each empresa - TODO: Optimize this with batch query if possible later
@@ -1190,6 +1204,21 @@ if empresas:
 
     st.dataframe(df_display, use_container_width=True, hide_index=True)
 
+    col_p1, col_p2, col_p3 = st.columns([1, 2, 1])
+    with col_p1:
+        if len(cursors) > 1 and st.button("Anterior"):
+            cursors.pop()
+            st.rerun()
+    with col_p2:
+        st.caption(
+            f"Página {len(cursors)} · {len(empresas)} exibidas · "
+            f"~{page.get('total_estimate', len(empresas))} no total"
+        )
+    with col_p3:
+        if page.get("next_cursor") and st.button("Próxima"):
+            cursors.append(page["next_cursor"])
+            st.rerun()
+
     # ─── Actions per empresa ─────────────────────────────────────────
     st.markdown("### Ações")
     selected_empresa = st.selectbox(
@@ -27,7 +27,7 @@ def fetch(endpoint: str, params: dict | None = None, timeout: int = 60):
         return r.json()
     except Exception as e:
         # Fallback to internal list for browsing, but NOT for direct queries
-        if endpoint == "/api/empresas":
+        if endpoint in ("/api/empresas", "/api/empresas/page"):
              from components.mock_data import get_mock_companies
              if "mock_companies" not in st.session_state:
                  st.session_state.mock_companies = get_mock_companies(150)
@@ -66,15 +66,32 @@ st.markdown("""
 """, unsafe_allow_html=True)
 
 # ─── Select Empresa ──────────────────────────────────────────────────
-empresas = fetch("/api/empresas", {"limit": 500})
+busca_empresa = st.text_input("Buscar empresa (CNPJ ou Razão Social)", key="detail_search")
 
-if not empresas:
-    st.info("Nenhuma empresa cadastrada.")
-    st.stop()
+page_params = {"limit": 100}
+if busca_empresa:
+    page_params["search"] = busca_empresa
+empresas_page = fetch("/api/empresas/page", page_params)
+
+# Offline fallback returns a plain list of mock companies
+if isinstance(empresas_page, list):
+    empresas = empresas_page
+else:
+    empresas = (empresas_page or {}).get("items", [])
 
 # Check if coming from Empresas page
 pre_selected = st.session_state.get("detail_empresa_id")
 
+# The pre-selected empresa may be outside the first page of results
+if pre_selected and not any(e["id"] == pre_selected for e in empresas):
+    empresa_pre = fetch(f"/api/empresas/{pre_selected}")
+    if empresa_pre:
+        empresas = [empresa_pre] + empresas
+
+if not empresas:
+    st.info("Nenhuma empresa encontrada." if busca_empresa else "Nenhuma empresa cadastrada.")
+    st.stop()
+
 # If we have a pre-selected ID from the previous page, use it directly to avoid selectbox sync issues
 if pre_selected:
     # Verify it exists in options
@@ -184,11 +201,12 @@ with tab_resumo:
     idx = 0
     for tipo, label in [("cnd_federal", "CND Federal"), ("cnd_pr", "CND PR"), ("fgts_regularidade", "FGTS")]:
         with col_results[idx]:
-            consultas = fetch("/api/consultas", {
+            consultas_page = fetch("/api/consultas/page", {
                 "empresa_id": empresa_id,
                 "tipo": tipo,
                 "limit": 1,
             })
+            consultas = (consultas_page or {}).get("items", [])
             
             st.markdown('<div class="kpi-card" style="min-height: 180px;">', unsafe_allow_html=True)
             st.markdown(f"<h3 style='margin-top:0;'>{label}</h3>", unsafe_allow_html=True)
@@ -300,7 +318,15 @@ with tab_historico:
     if status_filter != "Todos":
         params["status"] = status_filter
 
-    consultas = fetch("/api/consultas", params)
+    # Keyset pagination: accumulate pages while the filters stay the same
+    hist_key = (empresa_id, tipo_filter, status_filter)
+    if st.session_state.get("hist_key") != hist_key:
+        st.session_state.hist_key = hist_key
+        first_page = fetch("/api/consultas/page", params) or {}
+        st.session_state.hist_items = first_page.get("items", [])
+        st.session_state.hist_cursor = first_page.get("next_cursor")
+
+    consultas = st.session_state.hist_items
 
     if consultas:
         df = pd.DataFrame(consultas)
@@ -334,6 +360,14 @@ with tab_historico:
         display_df = df[["Tipo", "Status", "Situação", "Agendada", "Executada", "Tentativas"]]
         st.dataframe(display_df, use_container_width=True, hide_index=True)
 
+        if st.session_state.hist_cursor and st.button("Carregar mais"):
+            next_page = fetch(
+                "/api/consultas/page", {**params, "cursor": st.session_state.hist_cursor}
+            ) or {}
+            st.session_state.hist_items = consultas + next_page.get("items", [])
+            st.session_state.hist_cursor = next_page.get("next_cursor")
+            st.rerun()
+
         # PDF download links
         pdfs = df[df["pdf_url"].notna() & (df["pdf_url"] != "")]
         if not pdfs.empty:
@@ -153,6 +153,8 @@ with tab_auto:
         params["channel"] = channel_filter
     if status_filter != "Todos":
         params["status"] = status_filter
+    if search:
+        params["recipient"] = search
 
     raw_logs = fetch("/api/comunicacao/logs", params=params) or []
 
@@ -160,8 +162,6 @@ with tab_auto:
         st.info("Nenhum log de comunicação encontrado.")
     else:
         df = pd.DataFrame(raw_logs)
-        if search:
-            df = df[df['recipient'].str.contains(search, case=False, na=False)]
 
         df['Horário'] = pd.to_datetime(df['timestamp']).dt.strftime('%d/%m/%Y %H:%M:%S')
         df['Canal'] = df['channel'].apply(lambda x: "Email" if x == "email" else "WhatsApp")
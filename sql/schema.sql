@@ -2,6 +2,9 @@
 -- IAudit - Schema Completo Supabase
 -- =============================================
 
+-- Busca por substring (ilike '%x%') em razao_social / cnpj
+create extension if not exists pg_trgm;
+
 -- Tabela de Empresas
 create table if not exists empresas (
     id uuid default gen_random_uuid() primary key,
@@ -57,6 +60,14 @@ create index if not exists idx_consultas_data_agendada on consultas(data_agendad
 create index if not exists idx_consultas_status_data on consultas(status, data_agendada);
 create index if not exists idx_logs_consulta on logs_execucao(consulta_id);
 
+-- Busca trigram (ilike '%x%') e paginação keyset (ordem, id)
+create index if not exists idx_empresas_razao_trgm on empresas using gin (razao_social gin_trgm_ops);
+create index if not exists idx_empresas_cnpj_trgm on empresas using gin (cnpj gin_trgm_ops);
+create index if not exists idx_empresas_razao_id on empresas(razao_social, id);
+create index if not exists idx_empresas_created_id on empresas(created_at, id);
+create index if not exists idx_consultas_empresa_data_id on consultas(empresa_id, data_agendada desc, id desc);
+create index if not exists idx_consultas_data_id on consultas(data_agendada desc, id desc);
+
 -- =============================================
 -- Trigger para atualizar updated_at
 -- =============================================
@@ -167,3 +178,141 @@ begin
     limit limite;
 end;
 $$ language plpgsql;
+
+-- =============================================
+-- Tabela: app_settings (configurações dinâmicas compartilhadas entre réplicas)
+-- =============================================
+create table if not exists app_settings (
+    id text primary key default 'global',
+    data jsonb not null default '{}'::jsonb,
+    updated_at timestamptz default now()
+);
+
+-- =============================================
+-- Tabela: boletos (cobranças Bradesco)
+-- =============================================
+create table if not exists boletos (
+    id uuid default gen_random_uuid() primary key,
+    empresa_id uuid references empresas(id) on delete cascade,
+    nosso_numero text,
+    status text not null default 'emitido',
+    data_vencimento date,
+    vl_nominal bigint,
+    pagador_nome text,
+    linha_digitavel text,
+    created_at timestamptz default now(),
+    updated_at timestamptz default now()
+);
+
+-- Agenda de consulta de status (polling inteligente)
+alter table boletos add column if not exists next_check_at timestamptz;
+alter table boletos add column if not exists last_checked_at timestamptz;
+alter table boletos add column if not exists webhook_confirmed_at timestamptz;
+
+-- Número da fatura: chave de idempotência da emissão (reemitir um lote não duplica boletos).
+-- A linha é criada com status 'registrando' antes da chamada ao Bradesco; um
+-- 'registrando' antigo é um registro sem resposta, a conciliar com o Bradesco.
+alter table boletos add column if not exists nu_fatura text;
+create unique index if not exists idx_boletos_nu_fatura on boletos(nu_fatura);
+create index if not exists idx_boletos_registrando on boletos(created_at)
+    where status = 'registrando';
+
+-- Webhook e consultas de status localizam o boleto pelo nosso_numero do Bradesco
+create unique index if not exists idx_boletos_nosso_numero on boletos(nosso_numero);
+
+-- Só boletos ativos entram no polling; nunca consultados (null) primeiro
+create index if not exists idx_boletos_next_check on boletos(next_check_at nulls first)
+    where status in ('emitido', 'atraso');
+create index if not exists idx_boletos_empresa on boletos(empresa_id);
+
+-- Lembretes D-1 / D+N: seleção por data de vencimento
+create index if not exists idx_boletos_vencimento on boletos(data_vencimento)
+    where status in ('emitido', '01', 'atraso');
+
+-- Livro de lembretes enviados: um lembrete (marco -1 = D-1, N = D+N) por
+-- boleto e vencimento, mesmo que o job rode mais de uma vez no dia
+create table if not exists boleto_lembretes (
+    boleto_id uuid references boletos(id) on delete cascade,
+    data_vencimento date not null,
+    marco integer not null,
+    enviado_em timestamptz default now(),
+    primary key (boleto_id, data_vencimento, marco)
+);
+
+-- =============================================
+-- Agregados financeiros por empresa / mês / status
+-- Mantidos pelo trigger abaixo a cada insert/update/delete em boletos, para
+-- que as estatísticas não precisem varrer a carteira inteira.
+-- =============================================
+create table if not exists boleto_aggregates (
+    empresa_id uuid,
+    mes date not null,                       -- primeiro dia do mês de vencimento
+    status text not null,
+    quantidade bigint not null default 0,
+    valor_centavos bigint not null default 0,
+    updated_at timestamptz default now(),
+    unique nulls not distinct (empresa_id, mes, status)
+);
+
+create or replace function boleto_aggregates_add(p_empresa uuid, p_mes date, p_status text, p_quantidade int, p_valor bigint)
+returns void as $$
+begin
+    insert into boleto_aggregates as a (empresa_id, mes, status, quantidade, valor_centavos)
+    values (p_empresa, p_mes, p_status, p_quantidade, p_valor)
+    on conflict (empresa_id, mes, status) do update
+    set quantidade = a.quantidade + excluded.quantidade,
+        valor_centavos = a.valor_centavos + excluded.valor_centavos,
+        updated_at = now();
+end;
+$$ language plpgsql;
+
+create or replace function boletos_update_aggregates()
+returns trigger as $$
+begin
+    if tg_op in ('UPDATE', 'DELETE') then
+        perform boleto_aggregates_add(
+            old.empresa_id, date_trunc('month', coalesce(old.data_vencimento, old.created_at))::date,
+            old.status, -1, -coalesce(old.vl_nominal, 0));
+    end if;
+    if tg_op in ('INSERT', 'UPDATE') then
+        perform boleto_aggregates_add(
+            new.empresa_id, date_trunc('month', coalesce(new.data_vencimento, new.created_at))::date,
+            new.status, 1, coalesce(new.vl_nominal, 0));
+    end if;
+    return null;
+end;
+$$ language plpgsql;
+
+drop trigger if exists boletos_aggregates on boletos;
+create trigger boletos_aggregates
+    after insert or delete or update of status, empresa_id, data_vencimento, vl_nominal on boletos
+    for each row
+    execute function boletos_update_aggregates();
+
+-- Carga inicial (só quando a tabela de agregados ainda está vazia)
+insert into boleto_aggregates (empresa_id, mes, status, quantidade, valor_centavos)
+select empresa_id, date_trunc('month', coalesce(data_vencimento, created_at))::date, status,
+       count(*), coalesce(sum(vl_nominal), 0)
+from boletos
+where not exists (select 1 from boleto_aggregates)
+group by 1, 2, 3;
+
+-- =============================================
+-- Tabela: billing_plans (cobrança recorrente)
+-- =============================================
+create table if not exists billing_plans (
+    id uuid default gen_random_uuid() primary key,
+    empresa_id uuid references empresas(id) on delete cascade not null,
+    valor numeric(12, 2) not null,
+    dia_vencimento integer not null default 10 check (dia_vencimento between 1 and 31),
+    ativo boolean default true,
+    ultimo_processamento timestamptz,
+    created_at timestamptz default now()
+);
+
+-- Claim por réplica: um plano só é faturado por quem detém o lease
+alter table billing_plans add column if not exists claimed_by text;
+alter table billing_plans add column if not exists claimed_until timestamptz not null default 'epoch';
+
+create index if not exists idx_billing_plans_pendentes on billing_plans(ultimo_processamento nulls first)
+    where ativo;